@@ -0,0 +1,99 @@
+import asyncio
+from typing import Optional
+
+from hypercorn.middleware import AsyncioWSGIMiddleware
+from quart import Quart, jsonify, request
+
+from ai_context import AI_ROUTES, AIContextError
+from claude_service import AsyncClaudeService
+from claude_transport import claude_enabled
+from json_provider import init_json_provider
+
+AI_PREFIX = '/api/ai/'
+
+# hypercorn buffers WSGI request bodies; its 64KB default is too small for scripts
+WSGI_MAX_BODY_SIZE = 16 * 1024 * 1024
+
+
+def create_ai_app(flask_app, claude_service: Optional[AsyncClaudeService] = None) -> Quart:
+    """
+    Async twin of the Flask /api/ai/* routes, built from the same AI_ROUTES.
+
+    Views await AsyncClaudeService, so a worker holds any number of model
+    calls in flight on one event loop. Database reads reuse the ai_context
+    loaders and run in a worker thread inside a Flask app context, because
+    Flask-SQLAlchemy sessions are blocking and scoped to that context.
+    """
+    app = Quart(__name__)
+    app.config.update(flask_app.config)
+    init_json_provider(app)
+
+    if claude_service is None and claude_enabled(flask_app.config):
+        # Shares the Flask app's router, prefix registry and telemetry, so both stacks degrade and report together
+        claude_service = AsyncClaudeService.from_config(flask_app.config, router=flask_app.extensions['model_router'],
+                                                        prefixes=flask_app.extensions['prefix_registry'],
+                                                        telemetry=flask_app.extensions['ai_telemetry'],
+                                                        replies=flask_app.extensions['reply_cache'])
+    app.claude_service = claude_service
+
+    async def load(loader, *args):
+        def run():
+            with flask_app.app_context():
+                return loader(*args)
+        return await asyncio.to_thread(run)
+
+    @app.after_serving
+    async def close_claude_client():
+        if app.claude_service:
+            await app.claude_service.aclose()
+
+    @app.after_request
+    async def add_cors_headers(response):
+        # Same policy as CORS(app) on the Flask side: every origin is allowed
+        origin = request.headers.get('Origin')
+        if origin:
+            response.headers['Access-Control-Allow-Origin'] = origin
+            response.vary.add('Origin')
+        if request.method == 'OPTIONS':
+            response.headers['Access-Control-Allow-Methods'] = 'DELETE, GET, HEAD, OPTIONS, PATCH, POST, PUT'
+            requested_headers = request.headers.get('Access-Control-Request-Headers')
+            if requested_headers:
+                response.headers['Access-Control-Allow-Headers'] = requested_headers
+        return response
+
+    @app.errorhandler(AIContextError)
+    async def handle_ai_context_error(error):
+        return jsonify({'error': error.message}), error.status
+
+    def ai_view(route):
+        async def view():
+            if not app.claude_service:
+                return route.unavailable_response()
+            args = (await request.get_json(),) if route.with_body else ()
+            try:
+                context = await load(route.load, *args)
+                result = await getattr(app.claude_service, route.method)(**route.kwargs(context, request.headers))
+            except Exception as e:
+                return route.error_response(e)
+            return jsonify(result)
+        return view
+
+    for route in AI_ROUTES:
+        app.add_url_rule(route.path, route.endpoint, ai_view(route), methods=['POST'])
+
+    return app
+
+
+def mount_ai_app(ai_app: Quart, flask_app):
+    """ASGI app sending /api/ai/* to ai_app and every other path to the Flask app"""
+    # Flask requests run in the event loop's thread pool, as under gthread
+    wsgi_app = AsyncioWSGIMiddleware(flask_app, max_body_size=WSGI_MAX_BODY_SIZE)
+
+    async def app(scope, receive, send):
+        # Only the Quart app takes part in lifespan (before/after_serving)
+        if scope['type'] == 'lifespan' or scope['path'].startswith(AI_PREFIX):
+            await ai_app(scope, receive, send)
+        else:
+            await wsgi_app(scope, receive, send)
+
+    return app
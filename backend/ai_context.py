@@ -0,0 +1,224 @@
+from datetime import datetime, timedelta
+from typing import Any, Callable, Dict, List, NamedTuple, Optional, Tuple
+
+from analytics_service import AnalyticsService
+from models import Profile, ContentPillar, ContentManager, Platform
+from db_routing import read_replica
+from rollups import content_weeks, pillar_weeks
+
+CONTENT_FIELD_TYPES = ['caption', 'hook', 'script', 'tone', 'call_to_action', 'hashtags']
+# Weeks of platform history behind an optimization
+OPTIMIZE_HISTORY_WEEKS = 12
+# Milliseconds a client will wait for a model answer before taking a heuristic one
+DEADLINE_HEADER = 'X-Deadline-Ms'
+
+
+class AIContextError(Exception):
+    """A request the AI endpoints cannot serve; rendered as {'error': message} with status"""
+
+    def __init__(self, message: str, status: int = 404):
+        super().__init__(message)
+        self.message = message
+        self.status = status
+
+
+def request_deadline(headers) -> Optional[float]:
+    """The X-Deadline-Ms header in seconds, or None to use the task's configured deadline"""
+    value = headers.get(DEADLINE_HEADER)
+    if not value:
+        return None
+    try:
+        deadline = float(value) / 1000
+    except ValueError:
+        raise AIContextError(f'{DEADLINE_HEADER} must be a number of milliseconds', 400)
+    if deadline <= 0:
+        raise AIContextError(f'{DEADLINE_HEADER} must be positive', 400)
+    return deadline
+
+
+# Each loader reads what a ClaudeService method needs and returns it as that
+# method's keyword arguments. They are shared by the Flask views (app.py) and
+# the async AI app (asgi.py), which runs them in a worker thread.
+
+def strategy_context() -> Dict:
+    with read_replica():
+        # Get profile data
+        profile = Profile.query.first()
+        if not profile:
+            raise AIContextError('Profile not found')
+
+        # Recent analytics, as weekly totals per content and platform
+        analytics = content_weeks(datetime.utcnow().date() - timedelta(days=14))
+
+        # Get platforms
+        platforms = Platform.query.all()
+
+        return {
+            'profile_data': profile.to_dict(),
+            'analytics_data': analytics,
+            'platforms': [p.to_dict() for p in platforms]
+        }
+
+
+def ideas_context(data: Dict) -> Dict:
+    with read_replica():
+        pillar = ContentPillar.query.get_or_404(data.get('pillar_id'))
+        profile = Profile.query.first()
+
+        # Recent performance as weekly totals per pillar and platform
+        recent_performance = pillar_weeks(datetime.utcnow().date() - timedelta(days=30))
+
+        return {
+            'pillar_name': pillar.pillar_name,
+            'target_audience': profile.target_audience if profile else "General audience",
+            'recent_performance': recent_performance
+        }
+
+
+def bulk_ideas_contexts(data: Dict) -> List[Dict]:
+    """
+    One ideas request per pillar, or per pillar x platform with per_platform.
+
+    Each entry has the pillar_id and platform it was made for and the
+    generate_content_ideas kwargs under 'kwargs'. Profile and recent
+    performance are loaded once for the whole batch.
+    """
+    with read_replica():
+        query = ContentPillar.query
+        if data.get('pillar_ids'):
+            query = query.filter(ContentPillar.id.in_(data['pillar_ids']))
+        pillars = query.order_by(ContentPillar.id).all()
+        if not pillars:
+            raise AIContextError('No content pillars found')
+        profile = Profile.query.first()
+
+        recent_performance = pillar_weeks(datetime.utcnow().date() - timedelta(days=30))
+        platforms = [p.platform_name for p in Platform.query.order_by(Platform.id)] if data.get('per_platform') else [None]
+
+        return [
+            {
+                'pillar_id': pillar.id,
+                'platform': platform,
+                'kwargs': {
+                    'pillar_name': pillar.pillar_name,
+                    'target_audience': profile.target_audience if profile else "General audience",
+                    'recent_performance': recent_performance,
+                    'platform': platform
+                }
+            }
+            for pillar in pillars
+            for platform in platforms
+        ]
+
+
+def optimize_context(data: Dict) -> Dict:
+    platform = data.get('platform')
+    with read_replica():
+        content = ContentManager.query.get_or_404(data.get('content_id'))
+
+        # Get platform analytics
+        platform_obj = Platform.query.filter_by(platform_name=platform).first()
+        if not platform_obj:
+            raise AIContextError('Platform not found')
+
+        analytics = content_weeks(datetime.utcnow().date() - timedelta(weeks=OPTIMIZE_HISTORY_WEEKS),
+                                  platform_id=platform_obj.id)
+        return {
+            'content_data': content.to_dict(),
+            'platform': platform,
+            'analytics': analytics
+        }
+
+
+def analysis_context() -> Dict:
+    # Get all content with analytics
+    with read_replica():
+        content_items = ContentManager.query.all()
+        platforms = Platform.query.all()
+        return {
+            'content_data': [c.to_dict() for c in content_items],
+            'platforms': [p.platform_name for p in platforms]
+        }
+
+
+def weekly_plan_context(data: Dict) -> Dict:
+    # Get pillars data
+    pillars = ContentPillar.query.all()
+    return {
+        'pillars': [pillar.to_dict() for pillar in pillars],
+        'platforms': data.get('platforms', []),
+        'goals': data.get('goals', '')
+    }
+
+
+def content_field_context(data: Dict) -> Dict:
+    field_type = data.get('field_type')
+    content_data = data.get('content_data', {})
+
+    if not field_type or field_type not in CONTENT_FIELD_TYPES:
+        raise AIContextError('Invalid field_type. Must be caption, hook, script, tone, call_to_action, or hashtags', 400)
+
+    # Get profile data
+    profile = Profile.query.first()
+    profile_data = profile.to_dict() if profile else {}
+
+    # Get pillar data if specified
+    pillar_data: Optional[Dict] = None
+    if content_data.get('content_pillar_id'):
+        pillar = ContentPillar.query.get(content_data['content_pillar_id'])
+        pillar_data = pillar.to_dict() if pillar else None
+
+    return {
+        'field_type': field_type,
+        'content_data': content_data,
+        'profile_data': profile_data,
+        'pillar_data': pillar_data
+    }
+
+
+class AIRoute(NamedTuple):
+    """
+    One /api/ai/* endpoint, served by the Flask views (app.py) and the async
+    AI app (ai_app.py) alike: each stack only reads the body, runs the loader
+    and calls the ClaudeService method in its own sync or async way.
+    """
+    path: str
+    endpoint: str
+    method: str  # ClaudeService method taking the loader's kwargs
+    load: Callable[..., Dict]
+    with_body: bool = False  # The loader takes the JSON body
+    # Local heuristic given the loaded context; with one, the call has a deadline
+    fallback: Optional[Callable[[Dict], Any]] = None
+    unavailable: Tuple[int, str] = (500, 'Claude API key not configured')
+    errors_as_500: bool = False  # Render unexpected exceptions as {'error': message}, 500
+
+    def unavailable_response(self) -> Tuple[Dict, int]:
+        status, message = self.unavailable
+        return {'error': message}, status
+
+    def kwargs(self, context: Dict, headers) -> Dict:
+        if self.fallback is None:
+            return context
+        # Past the deadline (or on failure) the result is the heuristic one, flagged degraded
+        return {**context, 'deadline': request_deadline(headers), 'fallback': lambda: self.fallback(context)}
+
+    def error_response(self, error: Exception) -> Tuple[Dict, int]:
+        """{'error': message}, 500 for routes that render errors; re-raises anything else"""
+        if isinstance(error, AIContextError) or not self.errors_as_500:
+            raise error
+        return {'error': str(error)}, 500
+
+
+AI_ROUTES = (
+    AIRoute('/api/ai/generate-strategy', 'generate_strategy', 'generate_content_strategy', strategy_context),
+    AIRoute('/api/ai/generate-ideas', 'generate_ideas', 'generate_content_ideas', ideas_context, with_body=True,
+            fallback=lambda context: AnalyticsService().suggest_content_ideas(**context)),
+    AIRoute('/api/ai/optimize-content', 'optimize_content', 'optimize_content', optimize_context, with_body=True),
+    AIRoute('/api/ai/analyze-performance', 'analyze_performance', 'analyze_performance', analysis_context),
+    AIRoute('/api/ai/weekly-plan', 'generate_weekly_plan', 'generate_weekly_content_plan', weekly_plan_context,
+            with_body=True, unavailable=(503, 'Claude service not available'), errors_as_500=True),
+    AIRoute('/api/ai/generate-content-field', 'generate_content_field', 'generate_content_field',
+            content_field_context, with_body=True,
+            fallback=lambda context: AnalyticsService().suggest_content_field(**context),
+            unavailable=(503, 'Claude service not available'), errors_as_500=True),
+)
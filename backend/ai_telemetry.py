@@ -0,0 +1,177 @@
+from collections import Counter, defaultdict
+from typing import Dict, List, Optional
+import threading
+
+from model_routing import LatencyWindow
+
+QUANTILES = (0.5, 0.95, 0.99)
+TOKEN_KINDS = ('input', 'output', 'cache_read', 'cache_write')
+
+
+def usage_tokens(usage) -> Dict[str, int]:
+    """Token counts by kind from a response's usage block"""
+    return {
+        'input': getattr(usage, 'input_tokens', None) or 0,
+        'output': getattr(usage, 'output_tokens', None) or 0,
+        'cache_read': getattr(usage, 'cache_read_input_tokens', None) or 0,
+        'cache_write': getattr(usage, 'cache_creation_input_tokens', None) or 0
+    }
+
+
+def _label_value(value: str) -> str:
+    return value.replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def _labels(**labels) -> str:
+    return '{' + ','.join(f'{name}="{_label_value(str(value))}"' for name, value in labels.items()) + '}'
+
+
+class AITelemetry:
+    """
+    Per-task metrics for Claude calls, fed by ClaudeService.
+
+    Tasks are call names ('strategy', 'content_field.hook', ...). Every
+    upstream call (not every caller: coalesced callers share one) records
+    wall time, time to first token when streaming, token usage, attempts
+    and, for calls with a cacheable prefix, a prompt-cache hit or miss.
+    Cost comes from CLAUDE_MODEL_PRICES (USD per million tokens of each
+    kind). Quantiles cover the last `window` calls of each task; counters
+    run since the process started. Responses served by a local heuristic
+    instead of the model are counted by reason ('deadline' or 'error').
+    """
+
+    def __init__(self, prices: Optional[Dict[str, Dict[str, float]]] = None, window: int = 1000):
+        self.prices = prices or {}
+        self.window = window
+        self._lock = threading.Lock()
+        self._wall: Dict[str, LatencyWindow] = {}
+        self._ttft: Dict[str, LatencyWindow] = {}
+        self._wall_sum = Counter()
+        self._calls = Counter()  # (task, model, outcome)
+        self._tokens = Counter()  # (task, model, kind)
+        self._cost = Counter()  # (task, model)
+        self._retries = Counter()
+        self._cache = Counter()  # (task, 'hit' | 'miss')
+        self._degraded = Counter()  # (task, 'deadline' | 'error')
+
+    @classmethod
+    def from_config(cls, config) -> 'AITelemetry':
+        return cls(prices=config.get('CLAUDE_MODEL_PRICES'), window=config.get('CLAUDE_TELEMETRY_WINDOW', 1000))
+
+    def cost(self, model: str, tokens: Dict[str, int]) -> float:
+        prices = self.prices.get(model, {})
+        return sum(tokens[kind] * prices.get(kind, 0.0) for kind in TOKEN_KINDS) / 1_000_000
+
+    def _window(self, windows: Dict[str, LatencyWindow], task: str) -> LatencyWindow:
+        if task not in windows:
+            windows[task] = LatencyWindow(self.window)
+        return windows[task]
+
+    def record(self, task: str, model: str, seconds: float, attempts: int = 1, usage=None,
+               first_token: Optional[float] = None, cacheable: bool = False, error: bool = False) -> None:
+        tokens = usage_tokens(usage)
+        with self._lock:
+            self._calls[(task, model, 'error' if error else 'success')] += 1
+            self._retries[task] += max(attempts - 1, 0)
+            self._window(self._wall, task).add(seconds)
+            self._wall_sum[task] += seconds
+            if first_token is not None:
+                self._window(self._ttft, task).add(first_token)
+            if error:
+                return
+            for kind, count in tokens.items():
+                self._tokens[(task, model, kind)] += count
+            self._cost[(task, model)] += self.cost(model, tokens)
+            if cacheable:
+                self._cache[(task, 'hit' if tokens['cache_read'] else 'miss')] += 1
+
+    def record_degraded(self, task: str, reason: str) -> None:
+        with self._lock:
+            self._degraded[(task, reason)] += 1
+
+    def _tasks(self) -> List[str]:
+        return sorted({task for task, _, _ in self._calls} | {task for task, _ in self._degraded})
+
+    def summary(self) -> Dict:
+        """Rolling p50/p95/p99 and totals per task, for /api/stats/ai-calls"""
+        with self._lock:
+            stats = {}
+            for task in self._tasks():
+                calls = sum(count for (t, _, _), count in self._calls.items() if t == task)
+                errors = sum(count for (t, _, outcome), count in self._calls.items()
+                             if t == task and outcome == 'error')
+                tokens = {kind: sum(count for (t, _, k), count in self._tokens.items() if t == task and k == kind)
+                          for kind in TOKEN_KINDS}
+                cost = sum(value for (t, _), value in self._cost.items() if t == task)
+                successes = calls - errors
+                stats[task] = {
+                    'calls': calls,
+                    'errors': errors,
+                    'retries': self._retries[task],
+                    'latency_ms': self._quantiles_ms(self._wall.get(task)),
+                    'ttft_ms': self._quantiles_ms(self._ttft.get(task)),
+                    'tokens': tokens,
+                    'avg_output_tokens': round(tokens['output'] / successes, 1) if successes else None,
+                    'prompt_cache': {'hits': self._cache[(task, 'hit')], 'misses': self._cache[(task, 'miss')]},
+                    'degraded': {'deadline': self._degraded[(task, 'deadline')],
+                                 'error': self._degraded[(task, 'error')]},
+                    'cost_usd': round(cost, 6),
+                    'cost_per_call_usd': round(cost / successes, 6) if successes else None,
+                    'models': sorted({model for (t, model, _) in self._calls if t == task})
+                }
+            return stats
+
+    @staticmethod
+    def _quantiles_ms(window: Optional[LatencyWindow]) -> Dict[str, Optional[float]]:
+        values = window.quantiles(QUANTILES) if window else dict.fromkeys(QUANTILES)
+        return {f'p{int(q * 100)}': round(value * 1000, 1) if value is not None else None
+                for q, value in values.items()}
+
+    def prometheus(self) -> str:
+        """The metrics in Prometheus text exposition format, for /metrics"""
+        lines = []
+
+        def family(name, kind, help_text):
+            lines.append(f'# HELP {name} {help_text}')
+            lines.append(f'# TYPE {name} {kind}')
+
+        with self._lock:
+            family('ai_calls_total', 'counter', 'Upstream Claude calls by task, model and outcome.')
+            for (task, model, outcome), count in sorted(self._calls.items()):
+                lines.append(f'ai_calls_total{_labels(task=task, model=model, outcome=outcome)} {count}')
+
+            for name, windows, help_text in (
+                ('ai_call_duration_seconds', self._wall, 'Wall time of Claude calls including retries.'),
+                ('ai_time_to_first_token_seconds', self._ttft, 'Time to the first streamed token.')
+            ):
+                family(name, 'summary', help_text)
+                for task, window in sorted(windows.items()):
+                    for q, value in window.quantiles(QUANTILES).items():
+                        if value is not None:
+                            lines.append(f'{name}{_labels(task=task, quantile=q)} {value:.6f}')
+                    if name == 'ai_call_duration_seconds':
+                        count = sum(c for (t, _, _), c in self._calls.items() if t == task)
+                        lines.append(f'{name}_sum{_labels(task=task)} {self._wall_sum[task]:.6f}')
+                        lines.append(f'{name}_count{_labels(task=task)} {count}')
+
+            family('ai_tokens_total', 'counter', 'Tokens by task, model and kind (input, output, cache_read, cache_write).')
+            for (task, model, kind), count in sorted(self._tokens.items()):
+                lines.append(f'ai_tokens_total{_labels(task=task, model=model, kind=kind)} {count}')
+
+            family('ai_retries_total', 'counter', 'Extra attempts (retries and hedges) by task.')
+            for task, count in sorted(self._retries.items()):
+                lines.append(f'ai_retries_total{_labels(task=task)} {count}')
+
+            family('ai_prompt_cache_total', 'counter', 'Calls with a cacheable prefix by task and cache result.')
+            for (task, result), count in sorted(self._cache.items()):
+                lines.append(f'ai_prompt_cache_total{_labels(task=task, result=result)} {count}')
+
+            family('ai_degraded_total', 'counter', 'Responses served by a local heuristic, by task and reason.')
+            for (task, reason), count in sorted(self._degraded.items()):
+                lines.append(f'ai_degraded_total{_labels(task=task, reason=reason)} {count}')
+
+            family('ai_cost_usd_total', 'counter', 'Estimated spend in USD by task and model.')
+            for (task, model), value in sorted(self._cost.items()):
+                lines.append(f'ai_cost_usd_total{_labels(task=task, model=model)} {value:.6f}')
+
+        return '\n'.join(lines) + '\n'
@@ -0,0 +1,253 @@
+from datetime import date, timedelta
+from typing import Dict, List, NamedTuple, Optional
+
+from sqlalchemy import Date, Float, and_, cast, func, literal_column, null, select, type_coerce
+
+from models import db, Analytics, AnalyticsWeekly, ContentManager, ContentPillar, PillarAnalyticsWeekly, Platform
+from rollups import METRICS, RATES, week_start, week_start_sql
+
+INTERVALS = ('day', 'week', 'month')
+GROUPS = ('content', 'platform', 'pillar', 'content_type')
+AGGS = ('sum', 'avg', 'max', 'min')
+
+DEFAULT_DAYS = 90
+DEFAULT_POINTS = 120
+# Upper bounds on what one request can ask for, so a payload stays a few KB
+MAX_POINTS = 500
+MAX_SERIES = 25
+DEFAULT_SERIES = 10
+DEFAULT_WINDOW = 3
+
+# Each point is one row of these values
+POINT_COLUMNS = ('period', 'value', 'moving_avg', 'growth')
+
+
+class SeriesError(ValueError):
+    """An invalid series query; rendered as {'error': message} with status 400"""
+
+
+class SeriesQuery(NamedTuple):
+    """What GET /api/analytics/series was asked for"""
+    metric: str
+    agg: str
+    interval: str
+    group_by: Optional[str]
+    start: date
+    end: date
+    window: int = DEFAULT_WINDOW
+    points: int = DEFAULT_POINTS
+    series: int = DEFAULT_SERIES
+
+    @classmethod
+    def from_args(cls, args, today: Optional[date] = None) -> 'SeriesQuery':
+        metric = args.get('metric', 'views')
+        if metric not in METRICS + RATES:
+            raise SeriesError(f"metric must be one of {', '.join(METRICS + RATES)}")
+        # Counts add up over a period, rates do not
+        agg = args.get('agg') or ('avg' if metric in RATES else 'sum')
+        if agg not in AGGS:
+            raise SeriesError(f"agg must be one of {', '.join(AGGS)}")
+        interval = args.get('interval', 'day')
+        if interval not in INTERVALS:
+            raise SeriesError(f"interval must be one of {', '.join(INTERVALS)}")
+        group_by = args.get('group_by') or None
+        if group_by is not None and group_by not in GROUPS:
+            raise SeriesError(f"group_by must be one of {', '.join(GROUPS)}")
+
+        end = _date_arg(args, 'end') or today or date.today()
+        start = _date_arg(args, 'start') or end - timedelta(days=_int_arg(args, 'days', DEFAULT_DAYS, 1, 3660))
+        if start > end:
+            raise SeriesError('start must not be after end')
+
+        points = _int_arg(args, 'points', DEFAULT_POINTS, 2, MAX_POINTS)
+        return cls(metric, agg, interval, group_by, start, end,
+                   window=_int_arg(args, 'window', DEFAULT_WINDOW, 1, points),
+                   points=points,
+                   series=_int_arg(args, 'series', DEFAULT_SERIES, 1, MAX_SERIES))
+
+
+def range_key(args, today: Optional[date] = None) -> str:
+    """The start and end a request resolves to, for its ETag; empty for an invalid query"""
+    try:
+        query = SeriesQuery.from_args(args, today=today)
+    except SeriesError:
+        return ''
+    return f'{query.start}:{query.end}'
+
+
+def _date_arg(args, name: str) -> Optional[date]:
+    value = args.get(name)
+    if not value:
+        return None
+    try:
+        return date.fromisoformat(value)
+    except ValueError:
+        raise SeriesError(f'{name} must be a YYYY-MM-DD date')
+
+
+def _int_arg(args, name: str, default: int, low: int, high: int) -> int:
+    value = args.get(name)
+    if value in (None, ''):
+        return default
+    try:
+        number = int(value)
+    except ValueError:
+        raise SeriesError(f'{name} must be an integer')
+    if not low <= number <= high:
+        raise SeriesError(f'{name} must be between {low} and {high}')
+    return number
+
+
+def period_sql(column, interval: str, dialect: str):
+    """The first day of column's day, week (Monday) or month, as a date"""
+    if dialect == 'sqlite':
+        if interval == 'week':
+            expression = week_start_sql(column, dialect)
+        elif interval == 'month':
+            expression = func.date(column, literal_column("'start of month'"))
+        else:
+            expression = func.date(column)
+        # SQLite returns ISO strings; the Date type parses them on the way out
+        return type_coerce(expression, Date)
+    if interval == 'week':
+        return week_start_sql(column, dialect)
+    # A literal, not a bound parameter, so GROUP BY matches the selected expression
+    return cast(func.date_trunc(literal_column(f"'{interval}'"), column), Date)
+
+
+def _uses_rollups(query: SeriesQuery) -> bool:
+    # Weekly sums and averages read the rollup tables, so cost follows weeks rather than raw rows.
+    # Months do not: a week can straddle two of them.
+    return query.interval == 'week' and query.agg in ('sum', 'avg')
+
+
+def _grouped(query: SeriesQuery, dialect: str):
+    """SELECT period, key, value: the metric aggregated per interval and group within the range"""
+    if _uses_rollups(query):
+        model = PillarAnalyticsWeekly if query.group_by == 'pillar' else AnalyticsWeekly
+        column = getattr(model, query.metric if query.metric in METRICS else f'{query.metric}_sum')
+        if query.agg == 'sum':
+            value = func.sum(column)
+        else:
+            # Per-day average, as over raw rows: each rollup row holds `days` rows
+            value = cast(func.sum(column), Float) / func.nullif(func.sum(model.days), 0)
+        period = model.week_start
+        keys = {'content': AnalyticsWeekly.content_id, 'platform': model.platform_id,
+                'pillar': PillarAnalyticsWeekly.pillar_id, 'content_type': ContentManager.content_type}
+        in_range = and_(model.week_start >= week_start(query.start), model.week_start <= query.end)
+        content_id = AnalyticsWeekly.content_id
+    else:
+        model = Analytics
+        raw = getattr(Analytics, query.metric)
+        value = {'sum': func.sum(func.coalesce(raw, 0)), 'avg': func.avg(cast(func.coalesce(raw, 0), Float)),
+                 'max': func.max(raw), 'min': func.min(raw)}[query.agg]
+        period = period_sql(Analytics.date_recorded, query.interval, dialect)
+        keys = {'content': Analytics.content_id, 'platform': Analytics.platform_id,
+                'pillar': ContentManager.content_pillar_id, 'content_type': ContentManager.content_type}
+        in_range = Analytics.date_recorded.between(query.start, query.end)
+        content_id = Analytics.content_id
+
+    key = keys[query.group_by] if query.group_by else null()
+    stmt = select(period.label('period'), key.label('key'), value.label('value')).where(in_range)
+    if query.group_by in ('pillar', 'content_type') and model is not PillarAnalyticsWeekly:
+        stmt = stmt.join(ContentManager, ContentManager.id == content_id).where(key.isnot(None))
+    return stmt.group_by(period, key) if query.group_by else stmt.group_by(period)
+
+
+def series_points(query: SeriesQuery) -> List[Dict]:
+    """
+    The query's top series as rows of key, period, value, moving_avg, growth
+    and periods (how many intervals the point stands for), ordered by series
+    then period.
+
+    Everything runs in one SQL statement. Series are ranked by their total
+    and only the top query.series are kept. Each series is then cut into at
+    most query.points consecutive runs of periods (ntile); a run becomes one
+    point at its first period, valued at the mean of its periods, so a chart
+    keeps its scale at any range. The moving average (over query.window
+    points) and growth over the previous point are window functions over
+    the downsampled points.
+    """
+    grouped = _grouped(query, db.session.get_bind().dialect.name).subquery('grouped')
+
+    totalled = select(
+        grouped,
+        func.sum(grouped.c.value).over(partition_by=grouped.c.key).label('total'),
+        func.ntile(query.points).over(partition_by=grouped.c.key, order_by=grouped.c.period).label('tile')
+    ).subquery('totalled')
+    # Window functions cannot nest, so ranking by the total takes its own level
+    ranked = select(
+        totalled,
+        func.dense_rank().over(order_by=(totalled.c.total.desc(), totalled.c.key)).label('series_rank')
+    ).subquery('ranked')
+
+    sampled = select(
+        ranked.c.key,
+        func.min(ranked.c.series_rank).label('series_rank'),
+        func.min(ranked.c.period).label('period'),
+        func.avg(cast(ranked.c.value, Float)).label('value'),
+        func.count().label('periods')
+    ).where(ranked.c.series_rank <= query.series).group_by(ranked.c.key, ranked.c.tile).subquery('sampled')
+
+    in_series = dict(partition_by=sampled.c.key, order_by=sampled.c.period)
+    previous = func.lag(sampled.c.value).over(**in_series)
+    stmt = select(
+        sampled.c.key,
+        sampled.c.period,
+        sampled.c.value,
+        func.avg(sampled.c.value).over(rows=(-(query.window - 1), 0), **in_series).label('moving_avg'),
+        ((sampled.c.value - previous) / func.nullif(previous, 0)).label('growth'),
+        sampled.c.periods
+    ).order_by(sampled.c.series_rank, sampled.c.period)
+
+    return [dict(row) for row in db.session.execute(stmt).mappings()]
+
+
+def _labels(group_by: Optional[str], keys) -> Dict:
+    if group_by in ('content', 'platform', 'pillar'):
+        model, name = {'content': (ContentManager, ContentManager.content_title),
+                       'platform': (Platform, Platform.platform_name),
+                       'pillar': (ContentPillar, ContentPillar.pillar_name)}[group_by]
+        return dict(db.session.execute(select(model.id, name).where(model.id.in_(keys))).all())
+    return {key: key if key is not None else 'all' for key in keys}
+
+
+def _round(value: Optional[float]) -> Optional[float]:
+    return round(value, 4) if value is not None else None
+
+
+def _partial_ends(query: SeriesQuery) -> tuple:
+    """Whether start and end cut through their week or month, so the first and last periods are partial"""
+    if query.interval == 'week':
+        return query.start != week_start(query.start), query.end != week_start(query.end) + timedelta(days=6)
+    if query.interval == 'month':
+        return query.start.day != 1, (query.end + timedelta(days=1)).day != 1
+    return False, False
+
+
+def analytics_series(query: SeriesQuery) -> Dict:
+    """The GET /api/analytics/series payload: one compact point list per series"""
+    series: Dict = {}
+    downsampled = False
+    for row in series_points(query):
+        points = series.setdefault(row['key'], [])
+        points.append([row['period'], _round(row['value']), _round(row['moving_avg']), _round(row['growth'])])
+        downsampled = downsampled or row['periods'] > 1
+
+    labels = _labels(query.group_by, list(series))
+    partial_first, partial_last = _partial_ends(query)
+    return {
+        'metric': query.metric,
+        'agg': query.agg,
+        'interval': query.interval,
+        'group_by': query.group_by,
+        'start': query.start,
+        'end': query.end,
+        'window': query.window,
+        'downsampled': downsampled,
+        # Weekly rollups count these periods whole, days outside the range included; raw rows only the days inside
+        'partial_first': partial_first,
+        'partial_last': partial_last,
+        'columns': list(POINT_COLUMNS),
+        'series': [{'key': key, 'label': labels.get(key), 'points': points} for key, points in series.items()]
+    }
@@ -0,0 +1,252 @@
+from datetime import date, datetime, timedelta
+from typing import Dict, Iterable, List, NamedTuple, Optional, Set, Tuple
+import json
+import logging
+import math
+
+import click
+from flask import current_app
+from flask.cli import AppGroup
+from sqlalchemy import bindparam, delete, insert, select, update
+
+from models import db, Analytics, AnalyticsBaseline, ContentManager, NicheInsights, Platform, Profile
+from versioning import bump_versions
+
+logger = logging.getLogger(__name__)
+
+STATE = ('samples', 'mean', 'm2', 'last_date', 'last_views', 'last_alert_date')
+ACTION_ITEMS = [
+    'Reply to comments while the post is getting attention',
+    'Share it to the other platforms and stories today',
+    'Plan a follow-up on the same topic within the week'
+]
+
+
+class Thresholds(NamedTuple):
+    z_score: float = 3.0  # Standard deviations above the item's mean daily views
+    growth: float = 3.0  # Times the previous day's views
+    min_samples: int = 5  # Days seen before z-scores are trusted
+    min_views: int = 100  # Smaller days are never spikes
+    cooldown_days: int = 3  # Days between spikes reported for one item and platform
+
+    @classmethod
+    def from_config(cls, config) -> 'Thresholds':
+        return cls(z_score=config.get('ANOMALY_Z_SCORE', 3.0),
+                   growth=config.get('ANOMALY_GROWTH_FACTOR', 3.0),
+                   min_samples=config.get('ANOMALY_MIN_SAMPLES', 5),
+                   min_views=config.get('ANOMALY_MIN_VIEWS', 100),
+                   cooldown_days=config.get('ANOMALY_COOLDOWN_DAYS', 3))
+
+
+class Spike(NamedTuple):
+    content_id: int
+    platform_id: int
+    date_recorded: date
+    views: int
+    mean: float
+    stddev: float
+    z_score: Optional[float]
+    growth: Optional[float]
+    confidence: float
+
+
+def welford(samples: int, mean: float, m2: float, value: float) -> Tuple[int, float, float]:
+    """Add one value to a running count, mean and sum of squared deviations"""
+    samples += 1
+    delta = value - mean
+    mean += delta / samples
+    return samples, mean, m2 + delta * (value - mean)
+
+
+def _stddev(state: Dict) -> float:
+    spread = math.sqrt(state['m2'] / (state['samples'] - 1)) if state['samples'] > 1 else 0.0
+    # Counts vary by at least their square root, so a flat history does not make any rise a spike
+    return max(spread, math.sqrt(max(state['mean'], 1.0)))
+
+
+def check(state: Dict, views: int, day: date, thresholds: Thresholds) -> Optional[Tuple]:
+    """
+    (z-score, growth, confidence 0-100) when views on day is a spike against
+    the state before it, else None. Late rows for days before the latest one
+    seen are never spikes.
+    """
+    if views < thresholds.min_views:
+        return None
+    if state['last_date'] is not None and day < state['last_date']:
+        return None
+    cooldown = timedelta(days=thresholds.cooldown_days)
+    if state['last_alert_date'] is not None and day < state['last_alert_date'] + cooldown:
+        return None
+
+    z_score = growth = None
+    if state['samples'] >= thresholds.min_samples:
+        z_score = (views - state['mean']) / _stddev(state)
+    if state['samples'] >= 2 and state['last_views']:
+        growth = views / state['last_views']
+    strength = max(z_score if z_score is not None and z_score >= thresholds.z_score else 0.0,
+                   growth if growth is not None and growth >= thresholds.growth else 0.0)
+    if not strength:
+        return None
+    # Chebyshev: at most 1/k^2 of any distribution lies k deviations out
+    return z_score, growth, 100.0 * (1.0 - 1.0 / strength ** 2)
+
+
+def _advance(state: Dict, views: int, day: date) -> None:
+    state['samples'], state['mean'], state['m2'] = welford(state['samples'], state['mean'], state['m2'], views)
+    if state['last_date'] is None or day >= state['last_date']:
+        state['last_date'], state['last_views'] = day, views
+
+
+def _thresholds() -> Thresholds:
+    return current_app.extensions.get('anomaly_thresholds') or Thresholds()
+
+
+def observe(connection, rows: Iterable[Dict], thresholds: Optional[Thresholds] = None) -> Set[str]:
+    """
+    Fold newly inserted Analytics rows (column values) into the baselines
+    of their content item and platform, on the given connection, and write
+    a NicheInsights opportunity for each spike. Returns the tables written.
+    """
+    thresholds = thresholds or _thresholds()
+    by_key: Dict[Tuple[int, int], List[Dict]] = {}
+    for row in rows:
+        by_key.setdefault((row['content_id'], row['platform_id']), []).append(row)
+    if not by_key:
+        return set()
+
+    table = AnalyticsBaseline.__table__
+    existing = {
+        (row['content_id'], row['platform_id']): dict(row)
+        for row in connection.execute(
+            select(table).where(table.c.content_id.in_({content_id for content_id, _ in by_key})).with_for_update()
+        ).mappings()
+    }
+
+    spikes: List[Spike] = []
+    updates, inserts = [], []
+    for key, key_rows in by_key.items():
+        state = existing.get(key)
+        if state is None:
+            state = {'content_id': key[0], 'platform_id': key[1], 'samples': 0, 'mean': 0.0, 'm2': 0.0,
+                     'last_date': None, 'last_views': None, 'last_alert_date': None}
+        for row in sorted(key_rows, key=lambda row: row['date_recorded']):
+            views, day = row['views'] or 0, row['date_recorded']
+            found = check(state, views, day, thresholds)
+            if found:
+                spikes.append(Spike(key[0], key[1], day, views, state['mean'], _stddev(state), *found))
+                state['last_alert_date'] = day
+            _advance(state, views, day)
+        if key in existing:
+            updates.append({'b_id': state['id'], **{f'v_{name}': state[name] for name in STATE}})
+        else:
+            inserts.append(state)
+
+    if updates:
+        values = {name: bindparam(f'v_{name}') for name in STATE}
+        connection.execute(update(table).where(table.c.id == bindparam('b_id')).values(values), updates)
+    if inserts:
+        connection.execute(insert(table), inserts)
+    written = {table.name}
+    if spikes:
+        report(connection, spikes)
+        written.add(NicheInsights.__tablename__)
+    return written
+
+
+def report(connection, spikes: List[Spike]) -> None:
+    """Write one NicheInsights opportunity per spike, under the profile's niche"""
+    niche = connection.execute(select(Profile.niche).order_by(Profile.id).limit(1)).scalar() or 'general'
+    titles = dict(connection.execute(
+        select(ContentManager.id, ContentManager.content_title)
+        .where(ContentManager.id.in_({spike.content_id for spike in spikes}))
+    ).all())
+    platforms = dict(connection.execute(
+        select(Platform.id, Platform.platform_name).where(Platform.id.in_({spike.platform_id for spike in spikes}))
+    ).all())
+
+    rows = []
+    for spike in spikes:
+        title = titles.get(spike.content_id, f'Content #{spike.content_id}')
+        platform = platforms.get(spike.platform_id, f'platform #{spike.platform_id}')
+        reasons = []
+        if spike.z_score is not None:
+            reasons.append(f'{spike.z_score:.1f} standard deviations above its usual {spike.mean:.0f} a day')
+        if spike.growth is not None:
+            reasons.append(f'{spike.growth:.1f}x the day before')
+        rows.append({
+            'niche_name': niche,
+            'insight_type': 'opportunity',
+            'title': f'"{title}" is taking off on {platform}'[:200],
+            'description': f'{spike.views} views on {spike.date_recorded.isoformat()}, ' + ' and '.join(reasons) + '.',
+            'supporting_data': json.dumps({
+                'content_id': spike.content_id, 'platform_id': spike.platform_id,
+                'date_recorded': spike.date_recorded.isoformat(), 'views': spike.views,
+                'mean': round(spike.mean, 1), 'stddev': round(spike.stddev, 1),
+                'z_score': None if spike.z_score is None else round(spike.z_score, 2),
+                'growth': None if spike.growth is None else round(spike.growth, 2)
+            }),
+            'confidence_score': round(spike.confidence, 1),
+            'action_items': json.dumps(ACTION_ITEMS),
+            'priority': 'high' if spike.confidence >= 95 else 'medium',
+            'status': 'active',
+            'expiry_date': datetime.combine(spike.date_recorded + timedelta(days=7), datetime.min.time())
+        })
+    connection.execute(insert(NicheInsights), rows)
+    logger.info('Reported %d analytics spikes', len(rows))
+
+
+def rebuild_baselines() -> int:
+    """
+    Recompute every baseline from the raw Analytics rows in one transaction,
+    without reporting spikes, e.g. after edits, deletes or compaction the
+    streaming path does not follow. Returns the number of baselines.
+    """
+    table = AnalyticsBaseline.__table__
+    with db.engine.begin() as connection:
+        alerts = {(content_id, platform_id): last_alert for content_id, platform_id, last_alert in connection.execute(
+            select(table.c.content_id, table.c.platform_id, table.c.last_alert_date)
+        )}
+        connection.execute(delete(table))
+        states: Dict[Tuple[int, int], Dict] = {}
+        stream = connection.execute(
+            select(Analytics.content_id, Analytics.platform_id, Analytics.date_recorded, Analytics.views)
+            .order_by(Analytics.content_id, Analytics.platform_id, Analytics.date_recorded)
+            .execution_options(yield_per=5000)
+        )
+        for content_id, platform_id, day, views in stream:
+            key = (content_id, platform_id)
+            state = states.get(key)
+            if state is None:
+                state = states[key] = {'content_id': content_id, 'platform_id': platform_id, 'samples': 0,
+                                       'mean': 0.0, 'm2': 0.0, 'last_date': None, 'last_views': None,
+                                       'last_alert_date': alerts.get(key)}
+            _advance(state, views or 0, day)
+        if states:
+            connection.execute(insert(table), list(states.values()))
+        bump_versions(connection, [table.name])
+    return len(states)
+
+
+anomalies_cli = AppGroup('anomalies', help='Maintain the analytics spike detector.')
+
+
+@anomalies_cli.command('rebuild')
+def rebuild_command():
+    """Recompute the per-item baselines from raw analytics."""
+    click.echo(f'Rebuilt {rebuild_baselines()} baselines')
+
+
+def init_anomalies(app) -> None:
+    """
+    Add the `flask anomalies rebuild` command and the spike thresholds.
+
+    The rollup events (rollups.py) pass every Analytics row inserted through
+    the ORM to observe() in the same transaction. Each content item and
+    platform keeps its count, mean and sum of squared deviations of daily
+    views (Welford), so the state is constant-size however long the
+    history. A day is a spike when its views are ANOMALY_Z_SCORE standard
+    deviations above the mean or ANOMALY_GROWTH_FACTOR times the previous
+    day; each spike becomes an 'opportunity' insight.
+    """
+    app.extensions['anomaly_thresholds'] = Thresholds.from_config(app.config)
+    app.cli.add_command(anomalies_cli)
@@ -5,22 +5,67 @@ from datetime import datetime, timedelta
 import os
 
 from config import config
-from models import db, Platform, Profile, ContentPillar, ContentIdea, ContentManager, Task, ContentSubtask, Analytics, TrendingTopic, ContentPerformanceAnalysis, CompetitorAnalysis, NicheInsights
+from models import db, Platform, Profile, ContentPillar, ContentIdea, ContentManager, Task, ContentSubtask, Analytics, TrendingTopic, ContentPerformanceAnalysis, CompetitorAnalysis, NicheInsights, IdeaBatch
 from claude_service import ClaudeService
+from claude_transport import claude_enabled
+from coalescing import ReplyCache
+from model_routing import ModelRouter
+from prompt_cache import PrefixRegistry
+from ai_telemetry import AITelemetry
+from idea_batches import IdeaBatchRunner
+from json_provider import init_json_provider
+from versioning import init_versioning, conditional_get
+from partitions import init_partitions
+from content_totals import init_content_totals, refresh_engagement
+from anomalies import init_anomalies
+from rollups import init_rollups, content_weeks
+from forecasting import init_forecasting, forecast_for
+from trend_scores import init_trend_scores, ranked_topics, record_trends, topic_history
+from analytics_series import SeriesError, SeriesQuery, analytics_series, range_key
+from db_pool import init_db_pool, pool_stats
+from db_routing import init_routing, primary_only
+from ai_context import AI_ROUTES, AIContextError, bulk_ideas_contexts
 from analytics_service import AnalyticsService
+from posting_times import PostingTimes
+from benchmarks import DIMENSIONS as BENCHMARK_DIMENSIONS, METRICS as BENCHMARK_METRICS, Benchmarks
+from hashtag_stats import HashtagStats
 import json
 
-def create_app(config_name='development'):
+def create_app(config_name=None):
     app = Flask(__name__)
+    config_name = config_name or os.environ.get('APP_CONFIG', 'default')
     app.config.from_object(config[config_name])
     
     # Initialize extensions
     db.init_app(app)
-    migrate = Migrate(app, db)
+    init_db_pool(app, db)
+    init_routing(app)
+    migrate = Migrate(app, db, directory=os.path.join(os.path.dirname(os.path.abspath(__file__)), 'migrations'))
     CORS(app)
+    init_json_provider(app)
+    init_versioning(app)
+    init_partitions(app)
+    init_anomalies(app)
+    init_rollups(app)
+    init_content_totals(app)
+    init_forecasting(app)
+    init_trend_scores(app)
     
     # Initialize Claude service
-    app.claude_service = ClaudeService(app.config.get('CLAUDE_API_KEY')) if app.config.get('CLAUDE_API_KEY') else None
+    app.extensions['model_router'] = ModelRouter.from_config(app.config)
+    app.extensions['prefix_registry'] = PrefixRegistry()
+    app.extensions['ai_telemetry'] = AITelemetry.from_config(app.config)
+    app.extensions['reply_cache'] = ReplyCache.from_config(app.config)
+    app.extensions['posting_times'] = PostingTimes.from_config(app.config)
+    app.extensions['benchmarks'] = Benchmarks.from_config(app.config)
+    app.extensions['hashtag_stats'] = HashtagStats.from_config(app.config)
+    app.claude_service = (ClaudeService.from_config(app.config, router=app.extensions['model_router'],
+                                                    prefixes=app.extensions['prefix_registry'],
+                                                    telemetry=app.extensions['ai_telemetry'],
+                                                    replies=app.extensions['reply_cache'])
+                          if claude_enabled(app.config) else None)
+    app.extensions['idea_batches'] = (IdeaBatchRunner.from_config(app.config, app.claude_service)
+                                      if app.claude_service else None)
     
     # API Routes
     
@@ -64,6 +109,7 @@ def create_app(config_name='development'):
     
     # Profile
     @app.route('/api/profile', methods=['GET'])
+    @primary_only
     def get_profile():
         profile = Profile.query.first()
         if not profile:
@@ -182,11 +228,34 @@ def create_app(config_name='development'):
         db.session.commit()
         return '', 204
     
+    # Bulk idea generation (Message Batches); outside /api/ai/ so both deployments serve it from Flask
+    @app.route('/api/idea-batches', methods=['POST'])
+    def create_idea_batch():
+        runner = current_app.extensions['idea_batches']
+        if not runner:
+            return jsonify({'error': 'Claude API key not configured'}), 500
+
+        job = runner.submit(bulk_ideas_contexts(request.get_json(silent=True) or {}))
+        runner.start_polling(current_app._get_current_object(), job.id)
+        return jsonify(job.to_dict()), 202
+    
+    @app.route('/api/idea-batches/<int:job_id>', methods=['GET'])
+    @primary_only
+    def get_idea_batch(job_id):
+        job = IdeaBatch.query.get_or_404(job_id)
+        runner = current_app.extensions['idea_batches']
+        # Also picks up batches whose polling thread died with its worker
+        if runner:
+            job = runner.poll(job)
+        return jsonify(job.to_dict())
+    
     # Content Manager
     @app.route('/api/content-manager', methods=['GET'])
+    @conditional_get('content_manager', 'content_platforms', 'platforms', 'analytics_weekly')
     def get_content_manager():
         content_items = ContentManager.query.all()
-        return jsonify([item.to_dict() for item in content_items])
+        p_ranks = current_app.extensions['benchmarks'].p_ranks(content_items)
+        return jsonify([{**item.to_dict(), 'p_rank': p_rank} for item, p_rank in zip(content_items, p_ranks)])
     
     @app.route('/api/content-manager', methods=['POST'])
     def create_content_item():
@@ -231,6 +300,7 @@ def create_app(config_name='development'):
             saves=parse_numeric(data.get('saves'), 0),
             retention_rate=parse_numeric(data.get('retention_rate'), 0.0)
         )
+        refresh_engagement(content_item)
         db.session.add(content_item)
         db.session.flush()  # Flush to get the ID
         
@@ -279,12 +349,15 @@ def create_app(config_name='development'):
         content_item.content_link = data.get('content_link', content_item.content_link)
         content_item.hashtags_used = data.get('hashtags_used', content_item.hashtags_used)
         content_item.notes = data.get('notes', content_item.notes)
-        content_item.views = parse_numeric(data.get('views'), content_item.views)
-        content_item.likes = parse_numeric(data.get('likes'), content_item.likes)
-        content_item.shares = parse_numeric(data.get('shares'), content_item.shares)
-        content_item.comments = parse_numeric(data.get('comments'), content_item.comments)
-        content_item.saves = parse_numeric(data.get('saves'), content_item.saves)
-        content_item.retention_rate = parse_numeric(data.get('retention_rate'), content_item.retention_rate)
+        # Once analytics are recorded the totals are theirs, kept by content_totals.py
+        if not content_item.analytics_days:
+            content_item.views = parse_numeric(data.get('views'), content_item.views)
+            content_item.likes = parse_numeric(data.get('likes'), content_item.likes)
+            content_item.shares = parse_numeric(data.get('shares'), content_item.shares)
+            content_item.comments = parse_numeric(data.get('comments'), content_item.comments)
+            content_item.saves = parse_numeric(data.get('saves'), content_item.saves)
+            content_item.retention_rate = parse_numeric(data.get('retention_rate'), content_item.retention_rate)
+            refresh_engagement(content_item)
         content_item.updated_at = datetime.utcnow()
         
         # Handle platform assignments if provided
@@ -390,6 +463,7 @@ def create_app(config_name='development'):
     
     # Tasks
     @app.route('/api/tasks', methods=['GET'])
+    @conditional_get('tasks')
     def get_tasks():
         tasks = Task.query.all()
         return jsonify([task.to_dict() for task in tasks])
@@ -450,9 +524,67 @@ def create_app(config_name='development'):
         days = request.args.get('days', 7, type=int)
         start_date = datetime.utcnow().date() - timedelta(days=days)
         
+        if request.args.get('granularity') == 'week':
+            # Weekly totals per content and platform, from the rollup table
+            return jsonify(content_weeks(start_date))
+        
         analytics = Analytics.query.filter(Analytics.date_recorded >= start_date).all()
         return jsonify([analytic.to_dict() for analytic in analytics])
     
+    @app.route('/api/analytics/series', methods=['GET'])
+    # The default range ends today, so the same URL covers different days over time
+    @conditional_get('analytics', 'analytics_weekly', 'pillar_analytics_weekly', 'content_manager', 'platforms', 'content_pillars',
+                     key=lambda: range_key(request.args, today=datetime.utcnow().date()))
+    def get_analytics_series():
+        # Chart-ready series aggregated, downsampled and smoothed in SQL
+        try:
+            query = SeriesQuery.from_args(request.args, today=datetime.utcnow().date())
+        except SeriesError as e:
+            return jsonify({'error': str(e)}), 400
+        return jsonify(analytics_series(query))
+    
+    @app.route('/api/analytics/posting-times', methods=['GET'])
+    def get_posting_times():
+        # Engagement by hour of the week we published at, learned from our own analytics
+        platform_id = request.args.get('platform_id', type=int)
+        content_type = request.args.get('content_type') or None
+        posting_times = current_app.extensions['posting_times']
+        learned = posting_times.best_windows(platform_id, content_type, top=request.args.get('top', 3, type=int))
+        if learned is None:
+            return jsonify({'error': f'Fewer than {posting_times.min_posts} published posts with analytics'}), 404
+        learned['heatmap'] = posting_times.heatmap(platform_id, content_type)
+        return jsonify(learned)
+    
+    @app.route('/api/analytics/forecasts/<int:content_id>', methods=['GET'])
+    @primary_only
+    def get_content_forecast(content_id):
+        # Day-7 and day-30 views and likes from the item's own curve so far
+        ContentManager.query.get_or_404(content_id)
+        forecast = forecast_for(content_id)
+        db.session.commit()
+        if forecast is None:
+            return jsonify({'error': 'No analytics recorded for this content yet'}), 404
+        return jsonify(forecast.to_dict())
+    
+    @app.route('/api/analytics/benchmarks', methods=['GET'])
+    @conditional_get('content_manager', 'analytics_weekly')
+    def get_benchmarks():
+        # Percentiles of our own content per group, e.g. median engagement per content type
+        dimension = request.args.get('dimension', 'content_type')
+        metric = request.args.get('metric', 'engagement_rate')
+        if dimension not in BENCHMARK_DIMENSIONS or metric not in BENCHMARK_METRICS:
+            return jsonify({'error': f"dimension must be one of {', '.join(BENCHMARK_DIMENSIONS)} and "
+                                     f"metric one of {', '.join(BENCHMARK_METRICS)}"}), 400
+        groups = current_app.extensions['benchmarks'].summary(dimension, metric)
+        return jsonify({'dimension': dimension, 'metric': metric, 'groups': groups})
+    
+    @app.route('/api/analytics/benchmarks/<int:content_id>', methods=['GET'])
+    @conditional_get('content_manager', 'analytics_weekly')
+    def get_content_benchmarks(content_id):
+        # Where one item ranks against the rest of our content, per group and platform
+        content = ContentManager.query.get_or_404(content_id)
+        return jsonify({'content_id': content_id, **current_app.extensions['benchmarks'].item_ranks(content)})
+    
     @app.route('/api/analytics', methods=['POST'])
     def create_analytics():
         data = request.get_json()
@@ -474,158 +606,30 @@ def create_app(config_name='development'):
         return jsonify(analytics.to_dict()), 201
     
     # Claude AI Integration Routes
-    @app.route('/api/ai/generate-strategy', methods=['POST'])
-    def generate_strategy():
-        if not current_app.claude_service:
-            return jsonify({'error': 'Claude API key not configured'}), 500
-        
-        # Get profile data
-        profile = Profile.query.first()
-        if not profile:
-            return jsonify({'error': 'Profile not found'}), 404
-        
-        # Get recent analytics
-        analytics = Analytics.query.filter(
-            Analytics.date_recorded >= datetime.utcnow().date() - timedelta(days=14)
-        ).all()
-        
-        # Get platforms
-        platforms = Platform.query.all()
-        
-        strategy = current_app.claude_service.generate_content_strategy(
-            profile.to_dict(),
-            [a.to_dict() for a in analytics],
-            [p.to_dict() for p in platforms]
-        )
-        
-        return jsonify(strategy)
-    
-    @app.route('/api/ai/generate-ideas', methods=['POST'])
-    def generate_ideas():
-        if not current_app.claude_service:
-            return jsonify({'error': 'Claude API key not configured'}), 500
-        
-        data = request.get_json()
-        pillar_id = data.get('pillar_id')
-        
-        pillar = ContentPillar.query.get_or_404(pillar_id)
-        profile = Profile.query.first()
-        
-        # Get recent performance data for similar content
-        recent_performance = Analytics.query.filter(
-            Analytics.date_recorded >= datetime.utcnow().date() - timedelta(days=30)
-        ).all()
-        
-        ideas = current_app.claude_service.generate_content_ideas(
-            pillar.pillar_name,
-            profile.target_audience if profile else "General audience",
-            [p.to_dict() for p in recent_performance]
-        )
-        
-        return jsonify(ideas)
-    
-    @app.route('/api/ai/optimize-content', methods=['POST'])
-    def optimize_content():
-        if not current_app.claude_service:
-            return jsonify({'error': 'Claude API key not configured'}), 500
-        
-        data = request.get_json()
-        content_id = data.get('content_id')
-        platform = data.get('platform')
-        
-        content = ContentManager.query.get_or_404(content_id)
-        
-        # Get platform analytics
-        platform_obj = Platform.query.filter_by(platform_name=platform).first()
-        if not platform_obj:
-            return jsonify({'error': 'Platform not found'}), 404
-        
-        analytics = Analytics.query.filter_by(platform_id=platform_obj.id).all()
-        
-        optimized = current_app.claude_service.optimize_content(
-            content.to_dict(),
-            platform,
-            [a.to_dict() for a in analytics]
-        )
-        
-        return jsonify(optimized)
-    
-    @app.route('/api/ai/analyze-performance', methods=['POST'])
-    def analyze_performance():
-        if not current_app.claude_service:
-            return jsonify({'error': 'Claude API key not configured'}), 500
-        
-        # Get all content with analytics
-        content_items = ContentManager.query.all()
-        platforms = Platform.query.all()
-        
-        analysis = current_app.claude_service.analyze_performance(
-            [c.to_dict() for c in content_items],
-            [p.platform_name for p in platforms]
-        )
-        
-        return jsonify(analysis)
-    
-    @app.route('/api/ai/weekly-plan', methods=['POST'])
-    def generate_weekly_plan():
-        if not current_app.claude_service:
-            return jsonify({'error': 'Claude service not available'}), 503
-        
-        data = request.get_json()
-        
-        try:
-            # Get pillars data
-            pillars = ContentPillar.query.all()
-            pillars_data = [pillar.to_dict() for pillar in pillars]
-            
-            # Get platforms
-            platforms = data.get('platforms', [])
-            goals = data.get('goals', '')
-            
-            result = current_app.claude_service.generate_weekly_content_plan(
-                pillars_data, platforms, goals
-            )
-            
-            return jsonify(result)
-            
-        except Exception as e:
-            return jsonify({'error': str(e)}), 500
-    
-    # AI Content Field Generation
-    @app.route('/api/ai/generate-content-field', methods=['POST'])
-    def generate_content_field():
-        if not current_app.claude_service:
-            return jsonify({'error': 'Claude service not available'}), 503
-        
-        data = request.get_json()
-        field_type = data.get('field_type')  # 'caption', 'hook', 'script', 'tone', 'call_to_action', or 'hashtags'
-        content_data = data.get('content_data', {})
-        
-        if not field_type or field_type not in ['caption', 'hook', 'script', 'tone', 'call_to_action', 'hashtags']:
-            return jsonify({'error': 'Invalid field_type. Must be caption, hook, script, tone, call_to_action, or hashtags'}), 400
-        
-        try:
-            # Get profile data
-            profile = Profile.query.first()
-            profile_data = profile.to_dict() if profile else {}
-            
-            # Get pillar data if specified
-            pillar_data = None
-            if content_data.get('content_pillar_id'):
-                pillar = ContentPillar.query.get(content_data['content_pillar_id'])
-                pillar_data = pillar.to_dict() if pillar else None
-            
-            result = current_app.claude_service.generate_content_field(
-                field_type, content_data, profile_data, pillar_data
-            )
-            
+    # The async stack (asgi.py) serves the same endpoints on AsyncAnthropic
+    @app.errorhandler(AIContextError)
+    def handle_ai_context_error(error):
+        return jsonify({'error': error.message}), error.status
+
+    def ai_view(route):
+        def view():
+            if not current_app.claude_service:
+                return route.unavailable_response()
+            args = (request.get_json(),) if route.with_body else ()
+            try:
+                context = route.load(*args)
+                result = getattr(current_app.claude_service, route.method)(**route.kwargs(context, request.headers))
+            except Exception as e:
+                return route.error_response(e)
             return jsonify(result)
-            
-        except Exception as e:
-            return jsonify({'error': str(e)}), 500
+        return view
+
+    for route in AI_ROUTES:
+        app.add_url_rule(route.path, route.endpoint, ai_view(route), methods=['POST'])
     
     # Dashboard summary
     @app.route('/api/dashboard/summary', methods=['GET'])
+    @conditional_get('platforms', 'content_pillars', 'content_ideas', 'content_manager', 'content_platforms', 'tasks')
     def get_dashboard_summary():
         # Get counts
         platforms_count = Platform.query.count()
@@ -656,48 +660,46 @@ def create_app(config_name='development'):
     
     # Advanced Analytics Endpoints
     @app.route('/api/analytics/trending-topics', methods=['GET'])
+    @primary_only
     def get_trending_topics():
         """Get trending topics for the user's niche"""
         niche = request.args.get('niche', 'general')
         platforms = request.args.getlist('platforms') or ['instagram', 'tiktok', 'youtube']
         
-        analytics_service = AnalyticsService(current_app.claude_service)
+        analytics_service = AnalyticsService(current_app.claude_service, posting_times=current_app.extensions['posting_times'])
         trending_data = analytics_service.analyze_trending_topics(niche, platforms)
         
-        # Store in database for future reference
-        for trend in trending_data[:5]:  # Store top 5 trends
-            existing = TrendingTopic.query.filter_by(topic=trend['topic']).first()
-            if existing:
-                existing.trend_score = trend['trend_score']
-                existing.volume_24h = trend['volume_24h']
-                existing.engagement_rate = trend['engagement_rate']
-                existing.growth_rate = trend['growth_rate']
-                existing.updated_at = datetime.utcnow()
-            else:
-                trending_topic = TrendingTopic(
-                    topic=trend['topic'],
-                    hashtags=json.dumps(trend['hashtags']),
-                    platforms=json.dumps(trend['platforms']),
-                    trend_score=trend['trend_score'],
-                    niche_category=niche,
-                    volume_24h=trend['volume_24h'],
-                    engagement_rate=trend['engagement_rate'],
-                    growth_rate=trend['growth_rate']
-                )
-                db.session.add(trending_topic)
-        
+        # Keep the history and momentum of each topic, and rank by momentum-adjusted score
+        config = current_app.config
+        topics = record_trends(niche, trending_data, half_life_hours=config['TREND_HALF_LIFE_HOURS'],
+                               horizon_hours=config['TREND_HORIZON_HOURS'], stale_hours=config['TREND_STALE_HOURS'])
         db.session.commit()
+        
+        for trend, topic in zip(trending_data, topics):
+            trend.update(id=topic.id, decayed_score=topic.decayed_score, velocity=topic.velocity,
+                         acceleration=topic.acceleration)
+        trending_data.sort(key=lambda trend: trend['decayed_score'], reverse=True)
         return jsonify(trending_data)
     
+    @app.route('/api/analytics/trending-topics/<int:topic_id>/history', methods=['GET'])
+    @conditional_get('trending_topics', 'trend_snapshots')
+    def get_trending_topic_history(topic_id):
+        # Snapshots of one topic, oldest first
+        topic = TrendingTopic.query.get_or_404(topic_id)
+        snapshots = topic_history(topic_id, limit=min(request.args.get('limit', 100, type=int), 1000))
+        return jsonify({**topic.to_dict(), 'history': [snapshot.to_dict() for snapshot in snapshots]})
+    
     @app.route('/api/analytics/performance-prediction', methods=['POST'])
     def predict_content_performance():
         """Predict how well content will perform"""
         data = request.get_json()
         content_id = data.get('content_id')
         
+        forecast = None
         if content_id:
             content = ContentManager.query.get_or_404(content_id)
             content_data = content.to_dict()
+            forecast = forecast_for(content_id)
         else:
             content_data = data.get('content_data', {})
         
@@ -705,8 +707,9 @@ def create_app(config_name='development'):
         historical_content = ContentManager.query.filter_by(status='published').all()
         historical_data = [c.to_dict() for c in historical_content]
         
-        analytics_service = AnalyticsService(current_app.claude_service)
-        prediction = analytics_service.predict_content_performance(content_data, historical_data)
+        analytics_service = AnalyticsService(current_app.claude_service, posting_times=current_app.extensions['posting_times'])
+        prediction = analytics_service.predict_content_performance(
+            content_data, historical_data, forecast=forecast.to_dict() if forecast else None)
         
         # Store analysis if content_id provided
         if content_id:
@@ -727,6 +730,7 @@ def create_app(config_name='development'):
         return jsonify(prediction)
     
     @app.route('/api/analytics/competitor-analysis', methods=['GET'])
+    @primary_only
     def get_competitor_analysis():
         """Get competitor analysis for the specified niche"""
         niche = request.args.get('niche', 'general')
@@ -768,7 +772,7 @@ def create_app(config_name='development'):
                         return float(numbers[0])
                 return 0.5  # Default fallback
         
-        analytics_service = AnalyticsService(current_app.claude_service)
+        analytics_service = AnalyticsService(current_app.claude_service, posting_times=current_app.extensions['posting_times'])
         competitor_data = analytics_service.analyze_competitors(niche, competitors if competitors else None)
         
         # Store competitor data
@@ -809,6 +813,7 @@ def create_app(config_name='development'):
         return jsonify(competitor_data)
     
     @app.route('/api/analytics/niche-insights', methods=['GET'])
+    @primary_only
     def get_niche_insights():
         """Get AI-powered insights about the user's niche"""
         niche = request.args.get('niche', 'general')
@@ -817,7 +822,8 @@ def create_app(config_name='development'):
         user_content = ContentManager.query.all()
         user_content_data = [c.to_dict() for c in user_content]
         
-        analytics_service = AnalyticsService(current_app.claude_service)
+        analytics_service = AnalyticsService(current_app.claude_service, posting_times=current_app.extensions['posting_times'],
+                                             benchmarks=current_app.extensions['benchmarks'])
         insights = analytics_service.generate_niche_insights(niche, user_content_data)
         
         # Store insights
@@ -844,6 +850,7 @@ def create_app(config_name='development'):
         return jsonify(insights)
     
     @app.route('/api/analytics/content-analysis/<int:content_id>', methods=['GET'])
+    @primary_only
     def get_content_analysis(content_id):
         """Get detailed analysis for a specific content item"""
         content = ContentManager.query.get_or_404(content_id)
@@ -854,11 +861,13 @@ def create_app(config_name='development'):
             return jsonify(analysis.to_dict())
         
         # Generate new analysis
-        analytics_service = AnalyticsService(current_app.claude_service)
+        analytics_service = AnalyticsService(current_app.claude_service, posting_times=current_app.extensions['posting_times'])
         historical_content = ContentManager.query.filter_by(status='published').all()
         historical_data = [c.to_dict() for c in historical_content]
         
-        prediction = analytics_service.predict_content_performance(content.to_dict(), historical_data)
+        forecast = forecast_for(content_id)
+        prediction = analytics_service.predict_content_performance(
+            content.to_dict(), historical_data, forecast=forecast.to_dict() if forecast else None)
         
         # Store the analysis
         analysis = ContentPerformanceAnalysis(
@@ -878,15 +887,13 @@ def create_app(config_name='development'):
         return jsonify(analysis.to_dict())
     
     @app.route('/api/analytics/dashboard', methods=['GET'])
+    @conditional_get('trending_topics', 'niche_insights', 'content_performance_analysis', 'content_manager', 'competitor_analysis')
     def get_analytics_dashboard():
         """Get comprehensive analytics dashboard data"""
         niche = request.args.get('niche', 'general')
         
         # Get trending topics
-        trending_topics = TrendingTopic.query.filter_by(
-            niche_category=niche,
-            is_active=True
-        ).order_by(TrendingTopic.trend_score.desc()).limit(5).all()
+        trending_topics = ranked_topics(niche, limit=5)
         
         # Get recent insights
         recent_insights = NicheInsights.query.filter_by(
@@ -918,48 +925,29 @@ def create_app(config_name='development'):
         hashtags = data.get('hashtags', [])
         niche = data.get('niche', 'general')
         
-        analytics_service = AnalyticsService(current_app.claude_service)
-        
-        # Get trending topics to find related hashtags
-        trending_topics = TrendingTopic.query.filter_by(
-            niche_category=niche,
-            is_active=True
-        ).all()
+        stats = current_app.extensions['hashtag_stats']
         
         hashtag_analysis = {
             'input_hashtags': hashtags,
-            'trending_hashtags': [],
-            'suggested_hashtags': [],
+            # Strongest tags of the niche's active trending topics, by decayed score
+            'trending_hashtags': stats.trending(niche, 10),
+            # Tags used alongside these on engaging posts and trending topics
+            'suggested_hashtags': stats.suggest(hashtags, niche, 5),
             'hashtag_scores': {},
+            'hashtag_stats': {},
+            'top_hashtags': stats.top(10),
             'optimization_tips': []
         }
         
-        # Extract trending hashtags
-        for topic in trending_topics:
-            if topic.hashtags:
-                trending_hashtags = json.loads(topic.hashtags)
-                hashtag_analysis['trending_hashtags'].extend(trending_hashtags)
-        
-        # Remove duplicates and limit
-        hashtag_analysis['trending_hashtags'] = list(set(hashtag_analysis['trending_hashtags']))[:10]
-        
-        # Generate suggestions based on niche and trends
-        hashtag_analysis['suggested_hashtags'] = [
-            f'#{niche}tips',
-            f'#{niche}inspiration',
-            f'#{niche}community',
-            '#trending2024',
-            '#viral'
-        ]
-        
-        # Score input hashtags
+        # Score input hashtags from our own engagement, usage and trends
         for hashtag in hashtags:
-            score = 50  # Base score
-            if hashtag in hashtag_analysis['trending_hashtags']:
-                score += 30
-            if any(keyword in hashtag.lower() for keyword in ['trending', 'viral', '2024']):
-                score += 20
-            hashtag_analysis['hashtag_scores'][hashtag] = min(score, 100)
+            tag_stats = stats.score(hashtag, niche)
+            hashtag_analysis['hashtag_scores'][hashtag] = tag_stats.pop('score')
+            hashtag_analysis['hashtag_stats'][hashtag] = tag_stats
+        
+        if not hashtag_analysis['suggested_hashtags']:
+            # Nothing recorded yet to learn from
+            hashtag_analysis['suggested_hashtags'] = [f'#{niche}tips', f'#{niche}inspiration', f'#{niche}community']
         
         hashtag_analysis['optimization_tips'] = [
             "Use a mix of popular and niche-specific hashtags",
@@ -969,11 +957,54 @@ def create_app(config_name='development'):
         ]
         
         return jsonify(hashtag_analysis)
+    
+    # Operational stats
+    @app.route('/api/stats/db-pool', methods=['GET'])
+    def get_db_pool_stats():
+        """Connection pool metrics: checked-out, overflow and checkout wait time"""
+        return jsonify({
+            (bind_key or 'primary'): pool_stats(engine)
+            for bind_key, engine in db.engines.items()
+        })
+
+    @app.route('/api/stats/ai-routing', methods=['GET'])
+    def get_ai_routing_stats():
+        """Model routing per AI task: current tier, p95 latency per tier and degradations"""
+        return jsonify(current_app.extensions['model_router'].snapshot())
+
+    @app.route('/api/stats/prompt-prefixes', methods=['GET'])
+    def get_prompt_prefix_stats():
+        """Cacheable prompt prefixes: how often each repeats and the cache tokens Anthropic reports"""
+        return jsonify(current_app.extensions['prefix_registry'].snapshot())
+
+    @app.route('/api/stats/ai-calls', methods=['GET'])
+    def get_ai_call_stats():
+        """Per AI task: rolling p50/p95/p99 latency and time to first token, tokens, retries, cache hits, cost"""
+        return jsonify(current_app.extensions['ai_telemetry'].summary())
+
+    @app.route('/metrics', methods=['GET'])
+    def get_metrics():
+        """AI call metrics in Prometheus text format (per worker process)"""
+        return current_app.response_class(current_app.extensions['ai_telemetry'].prometheus(),
+                                          mimetype='text/plain; version=0.0.4')
 
     return app
 
+def prepare_database(app) -> None:
+    """
+    Create missing tables and apply the migrations; servers run this once,
+    before starting workers (gunicorn.conf.py, hypercorn.conf.py)
+    """
+    from flask_migrate import upgrade
+    with app.app_context():
+        db.create_all()
+        # create_all never alters existing tables; the migrations add new columns and indexes
+        upgrade()
+        for engine in db.engines.values():
+            engine.dispose()
+
 if __name__ == '__main__':
     app = create_app()
     with app.app_context():
         db.create_all()
-    app.run(debug=True, host='0.0.0.0', port=5000) 
\ No newline at end of file
+    app.run(debug=app.debug, host='0.0.0.0', port=5000, threaded=True) 
\ No newline at end of file
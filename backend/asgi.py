@@ -0,0 +1,14 @@
+#!/usr/bin/env python3
+"""
+AI Content Strategist Backend
+ASGI entry point: /api/ai/* on the async AI app, everything else on Flask
+(hypercorn asgi:app -c file:hypercorn.conf.py)
+"""
+
+from app import create_app
+from ai_app import create_ai_app, mount_ai_app
+
+# Tables and migrations are set up once by hypercorn.conf.py, not per worker
+flask_app = create_app('production')
+
+app = mount_ai_app(create_ai_app(flask_app), flask_app)
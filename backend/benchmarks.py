@@ -0,0 +1,436 @@
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+from functools import reduce
+from typing import Dict, Iterable, List, Optional, Tuple
+import logging
+import threading
+import time
+
+import numpy as np
+from flask import current_app
+from sqlalchemy import func, select
+
+from models import db, Analytics, AnalyticsWeekly, ContentManager
+from versioning import get_versions
+
+logger = logging.getLogger(__name__)
+
+METRICS = ('views', 'likes', 'engagement_rate')
+# Groups content is benchmarked within; 'all' is every item with analytics
+DIMENSIONS = ('all', 'content_type', 'content_format', 'pillar', 'platform')
+INTERACTIONS = ('likes', 'comments', 'shares', 'saves')
+QUANTILES = (0.1, 0.25, 0.5, 0.75, 0.9)
+SOURCE_TABLES = ('content_manager', 'analytics_weekly')
+
+# (dimension, group value, metric)
+Key = Tuple[str, object, str]
+
+
+class TDigest:
+    """
+    Mergeable quantile sketch: values are kept as at most ~compression
+    weighted centroids, small at the tails and larger towards the median,
+    so extreme quantiles stay accurate in constant space.
+
+    Adding and merging both concatenate centroids and recompress them in one
+    vectorised pass: sorted centroids are bucketed by the arcsine scale
+    function of their cumulative quantile and each bucket collapses into one
+    centroid. Merging two digests is therefore the same cost as
+    compressing, which is what lets chunks be sketched in parallel.
+    """
+
+    def __init__(self, compression: float = 100.0):
+        self.compression = compression
+        self.means = np.empty(0)
+        self.weights = np.empty(0)
+        self.minimum, self.maximum = np.inf, -np.inf
+
+    @property
+    def count(self) -> float:
+        return float(self.weights.sum())
+
+    def update(self, values: Iterable[float]) -> 'TDigest':
+        values = np.asarray(values, dtype=float)
+        if values.size:
+            self.minimum = min(self.minimum, float(values.min()))
+            self.maximum = max(self.maximum, float(values.max()))
+            self._compress(np.concatenate([self.means, values]), np.concatenate([self.weights, np.ones(values.size)]))
+        return self
+
+    def merge(self, other: 'TDigest') -> 'TDigest':
+        if other.weights.size:
+            self.minimum, self.maximum = min(self.minimum, other.minimum), max(self.maximum, other.maximum)
+            self._compress(np.concatenate([self.means, other.means]), np.concatenate([self.weights, other.weights]))
+        return self
+
+    def _compress(self, means: np.ndarray, weights: np.ndarray) -> None:
+        order = np.argsort(means, kind='stable')
+        means, weights = means[order], weights[order]
+        cumulative = np.cumsum(weights)
+        quantiles = (cumulative - weights / 2) / cumulative[-1]
+        # k1 scale: one unit of k holds few values near q = 0 and 1, many near the median
+        scale = self.compression / (2 * np.pi) * np.arcsin(2 * quantiles - 1)
+        buckets = np.floor(scale - scale[0]).astype(np.int64)
+        starts = np.flatnonzero(np.r_[True, np.diff(buckets) != 0])
+        self.weights = np.add.reduceat(weights, starts)
+        self.means = np.add.reduceat(means * weights, starts) / self.weights
+
+    def _positions(self) -> Tuple[np.ndarray, np.ndarray]:
+        """Centroid means and the quantile at each, bracketed by the exact min and max"""
+        cumulative = np.cumsum(self.weights)
+        quantiles = (cumulative - self.weights / 2) / cumulative[-1]
+        return np.r_[self.minimum, self.means, self.maximum], np.r_[0.0, quantiles, 1.0]
+
+    def quantile(self, q: float) -> Optional[float]:
+        if not self.weights.size:
+            return None
+        values, quantiles = self._positions()
+        return float(np.interp(q, quantiles, values))
+
+    def rank(self, value: float) -> Optional[float]:
+        """Fraction of values below value, counting ties as half"""
+        if not self.weights.size:
+            return None
+        if self.minimum == self.maximum:
+            return 0.5 if value == self.minimum else float(value > self.minimum)
+        values, quantiles = self._positions()
+        return float(np.interp(value, values, quantiles))
+
+
+class Digest:
+    """
+    Quantiles of values that can be replaced: one t-digest of every value
+    added and one of every value retracted. The rank of a value is the
+    difference of the two cumulative counts below it, so an item whose
+    totals changed is taken out and added again without a rebuild. Error
+    grows with the retracted weight, which a rebuild resets.
+    """
+
+    def __init__(self, compression: float = 100.0):
+        self.added = TDigest(compression)
+        self.removed = TDigest(compression)
+
+    @property
+    def count(self) -> float:
+        return self.added.count - self.removed.count
+
+    @staticmethod
+    def _below(digest: TDigest, values: np.ndarray) -> np.ndarray:
+        """Weight of digest below each of values, ties counting half"""
+        if not digest.weights.size:
+            return np.zeros(values.shape)
+        if digest.minimum == digest.maximum:
+            return digest.count * np.where(values == digest.minimum, 0.5, (values > digest.minimum).astype(float))
+        positions, quantiles = digest._positions()
+        return digest.count * np.interp(values, positions, quantiles)
+
+    def _ranks(self, values: np.ndarray) -> np.ndarray:
+        below = self._below(self.added, values) - self._below(self.removed, values)
+        return np.clip(below / self.count, 0.0, 1.0)
+
+    def rank(self, value: float) -> Optional[float]:
+        if self.count < 0.5:
+            return None
+        if not self.removed.weights.size:
+            return self.added.rank(value)
+        return float(self._ranks(np.array([value]))[0])
+
+    def quantile(self, q: float) -> Optional[float]:
+        if self.count < 0.5:
+            return None
+        if not self.removed.weights.size:
+            return self.added.quantile(q)
+        values = np.unique(np.r_[self.added._positions()[0], self.removed._positions()[0]])
+        return float(np.interp(q, np.maximum.accumulate(self._ranks(values)), values))
+
+
+def _engagement(views: np.ndarray, interactions: np.ndarray) -> np.ndarray:
+    return np.divide(interactions * 100.0, views, out=np.zeros_like(views, dtype=float), where=views > 0)
+
+
+def _sketch_chunk(chunk: Dict[str, np.ndarray], dimensions: Tuple[str, ...], compression: float) -> Dict[Key, TDigest]:
+    """Digests of one chunk of samples, per group of each dimension and metric"""
+    digests: Dict[Key, TDigest] = {}
+    for dimension in dimensions:
+        groups = chunk[dimension]
+        present = np.array([group is not None for group in groups], dtype=bool)
+        if not present.any():
+            continue
+        labels, inverse = np.unique(groups[present].astype(str), return_inverse=True)
+        originals = {str(group): group for group in groups[present]}
+        for index, label in enumerate(labels):
+            members = np.flatnonzero(present)[inverse == index]
+            for metric in METRICS:
+                key = (dimension, originals[label], metric)
+                digests[key] = TDigest(compression).update(chunk[metric][members])
+    return digests
+
+
+def _merge_all(parts: Iterable[Dict[Key, TDigest]]) -> Dict[Key, TDigest]:
+    def combine(merged: Dict[Key, TDigest], part: Dict[Key, TDigest]) -> Dict[Key, TDigest]:
+        for key, digest in part.items():
+            if key in merged:
+                merged[key].merge(digest)
+            else:
+                merged[key] = digest
+        return merged
+    return reduce(combine, parts, {})
+
+
+def sketch(samples: Dict[str, np.ndarray], dimensions: Tuple[str, ...], compression: float = 100.0,
+           chunk_size: int = 5000, workers: int = 4) -> Dict[Key, TDigest]:
+    """Digests of all samples (column arrays), sketched in chunks on a thread pool and merged"""
+    size = len(samples[METRICS[0]])
+    chunks = [{name: column[start:start + chunk_size] for name, column in samples.items()}
+              for start in range(0, size, chunk_size)]
+    if len(chunks) <= 1 or workers <= 1:
+        return _merge_all(_sketch_chunk(chunk, dimensions, compression) for chunk in chunks)
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        return _merge_all(pool.map(lambda chunk: _sketch_chunk(chunk, dimensions, compression), chunks))
+
+
+def _platform_totals(content_ids=None):
+    """Per content item and platform totals from the weekly rollups"""
+    interactions = sum(getattr(AnalyticsWeekly, name) for name in INTERACTIONS)
+    stmt = (
+        select(AnalyticsWeekly.content_id, AnalyticsWeekly.platform_id, func.sum(AnalyticsWeekly.views),
+               func.sum(AnalyticsWeekly.likes), func.sum(interactions))
+        .group_by(AnalyticsWeekly.content_id, AnalyticsWeekly.platform_id)
+    )
+    if content_ids is not None:
+        stmt = stmt.where(AnalyticsWeekly.content_id.in_(content_ids))
+    return db.session.execute(stmt).all()
+
+
+def _samples(content_ids=None) -> Tuple[Dict[int, tuple], Dict[int, List[tuple]]]:
+    """
+    Sample rows of the given content (all when None): per item its groups
+    and totals, and per item its (platform, views, likes, interactions)
+    on each platform.
+    """
+    stmt = (
+        select(ContentManager.id, ContentManager.content_type, ContentManager.content_format,
+               ContentManager.content_pillar_id, ContentManager.views, ContentManager.likes,
+               ContentManager.engagement_rate)
+        .where(ContentManager.analytics_days > 0)
+    )
+    if content_ids is not None:
+        stmt = stmt.where(ContentManager.id.in_(content_ids))
+    items = {row[0]: tuple(row[1:]) for row in db.session.execute(stmt)}
+    platforms: Dict[int, List[tuple]] = {}
+    for content_id, platform_id, views, likes, interactions in _platform_totals(content_ids):
+        platforms.setdefault(content_id, []).append((platform_id, views or 0, likes or 0, interactions or 0))
+    return items, platforms
+
+
+def _columns(items: Iterable[tuple], platforms: Iterable[tuple]) -> Tuple[Dict[str, np.ndarray], Dict[str, np.ndarray]]:
+    """Sample rows as the column arrays sketch() takes, for the content dimensions and for platforms"""
+    items, platforms = list(items), list(platforms)
+    content = {
+        'all': np.full(len(items), 'all', dtype=object),
+        'content_type': np.array([row[0] for row in items], dtype=object),
+        'content_format': np.array([row[1] for row in items], dtype=object),
+        'pillar': np.array([row[2] for row in items], dtype=object),
+        'views': np.array([row[3] or 0 for row in items], dtype=float),
+        'likes': np.array([row[4] or 0 for row in items], dtype=float),
+        'engagement_rate': np.array([row[5] or 0.0 for row in items], dtype=float)
+    }
+    views = np.array([row[1] for row in platforms], dtype=float)
+    per_platform = {
+        'platform': np.array([row[0] for row in platforms], dtype=object),
+        'views': views,
+        'likes': np.array([row[2] for row in platforms], dtype=float),
+        'engagement_rate': _engagement(views, np.array([row[3] for row in platforms], dtype=float))
+    }
+    return content, per_platform
+
+
+def _watermarks() -> Tuple[int, Optional[datetime]]:
+    return db.session.execute(
+        select(select(func.max(Analytics.id)).scalar_subquery(),
+               select(func.max(ContentManager.updated_at)).scalar_subquery())
+    ).one()
+
+
+class Benchmarks:
+    """
+    Percentile benchmarks of views, likes and engagement rate across our own
+    content, per content type, content format, pillar and platform.
+
+    Content items with analytics are benchmarked on their totals
+    (content_totals.py); platforms on each item's totals there (weekly
+    rollups). A read first compares version stamps; when they moved, only
+    content with new analytics rows or edits since the last read is
+    loaded, its previous samples are retracted from the digests and its
+    current ones folded in. Every rebuild_seconds the digests are sketched
+    from scratch in parallel chunks on a background thread, which resets
+    the retractions and picks up deleted content and edited analytics;
+    reads keep using the current digests meanwhile. Database reads and
+    sketching run outside the lock, which only guards the digests.
+    """
+
+    def __init__(self, compression: float = 100.0, min_samples: int = 5, chunk_size: int = 5000, workers: int = 4,
+                 rebuild_seconds: float = 3600, clock=time.monotonic):
+        self.compression = compression
+        self.min_samples = min_samples
+        self.chunk_size = chunk_size
+        self.workers = workers
+        self.rebuild_seconds = rebuild_seconds
+        self._clock = clock
+        self._lock = threading.Lock()
+        # Held by the one full rebuild running at a time
+        self._rebuilding = threading.Lock()
+        self._digests: Dict[Key, Digest] = {}
+        # content id -> the item and platform sample rows it contributed, to retract when it changes
+        self._items: Dict[int, tuple] = {}
+        self._platforms: Dict[int, List[tuple]] = {}
+        self._versions = None
+        self._built_at: Optional[float] = None
+        self._last_analytics_id = 0
+        self._last_content_update: Optional[datetime] = None
+
+    @classmethod
+    def from_config(cls, config) -> 'Benchmarks':
+        return cls(compression=config.get('BENCHMARK_COMPRESSION', 100.0),
+                   min_samples=config.get('BENCHMARK_MIN_SAMPLES', 5),
+                   chunk_size=config.get('BENCHMARK_CHUNK_SIZE', 5000),
+                   workers=config.get('BENCHMARK_WORKERS', 4),
+                   rebuild_seconds=config.get('BENCHMARK_REBUILD_SECONDS', 3600))
+
+    def _sketch(self, items: Iterable[tuple], platforms: Iterable[tuple]) -> Dict[Key, TDigest]:
+        content, per_platform = _columns(items, platforms)
+        options = dict(compression=self.compression, chunk_size=self.chunk_size, workers=self.workers)
+        digests = sketch(content, DIMENSIONS[:-1], **options)
+        digests.update(sketch(per_platform, ('platform',), **options))
+        return digests
+
+    def _rebuild(self) -> None:
+        versions = get_versions(SOURCE_TABLES)
+        # Watermarks first: rows written meanwhile are folded in again by the next update, never missed
+        last_id, last_update = _watermarks()
+        items, platforms = _samples()
+        digests = {}
+        for key, added in self._sketch(items.values(), (row for rows in platforms.values() for row in rows)).items():
+            digests[key] = Digest(self.compression)
+            digests[key].added = added
+        with self._lock:
+            self._digests, self._items, self._platforms = digests, items, platforms
+            self._last_analytics_id, self._last_content_update = last_id or 0, last_update
+            self._versions, self._built_at = versions, self._clock()
+
+    def rebuild(self) -> None:
+        """Sketch every digest from the database and swap them in"""
+        with self._rebuilding:
+            self._rebuild()
+
+    def _rebuild_in_background(self, app) -> None:
+        try:
+            with app.app_context():
+                self._rebuild()
+        except Exception:
+            logger.exception("Rebuilding the benchmark digests failed; retrying on a later read")
+        finally:
+            self._rebuilding.release()
+
+    def _update(self, versions) -> None:
+        last_id, last_update = _watermarks()
+        changed = set(db.session.execute(
+            select(Analytics.content_id).where(Analytics.id > self._last_analytics_id).distinct()
+        ).scalars())
+        edited = select(ContentManager.id)
+        if self._last_content_update is not None:
+            edited = edited.where(ContentManager.updated_at > self._last_content_update)
+        changed.update(db.session.execute(edited).scalars())
+        items, platforms = _samples(sorted(changed)) if changed else ({}, {})
+        added = self._sketch(items.values(), (row for rows in platforms.values() for row in rows))
+
+        with self._lock:
+            old_items = [self._items.pop(content_id) for content_id in changed if content_id in self._items]
+            old_platforms = [row for content_id in changed for row in self._platforms.pop(content_id, ())]
+            for parts, side in ((self._sketch(old_items, old_platforms), 'removed'), (added, 'added')):
+                for key, part in parts.items():
+                    if key not in self._digests:
+                        self._digests[key] = Digest(self.compression)
+                    getattr(self._digests[key], side).merge(part)
+            self._items.update(items)
+            self._platforms.update(platforms)
+            self._last_analytics_id, self._last_content_update = last_id or 0, last_update
+            self._versions = versions
+
+    def refresh(self) -> None:
+        """
+        Bring the digests up to date (one version lookup when nothing
+        changed). Only a process's first read waits for a full build; later
+        rebuilds run on a background thread.
+        """
+        if self._built_at is None:
+            with self._rebuilding:
+                if self._built_at is None:
+                    self._rebuild()
+            return
+        if self._clock() - self._built_at >= self.rebuild_seconds and self._rebuilding.acquire(blocking=False):
+            threading.Thread(target=self._rebuild_in_background, args=(current_app._get_current_object(),),
+                             name='benchmarks-rebuild', daemon=True).start()
+        versions = get_versions(SOURCE_TABLES)
+        if versions is None or versions != self._versions:
+            self._update(versions)
+
+    def _digest(self, dimension: str, group, metric: str) -> Optional[TDigest]:
+        digest = self._digests.get((dimension, group, metric))
+        return digest if digest is not None and digest.count >= self.min_samples else None
+
+    def _ranks(self, dimension: str, group, values: Dict) -> Optional[Dict]:
+        ranks = {}
+        for metric in METRICS:
+            digest = self._digest(dimension, group, metric)
+            if digest is None:
+                return None
+            ranks[metric] = round(100 * digest.rank(float(values[metric] or 0)), 1)
+        return ranks
+
+    def p_ranks(self, items: List[ContentManager]) -> List[Optional[Dict]]:
+        """Percentile of each content item among all our content with analytics, per metric"""
+        self.refresh()
+        with self._lock:
+            return [self._ranks('all', 'all', {metric: getattr(item, metric) for metric in METRICS})
+                    if item.analytics_days else None for item in items]
+
+    def item_ranks(self, item: ContentManager) -> Dict:
+        """Percentiles of a content item within each group it belongs to, platforms included"""
+        self.refresh()
+        totals = {metric: getattr(item, metric) for metric in METRICS}
+        platform_totals = _platform_totals([item.id])
+        with self._lock:
+            groups = {'all': 'all', 'content_type': item.content_type, 'content_format': item.content_format,
+                      'pillar': item.content_pillar_id}
+            ranks = {dimension: self._ranks(dimension, group, totals) if item.analytics_days else None
+                     for dimension, group in groups.items()}
+            ranks['platforms'] = {}
+            for _, platform_id, views, likes, interactions in platform_totals:
+                engagement = _engagement(np.array([float(views or 0)]), np.array([float(interactions or 0)]))[0]
+                ranks['platforms'][platform_id] = self._ranks(
+                    'platform', platform_id, {'views': views, 'likes': likes, 'engagement_rate': engagement}
+                )
+            return ranks
+
+    def summary(self, dimension: str, metric: str) -> List[Dict]:
+        """Count and quantiles of metric for each group of dimension with enough samples"""
+        self.refresh()
+        with self._lock:
+            rows = []
+            for (key_dimension, group, key_metric), digest in self._digests.items():
+                if key_dimension != dimension or key_metric != metric or digest.count < self.min_samples:
+                    continue
+                rows.append({'group': group, 'count': int(digest.count),
+                             **{f'p{int(q * 100)}': round(digest.quantile(q), 2) for q in QUANTILES}})
+            return sorted(rows, key=lambda row: row['p50'], reverse=True)
+
+    def median_lift(self, dimension: str, metric: str = 'engagement_rate') -> Optional[Dict]:
+        """The group of dimension with the highest median metric, and how far above the overall median it is"""
+        rows = self.summary(dimension, metric)
+        overall = self.summary('all', metric)
+        if len(rows) < 2 or not overall or not overall[0]['p50']:
+            return None
+        best = rows[0]
+        return {'group': best['group'], 'median': best['p50'], 'overall_median': overall[0]['p50'],
+                'lift': round(100 * (best['p50'] / overall[0]['p50'] - 1), 1)}
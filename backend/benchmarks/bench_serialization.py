@@ -0,0 +1,129 @@
+#!/usr/bin/env python3
+"""
+Micro-benchmark for model serialization.
+
+Times each model's to_dict and the full list-response encode for the stdlib
+and orjson JSON providers, and checks both providers produce identical bytes.
+
+Usage (from backend/):
+    python benchmarks/bench_serialization.py [--rows 5000] [--repeat 5]
+"""
+
+import argparse
+import os
+import sys
+import timeit
+from datetime import date, datetime, time, timedelta
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+from flask import Flask
+
+from json_provider import OrjsonProvider, StdlibJSONProvider, orjson
+from models import (Platform, Profile, ContentPillar, ContentIdea, ContentManager, Task, ContentSubtask,
+                    Analytics, TrendingTopic, ContentPerformanceAnalysis, CompetitorAnalysis, NicheInsights)
+
+NOW = datetime(2025, 3, 14, 9, 26, 53, 589793)
+
+
+def sample_rows(n):
+    """Build n transient instances of every model with realistic field values"""
+    rows = {}
+    rows[Platform] = [Platform(id=i, platform_name=f'platform-{i}', current_followers=1200 + i,
+                               goal_followers=10000, created_at=NOW, updated_at=NOW) for i in range(n)]
+    rows[Profile] = [Profile(id=i, mission='Help men build style on a budget', goals='10k followers',
+                             vision='Community', niche='mens fashion', target_audience='Men 20-35',
+                             stories='Grew up thrifting', motivation='Confidence', created_at=NOW,
+                             updated_at=NOW) for i in range(n)]
+    rows[ContentPillar] = [ContentPillar(id=i, pillar_name=f'Pillar {i}', description='Everyday outfits',
+                                         keywords='style,outfits', target_audience='Men 20-35',
+                                         content_frequency='3x/week', goals='Reach', color='#3B82F6',
+                                         created_at=NOW, updated_at=NOW) for i in range(n)]
+    rows[ContentIdea] = [ContentIdea(id=i, title=f'Idea {i}', description='Capsule wardrobe basics',
+                                     content_pillar_id=1, inspiration_link='https://example.com/v',
+                                     priority='high', status='pending', created_at=NOW,
+                                     updated_at=NOW) for i in range(n)]
+    rows[ContentManager] = [ContentManager(id=i, content_title=f'Content {i}', content_idea_id=1,
+                                           content_pillar_id=1, status='published', content_type='short_form',
+                                           content_format='fitcheck', publish_time=NOW + timedelta(hours=i),
+                                           intention='Educate', hook='Stop wearing this', caption='Caption ' * 20,
+                                           script='Script ' * 50, tone='casual', call_to_action='Save this',
+                                           music='lofi', duration=45, minutes_spent=90.5,
+                                           content_link='https://example.com/c', hashtags_used='#style #mens',
+                                           notes='', is_repurposed=False, views=15320, likes=1204, shares=88,
+                                           comments=73, saves=210, retention_rate=41.5, created_at=NOW,
+                                           updated_at=NOW) for i in range(n)]
+    rows[Task] = [Task(id=i, title=f'Task {i}', description='Film b-roll', content_id=1,
+                       due_date=NOW + timedelta(days=1), status='pending', priority='medium',
+                       estimated_hours=1.5, created_at=NOW, updated_at=NOW) for i in range(n)]
+    rows[ContentSubtask] = [ContentSubtask(id=i, content_id=1, task_title=f'Subtask {i}', status='pending',
+                                           due_date=None, created_at=NOW, updated_at=NOW) for i in range(n)]
+    rows[Analytics] = [Analytics(id=i, content_id=1, platform_id=1, date_recorded=date(2025, 3, 1) + timedelta(days=i % 365),
+                                 views=900 + i, likes=70, shares=4, comments=6, saves=12, retention_rate=38.2,
+                                 engagement_rate=10.2, created_at=NOW) for i in range(n)]
+    rows[TrendingTopic] = [TrendingTopic(id=i, topic=f'Topic {i}', hashtags='["#style", "#mens"]',
+                                         platforms='{"tiktok": {"volume": 100}}', trend_score=81.3,
+                                         niche_category='fashion', volume_24h=18420, engagement_rate=9.2,
+                                         growth_rate=156.7, peak_time=NOW, is_active=True, created_at=NOW,
+                                         updated_at=NOW) for i in range(n)]
+    rows[ContentPerformanceAnalysis] = [ContentPerformanceAnalysis(id=i, content_id=1, analysis_date=NOW,
+                                                                   performance_score=70, engagement_score=95,
+                                                                   viral_potential=55, trend_alignment=45,
+                                                                   best_performing_elements='["Strong hook"]',
+                                                                   improvement_suggestions='[]',
+                                                                   similar_trending_content='[]',
+                                                                   optimal_post_time=time(18, 0),
+                                                                   predicted_reach=700) for i in range(n)]
+    rows[CompetitorAnalysis] = [CompetitorAnalysis(id=i, competitor_name=f'Creator {i}', platform='tiktok',
+                                                   username=f'creator{i}', niche_category='fashion',
+                                                   followers_count=890000, avg_engagement_rate=6.7,
+                                                   post_frequency=0.71, best_content_types='["short_form"]',
+                                                   trending_hashtags='["#fitness"]', content_strategy='Mens fashion',
+                                                   posting_patterns='{"best_days": ["Monday"]}', growth_rate=0.0,
+                                                   last_analyzed=NOW, created_at=NOW) for i in range(n)]
+    rows[NicheInsights] = [NicheInsights(id=i, niche_name='fashion', insight_type='trend_opportunity',
+                                         title=f'Insight {i}', description='High growth potential',
+                                         supporting_data='{}', confidence_score=85.0,
+                                         action_items='["Post more"]', priority='high', status='active',
+                                         expiry_date=None, created_at=NOW, updated_at=NOW) for i in range(n)]
+    return rows
+
+
+def best_of(fn, repeat):
+    return min(timeit.repeat(fn, number=1, repeat=repeat))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--rows', type=int, default=5000, help='instances per model')
+    parser.add_argument('--repeat', type=int, default=5, help='timing repeats (best is reported)')
+    args = parser.parse_args()
+
+    app = Flask(__name__)
+    stdlib_provider = StdlibJSONProvider(app)
+    fast_provider = OrjsonProvider(app) if orjson is not None else None
+
+    print(f"{'model':<28}{'to_dict':>12}{'stdlib':>12}{'orjson':>12}{'speedup':>10}  identical")
+    for model, instances in sample_rows(args.rows).items():
+        to_dict_time = best_of(lambda: [obj.to_dict() for obj in instances], args.repeat)
+        payload = [obj.to_dict() for obj in instances]
+
+        with app.app_context():
+            stdlib_body = stdlib_provider.response(payload).get_data()
+            stdlib_time = best_of(lambda: stdlib_provider.response(payload), args.repeat)
+            if fast_provider is not None:
+                fast_body = fast_provider.response(payload).get_data()
+                fast_time = best_of(lambda: fast_provider.response(payload), args.repeat)
+
+        if fast_provider is None:
+            print(f"{model.__name__:<28}{to_dict_time * 1000:>10.1f}ms{stdlib_time * 1000:>10.1f}ms{'n/a':>12}{'':>10}  -")
+            continue
+        print(f"{model.__name__:<28}{to_dict_time * 1000:>10.1f}ms{stdlib_time * 1000:>10.1f}ms"
+              f"{fast_time * 1000:>10.1f}ms{stdlib_time / fast_time:>9.1f}x  {stdlib_body == fast_body}")
+
+    if fast_provider is None:
+        print("\norjson is not installed; only the stdlib provider was measured.")
+
+
+if __name__ == '__main__':
+    main()
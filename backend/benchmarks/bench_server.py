@@ -0,0 +1,83 @@
+#!/usr/bin/env python3
+"""
+HTTP throughput benchmark for a running backend.
+
+Fires requests from a pool of client threads for a fixed duration and
+reports requests/second and latency percentiles, so the dev server, the
+gunicorn launcher and the ASGI stack can be compared against the same
+endpoint.
+
+Usage:
+    python benchmarks/bench_server.py --url http://127.0.0.1:5000/api/content-manager \\
+        --concurrency 32 --duration 20
+    python benchmarks/bench_server.py --url http://127.0.0.1:5000/api/ai/analyze-performance \\
+        --json '{}' --concurrency 200 --duration 20
+"""
+
+import argparse
+import statistics
+import threading
+import time
+import urllib.error
+import urllib.request
+
+
+def worker(url, body, deadline, latencies, errors, lock):
+    local_latencies = []
+    local_errors = 0
+    headers = {'Content-Type': 'application/json'} if body is not None else {}
+    while time.perf_counter() < deadline:
+        started = time.perf_counter()
+        try:
+            request = urllib.request.Request(url, data=body, headers=headers)
+            with urllib.request.urlopen(request, timeout=30) as response:
+                response.read()
+        except (urllib.error.URLError, OSError):
+            local_errors += 1
+            continue
+        local_latencies.append(time.perf_counter() - started)
+    with lock:
+        latencies.extend(local_latencies)
+        errors.append(local_errors)
+
+
+def percentile(sorted_values, pct):
+    if not sorted_values:
+        return 0.0
+    index = min(int(round(pct / 100 * (len(sorted_values) - 1))), len(sorted_values) - 1)
+    return sorted_values[index]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--url', default='http://127.0.0.1:5000/api/content-manager')
+    parser.add_argument('--concurrency', type=int, default=32, help='client threads')
+    parser.add_argument('--duration', type=float, default=20.0, help='seconds to run')
+    parser.add_argument('--json', help='POST this JSON body instead of sending GETs')
+    args = parser.parse_args()
+
+    latencies, errors, lock = [], [], threading.Lock()
+    deadline = time.perf_counter() + args.duration
+    body = args.json.encode() if args.json is not None else None
+    threads = [threading.Thread(target=worker, args=(args.url, body, deadline, latencies, errors, lock))
+               for _ in range(args.concurrency)]
+    started = time.perf_counter()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    elapsed = time.perf_counter() - started
+
+    latencies.sort()
+    print(f"url:          {args.url}")
+    print(f"concurrency:  {args.concurrency}")
+    print(f"requests:     {len(latencies)} ok, {sum(errors)} failed in {elapsed:.1f}s")
+    print(f"throughput:   {len(latencies) / elapsed:.1f} req/s")
+    if latencies:
+        print(f"latency mean: {statistics.mean(latencies) * 1000:.1f}ms")
+        for pct in (50, 95, 99):
+            print(f"latency p{pct}:  {percentile(latencies, pct) * 1000:.1f}ms")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,120 @@
+#!/usr/bin/env python3
+"""
+Local stand-in for the Anthropic Messages API, for load tests.
+
+Answers every POST /v1/messages after a fixed delay with a small JSON reply
+(as server-sent events when the request streams, with the first token after
+--ttft seconds), so the AI routes can be driven at high concurrency without real model calls.
+--error-rate injects failures (529 overloaded by default, with retry-after)
+to exercise retries and the circuit breaker. Point the backend at it with
+ANTHROPIC_BASE_URL:
+
+    python benchmarks/fake_model_server.py --port 8787 --latency 1.0 --error-rate 0.2
+    ANTHROPIC_BASE_URL=http://127.0.0.1:8787 CLAUDE_API_KEY=test \\
+        hypercorn asgi:app -c file:hypercorn.conf.py
+"""
+
+import argparse
+import asyncio
+import itertools
+import json
+import random
+
+from hypercorn.asyncio import serve
+from hypercorn.config import Config
+
+REPLY_TEXT = json.dumps({'analysis': 'fake model reply'})
+
+
+def sse(event_type, data):
+    return f'event: {event_type}\ndata: {json.dumps({"type": event_type, **data})}\n\n'.encode()
+
+
+async def stream_reply(send, message, remaining):
+    """The reply as Messages API stream events: the first token now, the rest after `remaining` seconds"""
+    await send({'type': 'http.response.start', 'status': 200,
+                'headers': [(b'content-type', b'text/event-stream'), (b'cache-control', b'no-cache')]})
+    text = message['content'][0]['text']
+    start = {**message, 'content': [], 'stop_reason': None, 'usage': {**message['usage'], 'output_tokens': 1}}
+    events = [
+        sse('message_start', {'message': start}),
+        sse('content_block_start', {'index': 0, 'content_block': {'type': 'text', 'text': ''}}),
+        sse('content_block_delta', {'index': 0, 'delta': {'type': 'text_delta', 'text': text[:1]}})
+    ]
+    await send({'type': 'http.response.body', 'body': b''.join(events), 'more_body': True})
+    await asyncio.sleep(remaining)
+    events = [
+        sse('content_block_delta', {'index': 0, 'delta': {'type': 'text_delta', 'text': text[1:]}}),
+        sse('content_block_stop', {'index': 0}),
+        sse('message_delta', {'delta': {'stop_reason': 'end_turn', 'stop_sequence': None},
+                              'usage': {'output_tokens': message['usage']['output_tokens']}}),
+        sse('message_stop', {})
+    ]
+    await send({'type': 'http.response.body', 'body': b''.join(events)})
+
+
+def create_app(latency, error_rate=0.0, error_status=529, retry_after=1, ttft=None):
+    ttft = latency / 4 if ttft is None else ttft
+    ids = itertools.count()
+
+    async def app(scope, receive, send):
+        if scope['type'] != 'http':
+            return
+        request = b''
+        while True:
+            message = await receive()
+            request += message.get('body', b'')
+            if not message.get('more_body'):
+                break
+        body = json.loads(request or b'{}')
+        streaming = body.get('stream', False)
+        await asyncio.sleep(ttft if streaming else latency)
+
+        if random.random() < error_rate:
+            await send({'type': 'http.response.start', 'status': error_status,
+                        'headers': [(b'content-type', b'application/json'),
+                                    (b'retry-after', str(retry_after).encode())]})
+            await send({'type': 'http.response.body',
+                        'body': b'{"type":"error","error":{"type":"overloaded_error","message":"Overloaded"}}'})
+            return
+
+        message = {
+            'id': f'msg_fake_{next(ids)}',
+            'type': 'message',
+            'role': 'assistant',
+            'model': body.get('model', 'claude-3-haiku-20240307'),
+            'content': [{'type': 'text', 'text': REPLY_TEXT}],
+            'stop_reason': 'end_turn',
+            'stop_sequence': None,
+            'usage': {'input_tokens': 100, 'output_tokens': 20}
+        }
+        if streaming:
+            await stream_reply(send, message, max(latency - ttft, 0))
+            return
+        await send({'type': 'http.response.start', 'status': 200,
+                    'headers': [(b'content-type', b'application/json')]})
+        await send({'type': 'http.response.body', 'body': json.dumps(message).encode()})
+
+    return app
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--port', type=int, default=8787)
+    parser.add_argument('--latency', type=float, default=1.0, help='seconds before each reply')
+    parser.add_argument('--ttft', type=float, default=None,
+                        help='seconds to the first streamed token (default: a quarter of --latency)')
+    parser.add_argument('--error-rate', type=float, default=0.0, help='fraction of requests that fail')
+    parser.add_argument('--error-status', type=int, default=529, help='status code of injected failures')
+    parser.add_argument('--retry-after', type=int, default=1, help='retry-after seconds on injected failures')
+    args = parser.parse_args()
+
+    config = Config()
+    config.bind = [f'127.0.0.1:{args.port}']
+    config.backlog = 4096
+    asyncio.run(serve(create_app(args.latency, args.error_rate, args.error_status, args.retry_after, args.ttft),
+                      config))
+
+
+if __name__ == '__main__':
+    main()
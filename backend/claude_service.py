@@ -1,16 +1,335 @@
 import os
-from anthropic import Anthropic
-from typing import Dict, List, Optional
+from anthropic import Anthropic, AsyncAnthropic
+from concurrent.futures import ThreadPoolExecutor, wait
+from typing import Any, Callable, Dict, List, NamedTuple, Optional, Union
+import asyncio
 import json
+import threading
+import time
+
+import httpx
+
+from json_provider import json_default
+from resilience import Resilience
+from coalescing import AsyncSingleFlight, FileFlight, ReplyCache, SingleFlight, request_key
+from model_routing import ModelRouter, Route
+from prompt_cache import PrefixRegistry, has_breakpoint, system_blocks
+from structured_output import message_text, parse_structured, tool_definition
+from ai_telemetry import AITelemetry
+from claude_transport import OFFLINE_API_KEY, transport_from_config
+
+DEFAULT_MODEL = "claude-3-haiku-20240307"
+
+
+class Call(NamedTuple):
+    """One model call: the prompt, and how to turn the reply or a failure into a result"""
+    name: str
+    prompt: str
+    max_tokens: int
+    parse: Callable[[str], Any]
+    on_error: Callable[[str], Any]
+    # Stable context (profile, pillar) sent as a cached system prefix
+    system: Optional[str] = None
+    # Shape of a JSON reply; requested through a forced tool call when tools are on
+    schema: Optional[Dict] = None
+
+
+class Sent(NamedTuple):
+    """One upstream reply, with the time to its first streamed token (None unless streaming)"""
+    message: Any
+    first_token: Optional[float]
+
+
+class Pending(NamedTuple):
+    """A call rendered as a request, up to the upstream I/O both services do their own way"""
+    call: Call
+    route: Optional[Route]
+    request: Dict
+    key: str  # Coalescing and reply cache key
+    prefix: Optional[str]
+    deadline: Optional[float]  # Only calls with a fallback have one
+    fallback: Optional[Callable[[], Any]]
+    cached: Optional[str]  # A stored reply, when there is one nothing is sent
+    wait: Optional[float]  # Longest wait for another worker's identical call (None: the FileFlight's default)
+
+
+def degraded(result: Any) -> Any:
+    """A heuristic result flagged as such: a dict gets degraded=True, and so does each item of a list"""
+    if isinstance(result, list):
+        return [{**item, "degraded": True} for item in result]
+    return {**result, "degraded": True}
+
+
+def json_or(fallback: Callable[[str], Any], schema: Optional[Dict] = None) -> Callable[[str], Any]:
+    """
+    Parser that extracts the JSON in the reply (fenced, surrounded by prose or
+    truncated) and checks it against schema, or hands the raw text to fallback
+    """
+    def parse(text: str) -> Any:
+        try:
+            return parse_structured(text, schema)
+        except ValueError:
+            return fallback(text)
+    return parse
+
+
+STRATEGY_SCHEMA = {
+    'type': 'object',
+    'properties': {
+        'strategy_recommendations': {}, 'content_pillars': {}, 'optimal_posting_times': {},
+        'content_types': {}, 'hashtag_strategies': {}, 'improvements': {}
+    },
+    'required': ['strategy_recommendations']
+}
+IDEAS_SCHEMA = {
+    'type': 'array',
+    'items': {
+        'type': 'object',
+        'properties': {
+            'title': {'type': 'string'}, 'description': {'type': 'string'}, 'content_type': {'type': 'string'},
+            'hook': {'type': 'string'}, 'priority': {'type': 'string'}, 'estimated_engagement': {}
+        },
+        'required': ['title']
+    }
+}
+OPTIMIZE_SCHEMA = {
+    'type': 'object',
+    'properties': {'hook': {}, 'caption': {}, 'hashtags': {}, 'posting_time': {}, 'format_suggestions': {}},
+    'required': ['hook', 'caption']
+}
+ANALYSIS_SCHEMA = {'type': 'object'}
+WEEKLY_PLAN_SCHEMA = {
+    'type': 'object',
+    'properties': {
+        'weekly_plan': {
+            'type': 'array',
+            'items': {
+                'type': 'object',
+                'properties': {
+                    'day_name': {'type': 'string'}, 'content_suggestions': {}, 'recommended_pillar': {},
+                    'content_type': {}, 'optimal_posting_time': {}
+                },
+                'required': ['day_name']
+            }
+        }
+    },
+    'required': ['weekly_plan']
+}
+
+# If JSON parsing fails, return a simple structure
+parse_ideas = json_or(lambda text: [{"title": "AI Generated Ideas", "description": text, "content_type": "post"}],
+                      IDEAS_SCHEMA)
+
 
 class ClaudeService:
-    def __init__(self, api_key: str):
-        self.client = Anthropic(api_key=api_key)
+    # Short generations where racing a duplicate request against a slow one is cheap
+    HEDGED_CALLS = ('content_field',)
+    # Threads for calls that outlive their deadline
+    BACKGROUND_WORKERS = 32
+    single_flight_class = SingleFlight
+
+    def __init__(self, api_key: str, client: Optional[Anthropic] = None, resilience: Optional[Resilience] = None,
+                 timeout: Union[float, httpx.Timeout] = 60.0, single_flight: Optional[SingleFlight] = None,
+                 router: Optional[ModelRouter] = None, prefixes: Optional[PrefixRegistry] = None,
+                 use_tools: bool = True, telemetry: Optional[AITelemetry] = None, stream: bool = False,
+                 transport: Optional[httpx.BaseTransport] = None, replies: Optional[ReplyCache] = None):
+        # Retries happen in Resilience, so the SDK's own retry loop is off
+        self.client = client or Anthropic(
+            api_key=api_key, max_retries=0, timeout=timeout,
+            http_client=httpx.Client(transport=transport, timeout=timeout) if transport else None
+        )
+        self.resilience = resilience or Resilience()
+        # Identical requests already in flight (several tabs pressing
+        # "generate") share one upstream call
+        self.single_flight = single_flight or self.single_flight_class()
+        # Without a router every call uses DEFAULT_MODEL and the call's own max_tokens
+        self.router = router
+        self.model = DEFAULT_MODEL
+        self.prefixes = prefixes
+        # Ask for JSON replies through a forced tool call instead of prompt instructions alone
+        self.use_tools = use_tools
+        self.telemetry = telemetry
+        # Streaming only adds time-to-first-token to the telemetry; callers still get whole replies
+        self.stream = stream
+        # Replies of calls with a fallback, including ones finished after the caller degraded
+        self.replies = replies
+        self._background = None
+        self._background_lock = threading.Lock()
+
+    @classmethod
+    def from_config(cls, config, router: Optional[ModelRouter] = None, prefixes: Optional[PrefixRegistry] = None,
+                    telemetry: Optional[AITelemetry] = None, replies: Optional[ReplyCache] = None) -> 'ClaudeService':
+        return cls(
+            config.get('CLAUDE_API_KEY') or OFFLINE_API_KEY,
+            resilience=Resilience.from_config(config),
+            timeout=httpx.Timeout(config.get('CLAUDE_TIMEOUT_SECONDS', 60.0),
+                                  connect=config.get('CLAUDE_CONNECT_TIMEOUT_SECONDS', 5.0)),
+            single_flight=cls.single_flight_class(
+                FileFlight(config['CLAUDE_COALESCE_DIR'], wait_seconds=config.get('CLAUDE_TIMEOUT_SECONDS', 60.0))
+                if config.get('CLAUDE_COALESCE_DIR') else None
+            ),
+            router=router or ModelRouter.from_config(config),
+            prefixes=prefixes,
+            use_tools=config.get('CLAUDE_STRUCTURED_OUTPUT', 'tools') == 'tools',
+            telemetry=telemetry,
+            stream=config.get('CLAUDE_STREAM_RESPONSES', False),
+            transport=transport_from_config(config),
+            replies=replies or ReplyCache.from_config(config)
+        )
+
+    def _route(self, call: Call) -> Optional[Route]:
+        return self.router.route(call.name) if self.router else None
+
+    def _observe(self, route: Optional[Route], started: float) -> None:
+        if route:
+            self.router.observe(route, time.perf_counter() - started)
+
+    def _request(self, call: Call, route: Optional[Route] = None) -> Dict:
+        request = {
+            "model": route.model if route else self.model,
+            "max_tokens": (route and route.max_tokens) or call.max_tokens,
+            "messages": [
+                {"role": "user", "content": call.prompt}
+            ]
+        }
+        if self.use_tools and call.schema:
+            tool = tool_definition(call.name, call.schema)
+            request["tools"] = [tool]
+            request["tool_choice"] = {"type": "tool", "name": tool["name"]}
+        if call.system:
+            # Profile and pillar context go first so repeat calls for the same
+            # creator hit the prompt cache; only the task prompt varies
+            request["system"] = system_blocks(call.system, request["model"], request.get("tools"))
+        if route and route.timeout:
+            request["timeout"] = route.timeout
+        return request
+
+    def _record_prefix(self, call: Call, request: Dict) -> Optional[str]:
+        return self.prefixes.record(call.name, request) if self.prefixes else None
+
+    def _reply_text(self, call: Call, response, prefix: Optional[str]) -> str:
+        if self.prefixes:
+            self.prefixes.record_usage(prefix, getattr(response, 'usage', None))
+        return message_text(response, call.schema)
+
+    def _record_call(self, call: Call, request: Dict, started: float, attempts: int, sent: Optional[Sent]) -> None:
+        if self.telemetry:
+            self.telemetry.record(
+                call.name, request["model"], time.perf_counter() - started, attempts=attempts,
+                usage=sent and getattr(sent.message, 'usage', None), first_token=sent and sent.first_token,
+                cacheable=has_breakpoint(request), error=sent is None
+            )
+
+    def _deadline(self, route: Optional[Route], deadline: Optional[float]) -> Optional[float]:
+        if deadline is not None:
+            return deadline
+        return route.deadline if route else None
+
+    def _cached_reply(self, key: str, fallback: Optional[Callable[[], Any]]) -> Optional[str]:
+        return self.replies.get(key) if fallback and self.replies else None
+
+    def _store_reply(self, key: str, text: str, fallback: Optional[Callable[[], Any]]) -> None:
+        if fallback and self.replies:
+            self.replies.put(key, text)
+
+    def _degrade(self, call: Call, fallback: Callable[[], Any], reason: str) -> Any:
+        if self.telemetry:
+            self.telemetry.record_degraded(call.name, reason)
+        return degraded(fallback())
+
+    def _background_executor(self) -> ThreadPoolExecutor:
+        with self._background_lock:
+            if self._background is None:
+                self._background = ThreadPoolExecutor(max_workers=self.BACKGROUND_WORKERS,
+                                                      thread_name_prefix='claude-background')
+        return self._background
+
+    def _hedged(self, call: Call) -> bool:
+        return call.name.split('.', 1)[0] in self.HEDGED_CALLS
+
+    def _send(self, request: Dict) -> Sent:
+        if not self.stream:
+            return Sent(self.client.messages.create(**request), None)
+        started = time.perf_counter()
+        first_token = None
+        with self.client.messages.stream(**request) as stream:
+            for event in stream:
+                if first_token is None and event.type == 'content_block_delta':
+                    first_token = time.perf_counter() - started
+            return Sent(stream.get_final_message(), first_token)
+
+    def _start(self, call: Call, deadline: Optional[float], fallback: Optional[Callable[[], Any]]) -> Pending:
+        route = self._route(call)
+        request = self._request(call, route)
+        key = request_key(request)
+        cached = self._cached_reply(key, fallback)
+        deadline = self._deadline(route, deadline) if fallback else None
+        return Pending(call, route, request, key,
+                       prefix=self._record_prefix(call, request) if cached is None else None,
+                       deadline=deadline, fallback=fallback, cached=cached,
+                       wait=deadline if deadline is not None else (route and route.timeout) or None)
+
+    def _sent(self, pending: Pending, started: float, attempts: int, sent: Optional[Sent]) -> None:
+        self._observe(pending.route, started)
+        self._record_call(pending.call, pending.request, started, attempts, sent)
+
+    def _text(self, pending: Pending, sent: Sent) -> str:
+        text = self._reply_text(pending.call, sent.message, pending.prefix)
+        self._store_reply(pending.key, text, pending.fallback)
+        return text
+
+    def _failed(self, pending: Pending, error: Exception) -> Any:
+        if pending.fallback:
+            return self._degrade(pending.call, pending.fallback, 'error')
+        return pending.call.on_error(str(error))
+
+    def _complete(self, call: Call, deadline: Optional[float] = None,
+                  fallback: Optional[Callable[[], Any]] = None) -> Any:
+        """
+        Run a call and parse its reply.
+
+        With a fallback (a local heuristic) the call has a deadline, the
+        given one or its route's: if the model has not answered by then, or
+        fails, the fallback's result is returned flagged degraded. A late
+        call keeps running and stores its reply for the next identical
+        request. Everything but the I/O is shared with AsyncClaudeService.
+        """
+        pending = self._start(call, deadline, fallback)
+        if pending.cached is not None:
+            return call.parse(pending.cached)
+
+        def send():
+            started = time.perf_counter()
+            attempts = []
+
+            def attempt():
+                attempts.append(None)
+                return self._send(pending.request)
+
+            sent = None
+            try:
+                sent = self.resilience.call(attempt, hedge=self._hedged(call))
+            finally:
+                self._sent(pending, started, len(attempts), sent)
+            return self._text(pending, sent)
+
+        try:
+            # Callers share the raw reply; each parses its own copy
+            if pending.deadline is None:
+                text = self.single_flight.do(pending.key, send, pending.wait)
+            else:
+                future = self._background_executor().submit(self.single_flight.do, pending.key, send, pending.wait)
+                if not wait([future], timeout=pending.deadline).done:
+                    return self._degrade(call, fallback, 'deadline')
+                text = future.result()
+        except Exception as e:
+            return self._failed(pending, e)
+        return call.parse(text)
     
     def generate_content_strategy(self, profile_data: Dict, analytics_data: List[Dict], platforms: List[Dict]) -> Dict:
         """Generate content strategy based on profile and analytics data"""
         
-        prompt = f"""
+        system = f"""
         You are an AI Content Strategist. Based on the following information, provide strategic content recommendations:
 
         PROFILE INFORMATION:
@@ -19,12 +338,14 @@ class ClaudeService:
         - Vision: {profile_data.get('vision', 'Not specified')}
         - Niche: {profile_data.get('niche', 'Not specified')}
         - Target Audience: {profile_data.get('target_audience', 'Not specified')}
+        """
 
+        prompt = f"""
         PLATFORMS:
-        {json.dumps(platforms, indent=2)}
+        {json.dumps(platforms, indent=2, default=json_default)}
 
         RECENT ANALYTICS DATA:
-        {json.dumps(analytics_data, indent=2)}
+        {json.dumps(analytics_data, indent=2, default=json_default)}
 
         Please provide:
         1. Content strategy recommendations based on what's working
@@ -43,33 +364,31 @@ class ClaudeService:
         - improvements
         """
         
-        try:
-            response = self.client.messages.create(
-                model="claude-3-haiku-20240307",
-                max_tokens=2000,
-                messages=[
-                    {"role": "user", "content": prompt}
-                ]
-            )
-            
+        return self._complete(Call(
+            name='strategy',
+            prompt=prompt,
+            system=system,
+            max_tokens=2000,
+            schema=STRATEGY_SCHEMA,
             # Try to parse as JSON, fallback to text if parsing fails
-            try:
-                return json.loads(response.content[0].text)
-            except json.JSONDecodeError:
-                return {"strategy_text": response.content[0].text}
-                
-        except Exception as e:
-            return {"error": f"Failed to generate strategy: {str(e)}"}
+            parse=json_or(lambda text: {"strategy_text": text}, STRATEGY_SCHEMA),
+            on_error=lambda message: {"error": f"Failed to generate strategy: {message}"}
+        ))
     
-    def generate_content_ideas(self, pillar_name: str, target_audience: str, recent_performance: List[Dict]) -> List[Dict]:
-        """Generate content ideas based on pillar and performance data"""
-        
-        prompt = f"""
+    def ideas_call(self, pillar_name: str, target_audience: str, recent_performance: List[Dict],
+                   platform: Optional[str] = None) -> Call:
+        """The idea generation call, shared by generate_content_ideas and bulk batches (idea_batches.py)"""
+
+        system = f"""
         Generate 10 creative content ideas for the content pillar "{pillar_name}" 
         targeting this audience: {target_audience}
+        """
 
-        Recent performance data to consider:
-        {json.dumps(recent_performance, indent=2)}
+        # The platform goes in the user turn so every platform of a pillar shares the cached prefix
+        platform_line = f"Tailor every idea to {platform}.\n" if platform else ""
+        prompt = f"""
+        {platform_line}Recent performance data to consider:
+        {json.dumps(recent_performance, indent=2, default=json_default)}
 
         For each idea, provide:
         - title: catchy title for the content
@@ -81,24 +400,31 @@ class ClaudeService:
 
         Format as JSON array with these objects.
         """
-        
-        try:
-            response = self.client.messages.create(
-                model="claude-3-haiku-20240307",
-                max_tokens=1500,
-                messages=[
-                    {"role": "user", "content": prompt}
-                ]
-            )
-            
-            try:
-                return json.loads(response.content[0].text)
-            except json.JSONDecodeError:
-                # If JSON parsing fails, return a simple structure
-                return [{"title": "AI Generated Ideas", "description": response.content[0].text, "content_type": "post"}]
-                
-        except Exception as e:
-            return [{"error": f"Failed to generate ideas: {str(e)}"}]
+
+        return Call(
+            name='ideas',
+            prompt=prompt,
+            system=system,
+            max_tokens=1500,
+            schema=IDEAS_SCHEMA,
+            parse=parse_ideas,
+            on_error=lambda message: [{"error": f"Failed to generate ideas: {message}"}]
+        )
+
+    def generate_content_ideas(self, pillar_name: str, target_audience: str, recent_performance: List[Dict],
+                               platform: Optional[str] = None, deadline: Optional[float] = None,
+                               fallback: Optional[Callable[[], List[Dict]]] = None) -> List[Dict]:
+        """Generate content ideas based on pillar and performance data"""
+        return self._complete(self.ideas_call(pillar_name, target_audience, recent_performance, platform),
+                              deadline=deadline, fallback=fallback)
+
+    def batch_params(self, call: Call) -> Dict:
+        """A call rendered as the params of one Message Batches request"""
+        # Not self._route(): batch calls must not count in the router's interactive routing and p95 stats
+        request = self._request(call, self.router.home_route(call.name) if self.router else None)
+        # Batches run asynchronously on Anthropic's side; there is no per-request timeout
+        request.pop("timeout", None)
+        return request
     
     def optimize_content(self, content_data: Dict, platform: str, analytics: List[Dict]) -> Dict:
         """Optimize existing content based on platform and analytics"""
@@ -113,7 +439,7 @@ class ClaudeService:
         - Hashtags: {content_data.get('hashtags_used', 'Not specified')}
 
         PLATFORM PERFORMANCE DATA:
-        {json.dumps(analytics, indent=2)}
+        {json.dumps(analytics, indent=2, default=json_default)}
 
         Provide optimized versions of:
         1. Hook (first line to grab attention)
@@ -125,22 +451,14 @@ class ClaudeService:
         Format as JSON object with these keys: hook, caption, hashtags, posting_time, format_suggestions
         """
         
-        try:
-            response = self.client.messages.create(
-                model="claude-3-haiku-20240307",
-                max_tokens=1000,
-                messages=[
-                    {"role": "user", "content": prompt}
-                ]
-            )
-            
-            try:
-                return json.loads(response.content[0].text)
-            except json.JSONDecodeError:
-                return {"optimized_content": response.content[0].text}
-                
-        except Exception as e:
-            return {"error": f"Failed to optimize content: {str(e)}"}
+        return self._complete(Call(
+            name='optimize',
+            prompt=prompt,
+            max_tokens=1000,
+            schema=OPTIMIZE_SCHEMA,
+            parse=json_or(lambda text: {"optimized_content": text}, OPTIMIZE_SCHEMA),
+            on_error=lambda message: {"error": f"Failed to optimize content: {message}"}
+        ))
     
     def analyze_performance(self, content_data: List[Dict], platforms: List[str]) -> Dict:
         """Analyze content performance and provide insights"""
@@ -149,7 +467,7 @@ class ClaudeService:
         Analyze this content performance data and provide insights:
 
         CONTENT DATA:
-        {json.dumps(content_data, indent=2)}
+        {json.dumps(content_data, indent=2, default=json_default)}
 
         PLATFORMS: {', '.join(platforms)}
 
@@ -165,32 +483,26 @@ class ClaudeService:
         Format as JSON object with these analysis points.
         """
         
-        try:
-            response = self.client.messages.create(
-                model="claude-3-haiku-20240307",
-                max_tokens=1500,
-                messages=[
-                    {"role": "user", "content": prompt}
-                ]
-            )
-            
-            try:
-                return json.loads(response.content[0].text)
-            except json.JSONDecodeError:
-                return {"analysis": response.content[0].text}
-                
-        except Exception as e:
-            return {"error": f"Failed to analyze performance: {str(e)}"}
+        return self._complete(Call(
+            name='analysis',
+            prompt=prompt,
+            max_tokens=1500,
+            schema=ANALYSIS_SCHEMA,
+            parse=json_or(lambda text: {"analysis": text}, ANALYSIS_SCHEMA),
+            on_error=lambda message: {"error": f"Failed to analyze performance: {message}"}
+        ))
     
     def generate_weekly_content_plan(self, pillars: List[Dict], platforms: List[str], goals: str) -> Dict:
         """Generate a weekly content plan"""
         
-        prompt = f"""
+        system = f"""
         Create a weekly content plan (7 days) based on:
 
         CONTENT PILLARS:
-        {json.dumps(pillars, indent=2)}
+        {json.dumps(pillars, indent=2, default=json_default)}
+        """
 
+        prompt = f"""
         PLATFORMS: {', '.join(platforms)}
 
         GOALS: {goals}
@@ -205,24 +517,18 @@ class ClaudeService:
         Format as JSON object with 'weekly_plan' array.
         """
         
-        try:
-            response = self.client.messages.create(
-                model="claude-3-haiku-20240307",
-                max_tokens=2000,
-                messages=[
-                    {"role": "user", "content": prompt}
-                ]
-            )
-            
-            try:
-                return json.loads(response.content[0].text)
-            except json.JSONDecodeError:
-                return {"weekly_plan": response.content[0].text}
-                
-        except Exception as e:
-            return {"error": f"Failed to generate weekly plan: {str(e)}"}
-
-    def generate_content_field(self, field_type: str, content_data: Dict, profile_data: Dict, pillar_data: Optional[Dict] = None) -> Dict:
+        return self._complete(Call(
+            name='weekly_plan',
+            prompt=prompt,
+            system=system,
+            max_tokens=2000,
+            schema=WEEKLY_PLAN_SCHEMA,
+            parse=json_or(lambda text: {"weekly_plan": text}, WEEKLY_PLAN_SCHEMA),
+            on_error=lambda message: {"error": f"Failed to generate weekly plan: {message}"}
+        ))
+
+    def generate_content_field(self, field_type: str, content_data: Dict, profile_data: Dict, pillar_data: Optional[Dict] = None,
+                               deadline: Optional[float] = None, fallback: Optional[Callable[[], Dict]] = None) -> Dict:
         """Generate specific content fields (caption, hook, script, hashtags) based on existing content and profile data"""
         
         # Build context from existing content data
@@ -283,8 +589,6 @@ CREATOR PROFILE:
             prompt = f"""
 Create an engaging hook for this content that grabs attention within the first 3 seconds.
 
-{profile_context}
-{pillar_context}
 CONTENT CONTEXT:
 {context_str}
 
@@ -302,8 +606,6 @@ Provide just the hook text, no additional formatting or explanation.
             prompt = f"""
 Create an engaging caption for this content that encourages interaction and engagement.
 
-{profile_context}
-{pillar_context}
 CONTENT CONTEXT:
 {context_str}
 
@@ -322,8 +624,6 @@ Provide just the caption text, no additional formatting or explanation.
             prompt = f"""
 Create a detailed script or talking points for this content.
 
-{profile_context}
-{pillar_context}
 CONTENT CONTEXT:
 {context_str}
 
@@ -343,8 +643,6 @@ Provide the script with clear sections or bullet points for easy filming.
             prompt = f"""
 Generate relevant hashtags for this content that will maximize reach and engagement.
 
-{profile_context}
-{pillar_context}
 CONTENT CONTEXT:
 {context_str}
 
@@ -363,8 +661,6 @@ Provide hashtags in a single line, separated by spaces, starting with #.
             prompt = f"""
 Determine the ideal tone and style for this content based on the creator's brand and content context.
 
-{profile_context}
-{pillar_context}
 CONTENT CONTEXT:
 {context_str}
 
@@ -384,8 +680,6 @@ Provide the tone description in 1-2 sentences explaining the recommended style a
             prompt = f"""
 Create a compelling call-to-action for this content that drives engagement and aligns with the creator's goals.
 
-{profile_context}
-{pillar_context}
 CONTENT CONTEXT:
 {context_str}
 
@@ -402,26 +696,99 @@ Consider CTAs like asking questions, requesting opinions, encouraging shares, pr
 Provide a clear, engaging call-to-action that fits naturally with the content.
 """
 
-        try:
-            response = self.client.messages.create(
-                model="claude-3-haiku-20240307",
-                max_tokens=1000,
-                messages=[
-                    {"role": "user", "content": prompt}
-                ]
-            )
-            
-            generated_content = response.content[0].text.strip()
-            
-            return {
+        return self._complete(Call(
+            name=f'content_field.{field_type}',
+            prompt=prompt,
+            system=f"You create content for the creator described below.\n{profile_context}{pillar_context}",
+            max_tokens=1000,
+            parse=lambda text: {
                 "success": True,
-                "content": generated_content,
+                "content": text.strip(),
                 "field_type": field_type
-            }
-                
-        except Exception as e:
-            return {
+            },
+            on_error=lambda message: {
                 "success": False,
-                "error": f"Failed to generate {field_type}: {str(e)}",
+                "error": f"Failed to generate {field_type}: {message}",
                 "field_type": field_type
-            } 
\ No newline at end of file
+            }
+        ), deadline=deadline, fallback=fallback)
+
+
+class AsyncClaudeService(ClaudeService):
+    """
+    ClaudeService on AsyncAnthropic for the ASGI stack (asgi.py).
+
+    Prompts, request building and reply handling are inherited unchanged;
+    only _send and the waiting in _complete are async, so every public
+    method returns a coroutine and one event loop can
+    keep hundreds of generations in flight instead of one per worker thread.
+    """
+
+    single_flight_class = AsyncSingleFlight
+
+    def __init__(self, api_key: str, client: Optional[AsyncAnthropic] = None,
+                 timeout: Union[float, httpx.Timeout] = 60.0, transport: Optional[httpx.AsyncBaseTransport] = None,
+                 **kwargs):
+        # Other options as for ClaudeService
+        client = client or AsyncAnthropic(
+            api_key=api_key, max_retries=0, timeout=timeout,
+            http_client=httpx.AsyncClient(transport=transport, timeout=timeout) if transport else None
+        )
+        super().__init__(api_key, client=client, timeout=timeout, **kwargs)
+        self._late_calls = set()
+
+    def _forget(self, task: asyncio.Task) -> None:
+        self._late_calls.discard(task)
+        if not task.cancelled():
+            task.exception()  # retrieved, so a failed late call is not logged as unhandled
+
+    async def _send(self, request: Dict) -> Sent:
+        if not self.stream:
+            return Sent(await self.client.messages.create(**request), None)
+        started = time.perf_counter()
+        first_token = None
+        async with self.client.messages.stream(**request) as stream:
+            async for event in stream:
+                if first_token is None and event.type == 'content_block_delta':
+                    first_token = time.perf_counter() - started
+            return Sent(await stream.get_final_message(), first_token)
+
+    async def _complete(self, call: Call, deadline: Optional[float] = None,
+                        fallback: Optional[Callable[[], Any]] = None) -> Any:
+        pending = self._start(call, deadline, fallback)
+        if pending.cached is not None:
+            return call.parse(pending.cached)
+
+        async def send():
+            started = time.perf_counter()
+            attempts = []
+
+            def attempt():
+                attempts.append(None)
+                return self._send(pending.request)
+
+            sent = None
+            try:
+                sent = await self.resilience.acall(attempt, hedge=self._hedged(call))
+            finally:
+                self._sent(pending, started, len(attempts), sent)
+            return self._text(pending, sent)
+
+        try:
+            if pending.deadline is None:
+                text = await self.single_flight.do(pending.key, send, pending.wait)
+            else:
+                # Held until done, so a call that outlives its deadline is not garbage collected
+                task = asyncio.ensure_future(self.single_flight.do(pending.key, send, pending.wait))
+                self._late_calls.add(task)
+                task.add_done_callback(self._forget)
+                done, _ = await asyncio.wait({task}, timeout=pending.deadline)
+                if not done:
+                    return self._degrade(call, fallback, 'deadline')
+                text = task.result()
+        except Exception as e:
+            return self._failed(pending, e)
+        return call.parse(text)
+
+    async def aclose(self) -> None:
+        await self.client.close()
@@ -0,0 +1,254 @@
+from typing import Any, Dict, Optional
+import asyncio
+import json
+import math
+import os
+import random
+import threading
+import time
+
+import httpx
+
+from coalescing import request_key
+
+TRANSPORT_MODES = ('live', 'record', 'replay', 'synthetic')
+# Modes that never reach Anthropic and so need no API key
+OFFLINE_MODES = ('replay', 'synthetic')
+OFFLINE_API_KEY = 'offline'
+
+
+def fixture_key(request: httpx.Request) -> str:
+    """Fixture name for a Messages API request: a hash of its JSON body (model, prompt, stream, ...)"""
+    return request_key(json.loads(request.content or b'{}'))
+
+
+def _error_response(status: int, error_type: str, message: str, headers: Optional[Dict] = None) -> httpx.Response:
+    return httpx.Response(status, headers=headers,
+                          json={'type': 'error', 'error': {'type': error_type, 'message': message}})
+
+
+class FixtureStore:
+    """Recorded responses, one JSON file per request in a directory"""
+
+    def __init__(self, directory: str):
+        self.directory = directory
+        os.makedirs(directory, exist_ok=True)
+
+    def _path(self, key: str) -> str:
+        return os.path.join(self.directory, key + '.json')
+
+    def save(self, key: str, request: httpx.Request, response: httpx.Response, content: bytes) -> None:
+        fixture = {
+            'request': json.loads(request.content or b'{}'),
+            'status': response.status_code,
+            'content_type': response.headers.get('content-type', 'application/json'),
+            'body': content.decode('utf-8')
+        }
+        temp_path = f'{self._path(key)}.{os.getpid()}.{threading.get_ident()}.tmp'
+        with open(temp_path, 'w') as f:
+            json.dump(fixture, f, indent=1)
+        os.replace(temp_path, self._path(key))
+
+    def load(self, key: str) -> Optional[httpx.Response]:
+        try:
+            with open(self._path(key)) as f:
+                fixture = json.load(f)
+        except FileNotFoundError:
+            return None
+        return httpx.Response(fixture['status'], headers={'content-type': fixture['content_type']},
+                              content=fixture['body'].encode('utf-8'))
+
+
+class RecordTransport(httpx.BaseTransport, httpx.AsyncBaseTransport):
+    """Forwards to the real API and saves each response (streams included) before returning it"""
+
+    def __init__(self, store: FixtureStore, transport: Optional[httpx.BaseTransport] = None,
+                 async_transport: Optional[httpx.AsyncBaseTransport] = None):
+        self.store = store
+        self._transport = transport
+        self._async_transport = async_transport
+
+    def _replayable(self, request: httpx.Request, response: httpx.Response, content: bytes) -> httpx.Response:
+        self.store.save(fixture_key(request), request, response, content)
+        headers = {name: value for name, value in response.headers.items()
+                   if name.lower() not in ('content-encoding', 'content-length', 'transfer-encoding')}
+        return httpx.Response(response.status_code, headers=headers, content=content, request=request)
+
+    def handle_request(self, request: httpx.Request) -> httpx.Response:
+        self._transport = self._transport or httpx.HTTPTransport()
+        response = self._transport.handle_request(request)
+        try:
+            content = response.read()
+        finally:
+            response.close()
+        return self._replayable(request, response, content)
+
+    async def handle_async_request(self, request: httpx.Request) -> httpx.Response:
+        self._async_transport = self._async_transport or httpx.AsyncHTTPTransport()
+        response = await self._async_transport.handle_async_request(request)
+        try:
+            content = await response.aread()
+        finally:
+            await response.aclose()
+        return self._replayable(request, response, content)
+
+
+class ReplayTransport(httpx.BaseTransport, httpx.AsyncBaseTransport):
+    """Serves recorded responses; never touches the network"""
+
+    def __init__(self, store: FixtureStore):
+        self.store = store
+
+    def handle_request(self, request: httpx.Request) -> httpx.Response:
+        key = fixture_key(request)
+        response = self.store.load(key)
+        if response is None:
+            # A 400 is not retried, so a missing fixture fails fast with its name
+            return _error_response(400, 'invalid_request_error', f'No recorded response for request {key}')
+        return response
+
+    async def handle_async_request(self, request: httpx.Request) -> httpx.Response:
+        return self.handle_request(request)
+
+
+def synthesize(schema: Dict, name: str = 'value', rng: Optional[random.Random] = None) -> Any:
+    """A value that conforms to a JSON Schema subset (the shapes ClaudeService asks for)"""
+    rng = rng or random.Random()
+    kind = schema.get('type')
+    if kind == 'object' or (kind is None and 'properties' in schema):
+        properties = schema.get('properties') or {'summary': {}}
+        return {key: synthesize(subschema, key, rng) for key, subschema in properties.items()}
+    if kind == 'array':
+        return [synthesize(schema.get('items', {}), name, rng) for _ in range(3)]
+    if kind == 'integer':
+        return rng.randint(1, 100)
+    if kind == 'number':
+        return round(rng.uniform(1, 100), 2)
+    if kind == 'boolean':
+        return rng.random() < 0.5
+    return f'Synthetic {name.replace("_", " ")} {rng.randint(1, 999)}'
+
+
+def _sse(event_type: str, data: Dict) -> bytes:
+    return f'event: {event_type}\ndata: {json.dumps({"type": event_type, **data})}\n\n'.encode()
+
+
+def _stream_body(message: Dict) -> bytes:
+    """The message as Messages API stream events"""
+    start = {**message, 'content': [], 'stop_reason': None, 'usage': {**message['usage'], 'output_tokens': 1}}
+    events = [_sse('message_start', {'message': start})]
+    for index, block in enumerate(message['content']):
+        if block['type'] == 'tool_use':
+            events.append(_sse('content_block_start', {'index': index, 'content_block': {**block, 'input': {}}}))
+            delta = {'type': 'input_json_delta', 'partial_json': json.dumps(block['input'])}
+        else:
+            events.append(_sse('content_block_start', {'index': index, 'content_block': {'type': 'text', 'text': ''}}))
+            delta = {'type': 'text_delta', 'text': block['text']}
+        events.append(_sse('content_block_delta', {'index': index, 'delta': delta}))
+        events.append(_sse('content_block_stop', {'index': index}))
+    events.append(_sse('message_delta', {'delta': {'stop_reason': message['stop_reason'], 'stop_sequence': None},
+                                         'usage': {'output_tokens': message['usage']['output_tokens']}}))
+    events.append(_sse('message_stop', {}))
+    return b''.join(events)
+
+
+class SyntheticTransport(httpx.BaseTransport, httpx.AsyncBaseTransport):
+    """
+    Answers Messages API requests locally with schema-valid output.
+
+    Latency is lognormal around latency_ms (sigma 0 makes it constant).
+    error_rate of calls fail with error_status and a retry-after, to drive
+    retries and the circuit breaker. seed makes a run reproducible.
+    """
+
+    def __init__(self, latency_ms: float = 800.0, sigma: float = 0.5, error_rate: float = 0.0,
+                 error_status: int = 529, seed: Optional[int] = None):
+        self.latency_ms = latency_ms
+        self.sigma = sigma
+        self.error_rate = error_rate
+        self.error_status = error_status
+        self._rng = random.Random(seed)
+        self._lock = threading.Lock()
+        self._ids = 0
+
+    def _draw(self):
+        """Id, delay, whether to fail, and a content seed for the next request"""
+        with self._lock:
+            self._ids += 1
+            delay = self.latency_ms / 1000
+            if self.sigma:
+                # Median latency_ms; sigma 0.5 puts p95 at about 2.3x the median
+                delay *= math.exp(self.sigma * self._rng.gauss(0, 1))
+            return self._ids, delay, self._rng.random() < self.error_rate, self._rng.randrange(2 ** 32)
+
+    def _respond(self, request: httpx.Request, message_id: int, fail: bool, seed: int) -> httpx.Response:
+        if fail:
+            return _error_response(self.error_status, 'overloaded_error', 'Overloaded (synthetic)',
+                                   headers={'retry-after': '1'})
+        body = json.loads(request.content or b'{}')
+        rng = random.Random(seed)
+        tools = body.get('tools') or []
+        if tools:
+            tool = tools[0]
+            content = [{'type': 'tool_use', 'id': f'toolu_synthetic_{message_id}', 'name': tool['name'],
+                        'input': synthesize(tool['input_schema'], tool['name'], rng)}]
+            output = json.dumps(content[0]['input'])
+        else:
+            output = f'Synthetic reply {message_id}: a short, plausible piece of content.'
+            content = [{'type': 'text', 'text': output}]
+        message = {
+            'id': f'msg_synthetic_{message_id}', 'type': 'message', 'role': 'assistant',
+            'model': body.get('model', 'claude-3-haiku-20240307'), 'content': content,
+            'stop_reason': 'tool_use' if tools else 'end_turn', 'stop_sequence': None,
+            # Roughly four characters per token
+            'usage': {'input_tokens': len(request.content) // 4, 'output_tokens': max(len(output) // 4, 1)}
+        }
+        if body.get('stream'):
+            return httpx.Response(200, headers={'content-type': 'text/event-stream'}, content=_stream_body(message))
+        return httpx.Response(200, json=message)
+
+    def handle_request(self, request: httpx.Request) -> httpx.Response:
+        message_id, delay, fail, seed = self._draw()
+        time.sleep(delay)
+        return self._respond(request, message_id, fail, seed)
+
+    async def handle_async_request(self, request: httpx.Request) -> httpx.Response:
+        message_id, delay, fail, seed = self._draw()
+        await asyncio.sleep(delay)
+        return self._respond(request, message_id, fail, seed)
+
+
+def transport_from_config(config):
+    """
+    The Anthropic client transport CLAUDE_TRANSPORT selects.
+
+    - live (default): None, the SDK's own transport to the real API.
+    - record: the real API, saving every response to CLAUDE_FIXTURES_DIR.
+    - replay: the saved response for each request, byte for byte; a request
+      that was never recorded gets a 400 naming its fixture key.
+    - synthetic: no network; schema-valid output after a lognormal latency,
+      failing CLAUDE_SYNTHETIC_ERROR_RATE of calls, for load tests.
+
+    The transport sits under the SDK, so retries, streaming and reply
+    parsing run exactly as they do against the real API.
+    """
+    mode = config.get('CLAUDE_TRANSPORT', 'live')
+    if mode not in TRANSPORT_MODES:
+        raise ValueError(f'CLAUDE_TRANSPORT must be one of {", ".join(TRANSPORT_MODES)}, not {mode!r}')
+    if mode == 'record':
+        return RecordTransport(FixtureStore(config['CLAUDE_FIXTURES_DIR']))
+    if mode == 'replay':
+        return ReplayTransport(FixtureStore(config['CLAUDE_FIXTURES_DIR']))
+    if mode == 'synthetic':
+        return SyntheticTransport(
+            latency_ms=config.get('CLAUDE_SYNTHETIC_LATENCY_MS', 800.0),
+            sigma=config.get('CLAUDE_SYNTHETIC_LATENCY_SIGMA', 0.5),
+            error_rate=config.get('CLAUDE_SYNTHETIC_ERROR_RATE', 0.0),
+            seed=config.get('CLAUDE_SYNTHETIC_SEED')
+        )
+    return None
+
+
+def claude_enabled(config) -> bool:
+    """Whether AI routes can run: an API key, or a transport that needs none"""
+    return bool(config.get('CLAUDE_API_KEY')) or config.get('CLAUDE_TRANSPORT', 'live') in OFFLINE_MODES
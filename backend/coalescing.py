@@ -0,0 +1,257 @@
+from collections import OrderedDict
+from concurrent.futures import Future
+from typing import Any, Awaitable, Callable, Dict, Optional
+import asyncio
+import hashlib
+import json
+import os
+import threading
+import time
+
+# Lock and result files older than this belong to finished calls and are pruned
+STALE_FILE_SECONDS = 3600
+PRUNE_EVERY = 100
+
+
+def request_key(request: Dict) -> str:
+    """Stable key for a rendered model request (model, prompt, parameters)"""
+    return hashlib.sha256(json.dumps(request, sort_keys=True, default=str).encode()).hexdigest()
+
+
+class FileFlight:
+    """
+    Cross-process half of single-flight, for workers on one host.
+
+    The process that leads a call takes an exclusive flock on
+    <directory>/<key>.lock and publishes the result to <key>.json. A worker
+    that waited on the lock while that call was in flight reads the
+    published result instead of calling upstream again. Only successful
+    results are shared; after a failure each waiter makes its own call.
+    Waiters poll a non-blocking lock for at most the call's wait (default
+    wait_seconds), then call upstream uncoalesced, so a hung leader cannot
+    hold every worker past its deadline.
+    """
+
+    def __init__(self, directory: str, wait_seconds: float = 60.0, poll_seconds: float = 0.05):
+        import fcntl  # POSIX only; the setting is optional
+        self._fcntl = fcntl
+        self.directory = directory
+        self.wait_seconds = wait_seconds
+        self.poll_seconds = poll_seconds
+        self.lock_timeouts = 0
+        os.makedirs(directory, exist_ok=True)
+        self._publishes = 0
+
+    def _path(self, key: str, suffix: str) -> str:
+        return os.path.join(self.directory, key + suffix)
+
+    def try_lock(self, key: str):
+        """The locked file handle, or None while another process holds the lock"""
+        handle = open(self._path(key, '.lock'), 'a')
+        try:
+            self._fcntl.flock(handle, self._fcntl.LOCK_EX | self._fcntl.LOCK_NB)
+        except BlockingIOError:
+            handle.close()
+            return None
+        return handle
+
+    def _give_up_at(self, wait: Optional[float]) -> float:
+        return time.monotonic() + (self.wait_seconds if wait is None else wait)
+
+    def _gave_up(self, give_up_at: float) -> bool:
+        if time.monotonic() < give_up_at:
+            return False
+        self.lock_timeouts += 1
+        return True
+
+    def lock(self, key: str, wait: Optional[float] = None):
+        """The locked file handle, or None if the lock stayed taken for `wait` seconds"""
+        give_up_at = self._give_up_at(wait)
+        while True:
+            handle = self.try_lock(key)
+            if handle is not None or self._gave_up(give_up_at):
+                return handle
+            time.sleep(self.poll_seconds)
+
+    async def alock(self, key: str, wait: Optional[float] = None):
+        give_up_at = self._give_up_at(wait)
+        while True:
+            handle = self.try_lock(key)
+            if handle is not None or self._gave_up(give_up_at):
+                return handle
+            await asyncio.sleep(self.poll_seconds)
+
+    def unlock(self, handle) -> None:
+        self._fcntl.flock(handle, self._fcntl.LOCK_UN)
+        handle.close()
+
+    def published_since(self, key: str, since: float):
+        """(True, result) if a call finished after `since`, else (False, None)"""
+        try:
+            with open(self._path(key, '.json')) as f:
+                published = json.load(f)
+        except (OSError, ValueError):
+            return False, None
+        if published['finished_at'] < since:
+            return False, None
+        return True, published['result']
+
+    def publish(self, key: str, result: Any) -> None:
+        path = self._path(key, '.json')
+        temp_path = f'{path}.{os.getpid()}.{threading.get_ident()}.tmp'
+        with open(temp_path, 'w') as f:
+            json.dump({'finished_at': time.time(), 'result': result}, f)
+        os.replace(temp_path, path)
+        self._publishes += 1
+        if self._publishes % PRUNE_EVERY == 0:
+            self.prune()
+
+    def prune(self) -> None:
+        cutoff = time.time() - STALE_FILE_SECONDS
+        for entry in os.scandir(self.directory):
+            try:
+                if entry.stat().st_mtime < cutoff:
+                    os.unlink(entry.path)
+            except OSError:
+                pass
+
+    def run(self, key: str, fn: Callable[[], Any], wait: Optional[float] = None) -> Any:
+        started = time.time()
+        handle = self.lock(key, wait)
+        if handle is None:
+            # The leader is taking longer than this call may wait
+            return fn()
+        try:
+            found, result = self.published_since(key, started)
+            if found:
+                return result
+            result = fn()
+            self.publish(key, result)
+            return result
+        finally:
+            self.unlock(handle)
+
+    async def arun(self, key: str, fn: Callable[[], Awaitable[Any]], wait: Optional[float] = None) -> Any:
+        started = time.time()
+        handle = await self.alock(key, wait)
+        if handle is None:
+            return await fn()
+        try:
+            found, result = self.published_since(key, started)
+            if found:
+                return result
+            result = await fn()
+            self.publish(key, result)
+            return result
+        finally:
+            self.unlock(handle)
+
+
+class SingleFlight:
+    """
+    Collapses concurrent identical calls into one.
+
+    The first thread to call do() with a key runs fn; threads arriving with
+    the same key while it is in flight wait and receive the same result (or
+    exception). With a FileFlight the leader also coordinates with other
+    worker processes.
+    """
+
+    def __init__(self, files: Optional[FileFlight] = None):
+        self.files = files
+        self.shared_calls = 0
+        self._lock = threading.Lock()
+        self._in_flight: Dict[str, Future] = {}
+
+    def do(self, key: str, fn: Callable[[], Any], wait: Optional[float] = None) -> Any:
+        """Run fn once for concurrent callers of key; wait bounds the wait for another process's call"""
+        with self._lock:
+            future = self._in_flight.get(key)
+            leader = future is None
+            if leader:
+                future = self._in_flight[key] = Future()
+            else:
+                self.shared_calls += 1
+        if not leader:
+            return future.result()
+
+        try:
+            result = self.files.run(key, fn, wait) if self.files else fn()
+        except BaseException as e:
+            future.set_exception(e)
+            raise
+        else:
+            future.set_result(result)
+            return result
+        finally:
+            with self._lock:
+                del self._in_flight[key]
+
+
+class AsyncSingleFlight:
+    """
+    SingleFlight for coroutines on one event loop.
+
+    The leader's call runs as a task that every caller awaits through
+    asyncio.shield, so a disconnecting client does not cancel the request
+    the other callers are waiting on.
+    """
+
+    def __init__(self, files: Optional[FileFlight] = None):
+        self.files = files
+        self.shared_calls = 0
+        self._in_flight: Dict[str, asyncio.Task] = {}
+
+    async def do(self, key: str, fn: Callable[[], Awaitable[Any]], wait: Optional[float] = None) -> Any:
+        task = self._in_flight.get(key)
+        if task is None:
+            task = asyncio.ensure_future(self.files.arun(key, fn, wait) if self.files else fn())
+            self._in_flight[key] = task
+            task.add_done_callback(lambda _: self._in_flight.pop(key, None))
+        else:
+            self.shared_calls += 1
+        return await asyncio.shield(task)
+
+
+class ReplyCache:
+    """
+    Recent model replies by request key, for calls that may degrade.
+
+    A call that misses its deadline keeps running and stores its reply
+    here, so the next identical request is answered by the model instead
+    of the heuristic. Holds the most recently used max_entries replies for
+    ttl seconds.
+    """
+
+    def __init__(self, max_entries: int = 1000, ttl: float = 600.0, clock=time.monotonic):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.clock = clock
+        self.hits = 0
+        self._lock = threading.Lock()
+        self._entries: 'OrderedDict[str, tuple]' = OrderedDict()
+
+    @classmethod
+    def from_config(cls, config) -> 'ReplyCache':
+        return cls(max_entries=config.get('CLAUDE_REPLY_CACHE_SIZE', 1000),
+                   ttl=config.get('CLAUDE_REPLY_CACHE_TTL_SECONDS', 600.0))
+
+    def get(self, key: str) -> Optional[str]:
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            stored_at, reply = entry
+            if self.clock() - stored_at > self.ttl:
+                del self._entries[key]
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return reply
+
+    def put(self, key: str, reply: str) -> None:
+        with self._lock:
+            self._entries[key] = (self.clock(), reply)
+            self._entries.move_to_end(key)
+            if len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
@@ -1,13 +1,180 @@
+import json
 import os
 from dotenv import load_dotenv
+from sqlalchemy.pool import NullPool
+
+from db_pool import TimedQueuePool
+from db_routing import replica_binds
 
 load_dotenv()
 
+def env_bool(name, default=False, environ=os.environ):
+    value = environ.get(name)
+    if value is None or value == '':
+        return default
+    return value.strip().lower() in ('1', 'true', 'yes', 'on')
+
+def env_json(name, default, environ=os.environ):
+    """JSON object from the environment, merged over the default dict"""
+    value = environ.get(name)
+    if not value:
+        return default
+    return {**default, **json.loads(value)}
+
+def engine_options(uri, environ=os.environ):
+    """
+    Build SQLALCHEMY_ENGINE_OPTIONS from the environment.
+
+    DB_POOL_SIZE, DB_MAX_OVERFLOW, DB_POOL_TIMEOUT, DB_POOL_RECYCLE,
+    DB_POOL_PRE_PING and DB_STATEMENT_TIMEOUT_MS tune the pool. With
+    DB_PGBOUNCER=true the app keeps no pool of its own (PgBouncer does the
+    pooling) and the statement timeout is applied per transaction instead
+    of as a startup option, which PgBouncer rejects.
+    """
+    if uri.startswith('sqlite'):
+        # SQLite gets Flask-SQLAlchemy's defaults (StaticPool for :memory:)
+        return {}
+    
+    options = {'pool_pre_ping': env_bool('DB_POOL_PRE_PING', True, environ)}
+    statement_timeout_ms = int(environ.get('DB_STATEMENT_TIMEOUT_MS', 30000))
+    
+    if env_bool('DB_PGBOUNCER', False, environ):
+        options['poolclass'] = NullPool
+        return options
+    
+    options.update({
+        'poolclass': TimedQueuePool,
+        'pool_size': int(environ.get('DB_POOL_SIZE', 5)),
+        'max_overflow': int(environ.get('DB_MAX_OVERFLOW', 10)),
+        'pool_timeout': int(environ.get('DB_POOL_TIMEOUT', 30)),
+        'pool_recycle': int(environ.get('DB_POOL_RECYCLE', 1800)),
+    })
+    if statement_timeout_ms and uri.startswith('postgresql'):
+        options['connect_args'] = {'options': f'-c statement_timeout={statement_timeout_ms}'}
+    return options
+
 class Config:
     SECRET_KEY = os.environ.get('SECRET_KEY') or 'dev-secret-key-change-in-production'
     SQLALCHEMY_DATABASE_URI = os.environ.get('DATABASE_URL') or 'postgresql://localhost:5432/ai_content_strategist'
     SQLALCHEMY_TRACK_MODIFICATIONS = False
     CLAUDE_API_KEY = os.environ.get('CLAUDE_API_KEY')
+    JSON_BACKEND = os.environ.get('JSON_BACKEND', 'auto')  # auto, orjson or json
+    SQLALCHEMY_ENGINE_OPTIONS = engine_options(SQLALCHEMY_DATABASE_URI)
+    DB_PGBOUNCER = env_bool('DB_PGBOUNCER')
+    DB_STATEMENT_TIMEOUT_MS = int(os.environ.get('DB_STATEMENT_TIMEOUT_MS', 30000))
+    
+    # Read replicas: comma-separated URIs; GET requests read from a healthy one
+    DATABASE_REPLICA_URLS = [uri.strip() for uri in os.environ.get('DATABASE_REPLICA_URLS', '').split(',') if uri.strip()]
+    SQLALCHEMY_BINDS = replica_binds(DATABASE_REPLICA_URLS, engine_options)
+    REPLICA_MAX_LAG_SECONDS = float(os.environ.get('REPLICA_MAX_LAG_SECONDS', 5))
+    REPLICA_LAG_CHECK_INTERVAL = float(os.environ.get('REPLICA_LAG_CHECK_INTERVAL', 2))
+
+    # Analytics storage: Postgres keeps analytics in monthly partitions, and raw
+    # rows older than the retention are compacted into the weekly rollups
+    ANALYTICS_RAW_RETENTION_DAYS = int(os.environ.get('ANALYTICS_RAW_RETENTION_DAYS', 395))
+    ANALYTICS_PARTITIONS_AHEAD = int(os.environ.get('ANALYTICS_PARTITIONS_AHEAD', 3))  # months created in advance
+
+    # Learned posting times (posting_times.py): weekday x hour engagement histograms
+    POSTING_TIMES_MIN_POSTS = int(os.environ.get('POSTING_TIMES_MIN_POSTS', 5))  # posts before a histogram is used
+    POSTING_TIMES_BANDWIDTH_HOURS = float(os.environ.get('POSTING_TIMES_BANDWIDTH_HOURS', 1.5))
+    POSTING_TIMES_REBUILD_SECONDS = float(os.environ.get('POSTING_TIMES_REBUILD_SECONDS', 3600))
+
+    # Trending topic momentum (trend_scores.py): EWMA half-life, projection horizon, deactivation
+    TREND_HALF_LIFE_HOURS = float(os.environ.get('TREND_HALF_LIFE_HOURS', 24))
+    TREND_HORIZON_HOURS = float(os.environ.get('TREND_HORIZON_HOURS', 24))  # how far velocity is projected
+    TREND_STALE_HOURS = float(os.environ.get('TREND_STALE_HOURS', 72))  # topics unseen this long go inactive
+
+    # Spike detection on analytics ingest (anomalies.py): a day's views against the item's running stats
+    ANOMALY_Z_SCORE = float(os.environ.get('ANOMALY_Z_SCORE', 3))  # standard deviations above the mean
+    ANOMALY_GROWTH_FACTOR = float(os.environ.get('ANOMALY_GROWTH_FACTOR', 3))  # times the previous day
+    ANOMALY_MIN_SAMPLES = int(os.environ.get('ANOMALY_MIN_SAMPLES', 5))  # days before z-scores count
+    ANOMALY_MIN_VIEWS = int(os.environ.get('ANOMALY_MIN_VIEWS', 100))
+    ANOMALY_COOLDOWN_DAYS = int(os.environ.get('ANOMALY_COOLDOWN_DAYS', 3))  # between reports per item and platform
+
+    # Percentile benchmarks (benchmarks.py): t-digests of our own content per group
+    BENCHMARK_COMPRESSION = float(os.environ.get('BENCHMARK_COMPRESSION', 100))  # ~centroids per digest
+    BENCHMARK_MIN_SAMPLES = int(os.environ.get('BENCHMARK_MIN_SAMPLES', 5))  # items before a group is ranked
+    BENCHMARK_CHUNK_SIZE = int(os.environ.get('BENCHMARK_CHUNK_SIZE', 5000))  # items sketched per worker task
+    BENCHMARK_WORKERS = int(os.environ.get('BENCHMARK_WORKERS', 4))
+    BENCHMARK_REBUILD_SECONDS = float(os.environ.get('BENCHMARK_REBUILD_SECONDS', 3600))  # full re-sketch, in the background
+
+    # Hashtag statistics (hashtag_stats.py): heavy hitters, count-min sketches and co-occurrence
+    HASHTAG_TOP_K_CAPACITY = int(os.environ.get('HASHTAG_TOP_K_CAPACITY', 1000))  # Space-Saving counters
+    HASHTAG_SKETCH_WIDTH = int(os.environ.get('HASHTAG_SKETCH_WIDTH', 2048))
+    HASHTAG_SKETCH_DEPTH = int(os.environ.get('HASHTAG_SKETCH_DEPTH', 4))
+    HASHTAG_REBUILD_SECONDS = float(os.environ.get('HASHTAG_REBUILD_SECONDS', 3600))
+
+    # Claude calls: per-attempt timeouts, retries with backoff, circuit breaker, hedging
+    CLAUDE_TIMEOUT_SECONDS = float(os.environ.get('CLAUDE_TIMEOUT_SECONDS', 60))
+    CLAUDE_CONNECT_TIMEOUT_SECONDS = float(os.environ.get('CLAUDE_CONNECT_TIMEOUT_SECONDS', 5))
+    CLAUDE_MAX_RETRIES = int(os.environ.get('CLAUDE_MAX_RETRIES', 3))
+    CLAUDE_BACKOFF_BASE = float(os.environ.get('CLAUDE_BACKOFF_BASE', 0.5))
+    CLAUDE_BACKOFF_MAX = float(os.environ.get('CLAUDE_BACKOFF_MAX', 8))
+    CLAUDE_MAX_RETRY_AFTER = float(os.environ.get('CLAUDE_MAX_RETRY_AFTER', 30))
+    CLAUDE_BREAKER_THRESHOLD = int(os.environ.get('CLAUDE_BREAKER_THRESHOLD', 5))
+    CLAUDE_BREAKER_RESET_SECONDS = float(os.environ.get('CLAUDE_BREAKER_RESET_SECONDS', 30))
+    CLAUDE_HEDGE_AFTER_MS = int(os.environ.get('CLAUDE_HEDGE_AFTER_MS', 0))  # 0 disables hedging
+    # Directory for lock files that coalesce identical calls across worker processes
+    CLAUDE_COALESCE_DIR = os.environ.get('CLAUDE_COALESCE_DIR')
+
+    # Model routing: each task (or content_field.<field_type>) picks a tier,
+    # max_tokens, per-attempt timeout and p95 latency SLO in seconds. A task
+    # whose p95 breaches its SLO moves one tier faster for the cooldown.
+    # Ideas and content fields also have a deadline: past it the route answers
+    # with a local heuristic flagged degraded while the call finishes.
+    CLAUDE_MODEL_TIERS = env_json('CLAUDE_MODEL_TIERS', {
+        'quality': 'claude-sonnet-4-20250514',
+        'balanced': 'claude-3-5-haiku-20241022',
+        'fast': 'claude-3-haiku-20240307'
+    })
+    CLAUDE_TIER_ORDER = ['quality', 'balanced', 'fast']  # slowest to fastest
+    CLAUDE_MODEL_ROUTES = env_json('CLAUDE_MODEL_ROUTES', {
+        'strategy': {'tier': 'quality', 'max_tokens': 2000, 'timeout': 90, 'slo_p95': 40},
+        'weekly_plan': {'tier': 'quality', 'max_tokens': 2000, 'timeout': 90, 'slo_p95': 40},
+        'analysis': {'tier': 'balanced', 'max_tokens': 1500, 'timeout': 60, 'slo_p95': 25},
+        'ideas': {'tier': 'balanced', 'max_tokens': 1500, 'timeout': 60, 'slo_p95': 25, 'deadline': 20},
+        'optimize': {'tier': 'balanced', 'max_tokens': 1000, 'timeout': 45, 'slo_p95': 15},
+        'content_field': {'tier': 'balanced', 'max_tokens': 1000, 'timeout': 30, 'slo_p95': 10, 'deadline': 10},
+        'content_field.script': {'tier': 'quality', 'max_tokens': 1000, 'timeout': 60, 'slo_p95': 25, 'deadline': 20},
+        'content_field.hook': {'tier': 'fast', 'max_tokens': 200, 'timeout': 15, 'slo_p95': 4, 'deadline': 5},
+        'content_field.hashtags': {'tier': 'fast', 'max_tokens': 300, 'timeout': 15, 'slo_p95': 4, 'deadline': 5},
+        'content_field.tone': {'tier': 'fast', 'max_tokens': 200, 'timeout': 15, 'slo_p95': 4, 'deadline': 5},
+        'content_field.call_to_action': {'tier': 'fast', 'max_tokens': 200, 'timeout': 15, 'slo_p95': 4,
+                                         'deadline': 5},
+        'default': {'tier': 'fast'}
+    })
+    CLAUDE_DEGRADE_COOLDOWN_SECONDS = float(os.environ.get('CLAUDE_DEGRADE_COOLDOWN_SECONDS', 300))
+    CLAUDE_DEGRADE_MIN_SAMPLES = int(os.environ.get('CLAUDE_DEGRADE_MIN_SAMPLES', 20))
+    # Replies of calls that can degrade, kept so a call that missed its deadline still serves the next request
+    CLAUDE_REPLY_CACHE_SIZE = int(os.environ.get('CLAUDE_REPLY_CACHE_SIZE', 1000))
+    CLAUDE_REPLY_CACHE_TTL_SECONDS = float(os.environ.get('CLAUDE_REPLY_CACHE_TTL_SECONDS', 600))
+
+    # Telemetry: USD per million tokens of each kind, for the cost estimate in
+    # /metrics and /api/stats/ai-calls. Streaming adds time to first token.
+    CLAUDE_MODEL_PRICES = env_json('CLAUDE_MODEL_PRICES', {
+        'claude-sonnet-4-20250514': {'input': 3.0, 'output': 15.0, 'cache_write': 3.75, 'cache_read': 0.30},
+        'claude-3-5-haiku-20241022': {'input': 0.80, 'output': 4.0, 'cache_write': 1.0, 'cache_read': 0.08},
+        'claude-3-haiku-20240307': {'input': 0.25, 'output': 1.25, 'cache_write': 0.30, 'cache_read': 0.03}
+    })
+    CLAUDE_TELEMETRY_WINDOW = int(os.environ.get('CLAUDE_TELEMETRY_WINDOW', 1000))  # calls per task in quantiles
+    CLAUDE_STREAM_RESPONSES = env_bool('CLAUDE_STREAM_RESPONSES', True)
+
+    # Offline Claude backends (claude_transport.py): live, record, replay or synthetic
+    CLAUDE_TRANSPORT = os.environ.get('CLAUDE_TRANSPORT', 'live')
+    CLAUDE_FIXTURES_DIR = os.environ.get('CLAUDE_FIXTURES_DIR', 'fixtures/claude')
+    CLAUDE_SYNTHETIC_LATENCY_MS = float(os.environ.get('CLAUDE_SYNTHETIC_LATENCY_MS', 800))  # median
+    CLAUDE_SYNTHETIC_LATENCY_SIGMA = float(os.environ.get('CLAUDE_SYNTHETIC_LATENCY_SIGMA', 0.5))  # lognormal spread
+    CLAUDE_SYNTHETIC_ERROR_RATE = float(os.environ.get('CLAUDE_SYNTHETIC_ERROR_RATE', 0))
+    CLAUDE_SYNTHETIC_SEED = int(os.environ['CLAUDE_SYNTHETIC_SEED']) if os.environ.get('CLAUDE_SYNTHETIC_SEED') else None
+
+    # JSON replies: 'tools' forces a tool call whose input is the result, 'text'
+    # relies on prompt instructions; either way replies are salvaged locally
+    CLAUDE_STRUCTURED_OUTPUT = os.environ.get('CLAUDE_STRUCTURED_OUTPUT', 'tools')
+
+    # Bulk idea generation: 'anthropic' submits to the Message Batches API,
+    # 'local' runs the batch in-process through the normal Messages API
+    CLAUDE_BATCH_BACKEND = os.environ.get('CLAUDE_BATCH_BACKEND', 'anthropic')
+    CLAUDE_BATCH_POLL_SECONDS = float(os.environ.get('CLAUDE_BATCH_POLL_SECONDS', 60))
     
 class DevelopmentConfig(Config):
     DEBUG = True
@@ -15,8 +182,16 @@ class DevelopmentConfig(Config):
 class ProductionConfig(Config):
     DEBUG = False
     
+class TestingConfig(Config):
+    TESTING = True
+    SQLALCHEMY_DATABASE_URI = 'sqlite://'
+    SQLALCHEMY_ENGINE_OPTIONS = {}
+    SQLALCHEMY_BINDS = {}
+    CLAUDE_API_KEY = None
+    
 config = {
     'development': DevelopmentConfig,
     'production': ProductionConfig,
+    'testing': TestingConfig,
     'default': DevelopmentConfig
 } 
\ No newline at end of file
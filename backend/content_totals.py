@@ -0,0 +1,173 @@
+from typing import Dict, Mapping, Optional
+import logging
+
+import click
+from flask.cli import AppGroup
+from sqlalchemy import Float, Integer, bindparam, case, func, select, update
+
+from models import db, AnalyticsWeekly, ContentManager
+from versioning import bump_versions
+
+logger = logging.getLogger(__name__)
+
+METRICS = ('views', 'likes', 'shares', 'comments', 'saves')
+INTERACTIONS = ('likes', 'comments', 'shares', 'saves')
+TOTALS = METRICS + ('retention_rate', 'engagement_rate', 'analytics_days')
+# Rates are recomputed from float sums, which differ in the last bits between the two paths
+RATE_TOLERANCE = 1e-6
+
+Delta = Dict[str, float]
+
+
+def engagement_rate(totals: Mapping) -> float:
+    """Interactions per 100 views"""
+    views = totals['views'] or 0
+    return sum(totals[name] or 0 for name in INTERACTIONS) * 100.0 / views if views else 0.0
+
+
+def refresh_engagement(item: ContentManager) -> None:
+    """Recompute engagement_rate from hand-entered totals"""
+    item.engagement_rate = engagement_rate({metric: getattr(item, metric) for metric in METRICS})
+
+
+def _engagement_sql(totals: Mapping):
+    return func.coalesce(sum(totals[name] for name in INTERACTIONS) * 100.0 / func.nullif(totals['views'], 0), 0.0)
+
+
+def _delta_update():
+    """UPDATE adding one content item's Analytics delta to its totals, run once per item (executemany)"""
+    table = ContentManager.__table__
+    # Content without analytics rows holds hand-entered numbers, which its first rows replace
+    manual = table.c.analytics_days == 0
+    totals = {
+        metric: case((manual, bindparam(f'd_{metric}', type_=Integer)),
+                     else_=table.c[metric] + bindparam(f'd_{metric}', type_=Integer))
+        for metric in METRICS
+    }
+    days = table.c.analytics_days + bindparam('d_days', type_=Integer)
+    retention_sum = (case((manual, 0.0), else_=table.c.retention_rate * table.c.analytics_days)
+                     + bindparam('d_retention', type_=Float))
+    return update(table).where(table.c.id == bindparam('b_id')).values(
+        **totals,
+        retention_rate=case((days > 0, retention_sum / days), else_=0.0),
+        engagement_rate=_engagement_sql(totals),
+        analytics_days=days,
+        # Totals changing is not an edit of the content item
+        updated_at=table.c.updated_at
+    )
+
+
+def apply_totals(connection, deltas: Mapping[int, Delta]) -> None:
+    """
+    Add Analytics deltas to the ContentManager totals on the given
+    connection. Keys are content ids; each delta has the metric sums,
+    retention_rate_sum and days (+/- Analytics rows), as rollups.py builds
+    them.
+    """
+    rows = [
+        {'b_id': content_id, 'd_days': delta['days'], 'd_retention': delta['retention_rate_sum'],
+         **{f'd_{metric}': delta[metric] for metric in METRICS}}
+        for content_id, delta in deltas.items() if any(delta.values())
+    ]
+    if rows:
+        connection.execute(_delta_update(), rows)
+
+
+def expected_totals(sums: Optional[Mapping]) -> Dict:
+    """Totals for content whose Analytics add up to sums (metric sums, retention_rate_sum, days)"""
+    if not sums or not sums['days']:
+        totals = dict.fromkeys(METRICS, 0)
+        totals.update(retention_rate=0.0, analytics_days=0)
+    else:
+        totals = {metric: int(sums[metric] or 0) for metric in METRICS}
+        totals.update(retention_rate=(sums['retention_rate_sum'] or 0.0) / sums['days'],
+                      analytics_days=int(sums['days']))
+    totals['engagement_rate'] = engagement_rate(totals)
+    return totals
+
+
+def _drifted(current: Mapping, expected: Mapping) -> bool:
+    for name in TOTALS:
+        if name in ('retention_rate', 'engagement_rate'):
+            if abs((current[name] or 0.0) - expected[name]) > RATE_TOLERANCE:
+                return True
+        elif (current[name] or 0) != expected[name]:
+            return True
+    return False
+
+
+def reconcile(batch_size: int = 500, progress=None) -> int:
+    """
+    Repair ContentManager totals that drifted from their Analytics, in
+    batches of batch_size content items, each in its own transaction.
+
+    Expected totals come from the weekly rollups, which still hold the weeks
+    compaction removed from Analytics; rebuild them first (rollups backfill)
+    after writes that bypassed the ORM. Each batch is locked before its sums
+    are read, so a concurrent ingest applies its delta after the repair
+    rather than being overwritten by it. Content without analytics keeps its
+    hand-entered numbers. Returns the number of content items repaired.
+    """
+    table = ContentManager.__table__
+    sums_columns = [func.sum(getattr(AnalyticsWeekly, metric)).label(metric) for metric in METRICS]
+    sums_columns += [func.sum(AnalyticsWeekly.retention_rate_sum).label('retention_rate_sum'),
+                     func.sum(AnalyticsWeekly.days).label('days')]
+    repair = update(table).where(table.c.id == bindparam('b_id')).values(
+        {**{name: bindparam(f'v_{name}') for name in TOTALS}, 'updated_at': table.c.updated_at}
+    )
+
+    repaired, last_id = 0, 0
+    while True:
+        with db.engine.begin() as connection:
+            current = connection.execute(
+                select(table.c.id, *(table.c[name] for name in TOTALS))
+                .where(table.c.id > last_id).order_by(table.c.id).limit(batch_size).with_for_update()
+            ).mappings().all()
+            if not current:
+                break
+            ids = [row['id'] for row in current]
+            sums = {row['content_id']: row for row in connection.execute(
+                select(AnalyticsWeekly.content_id, *sums_columns)
+                .where(AnalyticsWeekly.content_id.in_(ids)).group_by(AnalyticsWeekly.content_id)
+            ).mappings()}
+
+            fixes = []
+            for row in current:
+                if row['id'] not in sums and not row['analytics_days']:
+                    continue
+                expected = expected_totals(sums.get(row['id']))
+                if _drifted(row, expected):
+                    fixes.append({'b_id': row['id'], **{f'v_{name}': value for name, value in expected.items()}})
+            if fixes:
+                connection.execute(repair, fixes)
+                bump_versions(connection, [ContentManager.__tablename__])
+        repaired += len(fixes)
+        last_id = ids[-1]
+        if progress:
+            progress(last_id, len(fixes))
+    if repaired:
+        logger.info('Repaired totals of %d content items', repaired)
+    return repaired
+
+
+totals_cli = AppGroup('totals', help='Maintain the analytics totals on content items.')
+
+
+@totals_cli.command('reconcile')
+@click.option('--batch-size', default=500, show_default=True, help='Content items checked per transaction.')
+def reconcile_command(batch_size):
+    """Repair content totals that drifted from their analytics."""
+    click.echo(f'Repaired {reconcile(batch_size)} content items')
+
+
+def init_content_totals(app) -> None:
+    """
+    Add the `flask totals reconcile` command.
+
+    ContentManager views, likes, shares, comments and saves are the sums of
+    the item's Analytics rows, retention_rate their mean and engagement_rate
+    interactions per 100 views, so list views need no join. The rollup
+    events (rollups.py) add each flush's Analytics delta in the same
+    transaction; reconcile() repairs what those cannot see.
+    """
+    app.cli.add_command(totals_cli)
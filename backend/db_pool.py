@@ -0,0 +1,125 @@
+from collections import deque
+from typing import Dict
+import threading
+import time
+
+from sqlalchemy import event, exc
+from sqlalchemy.pool import QueuePool
+
+
+class PoolWaitStats:
+    """Thread-safe record of how long checkouts waited for a pooled connection"""
+
+    def __init__(self, window: int = 1000):
+        self._lock = threading.Lock()
+        self._recent = deque(maxlen=window)
+        self.count = 0
+        self.total_seconds = 0.0
+        self.max_seconds = 0.0
+        self.timeouts = 0
+        self.errors = 0
+
+    def record(self, seconds: float, timed_out: bool = False) -> None:
+        with self._lock:
+            self.count += 1
+            self.total_seconds += seconds
+            self.max_seconds = max(self.max_seconds, seconds)
+            self._recent.append(seconds)
+            if timed_out:
+                self.timeouts += 1
+
+    def record_error(self) -> None:
+        """A checkout that failed for another reason than the pool timeout (e.g. connect refused)"""
+        with self._lock:
+            self.errors += 1
+
+    def snapshot(self) -> Dict:
+        with self._lock:
+            recent = sorted(self._recent)
+            count, total, max_seconds, timeouts = self.count, self.total_seconds, self.max_seconds, self.timeouts
+            errors = self.errors
+
+        def pct(p):
+            return recent[min(int(p / 100 * len(recent)), len(recent) - 1)] * 1000 if recent else 0.0
+
+        return {
+            'checkouts': count,
+            'timeouts': timeouts,
+            'errors': errors,
+            'avg_ms': round(total / count * 1000, 3) if count else 0.0,
+            'p95_ms': round(pct(95), 3),
+            'max_ms': round(max_seconds * 1000, 3)
+        }
+
+
+class TimedQueuePool(QueuePool):
+    """QueuePool that records how long each checkout waited for a free connection"""
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.wait_stats = PoolWaitStats()
+
+    def _do_get(self):
+        started = time.perf_counter()
+        try:
+            connection = super()._do_get()
+        except exc.TimeoutError:
+            self.wait_stats.record(time.perf_counter() - started, timed_out=True)
+            raise
+        except Exception:
+            # Connect and auth failures are not waits for the pool
+            self.wait_stats.record_error()
+            raise
+        self.wait_stats.record(time.perf_counter() - started)
+        return connection
+
+    def recreate(self):
+        # dispose() swaps in a fresh pool; keep the counters across it
+        pool = super().recreate()
+        pool.wait_stats = self.wait_stats
+        return pool
+
+
+def install_statement_timeout(engine, timeout_ms: int) -> None:
+    """
+    Apply statement_timeout per transaction with SET LOCAL.
+
+    Used in PgBouncer mode, where transaction pooling rejects the
+    `options` startup parameter and a session-level SET would leak onto
+    other clients sharing the server connection.
+    """
+    @event.listens_for(engine, 'begin')
+    def set_statement_timeout(connection):
+        connection.exec_driver_sql(f'SET LOCAL statement_timeout = {int(timeout_ms)}')
+
+
+def pool_stats(engine) -> Dict:
+    """Checked-out, overflow and wait-time metrics for an engine's pool"""
+    pool = engine.pool
+    stats = {
+        'pool_class': type(pool).__name__,
+        'status': pool.status()
+    }
+    if isinstance(pool, QueuePool):
+        stats.update({
+            'size': pool.size(),
+            'checked_out': pool.checkedout(),
+            'checked_in': pool.checkedin(),
+            'overflow': max(pool.overflow(), 0),
+            'max_overflow': pool._max_overflow,
+            'timeout_seconds': pool.timeout()
+        })
+    if hasattr(pool, 'wait_stats'):
+        stats['wait'] = pool.wait_stats.snapshot()
+    return stats
+
+
+def init_db_pool(app, db) -> None:
+    """Engine setup that cannot be expressed as create_engine options"""
+    timeout_ms = app.config.get('DB_STATEMENT_TIMEOUT_MS')
+    if not (app.config.get('DB_PGBOUNCER') and timeout_ms):
+        return
+    with app.app_context():
+        for engine in db.engines.values():
+            if engine.dialect.name == 'postgresql':
+                install_statement_timeout(engine, timeout_ms)
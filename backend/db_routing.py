@@ -0,0 +1,174 @@
+from contextlib import contextmanager
+from functools import wraps
+from typing import Dict, List, Optional, Tuple
+import logging
+import random
+import threading
+import time
+
+from flask import current_app, has_app_context, has_request_context, request
+from flask_sqlalchemy.session import Session
+from sqlalchemy.exc import DBAPIError
+from sqlalchemy.sql.dml import UpdateBase
+
+logger = logging.getLogger(__name__)
+
+REPLICA_BIND_PREFIX = 'replica_'
+
+# session.info keys
+PRIMARY_KEY = 'routing_use_primary'        # a write happened or the view demands the primary
+REPLICA_KEY = 'routing_replica'            # replica chosen for this session
+READ_REPLICA_KEY = 'routing_read_replica'  # explicit read_replica() block outside GET
+
+READ_METHODS = ('GET', 'HEAD')
+
+
+def replica_binds(uris: List[str], options_for) -> Dict[str, Dict]:
+    """SQLALCHEMY_BINDS entries for each replica URI"""
+    return {
+        f'{REPLICA_BIND_PREFIX}{index}': {'url': uri, **options_for(uri)}
+        for index, uri in enumerate(uris)
+    }
+
+
+def measure_lag(engine) -> float:
+    """Replication lag of a replica in seconds (0 for non-Postgres engines)"""
+    if engine.dialect.name != 'postgresql':
+        return 0.0
+    with engine.connect() as connection:
+        lag = connection.exec_driver_sql("""
+            SELECT CASE
+                WHEN NOT pg_is_in_recovery() THEN 0
+                WHEN pg_last_wal_receive_lsn() = pg_last_wal_replay_lsn() THEN 0
+                ELSE COALESCE(EXTRACT(EPOCH FROM now() - pg_last_xact_replay_timestamp()), 0)
+            END
+        """).scalar()
+    return float(lag or 0)
+
+
+class ReplicaMonitor:
+    """Caches per-replica lag so routing costs at most one probe per check interval"""
+
+    def __init__(self, max_lag_seconds: float, check_interval: float, probe=measure_lag):
+        self.max_lag_seconds = max_lag_seconds
+        self.check_interval = check_interval
+        self.probe = probe
+        self._lock = threading.Lock()
+        self._lag: Dict[str, Tuple[float, Optional[float]]] = {}
+
+    def lag(self, key: str, engine) -> Optional[float]:
+        """Last measured lag in seconds, or None when the replica is unreachable"""
+        now = time.monotonic()
+        with self._lock:
+            cached = self._lag.get(key)
+        if cached and now - cached[0] < self.check_interval:
+            return cached[1]
+        try:
+            lag = self.probe(engine)
+        except DBAPIError:
+            logger.warning("Replica %s is unreachable; routing reads to the primary", key, exc_info=True)
+            lag = None
+        with self._lock:
+            self._lag[key] = (now, lag)
+        return lag
+
+    def is_healthy(self, key: str, engine) -> bool:
+        lag = self.lag(key, engine)
+        return lag is not None and lag <= self.max_lag_seconds
+
+    def snapshot(self) -> Dict[str, Optional[float]]:
+        with self._lock:
+            return {key: lag for key, (_, lag) in self._lag.items()}
+
+
+class RoutingSession(Session):
+    """
+    Session that sends reads to a replica when it is safe to.
+
+    Reads go to a replica during GET/HEAD requests and inside read_replica()
+    blocks. Flushes and DML statements always use the primary, and once a
+    session has written, every later read in the same request stays on the
+    primary so it sees its own writes. Replicas lagging more than
+    REPLICA_MAX_LAG_SECONDS (or unreachable) are skipped.
+    """
+
+    def get_bind(self, mapper=None, clause=None, bind=None, **kwargs):
+        if bind is not None:
+            return bind
+
+        primary = super().get_bind(mapper=mapper, clause=clause, **kwargs)
+        if self._flushing or isinstance(clause, UpdateBase):
+            self.info[PRIMARY_KEY] = True
+            return primary
+        if primary is not self._db.engines.get(None):
+            # Models on their own bind keys are not replicated
+            return primary
+
+        replica_key = self._replica_key()
+        return self._db.engines[replica_key] if replica_key else primary
+
+    def _wants_replica(self) -> bool:
+        if self.info.get(PRIMARY_KEY) or not has_app_context():
+            return False
+        if self.info.get(READ_REPLICA_KEY):
+            return True
+        return has_request_context() and request.method in READ_METHODS
+
+    def _replica_key(self) -> Optional[str]:
+        if not self._wants_replica():
+            return None
+        if REPLICA_KEY in self.info:
+            return self.info[REPLICA_KEY]
+
+        monitor = current_app.extensions.get('replica_monitor')
+        engines = self._db.engines
+        candidates = [key for key in engines if isinstance(key, str) and key.startswith(REPLICA_BIND_PREFIX)]
+        healthy = [key for key in candidates if monitor is None or monitor.is_healthy(key, engines[key])]
+        # Stick to one replica (or the primary) for the rest of the session
+        self.info[REPLICA_KEY] = random.choice(healthy) if healthy else None
+        return self.info[REPLICA_KEY]
+
+
+def _session():
+    return current_app.extensions['sqlalchemy'].session()
+
+
+@contextmanager
+def read_replica():
+    """Route the reads in this block to a replica, e.g. analytics reads in POST handlers"""
+    session = _session()
+    previous = session.info.get(READ_REPLICA_KEY)
+    session.info[READ_REPLICA_KEY] = True
+    try:
+        yield session
+    finally:
+        if previous is None:
+            session.info.pop(READ_REPLICA_KEY, None)
+        else:
+            session.info[READ_REPLICA_KEY] = previous
+
+
+def primary_only(view):
+    """Keep every query of a view on the primary (GET handlers that write)"""
+    @wraps(view)
+    def wrapper(*args, **kwargs):
+        _session().info[PRIMARY_KEY] = True
+        return view(*args, **kwargs)
+    return wrapper
+
+
+def reset_routing() -> None:
+    """Forget routing decisions; each request decides replica vs primary afresh"""
+    info = _session().info
+    for key in (PRIMARY_KEY, REPLICA_KEY, READ_REPLICA_KEY):
+        info.pop(key, None)
+
+
+def init_routing(app) -> None:
+    app.extensions['replica_monitor'] = ReplicaMonitor(
+        max_lag_seconds=app.config.get('REPLICA_MAX_LAG_SECONDS', 5.0),
+        check_interval=app.config.get('REPLICA_LAG_CHECK_INTERVAL', 2.0)
+    )
+    # The session normally lives for one app context, but an app context can
+    # outlive a request (CLI commands, tests), so reset per request as well
+    app.before_request(reset_routing)
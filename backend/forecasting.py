@@ -0,0 +1,223 @@
+from datetime import date, datetime, timedelta
+from typing import Dict, List, Optional, Sequence
+import logging
+
+import click
+import numpy as np
+from flask.cli import AppGroup
+from sqlalchemy import delete, func, insert, or_, select
+
+from models import db, Analytics, ContentForecast, ContentManager
+from versioning import bump_versions, mark_written
+
+logger = logging.getLogger(__name__)
+
+HORIZONS = (7, 30)  # Days after publishing
+TARGETS = ('views', 'likes')
+# Time constants tried by the fit, in days; log-spaced so early and slow burners fit equally well
+TAUS = np.geomspace(0.5, 120.0, 32)
+MIN_DAYS = 3  # Days of analytics before a curve is fitted
+MAX_AGE_DAYS = 90  # Older content is no longer refitted
+Z = 1.96  # 95% prediction intervals
+FORECAST_COLUMNS = tuple(f'{target}_{horizon}{suffix}' for target in TARGETS for horizon in HORIZONS
+                         for suffix in ('', '_low', '_high')) + tuple(f'{target}_tau' for target in TARGETS)
+
+
+def fit_curves(cumulative: np.ndarray, observed: np.ndarray) -> Dict[str, np.ndarray]:
+    """
+    Least-squares fit of C(t) = A * (1 - exp(-t / tau)) to each row of an
+    (items, days) array of cumulative totals, where day t is column t - 1
+    and observed (items,) is how many leading columns each row has.
+
+    For a fixed tau the best A has a closed form, sum(f*y) / sum(f*f), so
+    every tau in TAUS is tried for every item with two einsums and each
+    item keeps the one with the smallest squared error. Returns A, tau,
+    the residual variance and sum(f*f) at the chosen tau, per item.
+    """
+    days = np.arange(1, cumulative.shape[1] + 1)
+    mask = (days[None, :] <= observed[:, None]).astype(float)
+    shapes = 1.0 - np.exp(-days[None, :] / TAUS[:, None])  # (taus, days)
+    masked = cumulative * mask
+    sum_ff = np.einsum('nd,kd->nk', mask, shapes ** 2)
+    sum_fy = np.einsum('nd,kd->nk', masked, shapes)
+    sum_yy = np.einsum('nd,nd->n', masked, masked)
+    amplitude = sum_fy / sum_ff
+    sse = np.maximum(sum_yy[:, None] - amplitude * sum_fy, 0.0)
+
+    best = np.argmin(sse, axis=1)
+    rows = np.arange(len(best))
+    return {
+        'amplitude': amplitude[rows, best],
+        'tau': TAUS[best],
+        'variance': sse[rows, best] / np.maximum(observed - 1, 1),
+        'sum_ff': sum_ff[rows, best]
+    }
+
+
+def predict(fit: Dict[str, np.ndarray], cumulative: np.ndarray, observed: np.ndarray, horizon: int):
+    """
+    Expected cumulative total at day horizon with its prediction interval,
+    as three (items,) arrays. Days already observed return the actual total,
+    and nothing is predicted below the total so far.
+    """
+    shape = 1.0 - np.exp(-horizon / fit['tau'])
+    expected = fit['amplitude'] * shape
+    spread = Z * np.sqrt(fit['variance'] * (1.0 + shape ** 2 / fit['sum_ff']))
+    so_far = cumulative[np.arange(len(observed)), observed - 1]
+    expected = np.maximum(expected, so_far)
+    low, high = np.maximum(expected - spread, so_far), expected + spread
+
+    if horizon <= cumulative.shape[1]:
+        seen = observed >= horizon
+        actual = cumulative[:, horizon - 1]
+        expected, low, high = (np.where(seen, actual, values) for values in (expected, low, high))
+    return expected, low, high
+
+
+def _stale(ids: Optional[Sequence[int]] = None, today: Optional[date] = None):
+    """Content whose totals moved since its forecast was fitted (or that has none)"""
+    since = datetime.combine((today or date.today()) - timedelta(days=MAX_AGE_DAYS), datetime.min.time())
+    stmt = (
+        select(ContentManager.id, ContentManager.publish_time, ContentManager.analytics_days,
+               ContentManager.views, ContentManager.likes)
+        .outerjoin(ContentForecast, ContentForecast.content_id == ContentManager.id)
+        .where(ContentManager.analytics_days > 0,
+               func.coalesce(ContentManager.publish_time, ContentManager.created_at) >= since,
+               or_(ContentForecast.id.is_(None),
+                   ContentForecast.analytics_days != ContentManager.analytics_days,
+                   ContentForecast.views_total != ContentManager.views,
+                   ContentForecast.likes_total != ContentManager.likes))
+        .order_by(ContentManager.id)
+    )
+    if ids is not None:
+        stmt = stmt.where(ContentManager.id.in_(ids))
+    return stmt
+
+
+def _fit_rows(connection, content: List) -> List[Dict]:
+    """ContentForecast rows for the given _stale() rows, fitted together"""
+    index = {row.id: i for i, row in enumerate(content)}
+    daily = connection.execute(
+        select(Analytics.content_id, Analytics.date_recorded,
+               func.sum(func.coalesce(Analytics.views, 0)), func.sum(func.coalesce(Analytics.likes, 0)))
+        .where(Analytics.content_id.in_(index))
+        .group_by(Analytics.content_id, Analytics.date_recorded)
+    ).all()
+
+    # Day 1 is the publishing day, or the first day with analytics for unpublished content
+    starts = {}
+    for content_id, day, _, _ in daily:
+        starts[content_id] = min(starts.get(content_id, day), day)
+    for row in content:
+        if row.publish_time is not None:
+            starts[row.id] = row.publish_time.date()
+
+    items = np.array([index[content_id] for content_id, _, _, _ in daily], dtype=np.int64)
+    days = np.array([(day - starts[content_id]).days + 1 for content_id, day, _, _ in daily], dtype=np.int64)
+    # Rows dated before publishing count towards day 1, rows past the fitted range towards its last day
+    days = np.clip(days, 1, MAX_AGE_DAYS)
+    observed = np.zeros(len(content), dtype=np.int64)
+    np.maximum.at(observed, items, days)
+    width = max(int(observed.max(initial=0)), max(HORIZONS))
+
+    unfitted = dict.fromkeys(FORECAST_COLUMNS)
+    rows = [{
+        'content_id': row.id, 'days_observed': int(observed[i]), 'analytics_days': row.analytics_days,
+        'views_total': row.views, 'likes_total': row.likes, 'fitted_at': datetime.utcnow(), **unfitted
+    } for i, row in enumerate(content)]
+    fitted = np.flatnonzero(observed >= MIN_DAYS)
+    if not len(fitted):
+        return rows
+    for column, target in enumerate(TARGETS, start=2):
+        increments = np.zeros((len(content), width))
+        np.add.at(increments, (items, days - 1), [float(record[column]) for record in daily])
+        cumulative = np.cumsum(increments, axis=1)[fitted]
+        fit = fit_curves(cumulative, observed[fitted])
+        for horizon in HORIZONS:
+            for suffix, values in zip(('', '_low', '_high'), predict(fit, cumulative, observed[fitted], horizon)):
+                for i, value in zip(fitted, values):
+                    rows[i][f'{target}_{horizon}{suffix}'] = round(float(value), 1)
+        for i, tau in zip(fitted, fit['tau']):
+            rows[i][f'{target}_tau'] = round(float(tau), 2)
+    return rows
+
+
+def _refresh(connection, content: List) -> int:
+    if not content:
+        return 0
+    rows = _fit_rows(connection, content)
+    connection.execute(delete(ContentForecast).where(ContentForecast.content_id.in_([row.id for row in content])))
+    connection.execute(insert(ContentForecast), rows)
+    return len(rows)
+
+
+def refresh_forecasts(batch_size: int = 500, today: Optional[date] = None, progress=None) -> int:
+    """
+    Refit the curves of content whose analytics changed since its last fit,
+    batch_size items per transaction, and drop forecasts of deleted content.
+    Returns the number of items refitted.
+    """
+    refitted, last_id = 0, 0
+    while True:
+        with db.engine.begin() as connection:
+            content = connection.execute(
+                _stale(today=today).where(ContentManager.id > last_id).limit(batch_size)
+            ).all()
+            if not content:
+                break
+            count = _refresh(connection, content)
+            bump_versions(connection, [ContentForecast.__tablename__])
+        refitted += count
+        last_id = content[-1].id
+        if progress:
+            progress(last_id, count)
+
+    with db.engine.begin() as connection:
+        orphans = connection.execute(
+            delete(ContentForecast).where(~ContentForecast.content_id.in_(select(ContentManager.id)))
+        ).rowcount
+        if orphans:
+            bump_versions(connection, [ContentForecast.__tablename__])
+    if refitted or orphans:
+        logger.info('Refitted %d forecasts, dropped %d', refitted, orphans)
+    return refitted
+
+
+def forecast_for(content_id: int) -> Optional[ContentForecast]:
+    """
+    The item's forecast, refitted first in the current session when its
+    analytics changed since; None when it has no analytics. The caller
+    commits.
+    """
+    content = db.session.execute(_stale([content_id])).all()
+    if _refresh(db.session.connection(), content):
+        mark_written(db.session, [ContentForecast.__tablename__])
+    return db.session.execute(
+        select(ContentForecast).where(ContentForecast.content_id == content_id)
+        .execution_options(populate_existing=True)
+    ).scalar_one_or_none()
+
+
+forecasts_cli = AppGroup('forecasts', help='Maintain the per-item view and like forecasts.')
+
+
+@forecasts_cli.command('refresh')
+@click.option('--batch-size', default=500, show_default=True, help='Content items fitted per transaction.')
+def refresh_command(batch_size):
+    """Refit forecasts of content with new analytics."""
+    click.echo(f'Refitted {refresh_forecasts(batch_size)} forecasts')
+
+
+def init_forecasting(app) -> None:
+    """
+    Add the `flask forecasts refresh` command.
+
+    Each content item's cumulative daily views and likes since publishing
+    are fitted with a saturation curve, A * (1 - exp(-t / tau)), to predict
+    its day-7 and day-30 totals with 95% intervals (ContentForecast). An
+    item is refitted only when its analytics totals (content_totals.py)
+    differ from the ones its forecast was fitted on: in batches by the
+    command, which a scheduler runs after ingest, and on demand when one
+    item's forecast is read.
+    """
+    app.cli.add_command(forecasts_cli)
@@ -0,0 +1,58 @@
+"""
+Gunicorn configuration for the AI Content Strategist backend.
+
+Usage:
+    gunicorn wsgi:app -c gunicorn.conf.py
+
+Every setting can be overridden through the environment variables below.
+"""
+
+import multiprocessing
+import os
+
+# Networking
+bind = f"0.0.0.0:{os.environ.get('PORT', 5000)}"
+backlog = int(os.environ.get('GUNICORN_BACKLOG', 2048))
+
+# Workers: threaded workers so requests blocked on Postgres or Claude
+# do not hold a whole process
+worker_class = 'gthread'
+workers = int(os.environ.get('WEB_CONCURRENCY', multiprocessing.cpu_count() * 2 + 1))
+threads = int(os.environ.get('GUNICORN_THREADS', 4))
+
+# Load the app once in the master so workers fork with it already imported
+preload_app = os.environ.get('GUNICORN_PRELOAD', 'true').lower() == 'true'
+
+# Timeouts: AI routes can legitimately take tens of seconds
+timeout = int(os.environ.get('GUNICORN_TIMEOUT', 120))
+graceful_timeout = int(os.environ.get('GUNICORN_GRACEFUL_TIMEOUT', 30))
+keepalive = int(os.environ.get('GUNICORN_KEEPALIVE', 5))
+
+# Recycle workers periodically to cap slow memory growth; jitter avoids
+# every worker restarting at once
+max_requests = int(os.environ.get('GUNICORN_MAX_REQUESTS', 1000))
+max_requests_jitter = int(os.environ.get('GUNICORN_MAX_REQUESTS_JITTER', 100))
+
+# Logging
+accesslog = os.environ.get('GUNICORN_ACCESS_LOG', '-')
+errorlog = os.environ.get('GUNICORN_ERROR_LOG', '-')
+loglevel = os.environ.get('GUNICORN_LOG_LEVEL', 'info')
+
+
+def on_starting(server):
+    """Create missing tables and apply migrations once, in the master, before workers start"""
+    from app import prepare_database
+    from wsgi import app
+    prepare_database(app)
+
+
+def post_fork(server, worker):
+    """Drop database connections inherited from the preloaded master"""
+    if not preload_app:
+        return
+    from wsgi import app
+    from models import db
+    with app.app_context():
+        # The primary and every replica bind
+        for engine in db.engines.values():
+            engine.dispose(close=False)
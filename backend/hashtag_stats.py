@@ -0,0 +1,307 @@
+from collections import Counter
+from datetime import datetime
+from typing import Dict, Iterable, List, Optional, Tuple
+import heapq
+import json
+import re
+import threading
+import time
+import zlib
+
+import numpy as np
+from sqlalchemy import func, select
+
+from models import db, ContentManager, TrendingTopic
+from versioning import get_versions
+
+TAG_PATTERN = re.compile(r'#?(\w+)')
+MAX_TAGS = 30  # Per post; more is spam and would square the pair count
+MIN_WEIGHT = 0.1  # Pair weight of posts with no engagement yet, so they still count a little
+NEIGHBOURS = 20  # Co-occurring tags kept per tag for suggestions
+SOURCE_TABLES = ('content_manager', 'trending_topics')
+
+
+def parse_tags(text: Optional[str]) -> Tuple[str, ...]:
+    """Normalised '#tag' strings in a hashtags_used value, in order, without repeats"""
+    tags = dict.fromkeys(f'#{tag.lower()}' for tag in TAG_PATTERN.findall(text or ''))
+    return tuple(tags)[:MAX_TAGS]
+
+
+class SpaceSaving:
+    """
+    Top-k heavy hitters in capacity counters (Space-Saving).
+
+    A new item past capacity takes over the smallest counter, inheriting its
+    count as the error bound, so any item with more than total / capacity
+    weight is always kept. The smallest counter is found through a heap
+    with lazy deletion. discount() takes weight back out for edited posts;
+    counts then stay estimates until the next rebuild.
+    """
+
+    def __init__(self, capacity: int = 1000):
+        self.capacity = capacity
+        self.counts: Dict[str, float] = {}
+        self.errors: Dict[str, float] = {}
+        self._heap: List[Tuple[float, str]] = []
+
+    def _push(self, item: str) -> None:
+        heapq.heappush(self._heap, (self.counts[item], item))
+        if len(self._heap) > 4 * self.capacity:
+            self._heap = [(count, key) for key, count in self.counts.items()]
+            heapq.heapify(self._heap)
+
+    def offer(self, item: str, weight: float = 1.0) -> None:
+        if item in self.counts:
+            self.counts[item] += weight
+        elif len(self.counts) < self.capacity:
+            self.counts[item], self.errors[item] = weight, 0.0
+        else:
+            while True:
+                count, smallest = heapq.heappop(self._heap)
+                if self.counts.get(smallest) == count:
+                    break
+            del self.counts[smallest], self.errors[smallest]
+            self.counts[item], self.errors[item] = count + weight, count
+        self._push(item)
+
+    def discount(self, item: str, weight: float = 1.0) -> None:
+        if item not in self.counts:
+            return
+        self.counts[item] -= weight
+        if self.counts[item] <= 0:
+            del self.counts[item], self.errors[item]
+        else:
+            self._push(item)
+
+    def top(self, k: int) -> List[Tuple[str, float]]:
+        return heapq.nlargest(k, self.counts.items(), key=lambda entry: entry[1])
+
+
+class CountMin:
+    """Count-min sketch of float weights per key; estimates never undercount while weights stay positive"""
+
+    def __init__(self, width: int = 2048, depth: int = 4):
+        self.width = width
+        self.table = np.zeros((depth, width))
+        self._rows = np.arange(depth)
+
+    def _columns(self, key: str) -> np.ndarray:
+        data = key.encode()
+        return np.array([zlib.crc32(data, seed) % self.width for seed in range(len(self._rows))])
+
+    def add(self, key: str, weight: float) -> None:
+        self.table[self._rows, self._columns(key)] += weight
+
+    def estimate(self, key: str) -> float:
+        return float(self.table[self._rows, self._columns(key)].min())
+
+
+class HashtagStats:
+    """
+    Hashtag usage, engagement and co-occurrence across our content and the
+    stored trending topics.
+
+    Each post's tags are offered to a Space-Saving summary (usage) and two
+    count-min sketches (uses and summed engagement rate, for the mean
+    engagement of any tag). Every pair of tags on a post adds the post's
+    engagement rate to a sparse co-occurrence map, and each tag's strongest
+    neighbours are cached until its row changes, so suggestions are O(k)
+    per input tag. Like PostingTimes, a read first compares version stamps;
+    content edited since the last refresh is taken back out and re-added,
+    and a full rebuild every rebuild_seconds drops deleted content and
+    re-weights posts whose engagement changed. Trending topic tags are
+    rebuilt whole whenever trending_topics changes: a heavy-hitter summary
+    per niche weighted by decayed score, and co-occurrence weighted by the
+    topic's engagement rate.
+    """
+
+    def __init__(self, capacity: int = 1000, width: int = 2048, depth: int = 4, rebuild_seconds: float = 3600,
+                 clock=time.monotonic):
+        self.capacity = capacity
+        self.width = width
+        self.depth = depth
+        self.rebuild_seconds = rebuild_seconds
+        self._clock = clock
+        self._lock = threading.Lock()
+        self._reset_content()
+        self._reset_trending()
+        self._built_at: Optional[float] = None
+        self._versions: Optional[Dict[str, int]] = None
+
+    @classmethod
+    def from_config(cls, config) -> 'HashtagStats':
+        return cls(capacity=config.get('HASHTAG_TOP_K_CAPACITY', 1000),
+                   width=config.get('HASHTAG_SKETCH_WIDTH', 2048),
+                   depth=config.get('HASHTAG_SKETCH_DEPTH', 4),
+                   rebuild_seconds=config.get('HASHTAG_REBUILD_SECONDS', 3600))
+
+    def _reset_content(self) -> None:
+        self._usage = SpaceSaving(self.capacity)
+        self._uses = CountMin(self.width, self.depth)
+        self._engagement = CountMin(self.width, self.depth)
+        self._pairs: Dict[str, Counter] = {}
+        self._neighbours: Dict[str, List[Tuple[str, float]]] = {}
+        # content id -> (tags, engagement rate) it contributed, to take back out when it changes
+        self._posts: Dict[int, Tuple[Tuple[str, ...], float]] = {}
+        self._total_engagement = 0.0
+        self._total_uses = 0
+        self._last_update: Optional[datetime] = None
+
+    def _reset_trending(self) -> None:
+        self._trending: Dict[str, SpaceSaving] = {}
+        self._trend_pairs: Dict[str, Counter] = {}
+
+    def _pair(self, pairs: Dict[str, Counter], tags: Tuple[str, ...], weight: float) -> None:
+        for tag in tags:
+            row = pairs.setdefault(tag, Counter())
+            for other in tags:
+                if other != tag:
+                    row[other] += weight
+                    if row[other] <= 1e-9:
+                        del row[other]
+            self._neighbours.pop(tag, None)
+
+    def _add_post(self, content_id: int, tags: Tuple[str, ...], engagement: float, sign: int) -> None:
+        for tag in tags:
+            if sign > 0:
+                self._usage.offer(tag)
+            else:
+                self._usage.discount(tag)
+            self._uses.add(tag, sign)
+            self._engagement.add(tag, sign * engagement)
+        self._total_engagement += sign * engagement * len(tags)
+        self._total_uses += sign * len(tags)
+        self._pair(self._pairs, tags, sign * max(engagement, MIN_WEIGHT))
+        if sign > 0:
+            self._posts[content_id] = (tags, engagement)
+
+    def _load(self, since: Optional[datetime] = None) -> None:
+        stmt = select(ContentManager.id, ContentManager.hashtags_used, ContentManager.engagement_rate)
+        if since is not None:
+            stmt = stmt.where(ContentManager.updated_at > since)
+        for content_id, hashtags_used, engagement in db.session.execute(stmt):
+            if content_id in self._posts:
+                self._add_post(content_id, *self._posts.pop(content_id), -1)
+            tags = parse_tags(hashtags_used)
+            if tags:
+                self._add_post(content_id, tags, engagement or 0.0, 1)
+
+    def _load_trending(self) -> None:
+        self._reset_trending()
+        topics = db.session.execute(
+            select(TrendingTopic.niche_category, TrendingTopic.hashtags, TrendingTopic.decayed_score,
+                   TrendingTopic.trend_score, TrendingTopic.engagement_rate)
+            .where(TrendingTopic.is_active.is_(True))
+        ).all()
+        for niche, hashtags, decayed, score, engagement in topics:
+            tags = parse_tags(' '.join(json.loads(hashtags or '[]')))
+            summary = self._trending.setdefault(niche, SpaceSaving(self.capacity))
+            for tag in tags:
+                summary.offer(tag, decayed if decayed else (score or 0.0))
+            self._pair(self._trend_pairs, tags, max(engagement or 0.0, MIN_WEIGHT))
+
+    def refresh(self) -> None:
+        """Bring the statistics up to date (one version lookup when nothing changed)"""
+        versions = get_versions(SOURCE_TABLES)
+        with self._lock:
+            unchanged = versions is not None and versions == self._versions
+            if self._built_at is not None and self._clock() - self._built_at < self.rebuild_seconds and unchanged:
+                return
+            last_update = db.session.execute(select(func.max(ContentManager.updated_at))).scalar()
+            if self._built_at is None or self._clock() - self._built_at >= self.rebuild_seconds:
+                self._reset_content()
+                self._load()
+                self._load_trending()
+                self._built_at = self._clock()
+            else:
+                if versions is None or versions['content_manager'] != self._versions['content_manager']:
+                    self._load(self._last_update)
+                if versions is None or versions['trending_topics'] != self._versions['trending_topics']:
+                    self._load_trending()
+                    self._neighbours.clear()
+            self._last_update = last_update
+            self._versions = versions
+
+    def _neighbours_of(self, tag: str) -> List[Tuple[str, float]]:
+        neighbours = self._neighbours.get(tag)
+        if neighbours is None:
+            row = Counter(self._pairs.get(tag, {}))
+            row.update(self._trend_pairs.get(tag, {}))
+            neighbours = self._neighbours[tag] = row.most_common(NEIGHBOURS)
+        return neighbours
+
+    def _mean_engagement(self, tag: str) -> Optional[float]:
+        uses = self._uses.estimate(tag)
+        return self._engagement.estimate(tag) / uses if uses >= 1 else None
+
+    def top(self, k: int = 10) -> List[Dict]:
+        """Our most used tags with their mean engagement rate"""
+        self.refresh()
+        with self._lock:
+            return [{'hashtag': tag, 'uses': int(round(count)),
+                     'engagement_rate': self._round(self._mean_engagement(tag))}
+                    for tag, count in self._usage.top(k)]
+
+    def trending(self, niche: str, k: int = 10) -> List[str]:
+        """The niche's trending tags, strongest first"""
+        self.refresh()
+        with self._lock:
+            summary = self._trending.get(niche)
+            return [tag for tag, _ in summary.top(k)] if summary else []
+
+    def suggest(self, hashtags: Iterable[str], niche: str, k: int = 5) -> List[str]:
+        """
+        Tags that co-occur with the given ones on engaging posts and trending
+        topics; without co-occurrences, the niche's trending tags and then our
+        best-engaging frequent tags.
+        """
+        self.refresh()
+        given = set(parse_tags(' '.join(hashtags)))
+        with self._lock:
+            scores = Counter()
+            for tag in given:
+                for other, weight in self._neighbours_of(tag):
+                    if other not in given:
+                        scores[other] += weight
+            suggestions = [tag for tag, _ in scores.most_common(k)]
+            summary = self._trending.get(niche)
+            fallback = [tag for tag, _ in summary.top(k)] if summary else []
+            frequent = [tag for tag, _ in self._usage.top(4 * k)]
+            fallback += sorted(frequent, key=lambda tag: -(self._mean_engagement(tag) or 0.0))
+            for tag in fallback:
+                if len(suggestions) >= k:
+                    break
+                if tag not in given and tag not in suggestions:
+                    suggestions.append(tag)
+            return suggestions
+
+    def score(self, hashtag: str, niche: str) -> Dict:
+        """
+        0-100 score of one tag: up to 40 for how its posts engage against our
+        average, 30 for how often we use it and 30 for trending strength in
+        the niche, with the underlying numbers.
+        """
+        self.refresh()
+        tag = (parse_tags(hashtag) or ('',))[0]
+        with self._lock:
+            uses = self._uses.estimate(tag) if tag else 0.0
+            mean = self._mean_engagement(tag) if tag else None
+            average = self._total_engagement / self._total_uses if self._total_uses else None
+            top_uses = max(self._usage.counts.values(), default=0.0)
+            summary = self._trending.get(niche)
+            trend_weight = summary.counts.get(tag, 0.0) if summary else 0.0
+            top_trend = max(summary.counts.values(), default=0.0) if summary else 0.0
+
+            score = 0.0
+            if mean is not None and average:
+                score += 40 * min(mean / average, 2.0) / 2
+            if top_uses:
+                score += 30 * min(uses / top_uses, 1.0)
+            if top_trend:
+                score += 30 * trend_weight / top_trend
+            return {'score': round(score, 1), 'uses': int(round(uses)), 'engagement_rate': self._round(mean),
+                    'trending': trend_weight > 0}
+
+    @staticmethod
+    def _round(value: Optional[float]) -> Optional[float]:
+        return None if value is None else round(value, 2)
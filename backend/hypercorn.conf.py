@@ -0,0 +1,34 @@
+"""
+Hypercorn configuration for the async (ASGI) backend.
+
+Usage:
+    hypercorn asgi:app -c file:hypercorn.conf.py
+
+One event loop per worker holds all in-flight Claude calls, so one worker
+per core is enough; CRUD routes run in each loop's thread pool.
+"""
+
+import multiprocessing
+import os
+
+bind = [f"0.0.0.0:{os.environ.get('PORT', 5000)}"]
+backlog = int(os.environ.get('HYPERCORN_BACKLOG', 2048))
+
+worker_class = 'asyncio'
+workers = int(os.environ.get('WEB_CONCURRENCY', multiprocessing.cpu_count()))
+
+keep_alive_timeout = int(os.environ.get('HYPERCORN_KEEPALIVE', 5))
+graceful_timeout = int(os.environ.get('HYPERCORN_GRACEFUL_TIMEOUT', 30))
+
+accesslog = os.environ.get('HYPERCORN_ACCESS_LOG', '-')
+errorlog = os.environ.get('HYPERCORN_ERROR_LOG', '-')
+loglevel = os.environ.get('HYPERCORN_LOG_LEVEL', 'info').upper()
+
+
+# hypercorn has no master hook like gunicorn's on_starting, but it runs this
+# file once in the parent process and hands workers the settings: create
+# missing tables and apply migrations here. Every name left in this module
+# becomes a setting sent to the workers, so the helpers are deleted.
+from app import create_app, prepare_database
+prepare_database(create_app('production'))
+del create_app, prepare_database
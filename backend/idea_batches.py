@@ -0,0 +1,197 @@
+from datetime import datetime
+from types import SimpleNamespace
+from typing import Dict, List, Optional
+import json
+import logging
+import threading
+import time
+import uuid
+
+from anthropic import APIError
+from sqlalchemy import insert, update
+
+from claude_service import IDEAS_SCHEMA, ClaudeService, parse_ideas
+from models import db, ContentIdea, IdeaBatch
+from structured_output import message_text
+
+logger = logging.getLogger(__name__)
+
+IDEA_PRIORITIES = ('high', 'medium', 'low')
+
+
+class LocalBatches:
+    """
+    In-process stand-in for client.messages.batches.
+
+    create() runs every request through client.messages.create on a
+    background thread, one after another, and retrieve()/results() return
+    the same shapes as the Message Batches API. Selected with
+    CLAUDE_BATCH_BACKEND=local for development against the fake model
+    server, and used by the tests.
+    """
+
+    def __init__(self, client):
+        self.client = client
+        self._lock = threading.Lock()
+        self._batches: Dict[str, Dict] = {}
+
+    def create(self, requests: List[Dict]):
+        batch_id = f'msgbatch_local_{uuid.uuid4().hex}'
+        with self._lock:
+            self._batches[batch_id] = {'status': 'in_progress', 'total': len(requests), 'results': []}
+        threading.Thread(target=self._run, args=(batch_id, requests), daemon=True).start()
+        return self.retrieve(batch_id)
+
+    def _run(self, batch_id: str, requests: List[Dict]) -> None:
+        batch = self._batches[batch_id]
+        for entry in requests:
+            try:
+                result = SimpleNamespace(type='succeeded', message=self.client.messages.create(**entry['params']))
+            except APIError as e:
+                result = SimpleNamespace(type='errored', error=SimpleNamespace(type='api_error', message=str(e)))
+            with self._lock:
+                batch['results'].append(SimpleNamespace(custom_id=entry['custom_id'], result=result))
+        with self._lock:
+            batch['status'] = 'ended'
+
+    def retrieve(self, batch_id: str):
+        with self._lock:
+            batch = self._batches[batch_id]
+            succeeded = sum(1 for entry in batch['results'] if entry.result.type == 'succeeded')
+            return SimpleNamespace(
+                id=batch_id,
+                processing_status=batch['status'],
+                request_counts=SimpleNamespace(processing=batch['total'] - len(batch['results']),
+                                               succeeded=succeeded, errored=len(batch['results']) - succeeded,
+                                               canceled=0, expired=0)
+            )
+
+    def results(self, batch_id: str):
+        with self._lock:
+            return iter(list(self._batches[batch_id]['results']))
+
+
+def idea_row(idea: Dict, pillar_id: int, platform: Optional[str], now: datetime) -> Optional[Dict]:
+    """A content_ideas row for one parsed idea, or None if the model returned something else"""
+    if not isinstance(idea, dict) or not idea.get('title') or 'error' in idea:
+        return None
+    details = [str(idea.get('description') or '')]
+    if idea.get('hook'):
+        details.append(f"Hook: {idea['hook']}")
+    if idea.get('content_type'):
+        details.append(f"Format: {idea['content_type']}")
+    if platform:
+        details.append(f"Platform: {platform}")
+    priority = str(idea.get('priority', '')).lower()
+    return {
+        'title': str(idea['title'])[:200],
+        'description': '\n'.join(detail for detail in details if detail),
+        'content_pillar_id': pillar_id,
+        'priority': priority if priority in IDEA_PRIORITIES else 'medium',
+        'status': 'pending',
+        'created_at': now,
+        'updated_at': now
+    }
+
+
+class IdeaBatchRunner:
+    """
+    Bulk idea generation through the Message Batches API.
+
+    submit() renders one generate_content_ideas call per context from
+    ai_context.bulk_ideas_contexts and sends them as a single batch, which
+    is billed at half the interactive price and recorded in idea_batches.
+    poll() checks the batch once; when it has ended, each reply is parsed
+    like an interactive one and all ideas are inserted into content_ideas in
+    one statement, together with the job's completion, so a batch is
+    imported exactly once. start_polling() repeats poll() on a daemon thread.
+    """
+
+    def __init__(self, service: ClaudeService, batches, poll_interval: float = 60.0, sleep=time.sleep):
+        self.service = service
+        self.batches = batches
+        self.poll_interval = poll_interval
+        self.sleep = sleep
+
+    @classmethod
+    def from_config(cls, config, service: ClaudeService) -> 'IdeaBatchRunner':
+        backend = config.get('CLAUDE_BATCH_BACKEND', 'anthropic')
+        if config.get('CLAUDE_TRANSPORT') == 'synthetic':
+            # The synthetic transport only speaks the Messages API
+            backend = 'local'
+        batches = LocalBatches(service.client) if backend == 'local' else service.client.messages.batches
+        return cls(service, batches, poll_interval=config.get('CLAUDE_BATCH_POLL_SECONDS', 60.0))
+
+    def submit(self, contexts: List[Dict]) -> IdeaBatch:
+        targets, requests = {}, []
+        for context in contexts:
+            custom_id = f"pillar-{context['pillar_id']}"
+            if context['platform']:
+                custom_id += '-' + ''.join(c if c.isalnum() else '_' for c in context['platform'])
+            targets[custom_id] = {'pillar_id': context['pillar_id'], 'platform': context['platform']}
+            call = self.service.ideas_call(**context['kwargs'])
+            requests.append({'custom_id': custom_id, 'params': self.service.batch_params(call)})
+
+        batch = self.batches.create(requests=requests)
+        job = IdeaBatch(batch_id=batch.id, status='in_progress', requests=json.dumps(targets),
+                        request_count=len(requests))
+        db.session.add(job)
+        db.session.commit()
+        logger.info("Submitted idea batch %s (%s) with %d requests", job.id, batch.id, len(requests))
+        return job
+
+    def poll(self, job: IdeaBatch) -> IdeaBatch:
+        """Check the batch once and import its ideas if it has ended"""
+        if job.status != 'in_progress':
+            return job
+        if self.batches.retrieve(job.batch_id).processing_status != 'ended':
+            return job
+
+        targets = json.loads(job.requests)
+        now = datetime.utcnow()
+        rows, errors = [], {}
+        for entry in self.batches.results(job.batch_id):
+            target = targets.get(entry.custom_id)
+            if target is None:
+                continue
+            if entry.result.type != 'succeeded':
+                errors[entry.custom_id] = str(getattr(entry.result, 'error', None) or entry.result.type)
+                continue
+            ideas = parse_ideas(message_text(entry.result.message, IDEAS_SCHEMA))
+            for idea in ideas if isinstance(ideas, list) else [ideas]:
+                row = idea_row(idea, target['pillar_id'], target['platform'], now)
+                if row:
+                    rows.append(row)
+
+        # Claim the job first: a concurrent poller finds it no longer in progress and imports nothing
+        claimed = db.session.execute(
+            update(IdeaBatch)
+            .where(IdeaBatch.id == job.id, IdeaBatch.status == 'in_progress')
+            .values(status='completed' if rows or not errors else 'failed', ideas_created=len(rows),
+                    errors=json.dumps(errors) if errors else None, completed_at=now)
+            .execution_options(synchronize_session=False)
+        ).rowcount
+        if claimed and rows:
+            db.session.execute(insert(ContentIdea), rows)
+        db.session.commit()
+        db.session.refresh(job)
+        if claimed:
+            logger.info("Idea batch %s finished: %d ideas, %d failed requests", job.id, len(rows), len(errors))
+        return job
+
+    def start_polling(self, app, job_id: int) -> threading.Thread:
+        """Poll a job on a daemon thread until it is no longer in progress"""
+        def run():
+            while True:
+                self.sleep(self.poll_interval)
+                try:
+                    with app.app_context():
+                        job = db.session.get(IdeaBatch, job_id)
+                        if job is None or self.poll(job).status != 'in_progress':
+                            return
+                except Exception:
+                    logger.exception("Polling idea batch %s failed; retrying", job_id)
+
+        thread = threading.Thread(target=run, name=f'idea-batch-{job_id}', daemon=True)
+        thread.start()
+        return thread
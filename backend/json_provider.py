@@ -0,0 +1,142 @@
+from datetime import date, datetime, time
+from decimal import Decimal
+from typing import Any, Union
+import json
+import math
+import re
+import uuid
+
+from flask.json.provider import DefaultJSONProvider
+
+try:
+    import orjson
+except ImportError:  # orjson is optional, fall back to the stdlib encoder
+    orjson = None
+
+NON_ASCII = re.compile(rb'[\x80-\xff]+')
+
+
+def json_default(obj: Any) -> Any:
+    """Serialize the non-JSON types our models return (dates and times as ISO 8601)"""
+    if isinstance(obj, (datetime, date, time)):
+        return obj.isoformat()
+    if isinstance(obj, Decimal):
+        return str(obj)
+    if isinstance(obj, uuid.UUID):
+        return str(obj)
+    if hasattr(obj, '__html__'):
+        return str(obj.__html__())
+    raise TypeError(f"Object of type {type(obj).__name__} is not JSON serializable")
+
+
+def _escape_non_ascii(match: re.Match) -> bytes:
+    """\\uXXXX escapes for a run of UTF-8, as json.dumps writes them with ensure_ascii"""
+    escapes = []
+    for char in match.group().decode('utf-8'):
+        code = ord(char)
+        if code > 0xFFFF:
+            # Outside the BMP: a UTF-16 surrogate pair
+            code -= 0x10000
+            escapes.append('\\u%04x\\u%04x' % (0xD800 | code >> 10, 0xDC00 | code & 0x3FF))
+        else:
+            escapes.append('\\u%04x' % code)
+    return ''.join(escapes).encode('ascii')
+
+
+def _replace_non_finite(obj: Any) -> Any:
+    """Swap NaN/Infinity for None, matching what orjson emits for them"""
+    if isinstance(obj, float) and not math.isfinite(obj):
+        return None
+    if isinstance(obj, dict):
+        return {key: _replace_non_finite(value) for key, value in obj.items()}
+    if isinstance(obj, (list, tuple)):
+        return [_replace_non_finite(value) for value in obj]
+    return obj
+
+
+class StdlibJSONProvider(DefaultJSONProvider):
+    """
+    Stdlib JSON provider that renders dates as ISO 8601 strings.
+
+    Output matches OrjsonProvider byte for byte: compact separators, sorted
+    keys, non-ASCII escaped as before, and NaN/Infinity sent as null. The one
+    known difference is floats that need exponent notation, which orjson
+    writes as 1e16 where the stdlib writes 1e+16.
+    """
+
+    default = staticmethod(json_default)
+    ensure_ascii = True
+    sort_keys = True
+
+    def _encode(self, obj: Any, indent: bool = False) -> bytes:
+        kwargs = {'indent': 2} if indent else {'separators': (',', ':')}
+        options = dict(default=self.default, ensure_ascii=self.ensure_ascii, sort_keys=self.sort_keys,
+                       allow_nan=False, **kwargs)
+        try:
+            text = json.dumps(obj, **options)
+        except ValueError:
+            text = json.dumps(_replace_non_finite(obj), **options)
+        return text.encode('utf-8')
+
+    def dumps(self, obj: Any, **kwargs: Any) -> str:
+        if set(kwargs) - {'indent'}:
+            # Callers asking for specific encoder arguments get the stdlib encoder as-is
+            return super().dumps(obj, **kwargs)
+        return self._encode(obj, indent=bool(kwargs.get('indent'))).decode('utf-8')
+
+    def response(self, *args: Any, **kwargs: Any):
+        obj = self._prepare_response_obj(args, kwargs)
+        indent = (self.compact is None and self._app.debug) or self.compact is False
+        body = self._encode(obj, indent=indent) + b'\n'
+        return self._app.response_class(body, mimetype=self.mimetype)
+
+
+class OrjsonProvider(StdlibJSONProvider):
+    """
+    JSON provider backed by orjson.
+
+    orjson serializes datetime/date/time natively, so models can hand raw
+    column values to jsonify without calling isoformat() per field. While
+    ensure_ascii is set, non-ASCII text in its output is rewritten to the
+    \\u escapes the stdlib writes; payloads orjson cannot encode at all
+    (ints over 64 bits) take the stdlib path.
+    """
+
+    def _options(self, indent: bool) -> int:
+        option = orjson.OPT_NON_STR_KEYS
+        if self.sort_keys:
+            option |= orjson.OPT_SORT_KEYS
+        if indent:
+            option |= orjson.OPT_INDENT_2
+        return option
+
+    def _encode(self, obj: Any, indent: bool = False) -> bytes:
+        try:
+            body = orjson.dumps(obj, default=self.default, option=self._options(indent))
+        except TypeError:
+            return super()._encode(obj, indent)
+        if self.ensure_ascii and not body.isascii():
+            # orjson always writes raw UTF-8, which only occurs inside strings; keep the \\u escapes
+            body = NON_ASCII.sub(_escape_non_ascii, body)
+        return body
+
+    def loads(self, s: Union[str, bytes], **kwargs: Any) -> Any:
+        if kwargs:
+            return json.loads(s, **kwargs)
+        return orjson.loads(s)
+
+
+JSON_PROVIDERS = {
+    'orjson': OrjsonProvider,
+    'json': StdlibJSONProvider,
+}
+
+
+def init_json_provider(app) -> None:
+    """Install the JSON provider selected by JSON_BACKEND ('auto', 'orjson' or 'json')"""
+    backend = app.config.get('JSON_BACKEND', 'auto')
+    if backend == 'auto':
+        backend = 'orjson' if orjson is not None else 'json'
+    if backend == 'orjson' and orjson is None:
+        raise RuntimeError("JSON_BACKEND is 'orjson' but orjson is not installed")
+    app.json = JSON_PROVIDERS[backend](app)
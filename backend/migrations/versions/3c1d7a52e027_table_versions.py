@@ -0,0 +1,34 @@
+"""Add table_versions for ETag version stamps
+
+Revision ID: 3c1d7a52e027
+Revises:
+Create Date: 2026-10-19 18:01:16
+
+Databases created by db.create_all() before this revision have every other
+table already; startup's create_all may also have created this one, so the
+revision only creates what is missing.
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '3c1d7a52e027'
+down_revision = None
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    if sa.inspect(op.get_bind()).has_table('table_versions'):
+        return
+    op.create_table(
+        'table_versions',
+        sa.Column('table_name', sa.String(length=100), nullable=False),
+        sa.Column('version', sa.BigInteger(), nullable=False),
+        sa.PrimaryKeyConstraint('table_name')
+    )
+
+
+def downgrade():
+    op.drop_table('table_versions')
@@ -0,0 +1,92 @@
+"""Add engagement_rate and analytics_days to content_manager and fill them
+
+Revision ID: 7b2e4f91c044
+Revises: 3c1d7a52e027
+Create Date: 2026-10-19 19:12:40
+
+Content with analytics gets its totals from them, as `totals reconcile`
+computes them: weekly rollups where they exist (they still hold compacted
+weeks), raw analytics rows otherwise. Content without analytics keeps its
+hand-entered numbers and gets their engagement rate.
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '7b2e4f91c044'
+down_revision = '3c1d7a52e027'
+branch_labels = None
+depends_on = None
+
+METRICS = ('views', 'likes', 'shares', 'comments', 'saves')
+INTERACTIONS = ('likes', 'comments', 'shares', 'saves')
+
+
+def _engagement_rate(totals):
+    views = totals['views'] or 0
+    return sum(totals[name] or 0 for name in INTERACTIONS) * 100.0 / views if views else 0.0
+
+
+def _sums(bind, table, retention_sum):
+    columns = [sa.func.sum(table.c[metric]).label(metric) for metric in METRICS]
+    return {row['content_id']: row for row in bind.execute(
+        sa.select(table.c.content_id, *columns, retention_sum.label('retention_rate_sum'),
+                  (sa.func.sum(table.c.days) if 'days' in table.c else sa.func.count()).label('days'))
+        .group_by(table.c.content_id)
+    ).mappings()}
+
+
+def _backfill(bind):
+    metadata = sa.MetaData()
+    content = sa.Table('content_manager', metadata, autoload_with=bind)
+    analytics = sa.Table('analytics', metadata, autoload_with=bind)
+    sums = _sums(bind, analytics, sa.func.sum(sa.func.coalesce(analytics.c.retention_rate, 0.0)))
+    if sa.inspect(bind).has_table('analytics_weekly'):
+        weekly = sa.Table('analytics_weekly', metadata, autoload_with=bind)
+        sums.update(_sums(bind, weekly, sa.func.sum(weekly.c.retention_rate_sum)))
+
+    rows = []
+    hand_entered = [content.c[metric] for metric in METRICS + ('retention_rate',)]
+    for item in bind.execute(sa.select(content.c.id, *hand_entered)).mappings():
+        item_sums = sums.get(item['id'])
+        if item_sums and item_sums['days']:
+            totals = {metric: int(item_sums[metric] or 0) for metric in METRICS}
+            totals.update(retention_rate=(item_sums['retention_rate_sum'] or 0.0) / item_sums['days'],
+                          analytics_days=int(item_sums['days']))
+        else:
+            totals = {metric: item[metric] for metric in METRICS + ('retention_rate',)}
+            totals.update(analytics_days=0)
+        rows.append({'b_id': item['id'], **{f'v_{name}': value for name, value in totals.items()},
+                     'v_engagement_rate': _engagement_rate(totals)})
+    if rows:
+        values = {name[2:]: sa.bindparam(name) for name in rows[0] if name.startswith('v_')}
+        # Filling the totals is not an edit of the content item
+        bind.execute(content.update().where(content.c.id == sa.bindparam('b_id'))
+                     .values(updated_at=content.c.updated_at, **values), rows)
+
+    # New content bodies, so ETags served before the upgrade must not match
+    versions = sa.Table('table_versions', metadata, autoload_with=bind)
+    bumped = bind.execute(versions.update().where(versions.c.table_name == 'content_manager')
+                          .values(version=versions.c.version + 1))
+    if bumped.rowcount == 0:
+        bind.execute(versions.insert().values(table_name='content_manager', version=1))
+
+
+def upgrade():
+    bind = op.get_bind()
+    # Databases created by db.create_all() since these columns were added already have them, in step
+    columns = {column['name'] for column in sa.inspect(bind).get_columns('content_manager')}
+    if 'analytics_days' in columns:
+        return
+    if 'engagement_rate' not in columns:
+        op.add_column('content_manager', sa.Column('engagement_rate', sa.Float(), nullable=True))
+    op.add_column('content_manager',
+                  sa.Column('analytics_days', sa.Integer(), nullable=False, server_default='0'))
+    _backfill(bind)
+
+
+def downgrade():
+    with op.batch_alter_table('content_manager') as batch_op:
+        batch_op.drop_column('analytics_days')
+        batch_op.drop_column('engagement_rate')
@@ -0,0 +1,66 @@
+"""Add trend momentum columns, their ranking index and trend_snapshots
+
+Revision ID: 9e5a03d6b047
+Revises: 7b2e4f91c044
+Create Date: 2026-10-19 19:48:05
+
+Existing topics have no snapshots yet. They rank by their current
+trend_score until their first snapshot starts the momentum from scratch.
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '9e5a03d6b047'
+down_revision = '7b2e4f91c044'
+branch_labels = None
+depends_on = None
+
+MOMENTUM = ('score_ewma', 'velocity', 'acceleration', 'decayed_score', 'last_seen_at')
+
+
+def upgrade():
+    inspector = sa.inspect(op.get_bind())
+    columns = {column['name'] for column in inspector.get_columns('trending_topics')}
+    if 'decayed_score' not in columns:
+        for name in MOMENTUM:
+            if name not in columns:
+                op.add_column('trending_topics',
+                              sa.Column(name, sa.DateTime() if name == 'last_seen_at' else sa.Float(), nullable=True))
+        topics = sa.table('trending_topics', sa.column('trend_score', sa.Float()), sa.column('velocity', sa.Float()),
+                          sa.column('acceleration', sa.Float()), sa.column('decayed_score', sa.Float()))
+        score = sa.func.coalesce(topics.c.trend_score, 0.0)
+        op.execute(topics.update().values(
+            velocity=0.0,
+            acceleration=0.0,
+            decayed_score=sa.case((score < 0, 0.0), (score > 100, 100.0), else_=score)
+        ))
+
+    if 'ix_trending_topics_rank' not in {index['name'] for index in inspector.get_indexes('trending_topics')}:
+        op.create_index('ix_trending_topics_rank', 'trending_topics',
+                        ['niche_category', 'is_active', 'decayed_score'])
+
+    if not inspector.has_table('trend_snapshots'):
+        op.create_table(
+            'trend_snapshots',
+            sa.Column('id', sa.Integer(), nullable=False),
+            sa.Column('topic_id', sa.Integer(), nullable=False),
+            sa.Column('recorded_at', sa.DateTime(), nullable=False),
+            sa.Column('trend_score', sa.Float(), nullable=False),
+            sa.Column('volume_24h', sa.Integer(), nullable=True),
+            sa.Column('engagement_rate', sa.Float(), nullable=True),
+            sa.Column('growth_rate', sa.Float(), nullable=True),
+            sa.ForeignKeyConstraint(['topic_id'], ['trending_topics.id']),
+            sa.PrimaryKeyConstraint('id')
+        )
+        op.create_index('ix_trend_snapshots_topic', 'trend_snapshots', ['topic_id', 'recorded_at'])
+
+
+def downgrade():
+    op.drop_index('ix_trend_snapshots_topic', table_name='trend_snapshots')
+    op.drop_table('trend_snapshots')
+    op.drop_index('ix_trending_topics_rank', table_name='trending_topics')
+    with op.batch_alter_table('trending_topics') as batch_op:
+        for name in reversed(MOMENTUM):
+            batch_op.drop_column(name)
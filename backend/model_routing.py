@@ -0,0 +1,174 @@
+from collections import Counter, deque
+from typing import Dict, List, NamedTuple, Optional
+import logging
+import threading
+import time
+
+logger = logging.getLogger(__name__)
+
+
+class Route(NamedTuple):
+    """Where one call goes: the model tier plus its output and time budget"""
+    task: str
+    tier: str
+    model: str
+    max_tokens: Optional[int]
+    timeout: Optional[float]
+    degraded: bool
+    # Seconds a caller with a local fallback waits before using it
+    deadline: Optional[float] = None
+
+
+class LatencyWindow:
+    """The most recent call durations of one task (per tier for routing)"""
+
+    def __init__(self, size: int = 100):
+        self._samples = deque(maxlen=size)
+
+    def add(self, seconds: float) -> None:
+        self._samples.append(seconds)
+
+    def __len__(self) -> int:
+        return len(self._samples)
+
+    def quantiles(self, qs) -> Dict[float, Optional[float]]:
+        """Nearest-rank quantiles of the window, from one sort"""
+        if not self._samples:
+            return dict.fromkeys(qs)
+        ordered = sorted(self._samples)
+        return {q: ordered[min(int(q * len(ordered)), len(ordered) - 1)] for q in qs}
+
+    def p95(self) -> Optional[float]:
+        return self.quantiles([0.95])[0.95]
+
+    def clear(self) -> None:
+        self._samples.clear()
+
+
+class ModelRouter:
+    """
+    Picks model, max_tokens, timeout and deadline per task from CLAUDE_MODEL_ROUTES.
+
+    Tasks are ClaudeService call names; field generations are
+    'content_field.<field_type>' and fall back to the 'content_field' entry,
+    and unknown tasks to 'default'. Each route names a tier, and tiers are
+    ordered from slowest/best to fastest. When the p95 of a task's last
+    calls on its tier exceeds the route's slo_p95 seconds, the task moves one
+    tier faster for cooldown seconds, then returns to its own tier with a
+    fresh latency window.
+    """
+
+    def __init__(self, tiers: Dict[str, str], tier_order: List[str], routes: Dict[str, Dict],
+                 cooldown: float = 300.0, min_samples: int = 20, window: int = 100, clock=time.monotonic):
+        self.tiers = tiers
+        self.tier_order = tier_order
+        self.routes = routes
+        self.cooldown = cooldown
+        self.min_samples = min_samples
+        self.window = window
+        self.clock = clock
+        self._lock = threading.Lock()
+        self._latency: Dict[tuple, LatencyWindow] = {}
+        self._degraded: Dict[str, tuple] = {}  # task -> (tier, until)
+        self._routed = Counter()
+        self._degradations = Counter()
+
+    @classmethod
+    def from_config(cls, config) -> 'ModelRouter':
+        return cls(
+            tiers=config['CLAUDE_MODEL_TIERS'],
+            tier_order=config['CLAUDE_TIER_ORDER'],
+            routes=config['CLAUDE_MODEL_ROUTES'],
+            cooldown=config.get('CLAUDE_DEGRADE_COOLDOWN_SECONDS', 300.0),
+            min_samples=config.get('CLAUDE_DEGRADE_MIN_SAMPLES', 20)
+        )
+
+    def _config(self, task: str) -> Dict:
+        family = task.split('.', 1)[0]
+        return self.routes.get(task) or self.routes.get(family) or self.routes.get('default', {})
+
+    def _faster(self, tier: str) -> Optional[str]:
+        index = self.tier_order.index(tier)
+        return self.tier_order[index + 1] if index + 1 < len(self.tier_order) else None
+
+    def route(self, task: str) -> Route:
+        config = self._config(task)
+        home_tier = config.get('tier', self.tier_order[-1])
+        with self._lock:
+            tier, degraded = home_tier, False
+            if task in self._degraded:
+                degraded_tier, until = self._degraded[task]
+                if self.clock() < until:
+                    tier, degraded = degraded_tier, True
+                else:
+                    del self._degraded[task]
+                    # Judge the home tier on fresh samples, not the ones that tripped the SLO
+                    self._window(task, home_tier).clear()
+                    logger.info("Model routing: %s back on tier %s", task, home_tier)
+            self._routed[(task, tier)] += 1
+        route = Route(task, tier, self.tiers[tier], config.get('max_tokens'), config.get('timeout'), degraded,
+                      config.get('deadline'))
+        logger.debug("Model routing: %s -> %s (%s)%s", task, route.model, tier, ' degraded' if degraded else '')
+        return route
+
+    def home_route(self, task: str) -> Route:
+        """
+        The task's own route, without counting it or applying a degradation.
+
+        For calls that don't run interactively (Message Batches): their
+        latency says nothing about the task's SLO and they must not show up
+        in the routing counters.
+        """
+        config = self._config(task)
+        tier = config.get('tier', self.tier_order[-1])
+        return Route(task, tier, self.tiers[tier], config.get('max_tokens'), config.get('timeout'), False,
+                     config.get('deadline'))
+
+    def _window(self, task: str, tier: str) -> LatencyWindow:
+        key = (task, tier)
+        if key not in self._latency:
+            self._latency[key] = LatencyWindow(self.window)
+        return self._latency[key]
+
+    def observe(self, route: Route, seconds: float) -> None:
+        """Record a call's duration and degrade the task if its p95 breaches the SLO"""
+        slo = self._config(route.task).get('slo_p95')
+        with self._lock:
+            window = self._window(route.task, route.tier)
+            window.add(seconds)
+            if route.degraded or slo is None or len(window) < self.min_samples or route.task in self._degraded:
+                return
+            p95 = window.p95()
+            faster = self._faster(route.tier)
+            if p95 <= slo or faster is None:
+                return
+            self._degraded[route.task] = (faster, self.clock() + self.cooldown)
+            self._degradations[route.task] += 1
+        logger.warning("Model routing: %s p95 %.1fs exceeds SLO %.1fs, moving from %s to %s for %.0fs",
+                       route.task, p95, slo, route.tier, faster, self.cooldown)
+
+    def snapshot(self) -> Dict:
+        """Per-task routing state and counters for the stats endpoint"""
+        now = self.clock()
+        with self._lock:
+            tasks = {task for task, _ in self._routed} | {task for task, _ in self._latency}
+            stats = {}
+            for task in sorted(tasks):
+                config = self._config(task)
+                degraded = self._degraded.get(task)
+                current = degraded[0] if degraded and now < degraded[1] else config.get('tier', self.tier_order[-1])
+                stats[task] = {
+                    'tier': current,
+                    'model': self.tiers[current],
+                    'home_tier': config.get('tier', self.tier_order[-1]),
+                    'degraded': current != config.get('tier', self.tier_order[-1]),
+                    'degradations': self._degradations[task],
+                    'slo_p95_ms': config['slo_p95'] * 1000 if config.get('slo_p95') else None,
+                    'p95_ms': {
+                        tier: round(window.p95() * 1000, 1)
+                        for (window_task, tier), window in self._latency.items()
+                        if window_task == task and len(window)
+                    },
+                    'routed': {tier: count for (routed_task, tier), count in self._routed.items() if routed_task == task}
+                }
+            return stats
@@ -1,9 +1,32 @@
 from flask_sqlalchemy import SQLAlchemy
 from datetime import datetime
+from operator import attrgetter
 from sqlalchemy import Text, JSON
 import json
 
-db = SQLAlchemy()
+from db_routing import RoutingSession
+
+db = SQLAlchemy(session_options={'class_': RoutingSession})
+
+def serializer(*fields):
+    """
+    Precompile a serializer for the given column attributes.
+
+    Values are returned as-is (datetimes included) and rendered by the app's
+    JSON provider, so to_dict does no per-field formatting.
+    """
+    getter = attrgetter(*fields)
+
+    if len(fields) == 1:
+        # attrgetter with a single name returns the value itself, not a tuple
+        def serialize(obj):
+            return {fields[0]: getter(obj)}
+        return serialize
+
+    def serialize(obj):
+        return dict(zip(fields, getter(obj)))
+    
+    return serialize
 
 class Platform(db.Model):
     __tablename__ = 'platforms'
@@ -15,15 +38,17 @@ class Platform(db.Model):
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
     updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
     
+    _serialize = serializer(
+        'id',
+        'platform_name',
+        'current_followers',
+        'goal_followers',
+        'created_at',
+        'updated_at'
+    )
+    
     def to_dict(self):
-        return {
-            'id': self.id,
-            'platform_name': self.platform_name,
-            'current_followers': self.current_followers,
-            'goal_followers': self.goal_followers,
-            'created_at': self.created_at.isoformat(),
-            'updated_at': self.updated_at.isoformat()
-        }
+        return self._serialize()
 
 class Profile(db.Model):
     __tablename__ = 'profile'
@@ -39,19 +64,21 @@ class Profile(db.Model):
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
     updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
     
+    _serialize = serializer(
+        'id',
+        'mission',
+        'goals',
+        'vision',
+        'niche',
+        'target_audience',
+        'stories',
+        'motivation',
+        'created_at',
+        'updated_at'
+    )
+    
     def to_dict(self):
-        return {
-            'id': self.id,
-            'mission': self.mission,
-            'goals': self.goals,
-            'vision': self.vision,
-            'niche': self.niche,
-            'target_audience': self.target_audience,
-            'stories': self.stories,
-            'motivation': self.motivation,
-            'created_at': self.created_at.isoformat(),
-            'updated_at': self.updated_at.isoformat()
-        }
+        return self._serialize()
 
 class ContentPillar(db.Model):
     __tablename__ = 'content_pillars'
@@ -70,19 +97,21 @@ class ContentPillar(db.Model):
     # Relationships
     content_ideas = db.relationship('ContentIdea', backref='pillar', lazy=True)
     
+    _serialize = serializer(
+        'id',
+        'pillar_name',
+        'description',
+        'keywords',
+        'target_audience',
+        'content_frequency',
+        'goals',
+        'color',
+        'created_at',
+        'updated_at'
+    )
+    
     def to_dict(self):
-        return {
-            'id': self.id,
-            'pillar_name': self.pillar_name,
-            'description': self.description,
-            'keywords': self.keywords,
-            'target_audience': self.target_audience,
-            'content_frequency': self.content_frequency,
-            'goals': self.goals,
-            'color': self.color,
-            'created_at': self.created_at.isoformat(),
-            'updated_at': self.updated_at.isoformat()
-        }
+        return self._serialize()
 
 class ContentIdea(db.Model):
     __tablename__ = 'content_ideas'
@@ -100,18 +129,20 @@ class ContentIdea(db.Model):
     # Relationships
     content_items = db.relationship('ContentManager', backref='idea', lazy=True)
     
+    _serialize = serializer(
+        'id',
+        'title',
+        'description',
+        'content_pillar_id',
+        'inspiration_link',
+        'priority',
+        'status',
+        'created_at',
+        'updated_at'
+    )
+    
     def to_dict(self):
-        return {
-            'id': self.id,
-            'title': self.title,
-            'description': self.description,
-            'content_pillar_id': self.content_pillar_id,
-            'inspiration_link': self.inspiration_link,
-            'priority': self.priority,
-            'status': self.status,
-            'created_at': self.created_at.isoformat(),
-            'updated_at': self.updated_at.isoformat()
-        }
+        return self._serialize()
 
 class ContentManager(db.Model):
     __tablename__ = 'content_manager'
@@ -147,6 +178,9 @@ class ContentManager(db.Model):
     comments = db.Column(db.Integer, default=0)
     saves = db.Column(db.Integer, default=0)
     retention_rate = db.Column(db.Float, default=0.0)  # % who watched full video
+    # Once Analytics rows exist, the totals above are theirs (content_totals.py)
+    engagement_rate = db.Column(db.Float, default=0.0)  # Interactions per 100 views
+    analytics_days = db.Column(db.Integer, nullable=False, default=0, server_default='0')  # Analytics rows summed
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
     updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
     
@@ -159,42 +193,46 @@ class ContentManager(db.Model):
     # Repurpose relationships
     original_content = db.relationship('ContentManager', remote_side=[id], backref='repurposed_content', lazy=True)
     
+    _serialize = serializer(
+        'id',
+        'content_title',
+        'content_idea_id',
+        'content_pillar_id',
+        'status',
+        'content_type',
+        'content_format',
+        'publish_time',
+        'intention',
+        'hook',
+        'caption',
+        'script',
+        'tone',
+        'call_to_action',
+        'music',
+        'duration',
+        'minutes_spent',
+        'content_link',
+        'hashtags_used',
+        'notes',
+        'original_content_id',
+        'is_repurposed',
+        'views',
+        'likes',
+        'shares',
+        'comments',
+        'saves',
+        'retention_rate',
+        'engagement_rate',
+        'created_at',
+        'updated_at'
+    )
+    
     def to_dict(self):
-        return {
-            'id': self.id,
-            'content_title': self.content_title,
-            'content_idea_id': self.content_idea_id,
-            'content_pillar_id': self.content_pillar_id,
-            'status': self.status,
-            'content_type': self.content_type,
-            'content_format': self.content_format,
-            'publish_time': self.publish_time.isoformat() if self.publish_time else None,
-            'intention': self.intention,
-            'hook': self.hook,
-            'caption': self.caption,
-            'script': self.script,
-            'tone': self.tone,
-            'call_to_action': self.call_to_action,
-            'music': self.music,
-            'duration': self.duration,
-            'minutes_spent': self.minutes_spent,
-            'content_link': self.content_link,
-            'hashtags_used': self.hashtags_used,
-            'notes': self.notes,
-            'original_content_id': self.original_content_id,
-            'is_repurposed': self.is_repurposed,
-            'views': self.views,
-            'likes': self.likes,
-            'shares': self.shares,
-            'comments': self.comments,
-            'saves': self.saves,
-            'retention_rate': self.retention_rate,
-            'platforms': [{'id': p.id, 'platform_name': p.platform_name} for p in self.platforms],
-            'original_content': {'id': self.original_content.id, 'content_title': self.original_content.content_title} if self.original_content else None,
-            'repurposed_count': len(self.repurposed_content) if hasattr(self, 'repurposed_content') else 0,
-            'created_at': self.created_at.isoformat(),
-            'updated_at': self.updated_at.isoformat()
-        }
+        data = self._serialize()
+        data['platforms'] = [{'id': p.id, 'platform_name': p.platform_name} for p in self.platforms]
+        data['original_content'] = {'id': self.original_content.id, 'content_title': self.original_content.content_title} if self.original_content else None
+        data['repurposed_count'] = len(self.repurposed_content) if hasattr(self, 'repurposed_content') else 0
+        return data
 
 # Junction table for many-to-many relationship between content and platforms
 content_platforms = db.Table('content_platforms',
@@ -219,19 +257,21 @@ class Task(db.Model):
     # Relationships
     content = db.relationship('ContentManager', backref='tasks', lazy=True)
     
+    _serialize = serializer(
+        'id',
+        'title',
+        'description',
+        'content_id',
+        'due_date',
+        'status',
+        'priority',
+        'estimated_hours',
+        'created_at',
+        'updated_at'
+    )
+    
     def to_dict(self):
-        return {
-            'id': self.id,
-            'title': self.title,
-            'description': self.description,
-            'content_id': self.content_id,
-            'due_date': self.due_date.isoformat() if self.due_date else None,
-            'status': self.status,
-            'priority': self.priority,
-            'estimated_hours': self.estimated_hours,
-            'created_at': self.created_at.isoformat(),
-            'updated_at': self.updated_at.isoformat()
-        }
+        return self._serialize()
 
 class ContentSubtask(db.Model):
     __tablename__ = 'content_subtasks'
@@ -244,19 +284,23 @@ class ContentSubtask(db.Model):
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
     updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
     
+    _serialize = serializer(
+        'id',
+        'content_id',
+        'task_title',
+        'status',
+        'due_date',
+        'created_at',
+        'updated_at'
+    )
+    
     def to_dict(self):
-        return {
-            'id': self.id,
-            'content_id': self.content_id,
-            'task_title': self.task_title,
-            'status': self.status,
-            'due_date': self.due_date.isoformat() if self.due_date else None,
-            'created_at': self.created_at.isoformat(),
-            'updated_at': self.updated_at.isoformat()
-        }
+        return self._serialize()
 
 class Analytics(db.Model):
     __tablename__ = 'analytics'
+    # Monthly range partitions on Postgres, managed by partitions.py
+    __table_args__ = {'postgresql_partition_by': 'RANGE (date_recorded)'}
     
     id = db.Column(db.Integer, primary_key=True)
     content_id = db.Column(db.Integer, db.ForeignKey('content_manager.id'), nullable=False)
@@ -271,25 +315,133 @@ class Analytics(db.Model):
     engagement_rate = db.Column(db.Float, default=0.0)
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
     
+    _serialize = serializer(
+        'id',
+        'content_id',
+        'platform_id',
+        'date_recorded',
+        'views',
+        'likes',
+        'shares',
+        'comments',
+        'saves',
+        'retention_rate',
+        'engagement_rate',
+        'created_at'
+    )
+    
+    def to_dict(self):
+        return self._serialize()
+
+# Weekly rollups of Analytics, maintained incrementally by rollups.py. No
+# foreign keys: they are derived data, and a content item or pillar deleted
+# in the same flush as its rollup rows must not trip a constraint.
+class AnalyticsWeekly(db.Model):
+    __tablename__ = 'analytics_weekly'
+    __table_args__ = (db.UniqueConstraint('content_id', 'platform_id', 'week_start', name='uq_analytics_weekly'),)
+
+    id = db.Column(db.Integer, primary_key=True)
+    content_id = db.Column(db.Integer, nullable=False)
+    platform_id = db.Column(db.Integer, nullable=False, index=True)
+    week_start = db.Column(db.Date, nullable=False, index=True)  # Monday
+    views = db.Column(db.BigInteger, nullable=False, default=0)
+    likes = db.Column(db.BigInteger, nullable=False, default=0)
+    shares = db.Column(db.BigInteger, nullable=False, default=0)
+    comments = db.Column(db.BigInteger, nullable=False, default=0)
+    saves = db.Column(db.BigInteger, nullable=False, default=0)
+    retention_rate_sum = db.Column(db.Float, nullable=False, default=0.0)
+    engagement_rate_sum = db.Column(db.Float, nullable=False, default=0.0)
+    days = db.Column(db.Integer, nullable=False, default=0)  # Analytics rows summed
+
+    _serialize = serializer(
+        'content_id',
+        'platform_id',
+        'week_start',
+        'views',
+        'likes',
+        'shares',
+        'comments',
+        'saves',
+        'days'
+    )
+
+    def to_dict(self):
+        data = self._serialize()
+        data['retention_rate'] = self.retention_rate_sum / self.days if self.days else 0.0
+        data['engagement_rate'] = self.engagement_rate_sum / self.days if self.days else 0.0
+        return data
+
+# Running daily-views statistics per content item and platform, kept by
+# anomalies.py as Analytics rows arrive. No foreign keys, like the rollups.
+class AnalyticsBaseline(db.Model):
+    __tablename__ = 'analytics_baselines'
+    __table_args__ = (db.UniqueConstraint('content_id', 'platform_id', name='uq_analytics_baselines'),)
+
+    id = db.Column(db.Integer, primary_key=True)
+    content_id = db.Column(db.Integer, nullable=False)
+    platform_id = db.Column(db.Integer, nullable=False)
+    samples = db.Column(db.Integer, nullable=False, default=0)  # Analytics rows seen
+    mean = db.Column(db.Float, nullable=False, default=0.0)  # Mean daily views
+    m2 = db.Column(db.Float, nullable=False, default=0.0)  # Sum of squared deviations (Welford)
+    last_date = db.Column(db.Date)  # Latest date_recorded seen
+    last_views = db.Column(db.Integer)  # Views on last_date
+    last_alert_date = db.Column(db.Date)  # Latest spike reported
+
+    _serialize = serializer(
+        'content_id',
+        'platform_id',
+        'samples',
+        'mean',
+        'last_date',
+        'last_views',
+        'last_alert_date'
+    )
+
+    def to_dict(self):
+        data = self._serialize()
+        data['stddev'] = (self.m2 / (self.samples - 1)) ** 0.5 if self.samples > 1 else 0.0
+        return data
+
+class PillarAnalyticsWeekly(db.Model):
+    __tablename__ = 'pillar_analytics_weekly'
+    __table_args__ = (db.UniqueConstraint('pillar_id', 'platform_id', 'week_start', name='uq_pillar_analytics_weekly'),)
+
+    id = db.Column(db.Integer, primary_key=True)
+    pillar_id = db.Column(db.Integer, nullable=False)
+    platform_id = db.Column(db.Integer, nullable=False, index=True)
+    week_start = db.Column(db.Date, nullable=False, index=True)  # Monday
+    views = db.Column(db.BigInteger, nullable=False, default=0)
+    likes = db.Column(db.BigInteger, nullable=False, default=0)
+    shares = db.Column(db.BigInteger, nullable=False, default=0)
+    comments = db.Column(db.BigInteger, nullable=False, default=0)
+    saves = db.Column(db.BigInteger, nullable=False, default=0)
+    retention_rate_sum = db.Column(db.Float, nullable=False, default=0.0)
+    engagement_rate_sum = db.Column(db.Float, nullable=False, default=0.0)
+    days = db.Column(db.Integer, nullable=False, default=0)  # Analytics rows summed, across the pillar's content
+
+    _serialize = serializer(
+        'pillar_id',
+        'platform_id',
+        'week_start',
+        'views',
+        'likes',
+        'shares',
+        'comments',
+        'saves',
+        'days'
+    )
+
     def to_dict(self):
-        return {
-            'id': self.id,
-            'content_id': self.content_id,
-            'platform_id': self.platform_id,
-            'date_recorded': self.date_recorded.isoformat(),
-            'views': self.views,
-            'likes': self.likes,
-            'shares': self.shares,
-            'comments': self.comments,
-            'saves': self.saves,
-            'retention_rate': self.retention_rate,
-            'engagement_rate': self.engagement_rate,
-            'created_at': self.created_at.isoformat()
-        }
+        data = self._serialize()
+        data['retention_rate'] = self.retention_rate_sum / self.days if self.days else 0.0
+        data['engagement_rate'] = self.engagement_rate_sum / self.days if self.days else 0.0
+        return data
 
 # Trend Analytics Models
 class TrendingTopic(db.Model):
     __tablename__ = 'trending_topics'
+    # Ranking reads active topics of a niche by decayed_score straight from this index
+    __table_args__ = (db.Index('ix_trending_topics_rank', 'niche_category', 'is_active', 'decayed_score'),)
     
     id = db.Column(db.Integer, primary_key=True)
     topic = db.Column(db.String(200), nullable=False)
@@ -302,25 +454,64 @@ class TrendingTopic(db.Model):
     growth_rate = db.Column(db.Float, default=0.0)  # % growth in last 24h
     peak_time = db.Column(db.DateTime)  # When trend peaked
     is_active = db.Column(db.Boolean, default=True)
+    # Momentum from the snapshots, maintained by trend_scores.py
+    score_ewma = db.Column(db.Float)  # Smoothed trend_score
+    velocity = db.Column(db.Float, default=0.0)  # Score points per hour, smoothed
+    acceleration = db.Column(db.Float, default=0.0)  # Change in velocity per hour, smoothed
+    decayed_score = db.Column(db.Float, default=0.0)  # Smoothed score projected along its velocity, 0-100
+    last_seen_at = db.Column(db.DateTime)  # Time of the latest snapshot
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
     updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
     
+    snapshots = db.relationship('TrendSnapshot', backref='trending_topic', lazy=True)
+    
+    _serialize = serializer(
+        'id',
+        'topic',
+        'trend_score',
+        'niche_category',
+        'volume_24h',
+        'engagement_rate',
+        'growth_rate',
+        'peak_time',
+        'is_active',
+        'velocity',
+        'acceleration',
+        'decayed_score',
+        'last_seen_at',
+        'created_at',
+        'updated_at'
+    )
+    
+    def to_dict(self):
+        data = self._serialize()
+        data['hashtags'] = json.loads(self.hashtags) if self.hashtags else []
+        data['platforms'] = json.loads(self.platforms) if self.platforms else {}
+        return data
+
+# Append-only history of each trending topic's readings
+class TrendSnapshot(db.Model):
+    __tablename__ = 'trend_snapshots'
+    __table_args__ = (db.Index('ix_trend_snapshots_topic', 'topic_id', 'recorded_at'),)
+    
+    id = db.Column(db.Integer, primary_key=True)
+    topic_id = db.Column(db.Integer, db.ForeignKey('trending_topics.id'), nullable=False)
+    recorded_at = db.Column(db.DateTime, nullable=False, default=datetime.utcnow)
+    trend_score = db.Column(db.Float, nullable=False)
+    volume_24h = db.Column(db.Integer, default=0)
+    engagement_rate = db.Column(db.Float, default=0.0)
+    growth_rate = db.Column(db.Float, default=0.0)
+    
+    _serialize = serializer(
+        'recorded_at',
+        'trend_score',
+        'volume_24h',
+        'engagement_rate',
+        'growth_rate'
+    )
+    
     def to_dict(self):
-        return {
-            'id': self.id,
-            'topic': self.topic,
-            'hashtags': json.loads(self.hashtags) if self.hashtags else [],
-            'platforms': json.loads(self.platforms) if self.platforms else {},
-            'trend_score': self.trend_score,
-            'niche_category': self.niche_category,
-            'volume_24h': self.volume_24h,
-            'engagement_rate': self.engagement_rate,
-            'growth_rate': self.growth_rate,
-            'peak_time': self.peak_time.isoformat() if self.peak_time else None,
-            'is_active': self.is_active,
-            'created_at': self.created_at.isoformat(),
-            'updated_at': self.updated_at.isoformat()
-        }
+        return self._serialize()
 
 class ContentPerformanceAnalysis(db.Model):
     __tablename__ = 'content_performance_analysis'
@@ -345,21 +536,24 @@ class ContentPerformanceAnalysis(db.Model):
     # Relationships
     content = db.relationship('ContentManager', backref='performance_analyses')
     
+    _serialize = serializer(
+        'id',
+        'content_id',
+        'analysis_date',
+        'performance_score',
+        'engagement_score',
+        'viral_potential',
+        'trend_alignment',
+        'predicted_reach'
+    )
+    
     def to_dict(self):
-        return {
-            'id': self.id,
-            'content_id': self.content_id,
-            'analysis_date': self.analysis_date.isoformat(),
-            'performance_score': self.performance_score,
-            'engagement_score': self.engagement_score,
-            'viral_potential': self.viral_potential,
-            'trend_alignment': self.trend_alignment,
-            'best_performing_elements': json.loads(self.best_performing_elements) if self.best_performing_elements else [],
-            'improvement_suggestions': json.loads(self.improvement_suggestions) if self.improvement_suggestions else [],
-            'similar_trending_content': json.loads(self.similar_trending_content) if self.similar_trending_content else [],
-            'optimal_post_time': self.optimal_post_time.strftime('%H:%M') if self.optimal_post_time else None,
-            'predicted_reach': self.predicted_reach
-        }
+        data = self._serialize()
+        data['best_performing_elements'] = json.loads(self.best_performing_elements) if self.best_performing_elements else []
+        data['improvement_suggestions'] = json.loads(self.improvement_suggestions) if self.improvement_suggestions else []
+        data['similar_trending_content'] = json.loads(self.similar_trending_content) if self.similar_trending_content else []
+        data['optimal_post_time'] = self.optimal_post_time.strftime('%H:%M') if self.optimal_post_time else None
+        return data
 
 class CompetitorAnalysis(db.Model):
     __tablename__ = 'competitor_analysis'
@@ -385,24 +579,27 @@ class CompetitorAnalysis(db.Model):
     last_analyzed = db.Column(db.DateTime, default=datetime.utcnow)
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
     
+    _serialize = serializer(
+        'id',
+        'competitor_name',
+        'platform',
+        'username',
+        'niche_category',
+        'followers_count',
+        'avg_engagement_rate',
+        'post_frequency',
+        'content_strategy',
+        'growth_rate',
+        'last_analyzed',
+        'created_at'
+    )
+    
     def to_dict(self):
-        return {
-            'id': self.id,
-            'competitor_name': self.competitor_name,
-            'platform': self.platform,
-            'username': self.username,
-            'niche_category': self.niche_category,
-            'followers_count': self.followers_count,
-            'avg_engagement_rate': self.avg_engagement_rate,
-            'post_frequency': self.post_frequency,
-            'best_content_types': json.loads(self.best_content_types) if self.best_content_types else [],
-            'trending_hashtags': json.loads(self.trending_hashtags) if self.trending_hashtags else [],
-            'content_strategy': self.content_strategy,
-            'posting_patterns': json.loads(self.posting_patterns) if self.posting_patterns else {},
-            'growth_rate': self.growth_rate,
-            'last_analyzed': self.last_analyzed.isoformat(),
-            'created_at': self.created_at.isoformat()
-        }
+        data = self._serialize()
+        data['best_content_types'] = json.loads(self.best_content_types) if self.best_content_types else []
+        data['trending_hashtags'] = json.loads(self.trending_hashtags) if self.trending_hashtags else []
+        data['posting_patterns'] = json.loads(self.posting_patterns) if self.posting_patterns else {}
+        return data
 
 class NicheInsights(db.Model):
     __tablename__ = 'niche_insights'
@@ -426,19 +623,114 @@ class NicheInsights(db.Model):
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
     updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
     
+    _serialize = serializer(
+        'id',
+        'niche_name',
+        'insight_type',
+        'title',
+        'description',
+        'confidence_score',
+        'priority',
+        'status',
+        'expiry_date',
+        'created_at',
+        'updated_at'
+    )
+    
+    def to_dict(self):
+        data = self._serialize()
+        data['supporting_data'] = json.loads(self.supporting_data) if self.supporting_data else {}
+        data['action_items'] = json.loads(self.action_items) if self.action_items else []
+        return data
+
+class IdeaBatch(db.Model):
+    __tablename__ = 'idea_batches'
+
+    id = db.Column(db.Integer, primary_key=True)
+    batch_id = db.Column(db.String(100), index=True)  # Message Batches API id
+    status = db.Column(db.String(20), default='in_progress')  # in_progress, completed, failed
+    requests = db.Column(Text)  # JSON of custom_id -> {pillar_id, platform}
+    request_count = db.Column(db.Integer, default=0)
+    ideas_created = db.Column(db.Integer, default=0)
+    errors = db.Column(Text)  # JSON of custom_id -> error message
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    completed_at = db.Column(db.DateTime)
+
+    _serialize = serializer(
+        'id',
+        'batch_id',
+        'status',
+        'request_count',
+        'ideas_created',
+        'created_at',
+        'completed_at'
+    )
+
+    def to_dict(self):
+        data = self._serialize()
+        data['errors'] = json.loads(self.errors) if self.errors else {}
+        return data
+
+# Fitted view/like curves per content item, refreshed by forecasting.py. No
+# foreign key: forecasts are derived data, and the refresh drops orphans.
+class ContentForecast(db.Model):
+    __tablename__ = 'content_forecasts'
+
+    id = db.Column(db.Integer, primary_key=True)
+    content_id = db.Column(db.Integer, nullable=False, unique=True)
+    days_observed = db.Column(db.Integer, nullable=False)  # Days since publishing covered by analytics
+    # The content totals the fit saw; a change means new data
+    analytics_days = db.Column(db.Integer, nullable=False)
+    views_total = db.Column(db.BigInteger, nullable=False)
+    likes_total = db.Column(db.BigInteger, nullable=False)
+    # Cumulative forecasts with 95% prediction intervals
+    views_7 = db.Column(db.Float)
+    views_7_low = db.Column(db.Float)
+    views_7_high = db.Column(db.Float)
+    views_30 = db.Column(db.Float)
+    views_30_low = db.Column(db.Float)
+    views_30_high = db.Column(db.Float)
+    likes_7 = db.Column(db.Float)
+    likes_7_low = db.Column(db.Float)
+    likes_7_high = db.Column(db.Float)
+    likes_30 = db.Column(db.Float)
+    likes_30_low = db.Column(db.Float)
+    likes_30_high = db.Column(db.Float)
+    views_tau = db.Column(db.Float)  # Fitted time constant in days: ~63% of the final total by then
+    likes_tau = db.Column(db.Float)
+    fitted_at = db.Column(db.DateTime, default=datetime.utcnow)
+
+    _serialize = serializer(
+        'content_id',
+        'days_observed',
+        'views_tau',
+        'likes_tau',
+        'fitted_at'
+    )
+
+    def to_dict(self):
+        data = self._serialize()
+        for metric in ('views', 'likes'):
+            data[metric] = {
+                f'day_{day}': {
+                    'expected': getattr(self, f'{metric}_{day}'),
+                    'low': getattr(self, f'{metric}_{day}_low'),
+                    'high': getattr(self, f'{metric}_{day}_high')
+                }
+                for day in (7, 30)
+            }
+        return data
+
+class TableVersion(db.Model):
+    __tablename__ = 'table_versions'
+    
+    table_name = db.Column(db.String(100), primary_key=True)
+    version = db.Column(db.BigInteger, nullable=False, default=0)  # Bumped on every committed write to the table
+    
+    _serialize = serializer(
+        'table_name',
+        'version'
+    )
+    
     def to_dict(self):
-        return {
-            'id': self.id,
-            'niche_name': self.niche_name,
-            'insight_type': self.insight_type,
-            'title': self.title,
-            'description': self.description,
-            'supporting_data': json.loads(self.supporting_data) if self.supporting_data else {},
-            'confidence_score': self.confidence_score,
-            'action_items': json.loads(self.action_items) if self.action_items else [],
-            'priority': self.priority,
-            'status': self.status,
-            'expiry_date': self.expiry_date.isoformat() if self.expiry_date else None,
-            'created_at': self.created_at.isoformat(),
-            'updated_at': self.updated_at.isoformat()
-        } 
\ No newline at end of file
+        return self._serialize()
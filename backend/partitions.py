@@ -0,0 +1,242 @@
+from datetime import date
+from typing import Iterable, List, Optional, Set
+import logging
+import re
+import threading
+
+import click
+from flask import current_app
+from flask.cli import AppGroup
+from sqlalchemy import event, text
+from sqlalchemy.ext.compiler import compiles
+from sqlalchemy.schema import CreateTable
+
+from models import db, Analytics
+
+logger = logging.getLogger(__name__)
+
+PARTITIONED_TABLE = Analytics.__tablename__
+PARTITION_NAME = re.compile(rf'^{PARTITIONED_TABLE}_(\d{{4}})_(\d{{2}})$')
+
+# session.info key for months whose partitions this transaction created or confirmed
+PENDING_KEY = 'partitions_pending'
+
+# Months known to have a partition, so ingest skips the DDL; filled on commit
+_known_months: Set[date] = set()
+_known_lock = threading.Lock()
+# Whether the analytics table is partitioned, per database URL (a plain table predates partitioning)
+_partitioned = {}
+
+
+def month_start(day: date) -> date:
+    return day.replace(day=1)
+
+
+def add_months(month: date, months: int) -> date:
+    index = month.year * 12 + month.month - 1 + months
+    return date(index // 12, index % 12 + 1, 1)
+
+
+def month_range(first: date, last: date) -> List[date]:
+    """The first day of every month from first's to last's, inclusive"""
+    months, month = [], month_start(first)
+    while month <= last:
+        months.append(month)
+        month = add_months(month, 1)
+    return months
+
+
+def partition_name(month: date) -> str:
+    return f'{PARTITIONED_TABLE}_{month:%Y_%m}'
+
+
+@compiles(CreateTable, 'postgresql')
+def _create_table(create, compiler, **kw):
+    sql = compiler.visit_create_table(create, **kw)
+    if create.element.name == PARTITIONED_TABLE:
+        # Keys of a partitioned table must include the partition column; id stays unique through its sequence
+        sql = sql.replace('PRIMARY KEY (id)', 'PRIMARY KEY (id, date_recorded)')
+    return sql
+
+
+def is_partitioned(connection) -> bool:
+    """Whether analytics is a partitioned Postgres table"""
+    if connection.dialect.name != 'postgresql':
+        return False
+    url = str(connection.engine.url)
+    if url not in _partitioned:
+        _partitioned[url] = bool(connection.execute(
+            text('SELECT EXISTS (SELECT 1 FROM pg_partitioned_table WHERE partrelid = to_regclass(:table))'),
+            {'table': PARTITIONED_TABLE}
+        ).scalar())
+    return _partitioned[url]
+
+
+def partition_months(connection) -> List[date]:
+    """The month of each existing analytics partition, oldest first"""
+    names = connection.execute(text(
+        'SELECT child.relname FROM pg_inherits JOIN pg_class child ON child.oid = pg_inherits.inhrelid '
+        'WHERE pg_inherits.inhparent = to_regclass(:table)'
+    ), {'table': PARTITIONED_TABLE}).scalars()
+    matches = filter(None, (PARTITION_NAME.match(name) for name in names))
+    return sorted(date(int(match[1]), int(match[2]), 1) for match in matches)
+
+
+def raw_horizon(connection) -> Optional[date]:
+    """
+    The first day older partitions may have been dropped before, or None.
+
+    Raw rows before it are only in the weekly rollups, so the week that
+    straddles it can no longer be rebuilt from raw rows.
+    """
+    if not is_partitioned(connection):
+        return None
+    months = partition_months(connection)
+    return months[0] if months else None
+
+
+def ensure_partitions(connection, months: Iterable[date]) -> List[date]:
+    """Create any missing partition for the given months; returns the months asked for"""
+    months = sorted({month_start(month) for month in months})
+    for month in months:
+        # Dates come from date objects, so formatting them into the DDL is safe
+        connection.execute(text(
+            f'CREATE TABLE IF NOT EXISTS {partition_name(month)} PARTITION OF {PARTITIONED_TABLE} '
+            f"FOR VALUES FROM ('{month.isoformat()}') TO ('{add_months(month, 1).isoformat()}')"
+        ))
+    return months
+
+
+def ensure_ahead(connection, ahead: int, today: Optional[date] = None) -> List[date]:
+    """Partitions for this month and the next `ahead` months"""
+    this_month = month_start(today or date.today())
+    return ensure_partitions(connection, month_range(this_month, add_months(this_month, ahead)))
+
+
+def drop_partitions(connection, before: date) -> List[date]:
+    """Drop every partition whose whole month is before the given day; returns their months"""
+    dropped = [month for month in partition_months(connection) if add_months(month, 1) <= before]
+    for month in dropped:
+        connection.execute(text(f'DROP TABLE {partition_name(month)}'))
+    with _known_lock:
+        _known_months.difference_update(dropped)
+    return dropped
+
+
+def convert(connection, ahead: int = 3, today: Optional[date] = None) -> int:
+    """
+    Replace a plain analytics table by a partitioned one holding the same
+    rows (Postgres). Returns the number of rows moved.
+
+    Runs in the caller's transaction, which holds an exclusive lock on
+    analytics until it commits: run it in a maintenance window.
+    """
+    if connection.dialect.name != 'postgresql' or is_partitioned(connection):
+        return 0
+    table, legacy = PARTITIONED_TABLE, f'{PARTITIONED_TABLE}_unpartitioned'
+    # The new table's key index and sequence take these names
+    connection.execute(text(f'ALTER TABLE {table} RENAME TO {legacy}'))
+    connection.execute(text(f'ALTER INDEX {table}_pkey RENAME TO {legacy}_pkey'))
+    connection.execute(text(f'ALTER SEQUENCE {table}_id_seq RENAME TO {legacy}_id_seq'))
+    Analytics.__table__.create(connection)
+
+    first, last = connection.execute(text(f'SELECT min(date_recorded), max(date_recorded) FROM {legacy}')).one()
+    if first is not None:
+        ensure_partitions(connection, month_range(first, last))
+    ensure_ahead(connection, ahead, today)
+
+    columns = ', '.join(column.name for column in Analytics.__table__.columns)
+    moved = connection.execute(text(f'INSERT INTO {table} ({columns}) SELECT {columns} FROM {legacy}')).rowcount
+    connection.execute(text(
+        f"SELECT setval(pg_get_serial_sequence('{table}', 'id'), (SELECT coalesce(max(id), 0) + 1 FROM {table}), false)"
+    ))
+    connection.execute(text(f'DROP TABLE {legacy}'))
+    _partitioned[str(connection.engine.url)] = True
+    return moved
+
+
+def _ensure_for(session, days: Iterable[date]) -> None:
+    """Create partitions for the months of rows about to be written, in the session's transaction"""
+    months = {month_start(day) for day in days if day is not None}
+    with _known_lock:
+        months -= _known_months
+    if not months:
+        return
+    connection = session.connection()
+    if not is_partitioned(connection):
+        return
+    ensure_partitions(connection, months)
+    session.info.setdefault(PENDING_KEY, set()).update(months)
+
+
+def _before_flush(session, flush_context, instances):
+    rows = [obj for obj in session.new if isinstance(obj, Analytics)]
+    rows += [obj for obj in session.dirty if isinstance(obj, Analytics)]
+    if rows:
+        _ensure_for(session, (obj.date_recorded for obj in rows))
+
+
+def _on_execute(orm_execute_state):
+    # ORM bulk INSERT (session.execute(insert(Analytics), rows)) bypasses flush
+    if orm_execute_state.is_insert and orm_execute_state.statement.table.name == PARTITIONED_TABLE:
+        rows = orm_execute_state.parameters
+        if isinstance(rows, list):
+            _ensure_for(orm_execute_state.session, (row.get('date_recorded') for row in rows))
+    return None
+
+
+def _after_commit(session):
+    months = session.info.pop(PENDING_KEY, None)
+    if months:
+        # Old months are not cached: compaction may drop them from under another process
+        recent = add_months(month_start(date.today()), -1)
+        with _known_lock:
+            _known_months.update(month for month in months if month >= recent)
+
+
+def _after_rollback(session):
+    session.info.pop(PENDING_KEY, None)
+
+
+partitions_cli = AppGroup('partitions', help='Manage the monthly analytics partitions (Postgres).')
+
+
+@partitions_cli.command('ensure')
+@click.option('--ahead', type=int, help='Months to create past this one (default ANALYTICS_PARTITIONS_AHEAD).')
+def ensure_command(ahead):
+    """Create the partitions for this month and the months ahead."""
+    with db.engine.begin() as connection:
+        if not is_partitioned(connection):
+            raise click.ClickException('analytics is not partitioned; run `flask partitions convert` first')
+        months = ensure_ahead(connection, current_app.config['ANALYTICS_PARTITIONS_AHEAD'] if ahead is None else ahead)
+    click.echo(f'Partitions in place from {months[0]:%Y-%m} to {months[-1]:%Y-%m}')
+
+
+@partitions_cli.command('convert')
+def convert_command():
+    """Move an existing plain analytics table into monthly partitions."""
+    with db.engine.begin() as connection:
+        if connection.dialect.name != 'postgresql':
+            raise click.ClickException('Partitioning needs Postgres')
+        moved = convert(connection, current_app.config['ANALYTICS_PARTITIONS_AHEAD'])
+    click.echo(f'Moved {moved} rows into partitions')
+
+
+def init_partitions(app) -> None:
+    """
+    Create analytics partitions as rows arrive, and add the
+    `flask partitions` commands.
+
+    On Postgres analytics is range partitioned by date_recorded, one
+    partition per month (analytics_YYYY_MM), so queries over recent days
+    scan only recent partitions and compaction (rollups.compact) drops old
+    months whole. A flush or bulk insert with rows for a month without a
+    partition creates it in the same transaction. Other databases keep one
+    plain table and these hooks do nothing.
+    """
+    app.cli.add_command(partitions_cli)
+    if not event.contains(db.session, 'before_flush', _before_flush):
+        event.listen(db.session, 'before_flush', _before_flush)
+        event.listen(db.session, 'do_orm_execute', _on_execute)
+        event.listen(db.session, 'after_commit', _after_commit)
+        event.listen(db.session, 'after_rollback', _after_rollback)
@@ -0,0 +1,243 @@
+from datetime import datetime
+from typing import Dict, Iterable, List, Optional, Tuple
+import threading
+import time
+
+import numpy as np
+from sqlalchemy import func, select
+
+from models import db, Analytics, AnalyticsWeekly, ContentManager
+from versioning import get_versions
+
+HOURS = 24
+BINS = 7 * HOURS  # Hour of the week, Monday 00:00 first
+WEEKDAYS = ('Monday', 'Tuesday', 'Wednesday', 'Thursday', 'Friday', 'Saturday', 'Sunday')
+INTERACTIONS = ('likes', 'comments', 'shares', 'saves')
+# A refresh is needed when any of these change
+SOURCE_TABLES = ('analytics', 'analytics_weekly', 'content_manager')
+
+# (platform_id, content_type); None stands for any
+Key = Tuple[Optional[int], Optional[str]]
+
+
+def hour_of_week(moments: np.ndarray) -> np.ndarray:
+    """Bin of each datetime64 moment: weekday * 24 + hour"""
+    days = moments.astype('datetime64[D]')
+    # 1970-01-01 was a Thursday
+    weekdays = (days.astype(np.int64) + 3) % 7
+    hours = (moments - days).astype('timedelta64[h]').astype(np.int64)
+    return weekdays * HOURS + hours
+
+
+def smooth(sums: np.ndarray, counts: np.ndarray, bandwidth: float = 1.5, prior: float = 2.0) -> np.ndarray:
+    """
+    Mean engagement per hour of the week for each row of (groups, 168)
+    sums and counts.
+
+    Both are smoothed with a Gaussian kernel of bandwidth hours that wraps
+    around the week, so Sunday 23:00 borrows from Monday 00:00, then the
+    ratio is shrunk towards the row's overall mean with prior pseudo-posts.
+    Hours with no posts nearby get that mean instead of 0 or noise.
+    """
+    sums, counts = np.atleast_2d(sums), np.atleast_2d(counts)
+    reach = int(np.ceil(3 * bandwidth))
+    offsets = np.arange(-reach, reach + 1)
+    weights = np.exp(-0.5 * (offsets / bandwidth) ** 2)
+    neighbours = (np.arange(BINS)[None, :] - offsets[:, None]) % BINS  # (kernel, 168)
+    smoothed_sums = np.einsum('k,gkb->gb', weights, sums[:, neighbours])
+    smoothed_counts = np.einsum('k,gkb->gb', weights, counts[:, neighbours])
+    overall = sums.sum(axis=1, keepdims=True) / np.maximum(counts.sum(axis=1, keepdims=True), 1)
+    return (smoothed_sums + prior * overall) / (smoothed_counts + prior)
+
+
+def format_window(window: Dict) -> str:
+    return f"{window['weekday']} {window['hour']:02d}:00-{(window['hour'] + 1) % HOURS:02d}:00"
+
+
+def _keys(platform_id: Optional[int], content_type: Optional[str]) -> Tuple[Key, ...]:
+    """Histograms a post counts in, most specific first"""
+    return (platform_id, content_type), (platform_id, None), (None, content_type), (None, None)
+
+
+class PostingTimes:
+    """
+    Engagement by the hour of the week content was published, per platform
+    and content type.
+
+    Each published item contributes its engagement rate on each platform
+    (interactions per 100 views, from the weekly rollups) to the bin of its
+    publish_time, in four histograms: platform x content type, platform,
+    content type and overall. Sums and counts live in two (groups, 168)
+    arrays. A refresh first compares table version stamps; when they moved
+    it re-bins only content with new analytics rows or edits since the last
+    refresh. Edits and deletes of analytics rows, and deleted content, are
+    picked up by a full rebuild every rebuild_seconds.
+    """
+
+    def __init__(self, min_posts: int = 5, bandwidth: float = 1.5, prior: float = 2.0,
+                 rebuild_seconds: float = 3600, clock=time.monotonic):
+        self.min_posts = min_posts
+        self.bandwidth = bandwidth
+        self.prior = prior
+        self.rebuild_seconds = rebuild_seconds
+        self._clock = clock
+        self._lock = threading.Lock()
+        self._reset()
+        self._built_at: Optional[float] = None
+        self._versions = None
+
+    @classmethod
+    def from_config(cls, config) -> 'PostingTimes':
+        return cls(min_posts=config.get('POSTING_TIMES_MIN_POSTS', 5),
+                   bandwidth=config.get('POSTING_TIMES_BANDWIDTH_HOURS', 1.5),
+                   rebuild_seconds=config.get('POSTING_TIMES_REBUILD_SECONDS', 3600))
+
+    def _reset(self) -> None:
+        self._groups: Dict[Key, int] = {}
+        self._sums = np.zeros((0, BINS))
+        self._counts = np.zeros((0, BINS))
+        # content id -> (histogram rows, bins, values) it contributed, to take back out when it changes
+        self._posts: Dict[int, Tuple[np.ndarray, np.ndarray, np.ndarray]] = {}
+        self._smoothed: Optional[np.ndarray] = None
+        self._last_analytics_id = 0
+        self._last_content_update: Optional[datetime] = None
+
+    def _rows(self, keys: Iterable[Key]) -> np.ndarray:
+        rows = []
+        for key in keys:
+            if key not in self._groups:
+                self._groups[key] = len(self._groups)
+            rows.append(self._groups[key])
+        missing = len(self._groups) - self._sums.shape[0]
+        if missing > 0:
+            self._sums = np.vstack([self._sums, np.zeros((missing, BINS))])
+            self._counts = np.vstack([self._counts, np.zeros((missing, BINS))])
+        return np.array(rows, dtype=np.int64)
+
+    def _add(self, rows: np.ndarray, bins: np.ndarray, values: np.ndarray, sign: int) -> None:
+        size = self._sums.size
+        flat = rows * BINS + bins
+        self._sums += sign * np.bincount(flat, weights=values, minlength=size).reshape(self._sums.shape)
+        self._counts += sign * np.bincount(flat, minlength=size).reshape(self._counts.shape)
+        self._smoothed = None
+
+    def _load(self, content_ids: Optional[List[int]] = None) -> None:
+        """Bin the given content (all when None) from the database"""
+        interactions = sum(getattr(AnalyticsWeekly, name) for name in INTERACTIONS)
+        stmt = (
+            select(ContentManager.id, ContentManager.publish_time, ContentManager.content_type,
+                   AnalyticsWeekly.platform_id, func.sum(AnalyticsWeekly.views), func.sum(interactions))
+            .join(AnalyticsWeekly, AnalyticsWeekly.content_id == ContentManager.id)
+            .where(ContentManager.publish_time.isnot(None))
+            .group_by(ContentManager.id, ContentManager.publish_time, ContentManager.content_type,
+                      AnalyticsWeekly.platform_id)
+        )
+        if content_ids is not None:
+            stmt = stmt.where(ContentManager.id.in_(content_ids))
+        records = [row for row in db.session.execute(stmt) if row[4]]
+        if not records:
+            return
+
+        content = np.array([row[0] for row in records], dtype=np.int64)
+        bins = hour_of_week(np.array([row[1] for row in records], dtype='datetime64[m]'))
+        values = np.array([row[5] * 100.0 / row[4] for row in records])
+        # Each post counts once in each of its four histograms
+        rows = self._rows(key for row in records for key in _keys(row[3], row[2])).reshape(-1, 4)
+        bins, values = np.repeat(bins, 4), np.repeat(values, 4)
+        content, rows = np.repeat(content, 4), rows.ravel()
+        self._add(rows, bins, values, 1)
+
+        order = np.argsort(content, kind='stable')
+        starts = np.flatnonzero(np.r_[True, np.diff(content[order]) != 0])
+        for chunk in np.split(order, starts[1:]):
+            self._posts[int(content[chunk[0]])] = (rows[chunk], bins[chunk], values[chunk])
+
+    def _watermarks(self) -> Tuple[int, Optional[datetime]]:
+        return db.session.execute(
+            select(select(func.max(Analytics.id)).scalar_subquery(),
+                   select(func.max(ContentManager.updated_at)).scalar_subquery())
+        ).one()
+
+    def _rebuild(self) -> None:
+        # Watermarks first: rows written meanwhile are seen again by the next update, never missed
+        last_id, last_update = self._watermarks()
+        self._reset()
+        self._load()
+        self._last_analytics_id, self._last_content_update = last_id or 0, last_update
+        self._built_at = self._clock()
+
+    def _update(self) -> None:
+        last_id, last_update = self._watermarks()
+        changed = set(db.session.execute(
+            select(Analytics.content_id).where(Analytics.id > self._last_analytics_id).distinct()
+        ).scalars())
+        edited = select(ContentManager.id)
+        if self._last_content_update is not None:
+            edited = edited.where(ContentManager.updated_at > self._last_content_update)
+        changed.update(db.session.execute(edited).scalars())
+
+        for content_id in changed:
+            if content_id in self._posts:
+                self._add(*self._posts.pop(content_id), -1)
+        if changed:
+            self._load(sorted(changed))
+        self._last_analytics_id, self._last_content_update = last_id or 0, last_update
+
+    def refresh(self) -> None:
+        """Bring the histograms up to date with the database (one version lookup when nothing changed)"""
+        versions = get_versions(SOURCE_TABLES)
+        with self._lock:
+            if self._built_at is None or self._clock() - self._built_at >= self.rebuild_seconds:
+                self._rebuild()
+            elif versions is None or versions != self._versions:
+                self._update()
+            else:
+                return
+            self._versions = versions
+
+    def _means(self) -> np.ndarray:
+        if self._smoothed is None:
+            self._smoothed = smooth(self._sums, self._counts, self.bandwidth, self.prior)
+        return self._smoothed
+
+    def _group(self, platform_id: Optional[int], content_type: Optional[str]) -> Optional[Tuple[Key, int, int]]:
+        """The most specific histogram with at least min_posts posts: (key, row, posts)"""
+        for key in _keys(platform_id, content_type):
+            row = self._groups.get(key)
+            if row is not None:
+                posts = int(round(self._counts[row].sum()))
+                if posts >= self.min_posts:
+                    return key, row, posts
+        return None
+
+    def best_windows(self, platform_id: Optional[int] = None, content_type: Optional[str] = None,
+                     top: int = 3) -> Optional[Dict]:
+        """The top hours to publish, from the most specific histogram with enough posts, or None"""
+        self.refresh()
+        with self._lock:
+            group = self._group(platform_id, content_type)
+            if group is None:
+                return None
+            key, row, posts = group
+            means = self._means()[row]
+            windows = [{'weekday': WEEKDAYS[b // HOURS], 'hour': int(b % HOURS),
+                        'engagement_rate': round(float(means[b]), 2)}
+                       for b in np.argsort(-means, kind='stable')[:top]]
+            return {'platform_id': key[0], 'content_type': key[1], 'posts': posts, 'windows': windows}
+
+    def heatmap(self, platform_id: Optional[int] = None, content_type: Optional[str] = None) -> Optional[Dict]:
+        """Smoothed mean engagement as 7 rows (Monday first) of 24 hours, plus each weekday's raw mean"""
+        self.refresh()
+        with self._lock:
+            group = self._group(platform_id, content_type)
+            if group is None:
+                return None
+            key, row, posts = group
+            by_day_sums = self._sums[row].reshape(7, HOURS).sum(axis=1)
+            by_day_counts = self._counts[row].reshape(7, HOURS).sum(axis=1)
+            weekday_means = np.divide(by_day_sums, by_day_counts, out=np.full(7, np.nan), where=by_day_counts > 0)
+            return {
+                'platform_id': key[0], 'content_type': key[1], 'posts': posts,
+                'hours': np.round(self._means()[row].reshape(7, HOURS), 2).tolist(),
+                'weekdays': [None if np.isnan(mean) else round(float(mean), 2) for mean in weekday_means]
+            }
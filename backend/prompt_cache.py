@@ -0,0 +1,116 @@
+from collections import OrderedDict
+from typing import Dict, List, Optional
+import hashlib
+import json
+import threading
+import time
+
+# Anthropic prompt caching: everything up to and including a block marked
+# with cache_control is cached for five minutes and billed at a fraction of
+# the input price when a later request repeats it exactly.
+CACHE_CONTROL = {"type": "ephemeral"}
+# Shorter prefixes are never cached, breakpoint or not: 2048 tokens on Haiku
+# models, 1024 on the others
+MIN_CACHEABLE_TOKENS = 1024
+MIN_CACHEABLE_TOKENS_HAIKU = 2048
+# No tokenizer here; English prompts average about four characters per token
+CHARS_PER_TOKEN = 4
+
+
+def min_cacheable_tokens(model: str) -> int:
+    return MIN_CACHEABLE_TOKENS_HAIKU if 'haiku' in model else MIN_CACHEABLE_TOKENS
+
+
+def system_blocks(system: str, model: str, tools: Optional[List[Dict]] = None) -> List[Dict]:
+    """
+    System prompt as content blocks, with a cache breakpoint after the stable
+    prefix when it is long enough to be cached. The prefix covers the tools,
+    which the API places before the system prompt.
+    """
+    chars = len(system) + (len(json.dumps(tools)) if tools else 0)
+    block = {"type": "text", "text": system}
+    if chars >= min_cacheable_tokens(model) * CHARS_PER_TOKEN:
+        block["cache_control"] = CACHE_CONTROL
+    return [block]
+
+
+def has_breakpoint(request: Dict) -> bool:
+    """Whether a request marks a prefix for caching"""
+    return any("cache_control" in block for block in request.get("system") or [])
+
+
+def prefix_hash(request: Dict) -> str:
+    """Hash of what the API caches for a request: model, tools and system prefix"""
+    prefix = {"model": request["model"], "tools": request.get("tools"), "system": request.get("system")}
+    return hashlib.sha256(json.dumps(prefix, sort_keys=True).encode()).hexdigest()
+
+
+class PrefixRegistry:
+    """
+    Local record of cacheable prompt prefixes (requests with a breakpoint).
+
+    Counts how often each prefix is sent (a repeat within the cache TTL is
+    a potential cache hit) and sums the cache read/write tokens the API
+    reports for it, so the two can be compared. Keeps the most recently used
+    max_entries prefixes.
+    """
+
+    def __init__(self, max_entries: int = 1000, ttl: float = 300.0, clock=time.time):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.clock = clock
+        self._lock = threading.Lock()
+        self._entries: 'OrderedDict[str, Dict]' = OrderedDict()
+        self.requests = 0
+        self.repeats = 0
+
+    def record(self, task: str, request: Dict) -> Optional[str]:
+        if not has_breakpoint(request):
+            return None
+        key = prefix_hash(request)
+        now = self.clock()
+        with self._lock:
+            self.requests += 1
+            entry = self._entries.get(key)
+            if entry is None:
+                entry = self._entries[key] = {
+                    'task': task, 'sends': 0, 'repeats_within_ttl': 0, 'last_sent': None,
+                    'chars': sum(len(block["text"]) for block in request["system"]),
+                    'cache_read_tokens': 0, 'cache_write_tokens': 0
+                }
+                if len(self._entries) > self.max_entries:
+                    self._entries.popitem(last=False)
+            else:
+                self._entries.move_to_end(key)
+                if now - entry['last_sent'] <= self.ttl:
+                    entry['repeats_within_ttl'] += 1
+                    self.repeats += 1
+            entry['sends'] += 1
+            entry['last_sent'] = now
+        return key
+
+    def record_usage(self, key: Optional[str], usage) -> None:
+        """Add the cache token counts from a response's usage block"""
+        if key is None or usage is None:
+            return
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return
+            entry['cache_read_tokens'] += getattr(usage, 'cache_read_input_tokens', None) or 0
+            entry['cache_write_tokens'] += getattr(usage, 'cache_creation_input_tokens', None) or 0
+
+    def snapshot(self, top: int = 20) -> Dict:
+        with self._lock:
+            entries = sorted(self._entries.items(), key=lambda item: item[1]['sends'], reverse=True)
+            return {
+                'requests': self.requests,
+                'distinct_prefixes': len(self._entries),
+                'repeat_rate': round(self.repeats / self.requests, 3) if self.requests else 0.0,
+                'cache_read_tokens': sum(entry['cache_read_tokens'] for _, entry in entries),
+                'cache_write_tokens': sum(entry['cache_write_tokens'] for _, entry in entries),
+                'prefixes': [
+                    {'hash': key[:16], **{name: value for name, value in entry.items() if name != 'last_sent'}}
+                    for key, entry in entries[:top]
+                ]
+            }
@@ -0,0 +1,231 @@
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from typing import Any, Awaitable, Callable, Optional
+import asyncio
+import email.utils
+import logging
+import random
+import threading
+import time
+
+import anthropic
+
+logger = logging.getLogger(__name__)
+
+# Upstream trouble worth retrying: request timeouts, lock conflicts, rate
+# limits, 5xx and 529 overload. Other 4xx request errors fail immediately.
+RETRYABLE_STATUSES = frozenset({408, 409, 429})
+
+
+def is_retryable(error: Exception) -> bool:
+    if isinstance(error, anthropic.APIConnectionError):  # includes APITimeoutError
+        return True
+    if isinstance(error, anthropic.APIStatusError):
+        return error.status_code in RETRYABLE_STATUSES or error.status_code >= 500
+    return False
+
+
+class CircuitOpenError(Exception):
+    """Raised instead of calling an upstream that the breaker has marked unhealthy"""
+
+
+def retry_after_seconds(error: Exception) -> Optional[float]:
+    """Delay requested by the upstream via retry-after-ms / retry-after, if any"""
+    response = getattr(error, 'response', None)
+    if response is None:
+        return None
+    headers = response.headers
+    try:
+        return float(headers['retry-after-ms']) / 1000
+    except (KeyError, TypeError, ValueError):
+        pass
+    value = headers.get('retry-after')
+    if value is None:
+        return None
+    try:
+        return float(value)
+    except ValueError:
+        parsed = email.utils.parsedate_tz(value)
+        return max(email.utils.mktime_tz(parsed) - time.time(), 0.0) if parsed else None
+
+
+class CircuitBreaker:
+    """
+    Consecutive-failure breaker shared by all threads of a process.
+
+    After failure_threshold upstream failures in a row the circuit opens and
+    calls fail fast for reset_timeout seconds. Then a single trial call is
+    let through (half-open): success closes the circuit, failure reopens it.
+    """
+
+    CLOSED, OPEN, HALF_OPEN = 'closed', 'open', 'half_open'
+
+    def __init__(self, failure_threshold: int = 5, reset_timeout: float = 30.0, clock=time.monotonic):
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.clock = clock
+        self._lock = threading.Lock()
+        self._state = self.CLOSED
+        self._failures = 0
+        self._opened_at = 0.0
+
+    @property
+    def state(self) -> str:
+        with self._lock:
+            return self._state
+
+    def before_call(self) -> None:
+        with self._lock:
+            if self._state == self.CLOSED:
+                return
+            remaining = self._opened_at + self.reset_timeout - self.clock()
+            if self._state == self.OPEN and remaining <= 0:
+                self._state = self.HALF_OPEN
+                return
+            raise CircuitOpenError(f"Claude API unavailable, retrying in {max(remaining, 0):.0f}s")
+
+    def record_success(self) -> None:
+        with self._lock:
+            self._state = self.CLOSED
+            self._failures = 0
+
+    def record_failure(self) -> None:
+        with self._lock:
+            self._failures += 1
+            if self._state == self.HALF_OPEN or self._failures >= self.failure_threshold:
+                if self._state != self.OPEN:
+                    logger.warning("Opening Claude circuit breaker after %d failures", self._failures)
+                self._state = self.OPEN
+                self._opened_at = self.clock()
+
+
+class Resilience:
+    """
+    Retry, backoff, circuit breaking and hedging around one upstream call.
+
+    call() and acall() take a zero-argument function that performs a single
+    attempt (the client's own timeout bounds each attempt). Retryable errors
+    are retried up to max_retries times, sleeping for the upstream's
+    retry-after when it sends one and for full-jitter exponential backoff
+    otherwise. A retry-after longer than max_retry_after is not waited out.
+    With hedge=True an attempt that has not answered after hedge_after
+    seconds is raced against a duplicate request and the first answer wins.
+    """
+
+    def __init__(self, max_retries: int = 3, backoff_base: float = 0.5, backoff_max: float = 8.0,
+                 max_retry_after: float = 30.0, hedge_after: Optional[float] = None,
+                 breaker: Optional[CircuitBreaker] = None, sleep=time.sleep, async_sleep=asyncio.sleep):
+        self.max_retries = max_retries
+        self.backoff_base = backoff_base
+        self.backoff_max = backoff_max
+        self.max_retry_after = max_retry_after
+        self.hedge_after = hedge_after
+        self.breaker = breaker or CircuitBreaker()
+        self.sleep = sleep
+        self.async_sleep = async_sleep
+        self._executor = None
+        self._executor_lock = threading.Lock()
+
+    @classmethod
+    def from_config(cls, config) -> 'Resilience':
+        hedge_ms = config.get('CLAUDE_HEDGE_AFTER_MS', 0)
+        return cls(
+            max_retries=config.get('CLAUDE_MAX_RETRIES', 3),
+            backoff_base=config.get('CLAUDE_BACKOFF_BASE', 0.5),
+            backoff_max=config.get('CLAUDE_BACKOFF_MAX', 8.0),
+            max_retry_after=config.get('CLAUDE_MAX_RETRY_AFTER', 30.0),
+            hedge_after=hedge_ms / 1000 if hedge_ms else None,
+            breaker=CircuitBreaker(
+                failure_threshold=config.get('CLAUDE_BREAKER_THRESHOLD', 5),
+                reset_timeout=config.get('CLAUDE_BREAKER_RESET_SECONDS', 30.0)
+            )
+        )
+
+    def _delay(self, attempt: int, error: Exception) -> Optional[float]:
+        """Seconds to wait before the next attempt, or None to give up"""
+        if attempt >= self.max_retries:
+            return None
+        retry_after = retry_after_seconds(error)
+        if retry_after is not None:
+            return retry_after if retry_after <= self.max_retry_after else None
+        return random.uniform(0, min(self.backoff_max, self.backoff_base * 2 ** attempt))
+
+    def _attempt_failed(self, attempt: int, error: Exception) -> float:
+        """Record a failed attempt; re-raise it unless another attempt should follow"""
+        if not is_retryable(error):
+            # The upstream answered (e.g. 400), so it is healthy
+            self.breaker.record_success()
+            raise error
+        self.breaker.record_failure()
+        delay = self._delay(attempt, error)
+        if delay is None:
+            raise error
+        logger.info("Claude call failed (%s), retry %d in %.2fs", type(error).__name__, attempt + 1, delay)
+        return delay
+
+    def call(self, attempt_fn: Callable[[], Any], hedge: bool = False) -> Any:
+        attempt = 0
+        while True:
+            self.breaker.before_call()
+            try:
+                result = self._hedged(attempt_fn) if hedge and self.hedge_after else attempt_fn()
+            except Exception as e:
+                self.sleep(self._attempt_failed(attempt, e))
+                attempt += 1
+                continue
+            self.breaker.record_success()
+            return result
+
+    async def acall(self, attempt_fn: Callable[[], Awaitable[Any]], hedge: bool = False) -> Any:
+        attempt = 0
+        while True:
+            self.breaker.before_call()
+            try:
+                result = await (self._ahedged(attempt_fn) if hedge and self.hedge_after else attempt_fn())
+            except Exception as e:
+                await self.async_sleep(self._attempt_failed(attempt, e))
+                attempt += 1
+                continue
+            self.breaker.record_success()
+            return result
+
+    def _hedged(self, attempt_fn):
+        with self._executor_lock:
+            if self._executor is None:
+                self._executor = ThreadPoolExecutor(max_workers=32, thread_name_prefix='claude-hedge')
+        futures = [self._executor.submit(attempt_fn)]
+        done, _ = wait(futures, timeout=self.hedge_after)
+        if not done:
+            futures.append(self._executor.submit(attempt_fn))
+        # A blocking request cannot be cancelled; the loser finishes in the background
+        return _first_success(futures, lambda pending: wait(pending, return_when=FIRST_COMPLETED)[0])
+
+    async def _ahedged(self, attempt_fn):
+        tasks = [asyncio.ensure_future(attempt_fn())]
+        done, _ = await asyncio.wait(tasks, timeout=self.hedge_after)
+        if not done:
+            tasks.append(asyncio.ensure_future(attempt_fn()))
+        try:
+            pending = set(tasks)
+            while True:
+                done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+                finished = [task for task in done if task.exception() is None]
+                if finished:
+                    return finished[0].result()
+                if not pending:
+                    raise next(iter(done)).exception()
+        finally:
+            for task in tasks:
+                task.cancel()
+
+
+def _first_success(futures, wait_any):
+    """Result of the first future to succeed, or the last error if all fail"""
+    pending = set(futures)
+    while True:
+        done = wait_any(pending)
+        pending -= done
+        for future in done:
+            if future.exception() is None:
+                return future.result()
+        if not pending:
+            raise next(iter(done)).exception()
@@ -0,0 +1,373 @@
+from datetime import date, timedelta
+from typing import Dict, Iterable, List, Optional, Tuple
+import logging
+
+import click
+from flask import current_app
+from flask.cli import AppGroup
+from sqlalchemy import Date, and_, cast, delete, event, func, insert, inspect, literal_column, select, update
+from sqlalchemy.dialects import postgresql, sqlite
+
+from anomalies import observe
+from content_totals import apply_totals
+from models import db, Analytics, AnalyticsWeekly, ContentManager, PillarAnalyticsWeekly
+from partitions import (add_months, drop_partitions, ensure_ahead, is_partitioned, month_start, partition_months,
+                        raw_horizon)
+from versioning import bump_versions, mark_written
+
+logger = logging.getLogger(__name__)
+
+METRICS = ('views', 'likes', 'shares', 'comments', 'saves')
+RATES = ('retention_rate', 'engagement_rate')
+# Rollup columns that are sums of Analytics rows
+COLUMNS = METRICS + tuple(f'{rate}_sum' for rate in RATES) + ('days',)
+# Analytics columns a rollup row is derived from
+FIELDS = ('content_id', 'platform_id', 'date_recorded') + METRICS + RATES
+ROLLUP_TABLES = (AnalyticsWeekly.__tablename__, PillarAnalyticsWeekly.__tablename__)
+# Tables written when Analytics changes: the rollups and the content totals
+DERIVED_TABLES = ROLLUP_TABLES + (ContentManager.__tablename__,)
+
+# flush_context.attributes key for changes seen in before_flush
+PENDING_KEY = 'rollups_pending'
+
+Delta = Dict[str, float]
+
+
+def week_start(day: date) -> date:
+    """The Monday of day's week"""
+    return day - timedelta(days=day.weekday())
+
+
+def first_monday(day: date) -> date:
+    """day if it is a Monday, else the next Monday"""
+    return day if day.weekday() == 0 else week_start(day) + timedelta(weeks=1)
+
+
+def week_start_sql(column, dialect: str):
+    """week_start() in SQL, for grouping Analytics rows by week"""
+    if dialect == 'sqlite':
+        # Back six days, then forward to the next Monday (the same day if it is one)
+        return func.date(column, literal_column("'-6 days'"), literal_column("'weekday 1'"))
+    # A literal, not a bound parameter, so GROUP BY matches the selected expression
+    return cast(func.date_trunc(literal_column("'week'"), column), Date)
+
+
+def _delta(values: Dict, sign: int) -> Delta:
+    delta = {metric: sign * (values.get(metric) or 0) for metric in METRICS}
+    delta.update({f'{rate}_sum': sign * (values.get(rate) or 0.0) for rate in RATES})
+    delta['days'] = sign
+    return delta
+
+
+def _current(obj: Analytics) -> Dict:
+    return {name: getattr(obj, name) for name in FIELDS}
+
+
+def _committed(obj, names: Iterable[str] = FIELDS) -> Dict:
+    """Column values as last loaded from the database, before this flush's changes"""
+    committed = inspect(obj).committed_state
+    return {name: committed[name] if name in committed else getattr(obj, name) for name in names}
+
+
+def _add(deltas: Dict[Tuple, Delta], key: Tuple, delta: Delta) -> None:
+    total = deltas.setdefault(key, dict.fromkeys(COLUMNS, 0))
+    for column, value in delta.items():
+        total[column] += value
+
+
+def _upsert(connection, table, keys: Tuple[str, ...], deltas: Dict[Tuple, Delta]) -> None:
+    """Add each delta to its rollup row, creating missing rows and dropping emptied ones"""
+    deltas = {key: delta for key, delta in deltas.items() if any(delta.values())}
+    if not deltas:
+        return
+    rows = [{**dict(zip(keys, key)), **delta} for key, delta in deltas.items()]
+
+    dialect = connection.dialect.name
+    if dialect in ('postgresql', 'sqlite'):
+        dialect_insert = postgresql.insert if dialect == 'postgresql' else sqlite.insert
+        stmt = dialect_insert(table).values(rows)
+        stmt = stmt.on_conflict_do_update(
+            index_elements=list(keys),
+            set_={column: table.c[column] + stmt.excluded[column] for column in COLUMNS}
+        )
+        connection.execute(stmt)
+    else:
+        for row in rows:
+            match = and_(*(table.c[name] == row[name] for name in keys))
+            result = connection.execute(
+                update(table).where(match).values({column: table.c[column] + row[column] for column in COLUMNS})
+            )
+            if result.rowcount == 0:
+                connection.execute(table.insert().values(row))
+
+    for key, delta in deltas.items():
+        if delta['days'] < 0:
+            connection.execute(delete(table).where(
+                and_(*(table.c[name] == value for name, value in zip(keys, key))), table.c.days <= 0
+            ))
+
+
+def apply_changes(connection, changes: Iterable[Tuple[Dict, int]], moves: Iterable[Tuple[int, int, int]] = (),
+                  deleted_pillars: Optional[Dict[int, Optional[int]]] = None) -> None:
+    """
+    Update both rollups, and the content totals, on the given connection.
+
+    changes are (Analytics column values, +1 or -1) for added and removed
+    rows; an edited row is both. moves are (content_id, old_pillar_id,
+    new_pillar_id) for content that changed pillar: its weekly totals move
+    with it. deleted_pillars gives the pillar of content deleted in the same
+    transaction, which can no longer be looked up.
+    """
+    pillar_deltas: Dict[Tuple, Delta] = {}
+
+    # Moves first: they carry the content's totals from before this flush's Analytics changes
+    for content_id, old_pillar, new_pillar in moves:
+        weeks = connection.execute(
+            select(AnalyticsWeekly.__table__).where(AnalyticsWeekly.content_id == content_id)
+        ).mappings().all()
+        for week in weeks:
+            totals = {column: week[column] for column in COLUMNS}
+            if old_pillar is not None:
+                _add(pillar_deltas, (old_pillar, week['platform_id'], week['week_start']),
+                     {column: -value for column, value in totals.items()})
+            if new_pillar is not None:
+                _add(pillar_deltas, (new_pillar, week['platform_id'], week['week_start']), totals)
+
+    content_deltas: Dict[Tuple, Delta] = {}
+    for values, sign in changes:
+        _add(content_deltas, (values['content_id'], values['platform_id'], week_start(values['date_recorded'])),
+             _delta(values, sign))
+
+    content_ids = {content_id for content_id, _, _ in content_deltas}
+    pillars = dict(deleted_pillars or {})
+    if content_ids:
+        pillars.update(connection.execute(
+            select(ContentManager.id, ContentManager.content_pillar_id).where(ContentManager.id.in_(content_ids))
+        ).all())
+    for (content_id, platform_id, week), delta in content_deltas.items():
+        if pillars.get(content_id) is not None:
+            _add(pillar_deltas, (pillars[content_id], platform_id, week), delta)
+
+    _upsert(connection, AnalyticsWeekly.__table__, ('content_id', 'platform_id', 'week_start'), content_deltas)
+    _upsert(connection, PillarAnalyticsWeekly.__table__, ('pillar_id', 'platform_id', 'week_start'), pillar_deltas)
+
+    totals: Dict[int, Delta] = {}
+    for (content_id, _, _), delta in content_deltas.items():
+        _add(totals, content_id, delta)
+    apply_totals(connection, totals)
+
+
+def _before_flush(session, flush_context, instances):
+    # Old values must be read before the flush overwrites or deletes the rows
+    pending = flush_context.attributes[PENDING_KEY] = {
+        'removed': [], 'edited': [], 'moves': [], 'deleted_pillars': {}
+    }
+    for obj in session.deleted:
+        if isinstance(obj, Analytics):
+            pending['removed'].append(_committed(obj))
+        elif isinstance(obj, ContentManager):
+            pending['deleted_pillars'][obj.id] = _committed(obj, ['content_pillar_id'])['content_pillar_id']
+    for obj in session.dirty:
+        if not session.is_modified(obj):
+            continue
+        if isinstance(obj, Analytics):
+            pending['removed'].append(_committed(obj))
+            pending['edited'].append(obj)
+        elif isinstance(obj, ContentManager):
+            old_pillar = _committed(obj, ['content_pillar_id'])['content_pillar_id']
+            if old_pillar != obj.content_pillar_id:
+                pending['moves'].append((obj.id, old_pillar, obj.content_pillar_id))
+
+
+def _after_flush(session, flush_context):
+    pending = flush_context.attributes.pop(PENDING_KEY, None)
+    if pending is None:
+        return
+    # New rows are read now, once they have ids (content set through a relationship included)
+    inserted = [_current(obj) for obj in session.new if isinstance(obj, Analytics)]
+    added = inserted + [_current(obj) for obj in pending['edited']]
+    if not (added or pending['removed'] or pending['moves']):
+        return
+    apply_changes(
+        session.connection(),
+        [(values, 1) for values in added] + [(values, -1) for values in pending['removed']],
+        pending['moves'], pending['deleted_pillars']
+    )
+    mark_written(session, DERIVED_TABLES)
+    # Only new rows feed the spike detector; edits and deletes are left to its rebuild
+    mark_written(session, observe(session.connection(), inserted))
+
+
+def _on_execute(orm_execute_state):
+    # ORM bulk INSERT (session.execute(insert(Analytics), rows)) bypasses flush
+    if not (orm_execute_state.is_insert and orm_execute_state.statement.table.name == Analytics.__tablename__):
+        return None
+    rows = orm_execute_state.parameters
+    if not isinstance(rows, list):
+        return None
+    result = orm_execute_state.invoke_statement()
+    connection = orm_execute_state.session.connection()
+    apply_changes(connection, [(row, 1) for row in rows])
+    mark_written(orm_execute_state.session, DERIVED_TABLES)
+    mark_written(orm_execute_state.session, observe(connection, rows))
+    return result
+
+
+def rebuild(connection, start: date, stop: date) -> None:
+    """Recompute both rollups for the weeks starting in [start, stop) from raw Analytics"""
+    week = week_start_sql(Analytics.date_recorded, connection.dialect.name)
+    sums = [func.sum(func.coalesce(getattr(Analytics, metric), 0)) for metric in METRICS]
+    sums += [func.sum(func.coalesce(getattr(Analytics, rate), 0.0)) for rate in RATES]
+    sums.append(func.count())
+    # Weeks start on Mondays, so this date range holds exactly those weeks' rows
+    in_range = and_(Analytics.date_recorded >= start, Analytics.date_recorded < stop)
+
+    for model in (AnalyticsWeekly, PillarAnalyticsWeekly):
+        connection.execute(delete(model).where(model.week_start >= start, model.week_start < stop))
+
+    connection.execute(insert(AnalyticsWeekly).from_select(
+        ['content_id', 'platform_id', 'week_start', *COLUMNS],
+        select(Analytics.content_id, Analytics.platform_id, week, *sums)
+        .where(in_range)
+        .group_by(Analytics.content_id, Analytics.platform_id, week)
+    ))
+    connection.execute(insert(PillarAnalyticsWeekly).from_select(
+        ['pillar_id', 'platform_id', 'week_start', *COLUMNS],
+        select(ContentManager.content_pillar_id, Analytics.platform_id, week, *sums)
+        .join(ContentManager, ContentManager.id == Analytics.content_id)
+        .where(in_range, ContentManager.content_pillar_id.isnot(None))
+        .group_by(ContentManager.content_pillar_id, Analytics.platform_id, week)
+    ))
+
+
+def backfill(since: Optional[date] = None, chunk_weeks: int = 4, progress=None) -> int:
+    """
+    Rebuild the rollups from raw Analytics, oldest week first.
+
+    Each chunk of chunk_weeks weeks is replaced in its own transaction, so
+    the backfill can be stopped and rerun (with since) at any point and
+    never holds long locks. Weeks compacted away are left as they are.
+    Returns the number of weeks rebuilt.
+    """
+    first, last = db.session.execute(select(func.min(Analytics.date_recorded), func.max(Analytics.date_recorded))).one()
+    horizon = raw_horizon(db.session.connection())
+    db.session.commit()
+    if first is None:
+        return 0
+    start = week_start(max(first, since) if since else first)
+    if horizon is not None:
+        # Compaction may have dropped the start of the week straddling the oldest partition
+        start = max(start, first_monday(horizon))
+    end = week_start(last)
+
+    weeks = 0
+    while start <= end:
+        stop = min(start + timedelta(weeks=chunk_weeks), end + timedelta(weeks=1))
+        with db.engine.begin() as connection:
+            rebuild(connection, start, stop)
+            bump_versions(connection, ROLLUP_TABLES)
+        weeks += (stop - start).days // 7
+        if progress:
+            progress(start, stop)
+        start = stop
+    return weeks
+
+
+def compact(older_than_days: int, today: Optional[date] = None) -> Tuple[date, int]:
+    """
+    Keep raw Analytics for the last older_than_days days only; older data
+    lives on in the weekly rollups.
+
+    The weeks about to go are rebuilt from their raw rows first, which also
+    folds in writes the incremental path missed. On partitioned Postgres
+    whole monthly partitions are dropped once their last day is past the
+    cutoff; elsewhere rows before the cutoff's week are deleted. Both run in
+    one transaction. Returns the cutoff and the number of partitions
+    dropped or rows deleted.
+    """
+    day = (today or date.today()) - timedelta(days=older_than_days)
+    with db.engine.begin() as connection:
+        if is_partitioned(connection):
+            cutoff = month_start(day)
+            months = [month for month in partition_months(connection) if add_months(month, 1) <= cutoff]
+            if not months:
+                return cutoff, 0
+            # The week straddling the oldest partition may already have lost its first days
+            start, stop = first_monday(months[0]), week_start(cutoff)
+            if start < stop:
+                rebuild(connection, start, stop)
+            removed = len(drop_partitions(connection, cutoff))
+        else:
+            cutoff = week_start(day)
+            first = connection.execute(
+                select(func.min(Analytics.date_recorded)).where(Analytics.date_recorded < cutoff)
+            ).scalar()
+            if first is None:
+                return cutoff, 0
+            rebuild(connection, week_start(first), cutoff)
+            removed = connection.execute(delete(Analytics).where(Analytics.date_recorded < cutoff)).rowcount
+        bump_versions(connection, (Analytics.__tablename__,) + ROLLUP_TABLES)
+    logger.info('Compacted analytics before %s (%d removed)', cutoff, removed)
+    return cutoff, removed
+
+
+def content_weeks(since: date, platform_id: Optional[int] = None) -> List[Dict]:
+    """Weekly content x platform totals for the weeks overlapping [since, today]"""
+    query = AnalyticsWeekly.query.filter(AnalyticsWeekly.week_start >= week_start(since))
+    if platform_id is not None:
+        query = query.filter(AnalyticsWeekly.platform_id == platform_id)
+    return [row.to_dict() for row in query.order_by(AnalyticsWeekly.week_start, AnalyticsWeekly.content_id)]
+
+
+def pillar_weeks(since: date, pillar_id: Optional[int] = None) -> List[Dict]:
+    """Weekly pillar x platform totals for the weeks overlapping [since, today]"""
+    query = PillarAnalyticsWeekly.query.filter(PillarAnalyticsWeekly.week_start >= week_start(since))
+    if pillar_id is not None:
+        query = query.filter(PillarAnalyticsWeekly.pillar_id == pillar_id)
+    return [row.to_dict() for row in query.order_by(PillarAnalyticsWeekly.week_start, PillarAnalyticsWeekly.pillar_id)]
+
+
+rollups_cli = AppGroup('rollups', help='Maintain the weekly analytics rollups.')
+
+
+@rollups_cli.command('backfill')
+@click.option('--since', type=click.DateTime(formats=['%Y-%m-%d']), help='Rebuild from the week of this date.')
+@click.option('--chunk-weeks', default=4, show_default=True, help='Weeks rebuilt per transaction.')
+def backfill_command(since, chunk_weeks):
+    """Rebuild the weekly rollups from raw analytics."""
+    weeks = backfill(since.date() if since else None, chunk_weeks,
+                     progress=lambda start, stop: click.echo(f'Rebuilt weeks {start} to {stop - timedelta(days=1)}'))
+    click.echo(f'Rebuilt {weeks} weeks')
+
+
+@rollups_cli.command('compact')
+@click.option('--older-than-days', type=int, help='Raw rows to keep, in days (default ANALYTICS_RAW_RETENTION_DAYS).')
+def compact_command(older_than_days):
+    """Fold old raw analytics into the weekly rollups and drop them."""
+    config = current_app.config
+    cutoff, removed = compact(config['ANALYTICS_RAW_RETENTION_DAYS'] if older_than_days is None else older_than_days)
+    with db.engine.begin() as connection:
+        partitioned = is_partitioned(connection)
+        if partitioned:
+            # The same daily job keeps partitions ready for the coming months
+            ensure_ahead(connection, config['ANALYTICS_PARTITIONS_AHEAD'])
+    click.echo(f"Compacted analytics before {cutoff}: {removed} {'partitions' if partitioned else 'rows'} removed")
+
+
+def init_rollups(app) -> None:
+    """
+    Keep the weekly rollups in step with Analytics writes, and add the
+    `flask rollups backfill` command.
+
+    Flushed inserts, edits and deletes of Analytics rows, and ORM bulk
+    inserts, add their difference to the rollup rows in the same
+    transaction, so readers never see one without the other. A content item
+    that changes pillar moves its totals to the new pillar. Writes that
+    bypass the ORM (raw SQL, query.update()) are not seen; run the backfill
+    for the weeks they touched.
+    """
+    app.cli.add_command(rollups_cli)
+    if not event.contains(db.session, 'before_flush', _before_flush):
+        event.listen(db.session, 'before_flush', _before_flush)
+        event.listen(db.session, 'after_flush', _after_flush)
+        event.listen(db.session, 'do_orm_execute', _on_execute)
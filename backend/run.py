@@ -1,7 +1,10 @@
 #!/usr/bin/env python3
 """
 AI Content Strategist Backend
-Run script for the Flask application
+Run script for the Flask development server.
+
+For production use the WSGI entry point instead:
+    gunicorn wsgi:app -c gunicorn.conf.py
 """
 
 import os
@@ -21,5 +24,6 @@ if __name__ == '__main__':
     app.run(
         host='0.0.0.0',
         port=int(os.environ.get('PORT', 5000)),
-        debug=True
+        debug=app.debug,
+        threaded=True
     ) 
\ No newline at end of file
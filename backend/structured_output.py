@@ -0,0 +1,174 @@
+from typing import Any, Dict, List, Optional, Tuple
+import json
+import logging
+import re
+
+logger = logging.getLogger(__name__)
+
+FENCE = re.compile(r"```(?:json|JSON)?\s*\n?(.*?)(?:```|$)", re.S)
+# Where to look for the start of a JSON value in prose; bounds work on long replies
+MAX_START_CANDIDATES = 20
+# Tool inputs must be objects, so array results travel under this key
+TOOL_RESULT_KEY = 'result'
+
+_decoder = json.JSONDecoder()
+
+
+class SchemaError(ValueError):
+    """A reply that parsed as JSON but does not have the shape the caller needs"""
+
+
+def close_truncated(fragment: str) -> Optional[str]:
+    """
+    Turn JSON cut off mid-value (max_tokens) into valid JSON.
+
+    Keeps everything up to the last complete element and closes the open
+    arrays and objects, so '[{"title": "a"}, {"title": "b", "descr' becomes
+    '[{"title": "a"}, {"title": "b"}]'. Returns None if the fragment is not
+    the start of an array or object.
+    """
+    stack: List[str] = []
+    in_string = escaped = False
+    cut, cut_stack = None, None
+    for index, char in enumerate(fragment):
+        if in_string:
+            if escaped:
+                escaped = False
+            elif char == '\\':
+                escaped = True
+            elif char == '"':
+                in_string = False
+        elif char == '"':
+            in_string = True
+        elif char in '[{':
+            stack.append('}' if char == '{' else ']')
+            cut, cut_stack = index + 1, list(stack)
+        elif char in ']}':
+            if not stack or stack[-1] != char:
+                return None
+            stack.pop()
+            if not stack:
+                return fragment[:index + 1]
+            cut, cut_stack = index + 1, list(stack)
+        elif char == ',':
+            cut, cut_stack = index, list(stack)
+
+    # The last value may itself be complete ('{"a": 1'), which loses nothing
+    tail = fragment.rstrip()
+    if not in_string and stack and tail[-1] not in ',:[{':
+        candidate = tail + ''.join(reversed(stack))
+        try:
+            json.loads(candidate)
+            return candidate
+        except json.JSONDecodeError:
+            pass
+    if cut is None:
+        return None
+    return fragment[:cut] + ''.join(reversed(cut_stack))
+
+
+def _candidates(text: str) -> List[str]:
+    fenced = [match.group(1) for match in FENCE.finditer(text) if match.group(1).strip()]
+    return fenced + [text]
+
+
+def extract_json(text: str) -> Tuple[Any, bool]:
+    """
+    The first JSON array or object in a reply, and whether it was repaired.
+
+    Handles bare JSON, JSON inside ``` fences, JSON after or before prose
+    ("Here is your plan: {...}") and JSON truncated by max_tokens. Raises
+    ValueError when there is none.
+    """
+    for candidate in _candidates(text):
+        starts = [index for index, char in enumerate(candidate) if char in '[{'][:MAX_START_CANDIDATES]
+        for start in starts:
+            try:
+                return _decoder.raw_decode(candidate, start)[0], False
+            except json.JSONDecodeError:
+                pass
+            repaired = close_truncated(candidate[start:])
+            if repaired is not None:
+                try:
+                    return json.loads(repaired), True
+                except json.JSONDecodeError:
+                    pass
+    raise ValueError('No JSON value in reply')
+
+
+_TYPES = {
+    'object': dict,
+    'array': list,
+    'string': str,
+    'boolean': bool,
+    'integer': int,
+    'number': (int, float)
+}
+
+
+def conform(value: Any, schema: Dict, path: str = '$') -> Any:
+    """
+    Check value against a JSON Schema subset (type, required, properties, items).
+
+    Array items that do not conform are dropped rather than failing the
+    whole reply; an array that loses every item does fail. Returns the
+    (possibly filtered) value or raises SchemaError.
+    """
+    expected = schema.get('type')
+    if expected and (not isinstance(value, _TYPES[expected])
+                     or (expected in ('integer', 'number') and isinstance(value, bool))):
+        raise SchemaError(f'{path}: expected {expected}, got {type(value).__name__}')
+
+    if expected == 'object':
+        missing = [key for key in schema.get('required', ()) if key not in value]
+        if missing:
+            raise SchemaError(f'{path}: missing {", ".join(missing)}')
+        for key, subschema in schema.get('properties', {}).items():
+            if key in value:
+                value[key] = conform(value[key], subschema, f'{path}.{key}')
+    elif expected == 'array' and schema.get('items'):
+        kept = []
+        for index, item in enumerate(value):
+            try:
+                kept.append(conform(item, schema['items'], f'{path}[{index}]'))
+            except SchemaError as e:
+                logger.debug("Dropping non-conforming item: %s", e)
+        if value and not kept:
+            raise SchemaError(f'{path}: no item matches the schema')
+        value = kept
+    return value
+
+
+def parse_structured(text: str, schema: Optional[Dict] = None) -> Any:
+    """Extract, repair and validate a JSON reply; raises ValueError if it cannot be salvaged"""
+    value, repaired = extract_json(text)
+    if repaired:
+        logger.info("Salvaged truncated JSON reply (%d chars)", len(text))
+    return conform(value, schema) if schema else value
+
+
+def tool_definition(name: str, schema: Dict) -> Dict:
+    """A tool whose input is the result, for forcing structured output with tool_choice"""
+    if schema.get('type') != 'object':
+        schema = {'type': 'object', 'properties': {TOOL_RESULT_KEY: schema}, 'required': [TOOL_RESULT_KEY]}
+    return {
+        'name': f"record_{name.replace('.', '_')}",
+        'description': f'Record the {name} result. Always call this tool with the complete result.',
+        'input_schema': schema
+    }
+
+
+def message_text(message, schema: Optional[Dict] = None) -> str:
+    """
+    A reply's content as text: the text blocks, or a forced tool call's input as JSON.
+
+    Tool input is re-serialized so every reply goes through the same
+    parse path (and single-flight shares plain text).
+    """
+    for block in message.content:
+        if getattr(block, 'type', None) == 'tool_use':
+            value = block.input
+            if schema and schema.get('type') != 'object' and isinstance(value, dict) and TOOL_RESULT_KEY in value:
+                value = value[TOOL_RESULT_KEY]
+            return json.dumps(value)
+    return ''.join(block.text for block in message.content if getattr(block, 'type', None) == 'text')
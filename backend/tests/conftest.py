@@ -0,0 +1,69 @@
+import os
+import sys
+
+import pytest
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+from app import create_app
+from models import db, Analytics, ContentManager, Platform
+
+
+@pytest.fixture
+def app():
+    app = create_app('testing')
+    with app.app_context():
+        db.create_all()
+        yield app
+        db.session.remove()
+        db.drop_all()
+
+
+@pytest.fixture
+def client(app):
+    return app.test_client()
+
+
+@pytest.fixture
+def platforms(app):
+    """instagram (id 1) and tiktok (id 2)"""
+    db.session.add_all([Platform(platform_name='instagram'), Platform(platform_name='tiktok')])
+    db.session.commit()
+
+
+@pytest.fixture
+def make_content(app):
+    """Factory committing one ContentManager item with the given columns"""
+    def make(title=None, **columns):
+        item = ContentManager(content_title=title or f'Post {ContentManager.query.count() + 1}', **columns)
+        db.session.add(item)
+        db.session.commit()
+        return item
+
+    return make
+
+
+@pytest.fixture
+def record_analytics(app):
+    """Factory committing one Analytics row through the ORM, so rollups, totals and spike checks see it"""
+    def record(content_id, day, views, platform_id=1, **metrics):
+        row = Analytics(content_id=content_id, platform_id=platform_id, date_recorded=day, views=views, **metrics)
+        db.session.add(row)
+        db.session.commit()
+        return row
+
+    return record
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+
+@pytest.fixture
+def clock():
+    """A monotonic clock the test moves by setting .now"""
+    return FakeClock()
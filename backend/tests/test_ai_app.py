@@ -0,0 +1,133 @@
+import asyncio
+import json
+import time
+
+import httpx
+import pytest
+from anthropic import Anthropic, AsyncAnthropic
+
+from ai_app import create_ai_app, mount_ai_app
+from claude_service import AsyncClaudeService, ClaudeService
+from resilience import Resilience
+from models import db, Profile
+
+REPLY = {'strategy_recommendations': ['post more reels']}
+
+
+def message(text):
+    return {
+        'id': 'msg_test', 'type': 'message', 'role': 'assistant', 'model': 'claude-3-haiku-20240307',
+        'content': [{'type': 'text', 'text': text}], 'stop_reason': 'end_turn', 'stop_sequence': None,
+        'usage': {'input_tokens': 10, 'output_tokens': 5}
+    }
+
+
+def async_service(delay=0.0, text=json.dumps(REPLY), status=200):
+    requests = []
+
+    async def handler(request):
+        requests.append(json.loads(request.content))
+        await asyncio.sleep(delay)
+        return httpx.Response(status, json=message(text) if status == 200 else {'type': 'error'})
+
+    client = AsyncAnthropic(api_key='test', max_retries=0,
+                            http_client=httpx.AsyncClient(transport=httpx.MockTransport(handler)))
+    return AsyncClaudeService('test', client=client, resilience=Resilience(max_retries=0)), requests
+
+
+@pytest.fixture
+def profile(app):
+    db.session.add(Profile(mission='teach', target_audience='developers'))
+    db.session.commit()
+
+
+def post(ai_app, path, body=None):
+    async def run():
+        response = await ai_app.test_client().post(path, json=body or {})
+        return response.status_code, await response.get_json()
+    return asyncio.run(run())
+
+
+def test_sync_and_async_services_send_the_same_request():
+    sent = []
+
+    def handler(request):
+        sent.append(json.loads(request.content))
+        return httpx.Response(200, json=message('{"analysis": "ok"}'))
+
+    sync = ClaudeService('test', client=Anthropic(api_key='test', http_client=httpx.Client(
+        transport=httpx.MockTransport(handler))))
+    service, async_sent = async_service(text='{"analysis": "ok"}')
+
+    assert sync.analyze_performance([{'views': 10}], ['instagram']) == {'analysis': 'ok'}
+    assert asyncio.run(service.analyze_performance([{'views': 10}], ['instagram'])) == {'analysis': 'ok'}
+    assert sent == async_sent
+
+
+def test_async_service_keeps_error_and_fallback_shapes():
+    failing, _ = async_service(status=500)
+    assert asyncio.run(failing.generate_content_field('hook', {}, {}))['success'] is False
+    plain, _ = async_service(text='not json')
+    assert asyncio.run(plain.optimize_content({}, 'instagram', [])) == {'optimized_content': 'not json'}
+
+
+def test_generate_strategy_reads_context_and_returns_model_json(app, profile):
+    service, requests = async_service()
+    status, body = post(create_ai_app(app, service), '/api/ai/generate-strategy')
+    assert status == 200
+    assert body == REPLY
+    assert 'Mission: teach' in requests[0]['system'][0]['text']
+
+
+def test_context_errors_match_the_flask_routes(app, client):
+    ai_app = create_ai_app(app, async_service()[0])
+    assert post(ai_app, '/api/ai/generate-strategy') == (404, {'error': 'Profile not found'})
+    assert client.post('/api/ai/generate-strategy').status_code == 500  # no API key in testing
+    status, body = post(ai_app, '/api/ai/generate-content-field', {'field_type': 'bogus'})
+    assert status == 400
+    assert body['error'].startswith('Invalid field_type')
+
+
+def test_requests_wait_on_the_model_concurrently(app, profile):
+    service, requests = async_service(delay=0.5)
+    ai_app = create_ai_app(app, service)
+
+    async def run():
+        client = ai_app.test_client()
+        # Distinct prompts, so single-flight does not merge them
+        return await asyncio.gather(*[
+            client.post('/api/ai/generate-content-field',
+                        json={'field_type': 'hook', 'content_data': {'content_title': f'Post {i}'}})
+            for i in range(50)
+        ])
+
+    started = time.perf_counter()
+    responses = asyncio.run(run())
+    assert [response.status_code for response in responses] == [200] * 50
+    assert len(requests) == 50
+    # 50 sequential calls would take 25s
+    assert time.perf_counter() - started < 5
+
+
+def test_mount_sends_other_paths_to_flask(app):
+    asgi_app = mount_ai_app(create_ai_app(app, async_service()[0]), app)
+
+    async def get(path):
+        sent = []
+
+        async def receive():
+            return {'type': 'http.request', 'body': b'', 'more_body': False}
+
+        async def send(event):
+            sent.append(event)
+
+        await asgi_app({
+            'type': 'http', 'asgi': {'version': '3.0'}, 'http_version': '1.1', 'method': 'GET',
+            'scheme': 'http', 'path': path, 'raw_path': path.encode(), 'query_string': b'', 'root_path': '',
+            'headers': [(b'host', b'localhost')], 'client': ('127.0.0.1', 1234), 'server': ('localhost', 80)
+        }, receive, send)
+        return sent[0]['status'], b''.join(event.get('body', b'') for event in sent[1:])
+
+    status, body = asyncio.run(get('/api/tasks'))
+    assert status == 200
+    assert json.loads(body) == []
@@ -0,0 +1,148 @@
+import asyncio
+import json
+from types import SimpleNamespace
+
+import httpx
+import pytest
+from anthropic import Anthropic, AsyncAnthropic
+
+from ai_telemetry import AITelemetry
+from claude_service import AsyncClaudeService, ClaudeService
+from resilience import Resilience
+
+MODEL = 'claude-3-haiku-20240307'
+PRICES = {MODEL: {'input': 1.0, 'output': 10.0, 'cache_write': 2.0, 'cache_read': 0.1}}
+PROFILE = {'mission': 'teach', 'target_audience': 'developers'}
+# Long enough for a cacheable prefix on Haiku (2048 tokens)
+LONG_PROFILE = {**PROFILE, 'vision': 'Every developer ships with confidence. ' * 250}
+
+
+def message(text='{"analysis": "ok"}', usage=None):
+    return {
+        'id': 'msg_test', 'type': 'message', 'role': 'assistant', 'model': MODEL,
+        'content': [{'type': 'text', 'text': text}], 'stop_reason': 'end_turn', 'stop_sequence': None,
+        'usage': usage or {'input_tokens': 1000, 'output_tokens': 100}
+    }
+
+
+def sse(*events):
+    return ''.join(f'event: {event["type"]}\ndata: {json.dumps(event)}\n\n' for event in events).encode()
+
+
+def streamed(text):
+    start = {**message(), 'content': [], 'stop_reason': None}
+    return sse(
+        {'type': 'message_start', 'message': start},
+        {'type': 'content_block_start', 'index': 0, 'content_block': {'type': 'text', 'text': ''}},
+        {'type': 'content_block_delta', 'index': 0, 'delta': {'type': 'text_delta', 'text': text}},
+        {'type': 'content_block_stop', 'index': 0},
+        {'type': 'message_delta', 'delta': {'stop_reason': 'end_turn', 'stop_sequence': None},
+         'usage': {'output_tokens': 100}},
+        {'type': 'message_stop'}
+    )
+
+
+class Upstream:
+    """Messages API stand-in: scripted statuses first, then replies with the given usage"""
+
+    def __init__(self, *statuses, usage=None):
+        self.statuses = list(statuses)
+        self.usage = usage
+
+    def handler(self, request):
+        if self.statuses:
+            return httpx.Response(self.statuses.pop(0), json={'type': 'error', 'error': {'type': 'overloaded_error'}})
+        if json.loads(request.content).get('stream'):
+            return httpx.Response(200, headers={'content-type': 'text/event-stream'},
+                                  content=streamed('{"analysis": "ok"}'))
+        return httpx.Response(200, json=message(usage=self.usage))
+
+    async def async_handler(self, request):
+        return self.handler(request)
+
+    def service(self, telemetry, **kwargs):
+        client = Anthropic(api_key='test', max_retries=0, http_client=httpx.Client(transport=httpx.MockTransport(self.handler)))
+        return ClaudeService('test', client=client, telemetry=telemetry,
+                             resilience=Resilience(max_retries=2, backoff_base=0), **kwargs)
+
+
+def test_records_latency_tokens_retries_and_cost():
+    telemetry = AITelemetry(prices=PRICES)
+    Upstream(529).service(telemetry).analyze_performance([], ['instagram'])
+    stats = telemetry.summary()['analysis']
+    assert (stats['calls'], stats['errors'], stats['retries']) == (1, 0, 1)
+    assert stats['tokens'] == {'input': 1000, 'output': 100, 'cache_read': 0, 'cache_write': 0}
+    assert stats['cost_usd'] == pytest.approx((1000 * 1.0 + 100 * 10.0) / 1e6)
+    assert stats['latency_ms']['p50'] is not None
+    assert stats['ttft_ms'] == {'p50': None, 'p95': None, 'p99': None}
+    assert stats['models'] == [MODEL]
+
+
+def test_failed_calls_count_as_errors():
+    telemetry = AITelemetry(prices=PRICES)
+    Upstream(400).service(telemetry).analyze_performance([], ['instagram'])
+    stats = telemetry.summary()['analysis']
+    assert (stats['calls'], stats['errors'], stats['cost_usd'], stats['cost_per_call_usd']) == (1, 1, 0, None)
+
+
+def test_prompt_cache_hits_and_misses_for_cacheable_calls():
+    telemetry = AITelemetry(prices=PRICES)
+    Upstream(usage={'input_tokens': 50, 'output_tokens': 10, 'cache_creation_input_tokens': 2000}).service(
+        telemetry).generate_content_strategy(LONG_PROFILE, [], [])
+    Upstream(usage={'input_tokens': 50, 'output_tokens': 10, 'cache_read_input_tokens': 2000}).service(
+        telemetry).generate_content_strategy(LONG_PROFILE, [], [{'platform_name': 'tiktok'}])
+    Upstream().service(telemetry).optimize_content({}, 'instagram', [])
+
+    summary = telemetry.summary()
+    assert summary['strategy']['prompt_cache'] == {'hits': 1, 'misses': 1}
+    assert summary['strategy']['tokens']['cache_read'] == 2000
+    assert summary['strategy']['cost_usd'] == pytest.approx((100 * 1.0 + 20 * 10.0 + 2000 * 2.0 + 2000 * 0.1) / 1e6)
+    # Calls without a cacheable prefix are neither, including ones whose prefix is too short
+    assert summary['optimize']['prompt_cache'] == {'hits': 0, 'misses': 0}
+    short = AITelemetry(prices=PRICES)
+    Upstream().service(short).generate_content_strategy(PROFILE, [], [])
+    assert short.summary()['strategy']['prompt_cache'] == {'hits': 0, 'misses': 0}
+
+
+def test_streaming_measures_time_to_first_token():
+    telemetry = AITelemetry()
+    result = Upstream().service(telemetry, stream=True).analyze_performance([], ['instagram'])
+    assert result == {'analysis': 'ok'}
+    stats = telemetry.summary()['analysis']
+    assert stats['ttft_ms']['p50'] is not None
+    assert stats['tokens']['output'] == 100
+
+
+def test_async_streaming_records_the_same_metrics():
+    telemetry = AITelemetry()
+    upstream = Upstream(529)
+    client = AsyncAnthropic(api_key='test', max_retries=0,
+                            http_client=httpx.AsyncClient(transport=httpx.MockTransport(upstream.async_handler)))
+    service = AsyncClaudeService('test', client=client, telemetry=telemetry, stream=True,
+                                 resilience=Resilience(max_retries=2, backoff_base=0))
+    assert asyncio.run(service.analyze_performance([], ['instagram'])) == {'analysis': 'ok'}
+    stats = telemetry.summary()['analysis']
+    assert (stats['calls'], stats['retries']) == (1, 1)
+    assert stats['ttft_ms']['p99'] is not None
+
+
+def test_prometheus_exposition():
+    telemetry = AITelemetry(prices=PRICES)
+    telemetry.record('content_field.hook', MODEL, 0.5, attempts=2,
+                     usage=SimpleNamespace(input_tokens=10, output_tokens=5), first_token=0.1)
+    text = telemetry.prometheus()
+    assert '# TYPE ai_call_duration_seconds summary' in text
+    assert f'ai_calls_total{{task="content_field.hook",model="{MODEL}",outcome="success"}} 1' in text
+    assert 'ai_call_duration_seconds{task="content_field.hook",quantile="0.95"} 0.500000' in text
+    assert 'ai_call_duration_seconds_count{task="content_field.hook"} 1' in text
+    assert 'ai_time_to_first_token_seconds{task="content_field.hook",quantile="0.5"} 0.100000' in text
+    assert f'ai_tokens_total{{task="content_field.hook",model="{MODEL}",kind="output"}} 5' in text
+    assert 'ai_retries_total{task="content_field.hook"} 1' in text
+
+
+def test_metrics_endpoints(client):
+    response = client.get('/metrics')
+    assert response.status_code == 200
+    assert response.mimetype == 'text/plain'
+    assert '# TYPE ai_calls_total counter' in response.get_data(as_text=True)
+    assert client.get('/api/stats/ai-calls').get_json() == {}
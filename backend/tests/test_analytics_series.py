@@ -0,0 +1,137 @@
+from datetime import date, datetime, timedelta
+
+import pytest
+
+from analytics_series import SeriesError, SeriesQuery
+from models import db, Analytics, ContentManager, ContentPillar, Platform
+from rollups import week_start
+
+END = date(2024, 3, 31)
+MONDAY = week_start(END) - timedelta(weeks=1)
+
+
+@pytest.fixture
+def content(app):
+    db.session.add_all([ContentPillar(pillar_name='Tutorials'), ContentPillar(pillar_name='Career')])
+    db.session.add_all([Platform(platform_name='instagram'), Platform(platform_name='tiktok')])
+    db.session.flush()
+    db.session.add_all([ContentManager(content_title='Decorators', content_pillar_id=1, content_type='short_form'),
+                        ContentManager(content_title='Interviews', content_pillar_id=2, content_type='carousel')])
+    db.session.commit()
+
+
+def add(content_id, day, views, platform_id=1, engagement_rate=0.0):
+    db.session.add(Analytics(content_id=content_id, platform_id=platform_id, date_recorded=day, views=views,
+                             engagement_rate=engagement_rate))
+
+
+def series(client, **params):
+    params.setdefault('end', END.isoformat())
+    response = client.get('/api/analytics/series', query_string=params)
+    assert response.status_code == 200, response.get_json()
+    return response.get_json()
+
+
+def test_daily_series_with_moving_average_and_growth(client, content):
+    for offset, views in enumerate([10, 20, 40]):
+        add(1, END - timedelta(days=2 - offset), views)
+        add(2, END - timedelta(days=2 - offset), 1)
+    db.session.commit()
+
+    body = series(client, group_by='content', days=6, window=2)
+    assert body['columns'] == ['period', 'value', 'moving_avg', 'growth']
+    assert [(s['key'], s['label']) for s in body['series']] == [(1, 'Decorators'), (2, 'Interviews')]
+    assert body['series'][0]['points'] == [
+        ['2024-03-29', 10.0, 10.0, None], ['2024-03-30', 20.0, 15.0, 1.0], ['2024-03-31', 40.0, 30.0, 1.0]
+    ]
+    assert body['downsampled'] is False
+
+    # Only the largest series is kept
+    assert [s['key'] for s in series(client, group_by='content', days=6, series=1)['series']] == [1]
+
+
+def test_groups_and_aggregates(client, content):
+    add(1, END, 100, platform_id=1, engagement_rate=4.0)
+    add(1, END, 50, platform_id=2, engagement_rate=2.0)
+    add(2, END, 30, platform_id=2, engagement_rate=1.0)
+    db.session.commit()
+
+    def values(**params):
+        return {s['label']: s['points'][0][1] for s in series(client, days=1, **params)['series']}
+
+    assert values(group_by='platform') == {'instagram': 100.0, 'tiktok': 80.0}
+    assert values(group_by='pillar', agg='max') == {'Tutorials': 100.0, 'Career': 30.0}
+    assert values(group_by='content_type') == {'short_form': 150.0, 'carousel': 30.0}
+    assert values(metric='engagement_rate') == {'all': pytest.approx(7 / 3, abs=1e-4)}
+
+
+def test_weekly_series_read_rollups_and_match_raw_rows(client, content):
+    for day in range(14):
+        add(1 + day % 2, MONDAY - timedelta(weeks=1) + timedelta(days=day), day, engagement_rate=day / 2)
+    db.session.commit()
+
+    views = series(client, interval='week', group_by='pillar', days=30)['series']
+    assert [s['label'] for s in views] == ['Career', 'Tutorials']
+    assert views[0]['points'] == [[(MONDAY - timedelta(weeks=1)).isoformat(), 9.0, 9.0, None],
+                                  [MONDAY.isoformat(), 40.0, 24.5, pytest.approx(31 / 9, abs=1e-4)]]
+
+    # Averages are per raw row, as when computed from Analytics directly
+    rates = series(client, interval='week', metric='engagement_rate', group_by='pillar', days=30)['series']
+    assert [p[1] for p in rates[1]['points']] == [1.5, 5.0]
+    raw = series(client, interval='day', metric='engagement_rate', days=30)['series'][0]['points']
+    assert len(raw) == 14
+
+
+def test_partial_first_and_last_periods_are_flagged(client, content):
+    # END is a Sunday; 30 days back is a Friday
+    body = series(client, interval='week', days=30)
+    assert (body['partial_first'], body['partial_last']) == (True, False)
+    body = series(client, interval='week', start=MONDAY.isoformat(), end=(MONDAY + timedelta(days=3)).isoformat())
+    assert (body['partial_first'], body['partial_last']) == (False, True)
+    assert series(client, interval='month', start='2024-02-01')['partial_first'] is False
+    assert series(client, interval='day', days=30)['partial_first'] is False
+
+
+def test_etag_follows_the_default_range(client, content, monkeypatch):
+    class Today(datetime):
+        now = datetime(2024, 3, 31)
+
+        @classmethod
+        def utcnow(cls):
+            return cls.now
+
+    monkeypatch.setattr('app.datetime', Today)
+    first = client.get('/api/analytics/series')
+    assert first.status_code == 200
+    assert client.get('/api/analytics/series', headers={'If-None-Match': first.headers['ETag']}).status_code == 304
+
+    # Same URL and data the next day: the range moved, so the cached body is stale
+    Today.now = datetime(2024, 4, 1)
+    assert client.get('/api/analytics/series', headers={'If-None-Match': first.headers['ETag']}).status_code == 200
+
+
+def test_downsampling_caps_points(client, content):
+    for day in range(100):
+        add(1, END - timedelta(days=day), 1 + day % 2)
+    db.session.commit()
+
+    body = series(client, days=99, points=10)
+    points = body['series'][0]['points']
+    assert body['downsampled'] is True
+    assert len(points) == 10
+    assert points[0][0] == (END - timedelta(days=99)).isoformat()
+    # Each point is the mean of the ten days it stands for
+    assert {p[1] for p in points} == {1.5}
+
+    monthly = series(client, interval='month', days=99)['series'][0]['points']
+    assert [p[0] for p in monthly] == ['2023-12-01', '2024-01-01', '2024-02-01', '2024-03-01']
+
+
+@pytest.mark.parametrize('params', [{'metric': 'followers'}, {'interval': 'hour'}, {'group_by': 'tag'},
+                                    {'agg': 'median'}, {'points': '100000'}, {'start': 'yesterday'},
+                                    {'start': '2024-04-02'}])
+def test_invalid_queries(client, params):
+    with pytest.raises(SeriesError):
+        SeriesQuery.from_args({'end': END.isoformat(), **params})
+    response = client.get('/api/analytics/series', query_string={'end': END.isoformat(), **params})
+    assert response.status_code == 400
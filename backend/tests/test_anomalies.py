@@ -0,0 +1,105 @@
+from datetime import date, timedelta
+
+import numpy as np
+import pytest
+from sqlalchemy import insert
+
+from anomalies import Thresholds, check, rebuild_baselines, welford
+from models import db, Analytics, AnalyticsBaseline, NicheInsights, Profile
+from versioning import get_versions
+
+START = date(2024, 3, 1)
+
+
+def test_welford_matches_batch_statistics():
+    values = [120, 80, 95, 300, 101, 99]
+    samples, mean, m2 = 0, 0.0, 0.0
+    for value in values:
+        samples, mean, m2 = welford(samples, mean, m2, value)
+    assert samples == len(values)
+    assert mean == pytest.approx(np.mean(values))
+    assert m2 / (samples - 1) == pytest.approx(np.var(values, ddof=1))
+
+
+def test_check_needs_history_and_respects_cooldown():
+    state = {'samples': 10, 'mean': 200.0, 'm2': 9 * 400.0, 'last_date': START, 'last_views': 210,
+             'last_alert_date': None}
+    z_score, growth, confidence = check(state, 400, START + timedelta(days=1), Thresholds())
+    assert z_score == pytest.approx(10.0) and growth == pytest.approx(400 / 210)
+    assert confidence == pytest.approx(99.0)
+    # Ordinary days, late rows and days within the cooldown are not spikes
+    assert check(state, 230, START + timedelta(days=1), Thresholds()) is None
+    assert check(state, 400, START - timedelta(days=1), Thresholds()) is None
+    assert check({**state, 'last_alert_date': START}, 400, START + timedelta(days=1), Thresholds()) is None
+    # Too little history for a z-score; growth alone still counts
+    young = {**state, 'samples': 2, 'last_views': 100}
+    assert check(young, 400, START + timedelta(days=1), Thresholds())[:2] == (None, 4.0)
+
+
+@pytest.fixture
+def content(platforms, make_content):
+    db.session.add(Profile(niche='fitness'))
+    make_content('Calisthenics basics')
+
+
+def test_spikes_become_opportunities_on_ingest(app, client, content):
+    for day, views in enumerate((200, 190, 210, 205, 195, 200)):
+        response = client.post('/api/analytics', json={'content_id': 1, 'platform_id': 2, 'views': views,
+                                                        'date_recorded': (START + timedelta(days=day)).isoformat()})
+        assert response.status_code == 201
+    assert NicheInsights.query.count() == 0
+    baseline = AnalyticsBaseline.query.one()
+    assert (baseline.samples, baseline.mean, baseline.last_views) == (6, 200.0, 200)
+
+    # Bulk inserts go through the detector too; the day after the spike is within the cooldown
+    db.session.execute(insert(Analytics), [
+        {'content_id': 1, 'platform_id': 2, 'date_recorded': START + timedelta(days=7), 'views': 2400},
+        {'content_id': 1, 'platform_id': 2, 'date_recorded': START + timedelta(days=6), 'views': 900},
+    ])
+    db.session.commit()
+    insight = NicheInsights.query.one()
+    assert (insight.niche_name, insight.insight_type, insight.priority) == ('fitness', 'opportunity', 'high')
+    assert insight.title == '"Calisthenics basics" is taking off on tiktok'
+    assert insight.confidence_score > 95
+    assert insight.description.startswith('900 views on 2024-03-07')
+
+    insights = client.get('/api/analytics/dashboard?niche=fitness').get_json()['insights']
+    assert [i['insight_type'] for i in insights] == ['opportunity']
+
+    samples = AnalyticsBaseline.query.one().samples
+    result = app.test_cli_runner().invoke(args=['anomalies', 'rebuild'])
+    assert 'Rebuilt 1 baselines' in result.output
+    rebuilt = AnalyticsBaseline.query.one()
+    assert rebuilt.samples == samples == 8 and rebuilt.last_alert_date == START + timedelta(days=6)
+
+
+def test_rebuild_baselines_follows_edits_and_deletes_without_reporting(content, make_content, record_analytics):
+    other = make_content('Mobility flow')
+    for day, views in enumerate((200, 190, 210, 205, 195, 200, 2400)):
+        record_analytics(1, START + timedelta(days=day), views, platform_id=2)
+    record_analytics(other.id, START, 50)
+    assert NicheInsights.query.count() == 1
+    alerted = AnalyticsBaseline.query.filter_by(content_id=1).one().last_alert_date
+
+    # Edits and deletes bypass the streaming path
+    Analytics.query.filter_by(content_id=1, views=2400).one().views = 220
+    Analytics.query.filter_by(content_id=other.id).delete()
+    db.session.commit()
+    version = get_versions(['analytics_baselines'])['analytics_baselines']
+
+    assert rebuild_baselines() == 1
+    db.session.expire_all()
+    baseline = AnalyticsBaseline.query.one()
+    views = [200, 190, 210, 205, 195, 200, 220]
+    assert (baseline.content_id, baseline.platform_id, baseline.samples) == (1, 2, 7)
+    assert baseline.mean == pytest.approx(np.mean(views))
+    assert baseline.m2 / (baseline.samples - 1) == pytest.approx(np.var(views, ddof=1))
+    assert (baseline.last_date, baseline.last_views) == (START + timedelta(days=6), 220)
+    # The cooldown survives, and replaying history reports nothing new
+    assert baseline.last_alert_date == alerted
+    assert NicheInsights.query.count() == 1
+    assert get_versions(['analytics_baselines'])['analytics_baselines'] == version + 1
+
+    # The next ingest continues from the rebuilt baseline
+    record_analytics(1, START + timedelta(days=7), 230, platform_id=2)
+    assert AnalyticsBaseline.query.one().samples == 8
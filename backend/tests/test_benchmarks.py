@@ -0,0 +1,145 @@
+from datetime import date
+
+import numpy as np
+import pytest
+
+from benchmarks import Benchmarks, Digest, TDigest, sketch
+from models import db, ContentManager, ContentPillar
+
+
+def test_digest_quantiles_and_ranks():
+    values = np.random.default_rng(7).lognormal(6, 1.2, 50_000)
+    digest = TDigest(100).update(values)
+    assert len(digest.means) <= 200
+    for q in (0.01, 0.1, 0.5, 0.9, 0.99):
+        assert digest.rank(np.quantile(values, q)) == pytest.approx(q, abs=0.005)
+    assert digest.quantile(0) == values.min() and digest.quantile(1) == values.max()
+
+    # Digests of parts merge into one as accurate as a single pass
+    merged = TDigest(100)
+    for part in np.array_split(values, 7):
+        merged.merge(TDigest(100).update(part))
+    assert merged.count == len(values)
+    for q in (0.01, 0.5, 0.99):
+        assert merged.rank(np.quantile(values, q)) == pytest.approx(q, abs=0.005)
+
+
+def test_parallel_chunks_match_a_single_chunk():
+    rng = np.random.default_rng(3)
+    samples = {'all': np.full(20_000, 'all', dtype=object),
+               'content_type': rng.choice(np.array(['short_form', 'carousel', None], dtype=object), 20_000),
+               'views': rng.exponential(1000, 20_000), 'likes': rng.exponential(50, 20_000),
+               'engagement_rate': rng.uniform(0, 20, 20_000)}
+    single = sketch(samples, ('all', 'content_type'), chunk_size=20_000)
+    parallel = sketch(samples, ('all', 'content_type'), chunk_size=1_000, workers=4)
+    assert set(single) == set(parallel) and ('content_type', None, 'views') not in single
+    for key in single:
+        assert parallel[key].count == single[key].count
+        assert parallel[key].quantile(0.5) == pytest.approx(single[key].quantile(0.5), rel=0.02)
+
+
+def test_digest_takes_replaced_values_back_out():
+    rng = np.random.default_rng(11)
+    values = rng.lognormal(6, 1.2, 20_000)
+    digest = Digest(100)
+    digest.added.update(values)
+    # Replace a quarter of the values with larger ones, as items whose totals grew
+    replaced = rng.choice(len(values), 5_000, replace=False)
+    digest.removed.update(values[replaced])
+    values[replaced] *= 3
+    digest.added.update(values[replaced])
+
+    assert digest.count == len(values)
+    for q in (0.1, 0.5, 0.9):
+        assert digest.rank(np.quantile(values, q)) == pytest.approx(q, abs=0.01)
+        assert digest.quantile(q) == pytest.approx(np.quantile(values, q), rel=0.05)
+
+
+@pytest.fixture
+def content(platforms, make_content):
+    db.session.add(ContentPillar(pillar_name='Style'))
+    for index in range(12):
+        content_type = 'short_form' if index % 2 else 'carousel'
+        views = 1000 * (index + 1)
+        likes = views // (20 if content_type == 'short_form' else 50)
+        make_content(f'Post {index}', content_type=content_type, content_pillar_id=1, views=views, likes=likes,
+                     engagement_rate=likes * 100.0 / views, analytics_days=7)
+    make_content('Draft')
+
+
+def test_content_gets_p_ranks(client, content):
+    items = client.get('/api/content-manager').get_json()
+    assert items[-1]['p_rank'] is None
+    ranks = [item['p_rank']['views'] for item in items[:-1]]
+    assert ranks == sorted(ranks) and ranks[0] < 10 < 90 < ranks[-1]
+
+    body = client.get('/api/analytics/benchmarks?dimension=content_type').get_json()
+    assert [group['group'] for group in body['groups']] == ['short_form', 'carousel']
+    assert body['groups'][0]['p50'] == pytest.approx(5.0)
+    assert client.get('/api/analytics/benchmarks?dimension=color').status_code == 400
+
+    detail = client.get('/api/analytics/benchmarks/12').get_json()
+    assert detail['content_type']['views'] > 80 and detail['pillar']['views'] > 90
+    assert detail['content_format'] is None and detail['platforms'] == {}
+
+    insights = client.get('/api/analytics/niche-insights?niche=style').get_json()
+    strategy = next(i for i in insights if i['type'] == 'content_strategy')
+    assert strategy['action_items'][0].startswith('Focus on short-form content (')
+
+
+def test_writes_are_folded_in_without_a_rebuild(content, make_content, record_analytics, monkeypatch, clock):
+    benchmarks = Benchmarks(clock=clock)
+    rebuilds = []
+    rebuild = Benchmarks._rebuild
+    monkeypatch.setattr(Benchmarks, '_rebuild', lambda self: rebuilds.append(1) or rebuild(self))
+    first = ContentManager.query.filter_by(content_title='Post 0').one()
+    assert benchmarks.p_ranks([first])[0]['views'] < 5
+    assert len(rebuilds) == 1
+
+    # New analytics move the item's totals; its old sample is retracted, not counted twice
+    record_analytics(first.id, date(2024, 3, 4), 100_000)
+    db.session.refresh(first)
+    assert benchmarks.p_ranks([first])[0]['views'] > 95
+    assert benchmarks.summary('all', 'views')[0]['count'] == 12
+
+    # Editing an item moves it between groups; the first analytics of the draft add it
+    first.content_type = 'short_form'
+    db.session.commit()
+    draft = ContentManager.query.filter_by(content_title='Draft').one()
+    record_analytics(draft.id, date(2024, 3, 4), 500)
+    counts = {row['group']: row['count'] for row in benchmarks.summary('content_type', 'views')}
+    assert counts == {'short_form': 7, 'carousel': 5}
+    assert benchmarks.summary('all', 'views')[0]['count'] == 13
+    assert benchmarks.item_ranks(draft)['platforms'][1] is None  # one item on the platform, under min_samples
+    assert len(rebuilds) == 1
+
+
+def test_periodic_rebuild_runs_in_the_background(app, content, record_analytics, monkeypatch, clock):
+    benchmarks = Benchmarks(rebuild_seconds=60, clock=clock)
+    benchmarks.refresh()
+    record_analytics(1, date(2024, 3, 4), 100_000)
+    benchmarks.refresh()
+    assert benchmarks._digests[('all', 'all', 'views')].removed.count == 1
+
+    started = []
+
+    class Thread:
+        def __init__(self, target, args, name, daemon):
+            started.append((target, args))
+
+        def start(self):
+            pass
+
+    monkeypatch.setattr('benchmarks.threading.Thread', Thread)
+    clock.now = 61
+    # The read that finds the digests due starts the rebuild and carries on with the current ones
+    assert benchmarks.summary('all', 'views')[0]['count'] == 12
+    assert len(started) == 1 and benchmarks._rebuilding.locked()
+    benchmarks.refresh()
+    assert len(started) == 1
+
+    target, args = started[0]
+    target(*args)
+    assert not benchmarks._rebuilding.locked()
+    assert benchmarks._digests[('all', 'all', 'views')].removed.count == 0
+    assert benchmarks.summary('all', 'views')[0]['count'] == 12
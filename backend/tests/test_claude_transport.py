@@ -0,0 +1,86 @@
+import asyncio
+import json
+
+import httpx
+import pytest
+
+from ai_telemetry import AITelemetry
+from claude_service import AsyncClaudeService, ClaudeService, IDEAS_SCHEMA, WEEKLY_PLAN_SCHEMA
+from claude_transport import (FixtureStore, RecordTransport, ReplayTransport, SyntheticTransport, claude_enabled,
+                              synthesize, transport_from_config)
+from resilience import CircuitBreaker, Resilience
+from structured_output import conform
+
+IDEAS = [{'title': 'Decorators', 'description': 'A quick tour'}]
+
+
+def upstream(request):
+    return httpx.Response(200, json={
+        'id': 'msg_live', 'type': 'message', 'role': 'assistant', 'model': 'claude-3-haiku-20240307',
+        'content': [{'type': 'tool_use', 'id': 'toolu_1', 'name': 'record_ideas', 'input': {'result': IDEAS}}],
+        'stop_reason': 'tool_use', 'stop_sequence': None, 'usage': {'input_tokens': 10, 'output_tokens': 5}
+    })
+
+
+def service(transport, **kwargs):
+    return ClaudeService('test', transport=transport, resilience=Resilience(max_retries=0), **kwargs)
+
+
+def test_record_then_replay_without_network(tmp_path):
+    store = FixtureStore(str(tmp_path))
+    recorded = service(RecordTransport(store, transport=httpx.MockTransport(upstream)))
+    assert recorded.generate_content_ideas('Tutorials', 'developers', []) == IDEAS
+    assert len(list(tmp_path.iterdir())) == 1
+
+    replayed = service(ReplayTransport(store))
+    assert replayed.generate_content_ideas('Tutorials', 'developers', []) == IDEAS
+    # A request that was never recorded fails fast instead of reaching the API
+    missing = replayed.generate_content_ideas('Reviews', 'developers', [])
+    assert 'No recorded response for request' in missing[0]['error']
+
+
+def test_synthetic_replies_match_the_schema():
+    ideas = service(SyntheticTransport(latency_ms=0, seed=1)).generate_content_ideas('Tutorials', 'developers', [])
+    assert conform(ideas, IDEAS_SCHEMA) == ideas and ideas
+    plan = service(SyntheticTransport(latency_ms=0, seed=1), stream=True).generate_weekly_content_plan([], ['instagram'], 'grow')
+    assert conform(plan, WEEKLY_PLAN_SCHEMA) == plan
+    hook = service(SyntheticTransport(latency_ms=0, seed=1), stream=True).generate_content_field('hook', {}, {})
+    assert hook['content'].startswith('Synthetic reply')
+
+
+def test_synthetic_async_streaming():
+    async_service = AsyncClaudeService('test', transport=SyntheticTransport(latency_ms=1, seed=2), stream=True,
+                                       resilience=Resilience(max_retries=0))
+    ideas = asyncio.run(async_service.generate_content_ideas('Tutorials', 'developers', []))
+    assert conform(ideas, IDEAS_SCHEMA) == ideas and ideas
+
+
+def test_synthetic_errors_drive_retries():
+    telemetry = AITelemetry()
+    flaky = ClaudeService('test', transport=SyntheticTransport(latency_ms=0, error_rate=0.5, seed=3),
+                          resilience=Resilience(max_retries=10, sleep=lambda seconds: None,
+                                                breaker=CircuitBreaker(failure_threshold=100)),
+                          telemetry=telemetry)
+    for _ in range(5):
+        flaky.analyze_performance([], ['instagram'])
+    stats = telemetry.summary()['analysis']
+    assert stats['errors'] == 0
+    assert stats['retries'] > 0
+
+
+def test_seed_makes_runs_repeatable():
+    def run(seed):
+        return service(SyntheticTransport(latency_ms=0, seed=seed)).generate_content_ideas('Tutorials', 'dev', [])
+    assert run(7) == run(7)
+    assert run(7) != run(8)
+    assert synthesize({'type': 'object', 'properties': {'n': {'type': 'integer'}}}, rng=None)['n'] >= 1
+
+
+def test_config_selects_the_transport(tmp_path):
+    assert transport_from_config({}) is None
+    assert isinstance(transport_from_config({'CLAUDE_TRANSPORT': 'replay', 'CLAUDE_FIXTURES_DIR': str(tmp_path)}),
+                      ReplayTransport)
+    with pytest.raises(ValueError):
+        transport_from_config({'CLAUDE_TRANSPORT': 'mock'})
+    assert claude_enabled({'CLAUDE_TRANSPORT': 'synthetic'})
+    assert not claude_enabled({'CLAUDE_TRANSPORT': 'record'})
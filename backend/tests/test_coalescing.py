@@ -0,0 +1,156 @@
+import asyncio
+import json
+import threading
+import time
+
+import httpx
+import pytest
+from anthropic import Anthropic, AsyncAnthropic
+
+from claude_service import AsyncClaudeService, ClaudeService
+from coalescing import AsyncSingleFlight, FileFlight, SingleFlight
+from resilience import Resilience
+
+PROFILE = {'mission': 'teach', 'target_audience': 'developers'}
+
+
+class CountingUpstream:
+    """Messages API stand-in that counts requests and answers after a delay"""
+
+    def __init__(self, delay=0.3, status=200):
+        self.delay = delay
+        self.status = status
+        self.calls = 0
+        self._lock = threading.Lock()
+
+    def _reply(self):
+        with self._lock:
+            self.calls += 1
+        if self.status != 200:
+            return httpx.Response(self.status, json={'type': 'error', 'error': {'type': 'invalid_request_error'}})
+        return httpx.Response(200, json={
+            'id': 'msg_test', 'type': 'message', 'role': 'assistant', 'model': 'claude-3-haiku-20240307',
+            'content': [{'type': 'text', 'text': json.dumps({'strategy_recommendations': ['reels']})}],
+            'stop_reason': 'end_turn', 'stop_sequence': None, 'usage': {'input_tokens': 10, 'output_tokens': 5}
+        })
+
+    def handler(self, request):
+        time.sleep(self.delay)
+        return self._reply()
+
+    async def async_handler(self, request):
+        await asyncio.sleep(self.delay)
+        return self._reply()
+
+    def service(self, single_flight=None):
+        client = Anthropic(api_key='test', http_client=httpx.Client(transport=httpx.MockTransport(self.handler)))
+        return ClaudeService('test', client=client, resilience=Resilience(max_retries=0), single_flight=single_flight)
+
+    def async_service(self):
+        client = AsyncAnthropic(api_key='test',
+                                http_client=httpx.AsyncClient(transport=httpx.MockTransport(self.async_handler)))
+        return AsyncClaudeService('test', client=client, resilience=Resilience(max_retries=0))
+
+
+def run_concurrently(count, fn):
+    results = [None] * count
+    barrier = threading.Barrier(count)
+
+    def run(index):
+        barrier.wait()
+        results[index] = fn(index)
+
+    threads = [threading.Thread(target=run, args=(i,)) for i in range(count)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    return results
+
+
+def test_concurrent_identical_calls_share_one_upstream_request():
+    upstream = CountingUpstream()
+    service = upstream.service()
+    results = run_concurrently(20, lambda _: service.generate_content_strategy(PROFILE, [], []))
+    assert upstream.calls == 1
+    assert results == [{'strategy_recommendations': ['reels']}] * 20
+    # Every caller gets its own parsed copy
+    assert len({id(result) for result in results}) == 20
+    assert service.single_flight.shared_calls == 19
+
+
+def test_different_prompts_are_not_merged():
+    upstream = CountingUpstream(delay=0.1)
+    service = upstream.service()
+    run_concurrently(4, lambda index: service.generate_content_strategy({**PROFILE, 'niche': str(index)}, [], []))
+    assert upstream.calls == 4
+
+
+def test_later_calls_are_not_served_from_a_finished_flight():
+    upstream = CountingUpstream(delay=0)
+    service = upstream.service()
+    service.analyze_performance([], ['instagram'])
+    service.analyze_performance([], ['instagram'])
+    assert upstream.calls == 2
+
+
+def test_errors_reach_every_waiter():
+    upstream = CountingUpstream(status=400)
+    service = upstream.service()
+    results = run_concurrently(5, lambda _: service.optimize_content({}, 'instagram', []))
+    assert upstream.calls == 1
+    assert all('error' in result for result in results)
+
+
+def test_async_service_coalesces_on_the_event_loop():
+    upstream = CountingUpstream()
+    service = upstream.async_service()
+
+    async def run():
+        return await asyncio.gather(*[service.generate_content_strategy(PROFILE, [], []) for _ in range(20)])
+
+    results = asyncio.run(run())
+    assert upstream.calls == 1
+    assert results == [{'strategy_recommendations': ['reels']}] * 20
+
+
+def test_lock_file_coalesces_across_workers(tmp_path):
+    upstream = CountingUpstream()
+    # One service per simulated worker process, sharing only the lock directory
+    workers = [upstream.service(SingleFlight(FileFlight(str(tmp_path)))) for _ in range(4)]
+    results = run_concurrently(4, lambda index: workers[index].generate_content_strategy(PROFILE, [], []))
+    assert upstream.calls == 1
+    assert results == [{'strategy_recommendations': ['reels']}] * 4
+
+
+def test_waiters_stop_waiting_on_a_hung_leader(tmp_path):
+    files = FileFlight(str(tmp_path), wait_seconds=0.2, poll_seconds=0.01)
+    # Another worker holds the lock and never finishes
+    held = FileFlight(str(tmp_path)).try_lock('key')
+    assert held is not None
+
+    started = time.monotonic()
+    assert SingleFlight(files).do('key', lambda: 'own call') == 'own call'
+    assert 0.2 <= time.monotonic() - started < 1.0
+
+    async def call():
+        return 'own async call'
+
+    started = time.monotonic()
+    assert asyncio.run(AsyncSingleFlight(files).do('key', call, wait=0.05)) == 'own async call'
+    assert time.monotonic() - started < 0.2
+    assert files.lock_timeouts == 2
+
+    files.unlock(held)
+    assert SingleFlight(files).do('key', lambda: 'coalesced') == 'coalesced'
+    assert files.lock_timeouts == 2
+
+
+def test_single_flight_propagates_exceptions():
+    def fail():
+        raise ValueError('boom')
+
+    flight = SingleFlight()
+    with pytest.raises(ValueError):
+        flight.do('key', fail)
+    assert flight.do('key', lambda: 'fresh') == 'fresh'
@@ -0,0 +1,90 @@
+from datetime import date, timedelta
+
+import pytest
+from sqlalchemy import insert, update
+
+from content_totals import reconcile
+from models import db, Analytics, ContentManager, Platform
+from rollups import compact
+
+TODAY = date.today()
+
+
+@pytest.fixture
+def content(client):
+    db.session.add(Platform(platform_name='instagram'))
+    db.session.commit()
+    for title in ('Decorators', 'Interviews'):
+        response = client.post('/api/content-manager', json={'content_title': title, 'views': 40, 'likes': 4})
+        assert response.status_code == 201
+
+
+def record(client, content_id, day, views, likes=0, retention_rate=0.0):
+    response = client.post('/api/analytics', json={
+        'content_id': content_id, 'platform_id': 1, 'date_recorded': day.isoformat(),
+        'views': views, 'likes': likes, 'retention_rate': retention_rate
+    })
+    assert response.status_code == 201
+    return response.get_json()['id']
+
+
+def totals(client, content_id):
+    item = next(c for c in client.get('/api/content-manager').get_json() if c['id'] == content_id)
+    return item['views'], item['likes'], item['retention_rate'], item['engagement_rate']
+
+
+def test_analytics_writes_maintain_totals(client, content):
+    # Hand-entered numbers stand until analytics arrive
+    assert totals(client, 1) == (40, 4, 0.0, 10.0)
+    updated_at = db.session.get(ContentManager, 1).updated_at
+
+    first = record(client, 1, TODAY, 100, 10, 50.0)
+    record(client, 1, TODAY - timedelta(days=1), 100, 30, 70.0)
+    assert totals(client, 1) == (200, 40, 60.0, 20.0)
+    assert totals(client, 2) == (40, 4, 0.0, 10.0)
+
+    db.session.get(Analytics, first).likes = 0
+    db.session.commit()
+    assert totals(client, 1) == (200, 30, 60.0, 15.0)
+    db.session.delete(db.session.get(Analytics, first))
+    db.session.commit()
+    assert totals(client, 1) == (100, 30, 70.0, 30.0)
+    assert db.session.get(ContentManager, 1).updated_at == updated_at
+
+    # Hand edits no longer override the analytics totals
+    client.put('/api/content-manager/1', json={'content_title': 'Decorators', 'views': 5})
+    assert totals(client, 1) == (100, 30, 70.0, 30.0)
+
+
+def test_bulk_inserts_update_totals(client, content):
+    db.session.execute(insert(Analytics), [
+        {'content_id': 2, 'platform_id': 1, 'date_recorded': TODAY, 'views': 7, 'likes': 7},
+        {'content_id': 2, 'platform_id': 1, 'date_recorded': TODAY - timedelta(days=1), 'views': 3}
+    ])
+    db.session.commit()
+    assert totals(client, 2) == (10, 7, 0.0, 70.0)
+
+
+def test_reconcile_repairs_drift_and_survives_compaction(app, client, content):
+    for day in range(40):
+        record(client, 1, TODAY - timedelta(days=day), 10, 1, 40.0)
+    record(client, 2, TODAY, 50, 5)
+    expected = totals(client, 1)
+    assert expected == (400, 40, 40.0, 10.0)
+
+    # Writes that bypass the ORM are invisible to the delta path
+    db.session.execute(update(ContentManager.__table__).where(ContentManager.id == 1).values(views=1))
+    db.session.execute(update(ContentManager.__table__).where(ContentManager.id == 2).values(analytics_days=0))
+    db.session.commit()
+    assert reconcile(batch_size=1) == 2
+    assert totals(client, 1) == expected
+    assert totals(client, 2) == (50, 5, 0.0, 10.0)
+    assert reconcile() == 0
+
+    # Compacted analytics still count, through the weekly rollups
+    assert compact(14)[1] > 0
+    assert reconcile() == 0
+    assert totals(client, 1) == expected
+
+    result = app.test_cli_runner().invoke(args=['totals', 'reconcile'])
+    assert 'Repaired 0 content items' in result.output
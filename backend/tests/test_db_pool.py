@@ -0,0 +1,91 @@
+import threading
+import time
+
+import pytest
+from sqlalchemy import create_engine, text
+from sqlalchemy.exc import OperationalError, TimeoutError as PoolTimeoutError
+from sqlalchemy.pool import NullPool
+
+from config import engine_options
+from db_pool import TimedQueuePool, pool_stats
+
+POSTGRES_URI = 'postgresql://localhost:5432/ai_content_strategist'
+
+
+def test_engine_options_from_environment():
+    options = engine_options(POSTGRES_URI, {
+        'DB_POOL_SIZE': '20',
+        'DB_MAX_OVERFLOW': '5',
+        'DB_POOL_RECYCLE': '600',
+        'DB_POOL_PRE_PING': 'false',
+        'DB_STATEMENT_TIMEOUT_MS': '5000'
+    })
+    assert options['poolclass'] is TimedQueuePool
+    assert options['pool_size'] == 20
+    assert options['max_overflow'] == 5
+    assert options['pool_recycle'] == 600
+    assert options['pool_pre_ping'] is False
+    assert options['connect_args'] == {'options': '-c statement_timeout=5000'}
+
+
+def test_engine_options_defaults():
+    options = engine_options(POSTGRES_URI, {})
+    assert options['pool_size'] == 5
+    assert options['pool_pre_ping'] is True
+    assert options['pool_recycle'] == 1800
+
+
+def test_pgbouncer_mode_disables_app_pool_and_startup_options():
+    options = engine_options(POSTGRES_URI, {'DB_PGBOUNCER': 'true'})
+    assert options['poolclass'] is NullPool
+    assert 'connect_args' not in options
+    assert 'pool_size' not in options
+
+
+def test_sqlite_keeps_default_options():
+    assert engine_options('sqlite:///app.db', {'DB_POOL_SIZE': '20'}) == {}
+
+
+def test_timed_pool_reports_checkouts_and_waits(tmp_path):
+    engine = create_engine(f'sqlite:///{tmp_path / "pool.db"}', poolclass=TimedQueuePool,
+                           pool_size=1, max_overflow=0, pool_timeout=2)
+    held = engine.connect()
+    stats = pool_stats(engine)
+    assert stats['checked_out'] == 1
+    assert stats['overflow'] == 0
+
+    def release():
+        time.sleep(0.2)
+        held.close()
+
+    threading.Thread(target=release).start()
+    with engine.connect() as connection:
+        connection.execute(text('SELECT 1'))
+
+    wait = pool_stats(engine)['wait']
+    assert wait['checkouts'] == 2
+    assert wait['max_ms'] >= 150
+
+
+def test_timed_pool_counts_timeouts(tmp_path):
+    engine = create_engine(f'sqlite:///{tmp_path / "pool.db"}', poolclass=TimedQueuePool,
+                           pool_size=1, max_overflow=0, pool_timeout=0.1)
+    with engine.connect():
+        with pytest.raises(PoolTimeoutError):
+            engine.connect()
+    assert pool_stats(engine)['wait']['timeouts'] == 1
+
+
+def test_timed_pool_counts_connect_failures_as_errors(tmp_path):
+    engine = create_engine(f'sqlite:///{tmp_path / "missing" / "pool.db"}', poolclass=TimedQueuePool,
+                           pool_size=1, max_overflow=0, pool_timeout=0.1)
+    with pytest.raises(OperationalError):
+        engine.connect()
+    wait = pool_stats(engine)['wait']
+    assert (wait['timeouts'], wait['errors'], wait['checkouts']) == (0, 1, 0)
+
+
+def test_pool_stats_endpoint(client):
+    response = client.get('/api/stats/db-pool')
+    assert response.status_code == 200
+    assert 'status' in response.get_json()['primary']
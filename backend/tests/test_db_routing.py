@@ -0,0 +1,87 @@
+import pytest
+from sqlalchemy.exc import OperationalError
+
+import config as config_module
+from app import create_app
+from db_routing import primary_only, read_replica, replica_binds
+from models import db, Task
+
+
+@pytest.fixture
+def replicated_app(tmp_path, monkeypatch):
+    class ReplicaTestingConfig(config_module.TestingConfig):
+        SQLALCHEMY_DATABASE_URI = f'sqlite:///{tmp_path / "primary.db"}'
+        SQLALCHEMY_BINDS = replica_binds([f'sqlite:///{tmp_path / "replica.db"}'], lambda uri: {})
+        REPLICA_LAG_CHECK_INTERVAL = 0
+
+    monkeypatch.setitem(config_module.config, 'replica-testing', ReplicaTestingConfig)
+    app = create_app('replica-testing')
+    with app.app_context():
+        db.create_all()
+        db.metadata.create_all(db.engines['replica_0'])
+        # Rows that only the replica has, so tests can tell which database answered
+        with db.engines['replica_0'].begin() as connection:
+            connection.execute(Task.__table__.insert().values(title='from replica', status='pending',
+                                                              priority='medium'))
+        yield app
+        db.session.remove()
+    # init_app registers a metadata per bind key on the shared db object
+    db.metadatas.pop('replica_0', None)
+
+
+def titles(response):
+    return [task['title'] for task in response.get_json()]
+
+
+def test_get_reads_from_replica_and_post_writes_to_primary(replicated_app):
+    client = replicated_app.test_client()
+    assert titles(client.get('/api/tasks')) == ['from replica']
+
+    assert client.post('/api/tasks', json={'title': 'from primary'}).status_code == 201
+    with db.engines[None].connect() as connection:
+        assert [row.title for row in connection.execute(Task.__table__.select())] == ['from primary']
+    assert titles(client.get('/api/tasks')) == ['from replica']
+
+
+def test_read_after_write_in_same_request_uses_primary(replicated_app):
+    with replicated_app.test_request_context('/api/tasks', method='GET'):
+        assert [task.title for task in Task.query.all()] == ['from replica']
+        db.session.add(Task(title='written'))
+        db.session.flush()
+        assert [task.title for task in Task.query.all()] == ['written']
+        db.session.rollback()
+
+
+def test_lagging_replica_falls_back_to_primary(replicated_app):
+    replicated_app.extensions['replica_monitor'].probe = lambda engine: 60.0
+    assert titles(replicated_app.test_client().get('/api/tasks')) == []
+
+
+def test_unreachable_replica_falls_back_to_primary(replicated_app):
+    def probe(engine):
+        raise OperationalError('SELECT 1', {}, Exception('connection refused'))
+
+    replicated_app.extensions['replica_monitor'].probe = probe
+    assert titles(replicated_app.test_client().get('/api/tasks')) == []
+
+
+def test_read_replica_block_outside_get(replicated_app):
+    with replicated_app.test_request_context('/api/ai/generate-strategy', method='POST'):
+        assert Task.query.all() == []
+        db.session.remove()
+        with read_replica():
+            assert [task.title for task in Task.query.all()] == ['from replica']
+
+
+def test_primary_only_view_reads_primary(replicated_app):
+    @primary_only
+    def view():
+        return [task.title for task in Task.query.all()]
+
+    with replicated_app.test_request_context('/api/profile', method='GET'):
+        assert view() == []
+
+
+def test_routing_is_inactive_without_replicas(client):
+    client.post('/api/tasks', json={'title': 'only primary'})
+    assert titles(client.get('/api/tasks')) == ['only primary']
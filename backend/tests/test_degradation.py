@@ -0,0 +1,147 @@
+import asyncio
+import json
+import threading
+import time
+
+import httpx
+import pytest
+from anthropic import Anthropic, AsyncAnthropic
+
+from ai_app import create_ai_app
+from ai_telemetry import AITelemetry
+from analytics_service import AnalyticsService
+from claude_service import AsyncClaudeService, ClaudeService
+from coalescing import ReplyCache
+from models import db, Profile
+from resilience import Resilience
+
+IDEAS = [{'title': 'Decorators', 'description': 'A quick tour'}]
+CONTEXT = {'pillar_name': 'Tutorials', 'target_audience': 'developers', 'recent_performance': []}
+
+
+class SlowUpstream:
+    """Messages API stand-in that answers after a delay and counts requests"""
+
+    def __init__(self, delay=0.0, status=200):
+        self.delay = delay
+        self.status = status
+        self.calls = 0
+        self._lock = threading.Lock()
+
+    def _reply(self):
+        with self._lock:
+            self.calls += 1
+        if self.status != 200:
+            return httpx.Response(self.status, json={'type': 'error', 'error': {'type': 'api_error'}})
+        return httpx.Response(200, json={
+            'id': 'msg_test', 'type': 'message', 'role': 'assistant', 'model': 'claude-3-haiku-20240307',
+            'content': [{'type': 'text', 'text': json.dumps(IDEAS)}], 'stop_reason': 'end_turn',
+            'stop_sequence': None, 'usage': {'input_tokens': 10, 'output_tokens': 5}
+        })
+
+    def handler(self, request):
+        time.sleep(self.delay)
+        return self._reply()
+
+    async def async_handler(self, request):
+        await asyncio.sleep(self.delay)
+        return self._reply()
+
+    def service(self, **kwargs):
+        client = Anthropic(api_key='test', max_retries=0,
+                           http_client=httpx.Client(transport=httpx.MockTransport(self.handler)))
+        return ClaudeService('test', client=client, resilience=Resilience(max_retries=0), use_tools=False,
+                             replies=ReplyCache(), **kwargs)
+
+    def async_service(self, **kwargs):
+        client = AsyncAnthropic(api_key='test', max_retries=0,
+                                http_client=httpx.AsyncClient(transport=httpx.MockTransport(self.async_handler)))
+        return AsyncClaudeService('test', client=client, resilience=Resilience(max_retries=0), use_tools=False,
+                                  replies=ReplyCache(), **kwargs)
+
+
+def heuristic_ideas():
+    return AnalyticsService().suggest_content_ideas(**CONTEXT)
+
+
+def wait_for(predicate, timeout=5.0):
+    deadline = time.monotonic() + timeout
+    while not predicate():
+        assert time.monotonic() < deadline, 'condition not met'
+        time.sleep(0.01)
+
+
+def test_missed_deadline_returns_heuristic_and_fills_the_cache():
+    upstream = SlowUpstream(delay=0.5)
+    telemetry = AITelemetry()
+    service = upstream.service(telemetry=telemetry)
+
+    started = time.perf_counter()
+    ideas = service.generate_content_ideas(**CONTEXT, deadline=0.05, fallback=heuristic_ideas)
+    assert time.perf_counter() - started < 0.4
+    assert ideas and all(idea['degraded'] for idea in ideas)
+    assert telemetry.summary()['ideas']['degraded'] == {'deadline': 1, 'error': 0}
+
+    # The late call finishes in the background and answers the next request
+    wait_for(lambda: telemetry.summary()['ideas']['calls'] == 1)
+    assert service.generate_content_ideas(**CONTEXT, deadline=0.05, fallback=heuristic_ideas) == IDEAS
+    assert upstream.calls == 1
+
+
+def test_failure_degrades_instead_of_erroring():
+    service = SlowUpstream(status=500).service()
+    result = service.generate_content_field(
+        'hashtags', {'hashtags_used': '#python'}, {'niche': 'tech'},
+        fallback=lambda: AnalyticsService().suggest_content_field('hashtags', {'hashtags_used': '#python'},
+                                                                  {'niche': 'tech'})
+    )
+    assert result['degraded'] and result['success']
+    assert result['content'].startswith('#python #tech')
+    # Without a fallback the error shape is unchanged
+    assert service.generate_content_field('hook', {}, {})['success'] is False
+
+
+def test_fast_answer_is_not_degraded():
+    service = SlowUpstream().service()
+    assert service.generate_content_ideas(**CONTEXT, deadline=1.0, fallback=heuristic_ideas) == IDEAS
+
+
+def test_async_missed_deadline_returns_heuristic():
+    upstream = SlowUpstream(delay=0.3)
+    service = upstream.async_service()
+
+    async def run():
+        degraded = await service.generate_content_ideas(**CONTEXT, deadline=0.05, fallback=heuristic_ideas)
+        await asyncio.sleep(0.4)
+        answered = await service.generate_content_ideas(**CONTEXT, deadline=0.05, fallback=heuristic_ideas)
+        return degraded, answered
+
+    degraded, answered = asyncio.run(run())
+    assert all(idea['degraded'] for idea in degraded)
+    assert answered == IDEAS
+    assert upstream.calls == 1
+
+
+@pytest.mark.parametrize('field_type', ['caption', 'hook', 'script', 'tone', 'call_to_action', 'hashtags'])
+def test_heuristic_fields(field_type):
+    result = AnalyticsService().suggest_content_field(
+        field_type, {'content_title': 'Decorators', 'content_type': 'short_form'},
+        {'niche': 'tech', 'target_audience': 'developers'}, {'pillar_name': 'Python', 'keywords': 'python, web dev'}
+    )
+    assert result['success'] and result['field_type'] == field_type and result['content']
+
+
+def test_deadline_header_on_the_async_route(app):
+    db.session.add(Profile(mission='teach', target_audience='developers'))
+    db.session.commit()
+    ai_app = create_ai_app(app, SlowUpstream(delay=0.5).async_service())
+
+    async def post(headers):
+        response = await ai_app.test_client().post('/api/ai/generate-content-field', headers=headers,
+                                                   json={'field_type': 'hook', 'content_data': {}})
+        return response.status_code, await response.get_json()
+
+    status, body = asyncio.run(post({'X-Deadline-Ms': '50'}))
+    assert status == 200
+    assert body['degraded'] is True
+    assert asyncio.run(post({'X-Deadline-Ms': 'soon'}))[0] == 400
@@ -0,0 +1,115 @@
+from datetime import date, datetime, timedelta
+
+import numpy as np
+import pytest
+
+from forecasting import MAX_AGE_DAYS, fit_curves, forecast_for, predict, refresh_forecasts
+from models import db, ContentForecast
+
+TODAY = date.today()
+
+
+def curve(total, tau, days):
+    return total * (1 - np.exp(-np.arange(1, days + 1) / tau))
+
+
+def test_fit_recovers_each_items_curve():
+    cumulative = np.zeros((2, 30))
+    cumulative[0, :10] = curve(1000, 2.0, 10)
+    cumulative[1, :5] = curve(500, 20.0, 5)
+    observed = np.array([10, 5])
+    fit = fit_curves(cumulative, observed)
+    assert fit['amplitude'] == pytest.approx([1000, 500], rel=0.05)
+
+    expected, low, high = predict(fit, cumulative, observed, 30)
+    assert expected == pytest.approx([1000, 500 * (1 - np.exp(-1.5))], rel=0.05)
+    assert (low <= expected).all() and (expected <= high).all()
+    # Already observed: the actual total, no interval
+    assert predict(fit, cumulative, observed, 7)[0][0] == cumulative[0, 6]
+
+
+@pytest.fixture
+def published(client, platforms, make_content):
+    make_content('Decorators', status='published',
+                 publish_time=datetime.combine(TODAY - timedelta(days=4), datetime.min.time()))
+
+    def record(day, views, likes):
+        response = client.post('/api/analytics', json={
+            'content_id': 1, 'platform_id': 1, 'views': views, 'likes': likes,
+            'date_recorded': (TODAY - timedelta(days=4 - day)).isoformat()
+        })
+        assert response.status_code == 201
+
+    return record
+
+
+def test_forecasts_refresh_only_changed_items(app, client, published):
+    assert client.get('/api/analytics/forecasts/1').status_code == 404
+    for day, views in enumerate((400, 240, 144, 86)):
+        published(day, views, views // 10)
+
+    forecast = client.get('/api/analytics/forecasts/1').get_json()
+    assert forecast['days_observed'] == 4
+    views = forecast['views']['day_30']
+    assert 870 <= views['low'] <= views['expected'] <= views['high']
+    assert views['expected'] == pytest.approx(1000, rel=0.1)
+    fitted_at = db.session.get(ContentForecast, 1).fitted_at
+
+    # Nothing new: no refit
+    assert refresh_forecasts() == 0
+    client.get('/api/analytics/forecasts/1')
+    assert db.session.get(ContentForecast, 1).fitted_at == fitted_at
+
+    published(4, 52, 5)
+    assert refresh_forecasts(batch_size=1) == 1
+    assert db.session.query(ContentForecast).count() == 1
+
+    prediction = client.post('/api/analytics/performance-prediction', json={'content_id': 1}).get_json()
+    engagement = prediction['engagement_prediction']
+    assert engagement['views'] == pytest.approx(1000, rel=0.1)
+    assert engagement['views_range'][0] <= engagement['views'] <= engagement['views_range'][1]
+
+    # Forecasts of deleted content are dropped
+    db.session.add(ContentForecast(content_id=99, days_observed=5, analytics_days=5, views_total=1, likes_total=0))
+    db.session.commit()
+    result = app.test_cli_runner().invoke(args=['forecasts', 'refresh'])
+    assert 'Refitted 0 forecasts' in result.output
+    assert [row.content_id for row in ContentForecast.query] == [1]
+
+
+def test_forecast_edge_cases(platforms, make_content, record_analytics):
+    def publish(days_ago):
+        return make_content(status='published',
+                            publish_time=datetime.combine(TODAY - timedelta(days=days_ago), datetime.min.time()))
+
+    # Under MIN_DAYS of analytics: a forecast row without predictions
+    young = publish(1)
+    for day in range(2):
+        record_analytics(young.id, TODAY - timedelta(days=1 - day), 100)
+    forecast = forecast_for(young.id).to_dict()
+    assert forecast['days_observed'] == 2
+    assert forecast['views']['day_30'] == {'expected': None, 'low': None, 'high': None}
+
+    # Unpublished content starts at its first analytics day; a flat zero curve predicts zero, not NaN
+    silent = make_content()
+    for day in range(4):
+        record_analytics(silent.id, TODAY - timedelta(days=10 - day), 0)
+    forecast = forecast_for(silent.id).to_dict()
+    assert forecast['days_observed'] == 4
+    assert forecast['views']['day_30'] == {'expected': 0.0, 'low': 0.0, 'high': 0.0}
+
+    # Rows dated before publishing count towards day 1
+    early = publish(3)
+    record_analytics(early.id, TODAY - timedelta(days=6), 50)
+    for day in range(4):
+        record_analytics(early.id, TODAY - timedelta(days=3 - day), 100)
+    forecast = forecast_for(early.id).to_dict()
+    assert forecast['days_observed'] == 4
+
+    # Content past MAX_AGE_DAYS is never fitted
+    old = publish(MAX_AGE_DAYS + 10)
+    for day in range(5):
+        record_analytics(old.id, TODAY - timedelta(days=MAX_AGE_DAYS + 10 - day), 100)
+    assert forecast_for(old.id) is None
+    db.session.commit()
+    assert refresh_forecasts() == 0
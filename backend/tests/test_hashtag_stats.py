@@ -0,0 +1,109 @@
+import json
+
+import numpy as np
+import pytest
+
+from hashtag_stats import CountMin, HashtagStats, SpaceSaving, parse_tags
+from models import db, ContentManager, TrendingTopic
+
+
+def test_parse_tags():
+    assert parse_tags('#Fitness, #gym fitness #GYM') == ('#fitness', '#gym')
+    assert parse_tags(None) == ()
+
+
+def test_sketches_keep_heavy_hitters_and_never_undercount():
+    rng = np.random.default_rng(5)
+    stream = [f'#tag{index}' for index in rng.zipf(1.5, 20_000) if index < 5000]
+    usage, counts = SpaceSaving(100), CountMin(256, 4)
+    for tag in stream:
+        usage.offer(tag)
+        counts.add(tag, 1)
+    exact = {tag: stream.count(tag) for tag in set(stream)}
+    heavy = [tag for tag, count in exact.items() if count > len(stream) / 100]
+    assert set(heavy) <= set(usage.counts) and len(usage.counts) == 100
+    assert [tag for tag, _ in usage.top(3)] == ['#tag1', '#tag2', '#tag3']
+    assert all(counts.estimate(tag) >= count for tag, count in exact.items())
+    assert counts.estimate('#tag1') <= exact['#tag1'] + 2 * len(stream) / 256
+
+    usage.discount('#tag1', usage.counts['#tag1'])
+    assert '#tag1' not in usage.counts
+
+
+@pytest.fixture
+def posts(make_content):
+    def publish(hashtags, engagement):
+        return make_content(hashtags, hashtags_used=hashtags, engagement_rate=engagement)
+
+    for _ in range(3):
+        publish('#fitness #gym #legday', 8.0)
+    publish('#fitness #yoga', 1.0)
+    publish('#travel', 4.0)
+    db.session.add_all([
+        TrendingTopic(topic='Hyrox', niche_category='fitness', hashtags=json.dumps(['#hyrox', '#fitness']),
+                      decayed_score=90.0, engagement_rate=6.0),
+        TrendingTopic(topic='Pilates', niche_category='fitness', hashtags=json.dumps(['pilates']),
+                      decayed_score=40.0, engagement_rate=3.0),
+        TrendingTopic(topic='Old', niche_category='fitness', hashtags=json.dumps(['#old']), is_active=False)
+    ])
+    db.session.commit()
+    return publish
+
+
+def test_learns_and_updates_incrementally(posts):
+    stats = HashtagStats(rebuild_seconds=float('inf'))
+    assert stats.top(2) == [{'hashtag': '#fitness', 'uses': 4, 'engagement_rate': 6.25},
+                            {'hashtag': '#gym', 'uses': 3, 'engagement_rate': 8.0}]
+    assert stats.trending('fitness') == ['#hyrox', '#fitness', '#pilates']
+    # Engaging posts outweigh the rest; trending topics add their pairs
+    assert stats.suggest(['#fitness'], 'fitness', 3) == ['#gym', '#legday', '#hyrox']
+    assert stats.suggest(['#travel'], 'fitness', 2) == ['#hyrox', '#fitness']
+
+    # An edited post is taken out and added again without a rebuild
+    item = ContentManager.query.filter_by(hashtags_used='#fitness #yoga').one()
+    item.hashtags_used = '#travel #yoga'
+    db.session.commit()
+    posts('#travel #yoga', 9.0)
+    assert stats.top(1)[0]['uses'] == 3
+    assert stats.suggest(['#travel'], 'fitness', 1) == ['#yoga']
+    assert stats.score('#yoga', 'fitness') == {'score': 34.6, 'uses': 2, 'engagement_rate': 5.0,
+                                               'trending': False}
+    assert stats.score('hyrox', 'fitness')['trending'] is True
+
+
+def test_edits_apply_at_once_and_deletes_at_the_next_rebuild(posts, clock):
+    stats = HashtagStats(rebuild_seconds=60, clock=clock)
+    assert stats.score('#gym', 'fitness')['uses'] == 3
+
+    # Clearing a post's tags takes them and their pairs back out without a rebuild
+    for item in ContentManager.query.filter_by(hashtags_used='#fitness #gym #legday').limit(2):
+        item.hashtags_used = ''
+    db.session.commit()
+    assert stats.score('#gym', 'fitness')['uses'] == 1
+    assert stats.top(1) == [{'hashtag': '#fitness', 'uses': 2, 'engagement_rate': 4.5}]
+
+    # Deleted content leaves no edit behind: its tags stay until the full rebuild
+    travel = ContentManager.query.filter_by(hashtags_used='#travel').one()
+    db.session.delete(travel)
+    db.session.commit()
+    assert stats.score('#travel', 'fitness')['uses'] == 1
+    clock.now = 61
+    assert stats.score('#travel', 'fitness')['uses'] == 0
+    assert '#travel' not in {row['hashtag'] for row in stats.top(10)}
+    assert stats.suggest(['#gym'], 'fitness', 2) == ['#fitness', '#legday']
+
+
+def test_endpoint_uses_the_statistics(client, posts):
+    body = client.post('/api/analytics/hashtag-analysis',
+                       json={'hashtags': ['#gym', '#unknown'], 'niche': 'fitness'}).get_json()
+    assert body['trending_hashtags'][0] == '#hyrox'
+    assert body['suggested_hashtags'][:2] == ['#fitness', '#legday']
+    assert body['hashtag_scores']['#gym'] > body['hashtag_scores']['#unknown'] == 0
+    assert body['hashtag_stats']['#gym'] == {'uses': 3, 'engagement_rate': 8.0, 'trending': False}
+    assert body['top_hashtags'][0]['hashtag'] == '#fitness'
+
+
+def test_endpoint_falls_back_without_data(client):
+    body = client.post('/api/analytics/hashtag-analysis', json={'hashtags': ['#gym'], 'niche': 'art'}).get_json()
+    assert body['suggested_hashtags'] == ['#arttips', '#artinspiration', '#artcommunity']
+    assert body['trending_hashtags'] == [] and body['hashtag_scores'] == {'#gym': 0.0}
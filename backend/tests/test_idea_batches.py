@@ -0,0 +1,143 @@
+import json
+import time
+
+import httpx
+import pytest
+from anthropic import Anthropic
+from sqlalchemy.orm.attributes import set_committed_value
+
+from ai_context import bulk_ideas_contexts
+from claude_service import ClaudeService
+from idea_batches import IdeaBatchRunner, LocalBatches
+from models import db, ContentIdea, ContentPillar, IdeaBatch, Platform, Profile
+from resilience import Resilience
+from versioning import get_versions
+
+IDEAS = [
+    {'title': 'Decorators in 60 seconds', 'description': 'Quick tour', 'content_type': 'reel',
+     'hook': 'You use these daily', 'priority': 'HIGH'},
+    {'title': 'Generators explained', 'description': 'Lazy iteration', 'priority': 'urgent'},
+    {'description': 'no title, skipped'}
+]
+
+
+class BatchUpstream:
+    """Messages API stand-in behind LocalBatches; fails requests for pillars named in fail_pillars"""
+
+    def __init__(self, fail_pillars=()):
+        self.fail_pillars = fail_pillars
+        self.sent = []
+
+    def handler(self, request):
+        body = json.loads(request.content)
+        self.sent.append(body)
+        if any(f'"{name}"' in body['system'][0]['text'] for name in self.fail_pillars):
+            return httpx.Response(400, json={'type': 'error', 'error': {'type': 'invalid_request_error',
+                                                                        'message': 'bad'}})
+        return httpx.Response(200, json={
+            'id': 'msg_test', 'type': 'message', 'role': 'assistant', 'model': body['model'],
+            'content': [{'type': 'text', 'text': json.dumps(IDEAS)}], 'stop_reason': 'end_turn',
+            'stop_sequence': None, 'usage': {'input_tokens': 10, 'output_tokens': 5}
+        })
+
+    def runner(self):
+        client = Anthropic(api_key='test', max_retries=0,
+                           http_client=httpx.Client(transport=httpx.MockTransport(self.handler)))
+        service = ClaudeService('test', client=client, resilience=Resilience(max_retries=0))
+        return IdeaBatchRunner(service, LocalBatches(client))
+
+
+@pytest.fixture
+def pillars(app):
+    db.session.add(Profile(target_audience='developers'))
+    db.session.add_all([ContentPillar(pillar_name='Tutorials'), ContentPillar(pillar_name='Career')])
+    db.session.add_all([Platform(platform_name='instagram'), Platform(platform_name='tiktok')])
+    db.session.commit()
+    return ContentPillar.query.order_by(ContentPillar.id).all()
+
+
+def wait_for(runner, job, timeout=5.0):
+    deadline = time.monotonic() + timeout
+    while runner.poll(job).status == 'in_progress':
+        assert time.monotonic() < deadline, 'batch did not finish'
+        time.sleep(0.01)
+    return job
+
+
+def contexts(per_platform=False):
+    return bulk_ideas_contexts({'per_platform': per_platform})
+
+
+def test_one_request_per_pillar_and_platform(pillars):
+    upstream = BatchUpstream()
+    runner = upstream.runner()
+    job = wait_for(runner, runner.submit(contexts(per_platform=True)))
+
+    assert job.request_count == 4
+    assert len(upstream.sent) == 4
+    # Pillar prefixes this short are under the minimum cacheable length, so they carry no breakpoint
+    assert not any('cache_control' in request['system'][0] for request in upstream.sent)
+    assert any('Tailor every idea to tiktok' in request['messages'][0]['content'] for request in upstream.sent)
+    assert set(json.loads(job.requests)) == {
+        f'pillar-{pillar.id}-{platform}' for pillar in pillars for platform in ('instagram', 'tiktok')
+    }
+
+    # Two valid ideas per reply; the untitled one is dropped
+    assert (job.status, job.ideas_created) == ('completed', 8)
+    ideas = ContentIdea.query.filter_by(content_pillar_id=pillars[0].id).order_by(ContentIdea.id).all()
+    assert len(ideas) == 4
+    assert ideas[0].priority == 'high'
+    assert ideas[1].priority == 'medium'
+    assert 'Hook: You use these daily' in ideas[0].description
+    assert 'Platform: instagram' in ideas[0].description
+
+
+def test_failed_requests_are_recorded_and_the_rest_imported(pillars):
+    upstream = BatchUpstream(fail_pillars=['Career'])
+    runner = upstream.runner()
+    job = wait_for(runner, runner.submit(contexts()))
+
+    assert (job.status, job.ideas_created) == ('completed', 2)
+    assert list(job.to_dict()['errors']) == [f'pillar-{pillars[1].id}']
+    assert ContentIdea.query.count() == 2
+
+
+def test_a_batch_is_imported_once(pillars):
+    runner = BatchUpstream().runner()
+    job = wait_for(runner, runner.submit(contexts()))
+    # A second poller that loaded the job before the first one committed
+    set_committed_value(job, 'status', 'in_progress')
+    runner.poll(job)
+    assert ContentIdea.query.count() == 4
+
+
+def test_bulk_insert_bumps_content_ideas_version(pillars):
+    before = get_versions(['content_ideas'])['content_ideas']
+    runner = BatchUpstream().runner()
+    wait_for(runner, runner.submit(contexts()))
+    assert get_versions(['content_ideas'])['content_ideas'] > before
+
+
+def test_batch_endpoints(app, client, pillars, monkeypatch):
+    runner = BatchUpstream().runner()
+    # The in-memory test database is per-thread, so poll through GET instead of a background thread
+    monkeypatch.setattr(runner, 'start_polling', lambda app, job_id: None)
+    app.extensions['idea_batches'] = runner
+
+    response = client.post('/api/idea-batches', json={'pillar_ids': [pillars[0].id]})
+    assert response.status_code == 202
+    job_id = response.get_json()['id']
+
+    deadline = time.monotonic() + 5
+    while (body := client.get(f'/api/idea-batches/{job_id}').get_json())['status'] == 'in_progress':
+        assert time.monotonic() < deadline
+        time.sleep(0.01)
+    assert body['ideas_created'] == 2
+    assert len(client.get('/api/content-ideas').get_json()) == 2
+
+
+def test_batch_endpoint_requires_pillars(app, client):
+    app.extensions['idea_batches'] = BatchUpstream().runner()
+    response = client.post('/api/idea-batches', json={})
+    assert response.status_code == 404
+    assert IdeaBatch.query.count() == 0
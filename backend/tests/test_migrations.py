@@ -0,0 +1,76 @@
+from datetime import date
+
+import pytest
+from flask_migrate import downgrade, upgrade
+from sqlalchemy import delete, inspect, select
+
+from models import db, Analytics, AnalyticsWeekly, ContentManager, Platform, TableVersion, TrendingTopic
+from versioning import get_versions
+
+
+def test_upgrade_keeps_tables_create_all_made(app):
+    upgrade()
+    assert inspect(db.engine).has_table('table_versions')
+
+
+def test_upgrade_creates_missing_table_versions(app):
+    TableVersion.__table__.drop(bind=db.engine)
+    upgrade()
+    assert inspect(db.engine).has_table('table_versions')
+
+
+def test_upgrade_adds_and_fills_content_totals(app):
+    db.session.add(Platform(platform_name='instagram'))
+    db.session.add_all([ContentManager(content_title='Rolled up'), ContentManager(content_title='Raw only'),
+                        ContentManager(content_title='Typed by hand', views=200, likes=10, saves=10)])
+    db.session.flush()
+    db.session.add_all([
+        Analytics(content_id=1, platform_id=1, date_recorded=date(2024, 3, 4), views=100, likes=5,
+                  retention_rate=0.4),
+        Analytics(content_id=1, platform_id=1, date_recorded=date(2024, 3, 12), views=300, likes=10, comments=5,
+                  retention_rate=0.6),
+        Analytics(content_id=2, platform_id=1, date_recorded=date(2024, 3, 4), views=50, shares=5)
+    ])
+    db.session.commit()
+    # Analytics written before the rollups existed have no weekly rows
+    db.session.execute(delete(AnalyticsWeekly).where(AnalyticsWeekly.content_id == 2))
+    db.session.commit()
+    upgrade()
+    downgrade(revision='3c1d7a52e027')
+    assert 'analytics_days' not in {column['name'] for column in inspect(db.engine).get_columns('content_manager')}
+
+    version = get_versions(['content_manager'])['content_manager']
+    upgrade()
+    assert get_versions(['content_manager'])['content_manager'] == version + 1
+    table = ContentManager.__table__
+    totals = db.session.execute(
+        select(table.c.views, table.c.likes, table.c.retention_rate, table.c.engagement_rate, table.c.analytics_days)
+        .order_by(table.c.id)
+    ).all()
+    assert [tuple(row) for row in totals] == [
+        (400, 15, pytest.approx(0.5), pytest.approx(5.0), 2),
+        (50, 0, 0.0, pytest.approx(10.0), 1),
+        (200, 10, 0.0, pytest.approx(10.0), 0)
+    ]
+
+
+def test_upgrade_adds_trend_momentum_and_snapshots(app):
+    db.session.add_all([TrendingTopic(topic='AI agents', trend_score=87.5, niche_category='tech'),
+                        TrendingTopic(topic='Overhyped', trend_score=140.0, niche_category='tech')])
+    db.session.commit()
+    upgrade()
+    downgrade(revision='7b2e4f91c044')
+    inspector = inspect(db.engine)
+    assert not inspector.has_table('trend_snapshots')
+    assert 'decayed_score' not in {column['name'] for column in inspector.get_columns('trending_topics')}
+
+    upgrade()
+    inspector = inspect(db.engine)
+    assert inspector.has_table('trend_snapshots')
+    assert 'ix_trend_snapshots_topic' in {index['name'] for index in inspector.get_indexes('trend_snapshots')}
+    assert 'ix_trending_topics_rank' in {index['name'] for index in inspector.get_indexes('trending_topics')}
+    table = TrendingTopic.__table__
+    # Topics rank by their last score until a snapshot starts their momentum
+    assert db.session.execute(
+        select(table.c.score_ewma, table.c.velocity, table.c.decayed_score).order_by(table.c.id)
+    ).all() == [(None, 0.0, 87.5), (None, 0.0, 100.0)]
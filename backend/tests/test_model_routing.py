@@ -0,0 +1,144 @@
+import json
+import logging
+
+import httpx
+from anthropic import Anthropic
+
+from claude_service import AsyncClaudeService, ClaudeService
+from config import Config
+from model_routing import ModelRouter
+from resilience import Resilience
+
+TIERS = {'quality': 'model-quality', 'balanced': 'model-balanced', 'fast': 'model-fast'}
+ORDER = ['quality', 'balanced', 'fast']
+ROUTES = {
+    'strategy': {'tier': 'quality', 'max_tokens': 2000, 'timeout': 90, 'slo_p95': 10},
+    'content_field': {'tier': 'balanced', 'max_tokens': 1000, 'slo_p95': 5},
+    'content_field.hook': {'tier': 'fast', 'max_tokens': 200, 'slo_p95': 2},
+    'default': {'tier': 'fast'}
+}
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+
+def router(**kwargs):
+    return ModelRouter(TIERS, ORDER, ROUTES, min_samples=5, **kwargs)
+
+
+def test_routes_by_task_then_family_then_default():
+    models = router()
+    assert models.route('strategy')[1:] == ('quality', 'model-quality', 2000, 90, False, None)
+    assert models.route('content_field.hook').max_tokens == 200
+    assert models.route('content_field.caption').tier == 'balanced'
+    assert models.route('weekly_plan').tier == 'fast'
+
+
+def test_p95_breach_degrades_to_a_faster_tier_until_cooldown(caplog):
+    clock = FakeClock()
+    models = router(cooldown=60, clock=clock)
+    for _ in range(5):
+        models.observe(models.route('strategy'), 12.0)
+
+    with caplog.at_level(logging.WARNING, logger='model_routing'):
+        models.observe(models.route('strategy'), 12.0)
+    assert 'exceeds SLO' in caplog.text
+
+    route = models.route('strategy')
+    assert (route.tier, route.model, route.degraded) == ('balanced', 'model-balanced', True)
+    assert route.max_tokens == 2000  # the task's budget is kept on the faster tier
+    assert models.snapshot()['strategy']['degraded'] is True
+
+    clock.now = 61
+    route = models.route('strategy')
+    assert (route.tier, route.degraded) == ('quality', False)
+    # The slow samples that tripped the SLO were discarded
+    models.observe(route, 1.0)
+    assert models.route('strategy').tier == 'quality'
+
+
+def test_fast_calls_and_fastest_tier_do_not_degrade():
+    models = router()
+    for _ in range(10):
+        models.observe(models.route('strategy'), 1.0)
+        models.observe(models.route('content_field.hook'), 30.0)
+    assert models.route('strategy').tier == 'quality'
+    assert models.route('content_field.hook').tier == 'fast'
+
+
+def test_snapshot_reports_routes_and_latency():
+    models = router()
+    models.observe(models.route('content_field.hook'), 0.5)
+    stats = models.snapshot()['content_field.hook']
+    assert stats['model'] == 'model-fast'
+    assert stats['routed'] == {'fast': 1}
+    assert stats['p95_ms'] == {'fast': 500.0}
+    assert stats['slo_p95_ms'] == 2000
+
+
+def test_service_sends_routed_model_and_budget():
+    sent = []
+
+    def handler(request):
+        sent.append(json.loads(request.content))
+        return httpx.Response(200, json={
+            'id': 'msg_test', 'type': 'message', 'role': 'assistant', 'model': 'model-fast',
+            'content': [{'type': 'text', 'text': '#reels'}], 'stop_reason': 'end_turn', 'stop_sequence': None,
+            'usage': {'input_tokens': 10, 'output_tokens': 5}
+        })
+
+    models = router()
+    client = Anthropic(api_key='test', http_client=httpx.Client(transport=httpx.MockTransport(handler)))
+    service = ClaudeService('test', client=client, resilience=Resilience(max_retries=0), router=models)
+    service.generate_content_field('hook', {}, {})
+    service.generate_content_strategy({}, [], [])
+    assert [(request['model'], request['max_tokens']) for request in sent] == [
+        ('model-fast', 200), ('model-quality', 2000)
+    ]
+    assert models.snapshot()['content_field.hook']['routed'] == {'fast': 1}
+
+
+def test_batch_params_use_the_home_tier_without_recording():
+    models = router()
+    service = ClaudeService('test', client=Anthropic(api_key='test'), router=models)
+    params = service.batch_params(service.ideas_call('Tutorials', 'developers', []))
+    assert params['model'] == 'model-fast'
+    assert 'timeout' not in params
+    assert models.snapshot() == {}
+
+
+def test_batch_params_ignore_a_degraded_route():
+    models = ModelRouter(TIERS, ORDER, {'ideas': {'tier': 'quality', 'slo_p95': 1}}, min_samples=5)
+    for _ in range(5):
+        models.observe(models.route('ideas'), 30.0)
+    assert models.route('ideas').degraded
+    routed = models.snapshot()['ideas']['routed']
+
+    service = ClaudeService('test', client=Anthropic(api_key='test'), router=models)
+    params = service.batch_params(service.ideas_call('Tutorials', 'developers', []))
+    assert params['model'] == 'model-quality'
+    assert models.snapshot()['ideas']['routed'] == routed
+
+
+def test_default_config_routes_every_task():
+    models = ModelRouter.from_config(vars(Config))
+    for task in ('strategy', 'ideas', 'optimize', 'analysis', 'weekly_plan', 'content_field.script',
+                 'content_field.caption', 'content_field.hashtags'):
+        assert models.route(task).model in Config.CLAUDE_MODEL_TIERS.values()
+
+
+def test_routing_stats_endpoint(client):
+    response = client.get('/api/stats/ai-routing')
+    assert response.status_code == 200
+    assert response.get_json() == {}
+
+
+def test_async_service_from_config_shares_the_router():
+    models = router()
+    service = AsyncClaudeService.from_config({**vars(Config), 'CLAUDE_API_KEY': 'test'}, router=models)
+    assert service.router is models
@@ -0,0 +1,72 @@
+from datetime import date, timedelta
+
+from sqlalchemy.dialects import postgresql
+from sqlalchemy.schema import CreateTable
+
+from models import db, Analytics, AnalyticsWeekly, ContentManager, Platform
+from partitions import add_months, ensure_ahead, month_range, partition_name
+from rollups import backfill, compact, week_start
+from versioning import get_versions
+
+TODAY = date(2024, 6, 12)
+
+
+class RecordingConnection:
+    """Stands in for a Postgres connection, keeping the DDL it is given"""
+
+    class dialect:
+        name = 'postgresql'
+
+    def __init__(self):
+        self.statements = []
+
+    def execute(self, statement, parameters=None):
+        self.statements.append(str(statement))
+
+
+def test_postgres_ddl_partitions_analytics_by_month():
+    ddl = str(CreateTable(Analytics.__table__).compile(dialect=postgresql.dialect()))
+    assert 'PARTITION BY RANGE (date_recorded)' in ddl
+    assert 'PRIMARY KEY (id, date_recorded)' in ddl
+    assert 'PRIMARY KEY (id)' in str(CreateTable(Platform.__table__).compile(dialect=postgresql.dialect()))
+
+    connection = RecordingConnection()
+    assert ensure_ahead(connection, 2, today=date(2024, 11, 30)) == [date(2024, 11, 1), date(2024, 12, 1),
+                                                                    date(2025, 1, 1)]
+    assert connection.statements[-1] == ("CREATE TABLE IF NOT EXISTS analytics_2025_01 PARTITION OF analytics "
+                                         "FOR VALUES FROM ('2025-01-01') TO ('2025-02-01')")
+
+
+def test_month_helpers():
+    assert add_months(date(2024, 12, 1), 1) == date(2025, 1, 1)
+    assert add_months(date(2024, 1, 1), -1) == date(2023, 12, 1)
+    assert month_range(date(2024, 1, 31), date(2024, 3, 1)) == [date(2024, 1, 1), date(2024, 2, 1), date(2024, 3, 1)]
+    assert partition_name(date(2024, 3, 1)) == 'analytics_2024_03'
+
+
+def test_compaction_keeps_old_weeks_in_the_rollups(app):
+    db.session.add(Platform(platform_name='instagram'))
+    db.session.add(ContentManager(content_title='Decorators'))
+    db.session.flush()
+    for day in range(60):
+        db.session.add(Analytics(content_id=1, platform_id=1, date_recorded=TODAY - timedelta(days=day), views=10))
+    db.session.commit()
+    weeks = {row.week_start: row.views for row in AnalyticsWeekly.query}
+    version = get_versions(['analytics'])['analytics']
+
+    cutoff, removed = compact(30, today=TODAY)
+    assert cutoff == week_start(TODAY - timedelta(days=30))
+    assert removed == (cutoff - (TODAY - timedelta(days=59))).days
+    assert db.session.query(db.func.min(Analytics.date_recorded)).scalar() == cutoff
+    assert get_versions(['analytics'])['analytics'] > version
+
+    db.session.expire_all()
+    assert {row.week_start: row.views for row in AnalyticsWeekly.query} == weeks
+    # A later backfill starts after the compacted weeks instead of erasing them
+    backfill()
+    db.session.expire_all()
+    assert {row.week_start: row.views for row in AnalyticsWeekly.query} == weeks
+
+    assert compact(30, today=TODAY)[1] == 0
+    result = app.test_cli_runner().invoke(args=['rollups', 'compact', '--older-than-days', '7'])
+    assert 'rows removed' in result.output
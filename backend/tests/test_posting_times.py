@@ -0,0 +1,105 @@
+from datetime import date, datetime, timedelta
+
+import numpy as np
+import pytest
+
+from models import db, Analytics, ContentManager
+from posting_times import BINS, PostingTimes, hour_of_week, smooth
+
+MONDAY = datetime(2024, 1, 1)  # A Monday
+
+
+def test_hour_of_week_bins():
+    moments = np.array([MONDAY, MONDAY + timedelta(days=1, hours=18, minutes=59), MONDAY - timedelta(minutes=1)],
+                       dtype='datetime64[m]')
+    assert hour_of_week(moments).tolist() == [0, 24 + 18, BINS - 1]
+
+
+def test_smoothing_wraps_around_the_week_and_shrinks_to_the_mean():
+    sums, counts = np.zeros(BINS), np.zeros(BINS)
+    sums[BINS - 1], counts[BINS - 1] = 20.0, 1
+    sums[84], counts[84] = 2.0, 1
+    means = smooth(sums, counts)[0]
+    assert means[BINS - 1] > means[0] > means[84]
+    # Far from any post, hours fall back to the overall mean
+    assert means[40] == pytest.approx(11.0)
+
+
+@pytest.fixture
+def posts(platforms, make_content, record_analytics):
+    def publish(at, engagement, content_type='short_form', platform_id=1):
+        item = make_content(f'Post {at}', content_type=content_type, publish_time=at, status='published')
+        record_analytics(item.id, date(2024, 1, 20), 100, platform_id=platform_id, likes=engagement)
+        return item
+
+    for week in range(3):
+        publish(MONDAY + timedelta(weeks=week, days=1, hours=18), 12)  # Tuesdays 18:00
+        publish(MONDAY + timedelta(weeks=week, hours=9), 2)  # Mondays 09:00
+    return publish
+
+
+def test_learns_and_updates_incrementally(posts):
+    engine = PostingTimes(min_posts=3, rebuild_seconds=float('inf'))
+    learned = engine.best_windows(1, 'short_form', top=1)
+    assert (learned['platform_id'], learned['content_type'], learned['posts']) == (1, 'short_form', 6)
+    assert learned['windows'][0]['weekday'] == 'Tuesday' and learned['windows'][0]['hour'] == 18
+
+    # New posts are binned without a rebuild
+    for week in range(4):
+        posts(MONDAY + timedelta(weeks=week, days=4, hours=20), 40)
+    learned = engine.best_windows(1, 'short_form', top=1)
+    assert learned['posts'] == 10
+    assert (learned['windows'][0]['weekday'], learned['windows'][0]['hour']) == ('Friday', 20)
+
+    # Moving a post moves its contribution
+    item = ContentManager.query.filter_by(publish_time=MONDAY + timedelta(days=4, hours=20)).one()
+    item.publish_time = MONDAY + timedelta(days=6, hours=7)
+    db.session.commit()
+    heatmap = engine.heatmap(1, 'short_form')
+    assert heatmap['posts'] == 10 and heatmap['weekdays'][6] == 40.0
+
+    # Too few tiktok carousels: fall back to the broadest histogram with enough posts
+    posts(MONDAY, 5, content_type='carousel', platform_id=2)
+    assert engine.best_windows(2, 'carousel')['platform_id'] is None
+
+
+def test_full_rebuild_picks_up_analytics_edits_and_deletes(posts, clock):
+    engine = PostingTimes(min_posts=3, rebuild_seconds=60, clock=clock)
+    assert engine.heatmap(1, 'short_form')['posts'] == 6
+
+    tuesdays = [item.id for item in ContentManager.query if item.publish_time.hour == 18]
+    for row in Analytics.query.filter(Analytics.content_id.in_(tuesdays)):
+        row.likes = 0
+    monday = ContentManager.query.filter_by(publish_time=MONDAY + timedelta(hours=9)).one()
+    Analytics.query.filter_by(content_id=monday.id).delete()
+    db.session.delete(monday)
+    db.session.commit()
+
+    # Neither leaves a new analytics row or a content edit behind, so only the rebuild sees them
+    assert engine.best_windows(1, 'short_form', top=1)['windows'][0]['hour'] == 18
+    clock.now = 61
+    learned = engine.best_windows(1, 'short_form', top=1)
+    assert learned['posts'] == 5
+    assert (learned['windows'][0]['weekday'], learned['windows'][0]['hour']) == ('Monday', 9)
+
+    assert engine.heatmap(1, 'short_form')['weekdays'][1] == 0.0
+    # Until the next rebuild, new posts are binned incrementally again
+    clock.now = 100
+    posts(MONDAY + timedelta(hours=9), 30)
+    assert engine.heatmap(1, 'short_form')['posts'] == 6
+
+
+def test_prediction_uses_learned_windows(client, posts):
+    for week in range(3):
+        posts(MONDAY + timedelta(weeks=week, days=1, hours=18), 15)
+    prediction = client.post('/api/analytics/performance-prediction', json={'content_id': 1}).get_json()
+    assert prediction['optimal_posting_time'] == 'Tuesday 18:00-19:00'
+    assert prediction['optimal_posting_windows'][0]['hour'] == 18
+
+    body = client.get('/api/analytics/posting-times?platform_id=1').get_json()
+    assert len(body['heatmap']['hours']) == 7 and len(body['heatmap']['hours'][0]) == 24
+    assert client.get('/api/analytics/posting-times?platform_id=2&content_type=story').status_code == 200
+
+    insights = client.get('/api/analytics/niche-insights?niche=tech').get_json()
+    pattern = next(i for i in insights if i['type'] == 'performance_pattern')
+    assert pattern['description'].startswith('Your content published on Tuesday')
@@ -0,0 +1,128 @@
+import json
+
+import httpx
+from anthropic import Anthropic
+
+from claude_service import ClaudeService
+from prompt_cache import PrefixRegistry, prefix_hash, system_blocks
+from resilience import Resilience
+
+PROFILE = {'mission': 'teach Python', 'target_audience': 'junior developers', 'niche': 'programming',
+           # Long enough for a cacheable prefix on Haiku (2048 tokens)
+           'stories': 'Started as a self-taught developer and now mentors bootcamp grads. ' * 130}
+SHORT_PROFILE = {'mission': 'teach Python', 'target_audience': 'junior developers'}
+PILLAR = {'name': 'Tutorials', 'description': 'Step-by-step guides'}
+
+
+class CachingUpstream:
+    """Messages API stand-in that checks cache breakpoints and reports cache reads for repeated prefixes"""
+
+    def __init__(self):
+        self.sent = []
+        self._seen = set()
+
+    def handler(self, request):
+        body = json.loads(request.content)
+        self.sent.append(body)
+        system = body.get('system') or []
+        breakpoints = [block for block in system if 'cache_control' in block]
+        assert len(breakpoints) <= 4  # the API rejects more
+        prefix = json.dumps([body['model'], system], sort_keys=True)
+        cached = prefix in self._seen
+        self._seen.add(prefix)
+        return httpx.Response(200, json={
+            'id': 'msg_test', 'type': 'message', 'role': 'assistant', 'model': body['model'],
+            'content': [{'type': 'text', 'text': '{"ok": true}'}], 'stop_reason': 'end_turn', 'stop_sequence': None,
+            'usage': {'input_tokens': 20, 'output_tokens': 5,
+                      'cache_read_input_tokens': 1500 if cached and breakpoints else 0,
+                      'cache_creation_input_tokens': 0 if cached or not breakpoints else 1500}
+        })
+
+    def service(self, prefixes=None):
+        client = Anthropic(api_key='test', http_client=httpx.Client(transport=httpx.MockTransport(self.handler)))
+        return ClaudeService('test', client=client, resilience=Resilience(max_retries=0), prefixes=prefixes)
+
+
+def test_profile_context_is_sent_as_a_cached_system_prefix():
+    upstream = CachingUpstream()
+    service = upstream.service()
+    service.generate_content_field('hook', {'content_title': 'Python decorators'}, PROFILE, PILLAR)
+    request = upstream.sent[0]
+    assert request['system'][0]['cache_control'] == {'type': 'ephemeral'}
+    assert 'junior developers' in request['system'][0]['text']
+    assert 'Step-by-step guides' in request['system'][0]['text']
+    # The variable part stays in the user turn, and the profile stays out of it
+    assert 'Python decorators' in request['messages'][0]['content']
+    assert 'junior developers' not in request['messages'][0]['content']
+
+
+def test_short_prefixes_get_no_breakpoint_and_are_not_registered():
+    upstream = CachingUpstream()
+    prefixes = PrefixRegistry()
+    upstream.service(prefixes).generate_content_field('hook', {}, SHORT_PROFILE)
+    assert 'cache_control' not in upstream.sent[0]['system'][0]
+    assert prefixes.snapshot()['requests'] == 0
+
+    # The tools before the system prompt count towards the prefix; the minimum depends on the model
+    system = 'x' * 5000
+    assert 'cache_control' not in system_blocks(system, 'claude-3-haiku-20240307')[0]
+    assert 'cache_control' in system_blocks(system, 'claude-sonnet-4-20250514')[0]
+    tools = [{'name': 'reply', 'description': 'y' * 4000, 'input_schema': {}}]
+    assert 'cache_control' in system_blocks(system, 'claude-3-haiku-20240307', tools)[0]
+
+
+def test_field_types_for_one_creator_share_a_prefix():
+    upstream = CachingUpstream()
+    for field_type in ('hook', 'script', 'hashtags', 'tone'):
+        upstream.service().generate_content_field(field_type, {}, PROFILE, PILLAR)
+    assert len({json.dumps(request['system']) for request in upstream.sent}) == 1
+
+
+def test_calls_without_stable_context_have_no_system_prompt():
+    upstream = CachingUpstream()
+    upstream.service().optimize_content({'title': 'x'}, 'instagram', [])
+    assert 'system' not in upstream.sent[0]
+
+
+def test_registry_counts_repeats_and_cache_tokens():
+    upstream = CachingUpstream()
+    prefixes = PrefixRegistry()
+    service = upstream.service(prefixes)
+    service.generate_content_field('hook', {'content_title': 'one'}, PROFILE, PILLAR)
+    service.generate_content_field('script', {'content_title': 'two'}, PROFILE, PILLAR)
+    service.generate_content_field('hook', {}, {**PROFILE, 'niche': 'cooking'}, PILLAR)
+    service.optimize_content({}, 'instagram', [])
+
+    stats = prefixes.snapshot()
+    assert (stats['requests'], stats['distinct_prefixes']) == (3, 2)
+    assert stats['repeat_rate'] == round(1 / 3, 3)
+    assert stats['cache_read_tokens'] == 1500
+    assert stats['cache_write_tokens'] == 3000
+    top = stats['prefixes'][0]
+    assert (top['task'], top['sends'], top['repeats_within_ttl']) == ('content_field.hook', 2, 1)
+
+
+def test_repeats_outside_the_cache_ttl_are_not_counted():
+    now = [0.0]
+    prefixes = PrefixRegistry(ttl=300, clock=lambda: now[0])
+    request = {'model': 'm', 'system': [{'type': 'text', 'text': 'profile', 'cache_control': {'type': 'ephemeral'}}]}
+    prefixes.record('strategy', request)
+    now[0] = 301
+    prefixes.record('strategy', request)
+    assert prefixes.snapshot()['repeat_rate'] == 0.0
+    assert prefix_hash(request) != prefix_hash({**request, 'model': 'other'})
+    assert prefix_hash(request) != prefix_hash({**request, 'tools': [{'name': 'reply'}]})
+
+
+def test_registry_is_bounded():
+    prefixes = PrefixRegistry(max_entries=2)
+    for index in range(3):
+        prefixes.record('strategy', {'model': 'm', 'system': [{'type': 'text', 'text': str(index),
+                                                              'cache_control': {'type': 'ephemeral'}}]})
+    assert prefixes.snapshot()['distinct_prefixes'] == 2
+
+
+def test_prompt_prefix_stats_endpoint(client):
+    response = client.get('/api/stats/prompt-prefixes')
+    assert response.status_code == 200
+    assert response.get_json()['requests'] == 0
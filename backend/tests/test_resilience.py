@@ -0,0 +1,188 @@
+import asyncio
+import json
+import threading
+import time
+
+import httpx
+import pytest
+from anthropic import Anthropic, AsyncAnthropic
+
+from claude_service import AsyncClaudeService, ClaudeService
+from resilience import CircuitBreaker, CircuitOpenError, Resilience
+
+FIELD_ARGS = ('hook', {'content_title': 'Morning routine'}, {'mission': 'teach'})
+
+
+def message(text):
+    return {
+        'id': 'msg_test', 'type': 'message', 'role': 'assistant', 'model': 'claude-3-haiku-20240307',
+        'content': [{'type': 'text', 'text': text}], 'stop_reason': 'end_turn', 'stop_sequence': None,
+        'usage': {'input_tokens': 10, 'output_tokens': 5}
+    }
+
+
+class FaultyUpstream:
+    """
+    Fault-injecting stand-in for the Messages API.
+
+    Each request consumes the next scripted fault: an HTTP status (with
+    optional headers), a transport exception, or a delay in seconds before a
+    normal reply. Once the script runs out, every request succeeds.
+    """
+
+    def __init__(self, *faults):
+        self.faults = list(faults)
+        self.calls = 0
+        self._lock = threading.Lock()
+
+    def _next(self):
+        with self._lock:
+            self.calls += 1
+            return self.faults.pop(0) if self.faults else None
+
+    def _reply(self, fault, request):
+        if isinstance(fault, Exception):
+            raise fault
+        if isinstance(fault, tuple):
+            status, headers = fault
+            return httpx.Response(status, headers=headers, json={'type': 'error', 'error': {'type': 'overloaded_error'}})
+        return httpx.Response(200, json=message('hook text'))
+
+    def handler(self, request):
+        fault = self._next()
+        if isinstance(fault, float):
+            time.sleep(fault)
+        return self._reply(fault, request)
+
+    async def async_handler(self, request):
+        fault = self._next()
+        if isinstance(fault, float):
+            await asyncio.sleep(fault)
+        return self._reply(fault, request)
+
+    def service(self, resilience):
+        client = Anthropic(api_key='test', max_retries=0,
+                           http_client=httpx.Client(transport=httpx.MockTransport(self.handler)))
+        return ClaudeService('test', client=client, resilience=resilience)
+
+    def async_service(self, resilience):
+        client = AsyncAnthropic(api_key='test', max_retries=0,
+                                http_client=httpx.AsyncClient(transport=httpx.MockTransport(self.async_handler)))
+        return AsyncClaudeService('test', client=client, resilience=resilience)
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+
+def resilience(**kwargs):
+    sleeps = []
+    kwargs.setdefault('sleep', sleeps.append)
+    return Resilience(**kwargs), sleeps
+
+
+def test_retries_rate_limits_and_overload_honouring_retry_after():
+    upstream = FaultyUpstream((429, {'retry-after': '2'}), (529, {'retry-after-ms': '250'}), (500, {}))
+    policy, sleeps = resilience(backoff_base=0.1, backoff_max=0.4)
+    result = upstream.service(policy).generate_content_field(*FIELD_ARGS)
+    assert result == {'success': True, 'content': 'hook text', 'field_type': 'hook'}
+    assert upstream.calls == 4
+    assert sleeps[:2] == [2.0, 0.25]
+    assert 0 <= sleeps[2] <= 0.4  # jittered backoff
+    assert policy.breaker.state == CircuitBreaker.CLOSED
+
+
+def test_timeouts_are_retried_and_surface_as_error_results():
+    upstream = FaultyUpstream(*[httpx.ReadTimeout('timed out')] * 3)
+    policy, sleeps = resilience(max_retries=2)
+    result = upstream.service(policy).generate_content_field(*FIELD_ARGS)
+    assert result['success'] is False
+    assert 'timed out' in result['error']
+    assert upstream.calls == 3
+    assert len(sleeps) == 2
+
+
+def test_client_errors_and_long_retry_after_are_not_retried():
+    upstream = FaultyUpstream((400, {}), (429, {'retry-after': '120'}))
+    policy, sleeps = resilience()
+    service = upstream.service(policy)
+    assert 'error' in service.optimize_content({}, 'instagram', [])
+    assert 'error' in service.optimize_content({}, 'instagram', [])
+    assert upstream.calls == 2
+    assert sleeps == []
+
+
+def test_breaker_fails_fast_then_half_opens():
+    clock = FakeClock()
+    upstream = FaultyUpstream(*[(503, {})] * 3)
+    policy, _ = resilience(max_retries=0, breaker=CircuitBreaker(failure_threshold=3, reset_timeout=30, clock=clock))
+    service = upstream.service(policy)
+
+    for _ in range(3):
+        service.analyze_performance([], ['instagram'])
+    assert policy.breaker.state == CircuitBreaker.OPEN
+
+    result = service.analyze_performance([], ['instagram'])
+    assert 'unavailable' in result['error']
+    assert upstream.calls == 3  # the open circuit did not call upstream
+
+    clock.now = 31
+    assert service.analyze_performance([], ['instagram']) == {'analysis': 'hook text'}
+    assert policy.breaker.state == CircuitBreaker.CLOSED
+
+
+def test_half_open_allows_a_single_trial_call():
+    clock = FakeClock()
+    breaker = CircuitBreaker(failure_threshold=1, reset_timeout=10, clock=clock)
+    breaker.record_failure()
+    clock.now = 11
+    breaker.before_call()
+    with pytest.raises(CircuitOpenError):
+        breaker.before_call()
+    breaker.record_failure()
+    assert breaker.state == CircuitBreaker.OPEN
+
+
+def test_hedged_field_generation_races_a_slow_request():
+    upstream = FaultyUpstream(1.0)
+    policy, _ = resilience(hedge_after=0.05)
+    started = time.perf_counter()
+    assert upstream.service(policy).generate_content_field(*FIELD_ARGS)['success'] is True
+    assert time.perf_counter() - started < 0.8
+    assert upstream.calls == 2
+
+
+def test_long_generations_are_not_hedged():
+    upstream = FaultyUpstream(0.2)
+    policy, _ = resilience(hedge_after=0.05)
+    upstream.service(policy).analyze_performance([], ['instagram'])
+    assert upstream.calls == 1
+
+
+def test_async_service_retries_and_hedges():
+    upstream = FaultyUpstream((529, {'retry-after': '0'}), 1.0)
+    sleeps = []
+
+    async def record_sleep(seconds):
+        sleeps.append(seconds)
+
+    policy = Resilience(hedge_after=0.05, async_sleep=record_sleep)
+    service = upstream.async_service(policy)
+    started = time.perf_counter()
+    result = asyncio.run(service.generate_content_field(*FIELD_ARGS))
+    assert result['content'] == 'hook text'
+    assert sleeps == [0.0]
+    assert upstream.calls == 3  # overloaded, then a slow attempt raced by its hedge
+    assert time.perf_counter() - started < 0.8
+
+
+def test_from_config_builds_policy():
+    policy = Resilience.from_config({'CLAUDE_MAX_RETRIES': 1, 'CLAUDE_HEDGE_AFTER_MS': 1500,
+                                     'CLAUDE_BREAKER_THRESHOLD': 2})
+    assert policy.max_retries == 1
+    assert policy.hedge_after == 1.5
+    assert policy.breaker.failure_threshold == 2
@@ -0,0 +1,112 @@
+from datetime import date, timedelta
+
+import pytest
+from sqlalchemy import insert
+
+from ai_context import ideas_context, optimize_context
+from models import db, Analytics, AnalyticsWeekly, ContentManager, ContentPillar, PillarAnalyticsWeekly, Platform
+from rollups import backfill, week_start
+
+MONDAY = week_start(date.today()) - timedelta(weeks=1)
+
+
+@pytest.fixture
+def content(app):
+    db.session.add_all([ContentPillar(pillar_name='Tutorials'), ContentPillar(pillar_name='Career')])
+    db.session.add_all([Platform(platform_name='instagram'), Platform(platform_name='tiktok')])
+    db.session.flush()
+    db.session.add_all([ContentManager(content_title='Decorators', content_pillar_id=1),
+                        ContentManager(content_title='Interviews', content_pillar_id=2)])
+    db.session.commit()
+
+
+def record(client, content_id, day, views, engagement_rate=0.0, platform_id=1):
+    response = client.post('/api/analytics', json={
+        'content_id': content_id, 'platform_id': platform_id, 'date_recorded': day.isoformat(),
+        'views': views, 'likes': views // 10, 'engagement_rate': engagement_rate
+    })
+    assert response.status_code == 201
+    return response.get_json()['id']
+
+
+def weekly(model=AnalyticsWeekly):
+    key = 'content_id' if model is AnalyticsWeekly else 'pillar_id'
+    return {(getattr(row, key), row.platform_id, row.week_start): (row.views, row.likes, row.days)
+            for row in model.query}
+
+
+def test_ingest_updates_both_rollups(client, content):
+    record(client, 1, MONDAY, 100, 4.0)
+    record(client, 1, MONDAY + timedelta(days=6), 50, 2.0)
+    record(client, 1, MONDAY + timedelta(days=7), 10)
+    record(client, 2, MONDAY, 30, platform_id=2)
+
+    next_week = MONDAY + timedelta(weeks=1)
+    assert weekly() == {(1, 1, MONDAY): (150, 15, 2), (1, 1, next_week): (10, 1, 1), (2, 2, MONDAY): (30, 3, 1)}
+    assert weekly(PillarAnalyticsWeekly) == {
+        (1, 1, MONDAY): (150, 15, 2), (1, 1, next_week): (10, 1, 1), (2, 2, MONDAY): (30, 3, 1)
+    }
+    row = client.get('/api/analytics?days=14&granularity=week').get_json()[0]
+    assert (row['content_id'], row['views'], row['engagement_rate']) == (1, 150, 3.0)
+
+
+def test_edits_deletes_and_pillar_moves(client, content):
+    first = record(client, 1, MONDAY, 100)
+    second = record(client, 1, MONDAY + timedelta(days=1), 20)
+
+    db.session.get(Analytics, first).views = 70
+    db.session.commit()
+    assert weekly()[(1, 1, MONDAY)] == (90, 12, 2)
+
+    db.session.delete(db.session.get(Analytics, second))
+    db.session.commit()
+    assert weekly()[(1, 1, MONDAY)] == (70, 10, 1)
+
+    # Moving content to another pillar carries its weekly totals, including rows added in the same flush
+    db.session.get(ContentManager, 1).content_pillar_id = 2
+    db.session.add(Analytics(content_id=1, platform_id=1, date_recorded=MONDAY, views=5))
+    db.session.commit()
+    assert weekly(PillarAnalyticsWeekly) == {(2, 1, MONDAY): (75, 10, 2)}
+
+    db.session.delete(db.session.get(Analytics, first))
+    db.session.commit()
+    assert weekly()[(1, 1, MONDAY)] == (5, 0, 1)
+
+
+def test_bulk_insert_is_rolled_up(content):
+    db.session.execute(insert(Analytics), [
+        {'content_id': 2, 'platform_id': 1, 'date_recorded': MONDAY, 'views': 7},
+        {'content_id': 2, 'platform_id': 1, 'date_recorded': MONDAY + timedelta(days=2), 'views': 3}
+    ])
+    db.session.commit()
+    assert weekly() == {(2, 1, MONDAY): (10, 0, 2)}
+    assert weekly(PillarAnalyticsWeekly) == {(2, 1, MONDAY): (10, 0, 2)}
+
+
+def test_backfill_rebuilds_what_ingest_maintains(app, client, content):
+    for offset in range(0, 40, 3):
+        record(client, 1 + offset % 2, MONDAY - timedelta(days=offset), 10 + offset, 1.5, platform_id=1 + offset % 2)
+    incremental = (weekly(), weekly(PillarAnalyticsWeekly))
+
+    AnalyticsWeekly.query.delete()
+    PillarAnalyticsWeekly.query.delete()
+    db.session.commit()
+    assert backfill(chunk_weeks=2) >= 6
+    db.session.expire_all()
+    assert (weekly(), weekly(PillarAnalyticsWeekly)) == incremental
+
+    # The CLI runs the same backfill
+    result = app.test_cli_runner().invoke(args=['rollups', 'backfill', '--since', MONDAY.isoformat()])
+    assert 'Rebuilt 1 weeks' in result.output
+    db.session.expire_all()
+    assert weekly() == incremental[0]
+
+
+def test_ai_contexts_read_rollups(client, content):
+    record(client, 1, date.today(), 100, 4.0)
+    record(client, 1, date.today(), 50, 2.0)
+
+    performance = ideas_context({'pillar_id': 1})['recent_performance']
+    assert [(p['pillar_id'], p['views'], p['engagement_rate']) for p in performance] == [(1, 150, 3.0)]
+    analytics = optimize_context({'content_id': 1, 'platform': 'instagram'})['analytics']
+    assert [(a['content_id'], a['views'], a['days']) for a in analytics] == [(1, 150, 2)]
@@ -0,0 +1,111 @@
+from datetime import date, datetime, time
+
+import pytest
+from flask.json.provider import DefaultJSONProvider
+
+from json_provider import OrjsonProvider, StdlibJSONProvider, orjson
+from models import (Platform, Profile, ContentPillar, ContentIdea, ContentManager, Task, ContentSubtask,
+                    Analytics, TrendingTopic, ContentPerformanceAnalysis, CompetitorAnalysis, NicheInsights,
+                    TableVersion, serializer)
+
+NOW = datetime(2025, 3, 14, 9, 26, 53, 589793)
+
+PROVIDERS = [StdlibJSONProvider]
+if orjson is not None:
+    PROVIDERS.append(OrjsonProvider)
+
+
+def sample_instances():
+    return [
+        Platform(id=1, platform_name='tiktok', current_followers=1200, goal_followers=10000,
+                 created_at=NOW, updated_at=NOW),
+        Profile(id=1, mission='Café culture 😀', goals='10k', vision='Community', niche='mens fashion',
+                target_audience='Men 20-35', stories='', motivation=None, created_at=NOW, updated_at=NOW),
+        ContentPillar(id=1, pillar_name='Style', description='Outfits', keywords='style', target_audience='Men',
+                      content_frequency='3x/week', goals='Reach', color='#3B82F6', created_at=NOW, updated_at=NOW),
+        ContentIdea(id=1, title='Idea', description='Basics', content_pillar_id=1, inspiration_link='',
+                    priority='high', status='pending', created_at=NOW, updated_at=NOW),
+        ContentManager(id=1, content_title='Naïve outfit', status='published', content_type='short_form',
+                       publish_time=NOW, hook='Stop', caption='Caption', views=15320, likes=1204, shares=88,
+                       comments=73, saves=210, retention_rate=41.5, is_repurposed=False,
+                       created_at=NOW, updated_at=NOW),
+        Task(id=1, title='Film', description='', content_id=1, due_date=None, status='pending',
+             priority='medium', estimated_hours=1.5, created_at=NOW, updated_at=NOW),
+        ContentSubtask(id=1, content_id=1, task_title='Edit', status='pending', due_date=NOW,
+                       created_at=NOW, updated_at=NOW),
+        Analytics(id=1, content_id=1, platform_id=1, date_recorded=date(2025, 3, 1), views=900, likes=70,
+                  shares=4, comments=6, saves=12, retention_rate=38.2, engagement_rate=10.2, created_at=NOW),
+        TrendingTopic(id=1, topic='Thrift', hashtags='["#thrift"]', platforms='{"tiktok": {}}', trend_score=81.3,
+                      niche_category='fashion', volume_24h=10, engagement_rate=9.2, growth_rate=156.7,
+                      peak_time=None, is_active=True, created_at=NOW, updated_at=NOW),
+        ContentPerformanceAnalysis(id=1, content_id=1, analysis_date=NOW, performance_score=70.0,
+                                   engagement_score=95.0, viral_potential=55.0, trend_alignment=45.0,
+                                   best_performing_elements='[]', improvement_suggestions='["Add a hook"]',
+                                   similar_trending_content=None, optimal_post_time=time(18, 0),
+                                   predicted_reach=700),
+        CompetitorAnalysis(id=1, competitor_name='Creator', platform='tiktok', username='creator',
+                           niche_category='fashion', followers_count=10, avg_engagement_rate=6.7,
+                           post_frequency=0.5, best_content_types=None, trending_hashtags='["#fit"]',
+                           content_strategy='x', posting_patterns='{}', growth_rate=0.0,
+                           last_analyzed=NOW, created_at=NOW),
+        NicheInsights(id=1, niche_name='fashion', insight_type='trend', title='Insight', description='d',
+                      supporting_data=None, confidence_score=85.0, action_items='["Post"]', priority='high',
+                      status='active', expiry_date=None, created_at=NOW, updated_at=NOW),
+        TableVersion(table_name='tasks', version=3),
+    ]
+
+
+def legacy_dict(obj):
+    """What to_dict returned before dates were left to the JSON provider"""
+    return {key: value.isoformat() if isinstance(value, (datetime, date)) else value
+            for key, value in obj.to_dict().items()}
+
+
+@pytest.mark.parametrize('provider_class', PROVIDERS)
+@pytest.mark.parametrize('obj', sample_instances(), ids=lambda obj: type(obj).__name__)
+def test_to_dict_response_matches_legacy_isoformat_output(app, provider_class, obj):
+    app.debug = False
+    expected = DefaultJSONProvider(app).response([legacy_dict(obj)]).get_data()
+    actual = provider_class(app).response([obj.to_dict()]).get_data()
+    assert actual == expected
+
+
+@pytest.mark.parametrize('debug', [False, True])
+def test_providers_agree_on_edge_values(app, debug):
+    if orjson is None:
+        pytest.skip('orjson is not installed')
+    app.debug = debug
+    payload = {'nan': float('nan'), 'inf': float('inf'), 'text': 'Café 😀', 'when': NOW,
+               'day': date(2025, 1, 2), 'at': time(18, 0), 'nested': [{'b': 1, 'a': 2.5}], 'big': 2 ** 70}
+    stdlib_body = StdlibJSONProvider(app).response(payload).get_data()
+    fast_body = OrjsonProvider(app).response(payload).get_data()
+    assert stdlib_body == fast_body
+    assert b'"nan":null' in stdlib_body.replace(b' ', b'')
+    assert b'\\u00e9' in stdlib_body
+
+
+def test_dumps_matches_between_providers(app):
+    if orjson is None:
+        pytest.skip('orjson is not installed')
+    payload = {'a': 1.5, 'b': [1, 2], 'c': NOW}
+    assert StdlibJSONProvider(app).dumps(payload) == OrjsonProvider(app).dumps(payload)
+
+
+def test_single_field_serializer():
+    serialize = serializer('table_name')
+    assert serialize(TableVersion(table_name='tasks', version=1)) == {'table_name': 'tasks'}
+
+
+def test_orjson_escapes_non_ascii_in_one_pass(app, monkeypatch):
+    if orjson is None:
+        pytest.skip('orjson is not installed')
+    payload = {'caption': 'Naïve fit 😀🔥 — ☕ 𝄞', 'tags': ['#café', 'ok'], 'ctrl': 'a b'}
+    expected = StdlibJSONProvider(app).response(payload).get_data()
+
+    def stdlib_encode(*args, **kwargs):
+        raise AssertionError('fell back to the stdlib encoder')
+
+    monkeypatch.setattr(StdlibJSONProvider, '_encode', stdlib_encode)
+    body = OrjsonProvider(app).response(payload).get_data()
+    assert body == expected and body.isascii()
+    assert b'\\ud83d\\ude00' in body
@@ -0,0 +1,115 @@
+import json
+
+import httpx
+import pytest
+from anthropic import Anthropic
+
+from claude_service import IDEAS_SCHEMA, WEEKLY_PLAN_SCHEMA, ClaudeService
+from resilience import Resilience
+from structured_output import SchemaError, close_truncated, conform, extract_json, parse_structured, tool_definition
+
+IDEAS = [{'title': 'Decorators', 'description': 'A quick tour'}, {'title': 'Generators', 'description': 'Lazy'}]
+
+
+def test_extracts_fenced_and_prose_wrapped_json():
+    fenced = 'Here are your ideas:\n```json\n' + json.dumps(IDEAS) + '\n```\nLet me know!'
+    assert extract_json(fenced) == (IDEAS, False)
+    prose = 'Sure! {"hook": "Stop scrolling", "caption": "x"} Hope that helps.'
+    assert extract_json(prose) == ({'hook': 'Stop scrolling', 'caption': 'x'}, False)
+    # A brace in the prose before the real JSON is skipped
+    assert extract_json('Use {brand} voice: {"hook": "a"}')[0] == {'hook': 'a'}
+
+
+@pytest.mark.parametrize('fragment, expected', [
+    ('[{"title": "a"}, {"title": "b", "descr', [{'title': 'a'}, {'title': 'b'}]),
+    ('[{"title": "a"}, {"title": "b", "description": "half a sent', [{'title': 'a'}, {'title': 'b'}]),
+    ('{"weekly_plan": [{"day_name": "Monday"}, {"day_na', {'weekly_plan': [{'day_name': 'Monday'}, {}]}),
+    ('{"a": 1', {'a': 1}),
+    ('{"a": 1, "tags": ["x", "y', {'a': 1, 'tags': ['x']}),
+    ('{"text": "quote \\" and , comma', {}),
+])
+def test_repairs_truncated_json(fragment, expected):
+    assert json.loads(close_truncated(fragment)) == expected
+
+
+def test_unfenced_truncated_reply_is_flagged_as_repaired():
+    value, repaired = extract_json('```json\n[{"title": "a"}, {"title": "b"')
+    assert value == [{'title': 'a'}, {'title': 'b'}]
+    assert repaired
+
+
+def test_no_json_raises():
+    with pytest.raises(ValueError):
+        extract_json('I cannot help with that.')
+
+
+def test_schema_drops_bad_items_and_rejects_wrong_shapes():
+    assert conform([{'title': 'a'}, {'description': 'no title'}, 'text'], IDEAS_SCHEMA) == [{'title': 'a'}]
+    with pytest.raises(SchemaError):
+        conform([{'description': 'no title'}], IDEAS_SCHEMA)
+    with pytest.raises(SchemaError):
+        conform({'title': 'a'}, IDEAS_SCHEMA)
+    with pytest.raises(SchemaError):
+        conform({'plan': []}, WEEKLY_PLAN_SCHEMA)
+    # The truncated last day loses its required key and is dropped
+    plan = parse_structured('{"weekly_plan": [{"day_name": "Monday"}, {"day_na', WEEKLY_PLAN_SCHEMA)
+    assert plan == {'weekly_plan': [{'day_name': 'Monday'}]}
+
+
+def test_tool_definition_wraps_array_results():
+    tool = tool_definition('content_field.hook', IDEAS_SCHEMA)
+    assert tool['name'] == 'record_content_field_hook'
+    assert tool['input_schema']['type'] == 'object'
+    assert tool['input_schema']['properties']['result'] == IDEAS_SCHEMA
+
+
+class Upstream:
+    def __init__(self, content, stop_reason='end_turn'):
+        self.content = content
+        self.stop_reason = stop_reason
+        self.sent = []
+
+    def handler(self, request):
+        self.sent.append(json.loads(request.content))
+        return httpx.Response(200, json={
+            'id': 'msg_test', 'type': 'message', 'role': 'assistant', 'model': 'claude-3-haiku-20240307',
+            'content': self.content, 'stop_reason': self.stop_reason, 'stop_sequence': None,
+            'usage': {'input_tokens': 10, 'output_tokens': 5}
+        })
+
+    def service(self, **kwargs):
+        client = Anthropic(api_key='test', http_client=httpx.Client(transport=httpx.MockTransport(self.handler)))
+        return ClaudeService('test', client=client, resilience=Resilience(max_retries=0), **kwargs)
+
+
+def test_json_calls_force_a_tool_and_read_its_input():
+    upstream = Upstream([{'type': 'tool_use', 'id': 'toolu_1', 'name': 'record_ideas', 'input': {'result': IDEAS}}],
+                        stop_reason='tool_use')
+    ideas = upstream.service().generate_content_ideas('Tutorials', 'developers', [])
+    assert ideas == IDEAS
+    request = upstream.sent[0]
+    assert request['tool_choice'] == {'type': 'tool', 'name': 'record_ideas'}
+    assert request['tools'][0]['input_schema']['properties']['result']['type'] == 'array'
+
+
+def test_text_fields_and_text_mode_send_no_tools():
+    upstream = Upstream([{'type': 'text', 'text': 'Stop scrolling!'}])
+    service = upstream.service()
+    assert service.generate_content_field('hook', {}, {})['content'] == 'Stop scrolling!'
+    upstream.service(use_tools=False).analyze_performance([], ['instagram'])
+    assert all('tools' not in request for request in upstream.sent)
+
+
+def test_truncated_reply_is_salvaged_without_a_second_call():
+    truncated = 'Here you go:\n```json\n' + json.dumps(IDEAS)[:-30]
+    upstream = Upstream([{'type': 'text', 'text': truncated}], stop_reason='max_tokens')
+    ideas = upstream.service(use_tools=False).generate_content_ideas('Tutorials', 'developers', [])
+    assert ideas == [IDEAS[0]]
+    assert len(upstream.sent) == 1
+
+
+def test_unsalvageable_reply_keeps_the_text_fallback():
+    upstream = Upstream([{'type': 'text', 'text': 'Post more reels on Tuesdays.'}])
+    assert upstream.service().generate_content_strategy({}, [], []) == {
+        'strategy_text': 'Post more reels on Tuesdays.'
+    }
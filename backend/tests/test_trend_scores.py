@@ -0,0 +1,69 @@
+from datetime import datetime, timedelta
+
+import pytest
+
+from models import db, TrendingTopic, TrendSnapshot
+from trend_scores import Momentum, momentum, record_trends
+
+START = datetime(2024, 5, 1, 9)
+
+
+def trend(topic, score):
+    return {'topic': topic, 'hashtags': ['#style'], 'platforms': {}, 'trend_score': score,
+            'volume_24h': 1000, 'engagement_rate': 5.0, 'growth_rate': 50.0}
+
+
+def test_momentum_is_time_aware():
+    first = momentum(None, 0, 40.0)
+    assert first == Momentum(40.0, 0.0, 0.0, 40.0)
+
+    rising = momentum(first, 24, 60.0, half_life_hours=24)
+    assert rising.score_ewma == pytest.approx(50.0)
+    assert rising.velocity > 0 and rising.acceleration > 0
+    assert rising.decayed_score > rising.score_ewma
+
+    # The same reading an hour later moves the average far less than a day later
+    assert momentum(first, 1, 60.0, half_life_hours=24).score_ewma < 41.0
+    # Projection stays within 0-100
+    assert momentum(Momentum(10.0, -5.0, 0.0, 0.0), 24, 0.0).decayed_score == 0.0
+
+
+def test_snapshots_rank_and_expire(app, client):
+    for hours, scores in enumerate(((50, 60, 40), (70, 55, 40), (90, 50, 40))):
+        at = START + timedelta(hours=12 * hours)
+        record_trends('fashion', [trend('Rising', scores[0]), trend('Fading', scores[1]), trend('Flat', scores[2])],
+                      at=at)
+        db.session.commit()
+
+    # History is kept, the topic row holds the latest readings
+    assert TrendSnapshot.query.count() == 9
+    rising = TrendingTopic.query.filter_by(topic='Rising').one()
+    assert rising.trend_score == 90 and rising.last_seen_at == START + timedelta(hours=24)
+    fading = TrendingTopic.query.filter_by(topic='Fading').one()
+    assert rising.velocity > 0 > fading.velocity
+    # Fading peaked at its first reading; Rising has not peaked yet
+    assert fading.peak_time == START and rising.peak_time is None
+
+    body = client.get(f'/api/analytics/trending-topics/{rising.id}/history?limit=2').get_json()
+    assert [point['trend_score'] for point in body['history']] == [70, 90]
+
+    # Topics missing from later polls go inactive once stale
+    record_trends('fashion', [trend('Rising', 95)], at=START + timedelta(hours=24 + 73))
+    db.session.commit()
+    assert [t.topic for t in TrendingTopic.query.filter_by(is_active=True)] == ['Rising']
+
+    dashboard = client.get('/api/analytics/dashboard?niche=fashion').get_json()
+    assert [t['topic'] for t in dashboard['trending_topics']] == ['Rising']
+
+    result = app.test_cli_runner().invoke(args=['trends', 'replay'])
+    assert 'Replayed 3 topics' in result.output
+    db.session.expire_all()
+    assert db.session.get(TrendingTopic, rising.id).velocity == pytest.approx(rising.velocity)
+
+
+def test_endpoint_orders_by_decayed_score(client):
+    first = client.get('/api/analytics/trending-topics?niche=fitness').get_json()
+    assert all(t['decayed_score'] == t['trend_score'] for t in first)
+    second = client.get('/api/analytics/trending-topics?niche=fitness').get_json()
+    assert [t['decayed_score'] for t in second] == sorted((t['decayed_score'] for t in second), reverse=True)
+    assert TrendSnapshot.query.count() == 2 * len(first)
@@ -0,0 +1,96 @@
+import pytest
+from flask import jsonify
+from sqlalchemy import event
+
+from models import db, Task, TableVersion
+from versioning import conditional_get, get_versions
+
+
+def test_get_returns_etag_and_304_when_unchanged(client):
+    response = client.get('/api/tasks')
+    assert response.status_code == 200
+    etag = response.headers['ETag']
+
+    response = client.get('/api/tasks', headers={'If-None-Match': etag})
+    assert response.status_code == 304
+    assert response.data == b''
+    assert response.headers['ETag'] == etag
+
+
+def test_write_invalidates_etag(client):
+    etag = client.get('/api/tasks').headers['ETag']
+    client.post('/api/tasks', json={'title': 'Film b-roll'})
+
+    response = client.get('/api/tasks', headers={'If-None-Match': etag})
+    assert response.status_code == 200
+    assert response.headers['ETag'] != etag
+    assert [task['title'] for task in response.get_json()] == ['Film b-roll']
+
+
+def test_write_to_unrelated_table_keeps_etag(client):
+    etag = client.get('/api/tasks').headers['ETag']
+    client.post('/api/platforms', json={'platform_name': 'tiktok'})
+
+    assert client.get('/api/tasks', headers={'If-None-Match': etag}).status_code == 304
+
+
+def test_association_change_invalidates_content_list(client):
+    client.post('/api/platforms', json={'platform_name': 'tiktok'})
+    client.post('/api/content-manager', json={'content_title': 'Fit check', 'platform_ids': [1]})
+    etag = client.get('/api/content-manager').headers['ETag']
+
+    client.put('/api/content-manager/1', json={'platform_ids': []})
+    assert client.get('/api/content-manager', headers={'If-None-Match': etag}).status_code == 200
+
+
+def test_query_string_is_part_of_etag(client):
+    etag = client.get('/api/analytics/dashboard?niche=fitness').headers['ETag']
+    response = client.get('/api/analytics/dashboard?niche=fashion', headers={'If-None-Match': etag})
+    assert response.status_code == 200
+
+
+def test_rolled_back_write_does_not_bump(app):
+    db.session.add(Task(title='Draft'))
+    db.session.flush()
+    db.session.rollback()
+    assert get_versions(['tasks']) == {'tasks': 0}
+
+
+def test_non_200_response_has_no_etag(app, client):
+    @app.route('/api/test-missing')
+    @conditional_get('tasks')
+    def missing():
+        return jsonify({'error': 'Not found'}), 404
+
+    response = client.get('/api/test-missing')
+    assert response.status_code == 404
+    assert 'ETag' not in response.headers
+
+
+def test_stamp_commits_with_the_data(app):
+    def fail(session):
+        raise RuntimeError('commit interrupted')
+
+    # Listeners run in order, so this one fails the commit after the bump
+    event.listen(db.session, 'before_commit', fail)
+    try:
+        db.session.add(Task(title='Draft'))
+        with pytest.raises(RuntimeError):
+            db.session.commit()
+    finally:
+        event.remove(db.session, 'before_commit', fail)
+    db.session.rollback()
+    assert Task.query.count() == 0
+    assert get_versions(['tasks']) == {'tasks': 0}
+
+    db.session.add(Task(title='Draft'))
+    db.session.commit()
+    assert get_versions(['tasks']) == {'tasks': 1}
+
+
+def test_missing_versions_table_disables_etags(app, client):
+    TableVersion.__table__.drop(bind=db.engine)
+
+    response = client.get('/api/tasks')
+    assert response.status_code == 200
+    assert 'ETag' not in response.headers
@@ -0,0 +1,183 @@
+from datetime import datetime, timedelta
+from typing import Dict, List, NamedTuple, Optional
+import json
+
+import click
+from flask import current_app
+from flask.cli import AppGroup
+from sqlalchemy import or_, select, update
+
+from models import db, TrendingTopic, TrendSnapshot
+
+# Snapshots closer together than this are treated as this far apart, in hours
+MIN_INTERVAL_HOURS = 1 / 60
+
+
+class Momentum(NamedTuple):
+    score_ewma: float
+    velocity: float
+    acceleration: float
+    decayed_score: float
+
+
+def momentum(previous: Optional[Momentum], elapsed_hours: float, score: float, half_life_hours: float = 24.0,
+             horizon_hours: float = 24.0) -> Momentum:
+    """
+    Fold one snapshot's score into a topic's momentum, in O(1).
+
+    The smoothed score, its velocity (points per hour) and acceleration are
+    exponentially weighted moving averages whose weight depends on the time
+    since the previous snapshot, so irregular polling is handled: after
+    half_life_hours the old value counts for half. The decayed score used
+    for ranking is the smoothed score projected horizon_hours along its
+    velocity, clamped to 0-100, so rising topics outrank fading ones with
+    the same level.
+    """
+    if previous is None or previous.score_ewma is None:
+        level, velocity, acceleration = score, 0.0, 0.0
+    else:
+        elapsed = max(elapsed_hours, MIN_INTERVAL_HOURS)
+        alpha = 1.0 - 0.5 ** (elapsed / half_life_hours)
+        level = previous.score_ewma + alpha * (score - previous.score_ewma)
+        velocity = previous.velocity + alpha * ((level - previous.score_ewma) / elapsed - previous.velocity)
+        acceleration = previous.acceleration + alpha * ((velocity - previous.velocity) / elapsed
+                                                        - previous.acceleration)
+    decayed = min(max(level + horizon_hours * velocity, 0.0), 100.0)
+    return Momentum(round(level, 4), round(velocity, 6), round(acceleration, 8), round(decayed, 2))
+
+
+def _state(topic: TrendingTopic) -> Optional[Momentum]:
+    if topic.score_ewma is None:
+        return None
+    return Momentum(topic.score_ewma, topic.velocity or 0.0, topic.acceleration or 0.0, topic.decayed_score or 0.0)
+
+
+def _apply(topic: TrendingTopic, score: float, at: datetime, half_life_hours: float, horizon_hours: float) -> None:
+    previous = _state(topic)
+    elapsed = (at - topic.last_seen_at).total_seconds() / 3600 if topic.last_seen_at else 0.0
+    state = momentum(previous, elapsed, score, half_life_hours, horizon_hours)
+    # Velocity turning down (or never rising) means the previous reading was the peak
+    if previous is not None and state.velocity <= 0 and (previous.velocity > 0 or topic.peak_time is None):
+        topic.peak_time = topic.last_seen_at
+    topic.score_ewma, topic.velocity, topic.acceleration, topic.decayed_score = state
+    topic.last_seen_at = at
+
+
+def record_trends(niche: str, trends: List[Dict], at: Optional[datetime] = None,
+                  half_life_hours: float = 24.0, horizon_hours: float = 24.0,
+                  stale_hours: float = 72.0) -> List[TrendingTopic]:
+    """
+    Store a poll of trending topics (analyze_trending_topics output) in the
+    current session: one TrendSnapshot per trend, the topic's latest readings
+    and momentum updated in place, and topics not seen for stale_hours
+    deactivated. Returns the topics in the order of trends; the caller
+    commits.
+    """
+    at = at or datetime.utcnow()
+    names = [trend['topic'] for trend in trends]
+    topics = {topic.topic: topic for topic in TrendingTopic.query.filter(TrendingTopic.topic.in_(names))}
+    for trend in trends:
+        topic = topics.get(trend['topic'])
+        if topic is None:
+            topic = topics[trend['topic']] = TrendingTopic(
+                topic=trend['topic'],
+                hashtags=json.dumps(trend['hashtags']),
+                platforms=json.dumps(trend['platforms']),
+                niche_category=niche
+            )
+            db.session.add(topic)
+        topic.trend_score = trend['trend_score']
+        topic.volume_24h = trend['volume_24h']
+        topic.engagement_rate = trend['engagement_rate']
+        topic.growth_rate = trend['growth_rate']
+        topic.is_active = True
+        _apply(topic, trend['trend_score'], at, half_life_hours, horizon_hours)
+        # Through the backref, which does not load the topic's history
+        db.session.add(TrendSnapshot(
+            trending_topic=topic,
+            recorded_at=at,
+            trend_score=trend['trend_score'],
+            volume_24h=trend['volume_24h'],
+            engagement_rate=trend['engagement_rate'],
+            growth_rate=trend['growth_rate']
+        ))
+    deactivate_stale(stale_hours, now=at)
+    return [topics[name] for name in names]
+
+
+def deactivate_stale(stale_hours: float, now: Optional[datetime] = None) -> int:
+    """Mark topics without a snapshot in the last stale_hours inactive, in the current session"""
+    cutoff = (now or datetime.utcnow()) - timedelta(hours=stale_hours)
+    seen = TrendingTopic.last_seen_at.isnot(None)
+    result = db.session.execute(
+        update(TrendingTopic)
+        .where(TrendingTopic.is_active.is_(True),
+               or_(TrendingTopic.last_seen_at < cutoff, ~seen & (TrendingTopic.updated_at < cutoff)))
+        .values(is_active=False)
+        .execution_options(synchronize_session='fetch')
+    )
+    return result.rowcount
+
+
+def ranked_topics(niche: str, limit: int = 5) -> List[TrendingTopic]:
+    """Active topics of a niche by decayed score, read from ix_trending_topics_rank"""
+    return TrendingTopic.query.filter_by(niche_category=niche, is_active=True).order_by(
+        TrendingTopic.decayed_score.desc()
+    ).limit(limit).all()
+
+
+def topic_history(topic_id: int, limit: int = 100) -> List[TrendSnapshot]:
+    """The topic's latest snapshots, oldest first"""
+    latest = db.session.execute(
+        select(TrendSnapshot).where(TrendSnapshot.topic_id == topic_id)
+        .order_by(TrendSnapshot.recorded_at.desc(), TrendSnapshot.id.desc()).limit(limit)
+    ).scalars().all()
+    return latest[::-1]
+
+
+def replay(half_life_hours: float = 24.0, horizon_hours: float = 24.0) -> int:
+    """
+    Recompute every topic's momentum from its snapshots, e.g. after changing
+    the half-life. Returns the number of topics replayed.
+    """
+    topics = 0
+    for topic in TrendingTopic.query.order_by(TrendingTopic.id):
+        topic.score_ewma, topic.velocity, topic.acceleration, topic.decayed_score = None, 0.0, 0.0, 0.0
+        topic.last_seen_at = None
+        for snapshot in TrendSnapshot.query.filter_by(topic_id=topic.id).order_by(TrendSnapshot.recorded_at,
+                                                                                  TrendSnapshot.id):
+            _apply(topic, snapshot.trend_score, snapshot.recorded_at, half_life_hours, horizon_hours)
+        topics += 1
+    db.session.commit()
+    return topics
+
+
+trends_cli = AppGroup('trends', help='Maintain trending topic momentum.')
+
+
+@trends_cli.command('expire')
+def expire_command():
+    """Deactivate topics without recent snapshots."""
+    count = deactivate_stale(current_app.config['TREND_STALE_HOURS'])
+    db.session.commit()
+    click.echo(f'Deactivated {count} topics')
+
+
+@trends_cli.command('replay')
+def replay_command():
+    """Recompute topic momentum from the snapshot history."""
+    config = current_app.config
+    count = replay(config['TREND_HALF_LIFE_HOURS'], config['TREND_HORIZON_HOURS'])
+    click.echo(f'Replayed {count} topics')
+
+
+def init_trend_scores(app) -> None:
+    """
+    Add the `flask trends expire` and `flask trends replay` commands.
+
+    Each poll of trending topics appends a TrendSnapshot per topic and
+    updates the topic's EWMA momentum in place (record_trends), so the
+    history survives while ranking stays a single indexed read of
+    decayed_score.
+    """
+    app.cli.add_command(trends_cli)
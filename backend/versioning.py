@@ -0,0 +1,173 @@
+from functools import wraps
+from hashlib import blake2b
+from typing import Callable, Dict, Iterable, Optional, Set
+import logging
+
+from flask import request, current_app
+from sqlalchemy import event, inspect, select, update
+from sqlalchemy.exc import DBAPIError
+from sqlalchemy.dialects import postgresql, sqlite
+
+from models import db, TableVersion
+
+logger = logging.getLogger(__name__)
+
+# session.info key collecting tables written in the current transaction
+PENDING_KEY = 'versioning_pending_tables'
+
+
+def _tables_for(obj) -> Set[str]:
+    """Tables a flushed object can change: its own table plus any many-to-many association tables"""
+    mapper = inspect(obj).mapper
+    tables = {table.name for table in mapper.tables}
+    for relationship in mapper.relationships:
+        if relationship.secondary is not None:
+            tables.add(relationship.secondary.name)
+    return tables
+
+
+def bump_versions(connection, tables: Iterable[str]) -> None:
+    """Increment the version stamp of each table on the given connection"""
+    tables = sorted(set(tables) - {TableVersion.__tablename__})
+    if not tables:
+        return
+
+    dialect = connection.dialect.name
+    if dialect in ('postgresql', 'sqlite'):
+        insert = postgresql.insert if dialect == 'postgresql' else sqlite.insert
+        stmt = insert(TableVersion.__table__).values([{'table_name': name, 'version': 1} for name in tables])
+        stmt = stmt.on_conflict_do_update(
+            index_elements=['table_name'],
+            set_={'version': TableVersion.__table__.c.version + 1}
+        )
+        connection.execute(stmt)
+        return
+
+    for name in tables:
+        result = connection.execute(
+            update(TableVersion.__table__)
+            .where(TableVersion.__table__.c.table_name == name)
+            .values(version=TableVersion.__table__.c.version + 1)
+        )
+        if result.rowcount == 0:
+            connection.execute(TableVersion.__table__.insert().values(table_name=name, version=1))
+
+
+def get_versions(tables: Iterable[str]) -> Optional[Dict[str, int]]:
+    """
+    Current version stamp per table; tables never written to report 0.
+
+    Returns None when table_versions is unavailable (e.g. a database created
+    before it existed), in which case callers should skip conditional GET.
+    """
+    tables = sorted(set(tables))
+    try:
+        rows = db.session.execute(
+            select(TableVersion.table_name, TableVersion.version).where(TableVersion.table_name.in_(tables))
+        ).all()
+    except DBAPIError:
+        db.session.rollback()
+        logger.warning("table_versions is unavailable; serving without ETags", exc_info=True)
+        return None
+    versions = dict.fromkeys(tables, 0)
+    versions.update(rows)
+    return versions
+
+
+def _pending_tables(session) -> Set[str]:
+    return session.info.setdefault(PENDING_KEY, set())
+
+
+def mark_written(session, tables: Iterable[str]) -> None:
+    """Record tables written with Core statements, which flush events do not see"""
+    _pending_tables(session).update(tables)
+
+
+def _after_flush(session, flush_context):
+    pending = _pending_tables(session)
+    for obj in list(session.new) + list(session.dirty) + list(session.deleted):
+        pending |= _tables_for(obj)
+
+
+def _after_bulk(context):
+    # query.update()/query.delete() bypass flush, so record their target table here
+    _pending_tables(context.session).add(context.mapper.local_table.name)
+
+
+def _on_execute(orm_execute_state):
+    # ORM bulk INSERT (session.execute(insert(Model), rows)) also bypasses flush
+    if orm_execute_state.is_insert:
+        _pending_tables(orm_execute_state.session).add(orm_execute_state.statement.table.name)
+
+
+def _before_commit(session):
+    # Commit flushes after this hook; flush first so the tables it writes are known
+    session.flush()
+    tables = session.info.pop(PENDING_KEY, None)
+    if not tables:
+        return
+    # Same connection and transaction as the data, so the stamps commit or roll back with it
+    table = TableVersion.__table__
+    bump_versions(session.connection(bind_arguments={'clause': update(table)}), tables)
+
+
+def _after_rollback(session):
+    session.info.pop(PENDING_KEY, None)
+
+
+def init_versioning(app) -> None:
+    """
+    Bump table version stamps from SQLAlchemy write events.
+
+    Tables written in a transaction are collected from flushes, bulk
+    statements and mark_written(), and their stamps are bumped just before
+    it commits, on its own connection, so data and stamps become visible
+    together. The table_versions rows stay locked only for the commit
+    itself. The table is created by the migrations (flask db upgrade).
+    """
+    if not event.contains(db.session, 'after_flush', _after_flush):
+        event.listen(db.session, 'after_flush', _after_flush)
+        event.listen(db.session, 'after_bulk_update', _after_bulk)
+        event.listen(db.session, 'after_bulk_delete', _after_bulk)
+        event.listen(db.session, 'do_orm_execute', _on_execute)
+        event.listen(db.session, 'before_commit', _before_commit)
+        event.listen(db.session, 'after_rollback', _after_rollback)
+
+
+def conditional_get(*tables: str, key: Optional[Callable[[], str]] = None):
+    """
+    Serve a GET endpoint with an ETag derived from the version stamps of the
+    tables it reads.
+
+    A matching If-None-Match is answered with 304 before the view runs, so
+    polling clients cost a single lookup on table_versions instead of the
+    full query and serialization. key, if given, returns whatever else the
+    response depends on beyond the URL, e.g. a date range that defaults to
+    today.
+    """
+    def decorator(view):
+        @wraps(view)
+        def wrapper(*args, **kwargs):
+            versions = get_versions(tables)
+            if versions is None:
+                return view(*args, **kwargs)
+            digest = blake2b(digest_size=16)
+            digest.update(request.full_path.encode('utf-8'))
+            if key is not None:
+                digest.update(f'|{key()}'.encode('utf-8'))
+            for name, version in versions.items():
+                digest.update(f'|{name}:{version}'.encode('utf-8'))
+            etag = digest.hexdigest()
+
+            if request.if_none_match.contains(etag):
+                response = current_app.response_class(status=304)
+            else:
+                response = current_app.make_response(view(*args, **kwargs))
+                if response.status_code != 200:
+                    return response
+
+            response.set_etag(etag)
+            response.headers['Cache-Control'] = 'no-cache'
+            return response
+        return wrapper
+    return decorator
@@ -0,0 +1,11 @@
+#!/usr/bin/env python3
+"""
+AI Content Strategist Backend
+WSGI entry point for production servers (gunicorn wsgi:app -c gunicorn.conf.py)
+"""
+
+from app import create_app
+
+# Always production: settings in .env (e.g. APP_CONFIG=development)
+# must not switch a deployed server into debug mode
+app = create_app('production')